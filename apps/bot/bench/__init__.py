@@ -0,0 +1,30 @@
+"""
+Offline benchmark and load generator for the bot (see __main__.py).
+
+  fake_supabase.py     in-memory AsyncClient with injected latency
+  fake_telegram.py     in-memory Bot API transport
+  load.py              seeding, synthetic updates, reports and baselines
+  concurrency.py       N simultaneous /balance, blocking vs async client
+  settlement.py        /balance transfers: exact settlement vs greedy
+  modes.py             update-to-reply latency, polling vs webhook
+  write_queue.py       expense write queue: confirm latency, partial failures
+  bulk_import.py       CSV import: 10k rows, memory per document
+  export.py            /exportar: peak RSS and loop stalls from 1k to 1M rows
+  automation.py        automation rules: match cost, loading across households
+  fanout.py            expense notifications against a rate-limited fake Bot API
+  metrics_overhead.py  cost of the metrics instrumentation per update
+
+Importing the package points the bot's local files (pending flows, budget
+alerts) at a scratch directory before any bot module reads the paths.
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "1:bench")
+SCRATCH = tempfile.mkdtemp(prefix="bench-")
+os.environ.setdefault("PENDING_STORE_PATH", os.path.join(SCRATCH, "pending.sqlite3"))
+os.environ.setdefault("BUDGET_STORE_PATH", os.path.join(SCRATCH, "budget.sqlite3"))
+# The notifier's rate limits model Telegram, which isn't there; keep them
+# from stretching the shutdown drain.
+os.environ.setdefault("NOTIFY_GLOBAL_RATE", "100000")
@@ -0,0 +1,140 @@
+"""
+Run the offline benchmark:
+
+  cd apps/bot
+  python -m bench                                  # defaults below
+  python -m bench --households 2000 --updates 20000 --latency-ms 30
+  python -m bench --save default                   # store bench/baselines/default.json
+  python -m bench --compare default                # exit 1 on a regression
+  python -m bench --backend sqlite                 # against a real SQLite file
+
+By default no network, credentials or database are used: Supabase is
+bench/fake_supabase.py and the Bot API is bench/fake_telegram.py. With
+--backend sqlite (a scratch file) or postgres (DATABASE_URL, which should
+point at an empty database) the same load runs against the SQL backend of
+utils/sql_client.py, without simulated latency. Everything else — handlers, caches,
+write queue, notifier — is the bot's own code, started and stopped through the
+Application's post_init/post_stop/post_shutdown hooks as in production.
+"""
+
+import os
+import sys
+import random
+import asyncio
+import logging
+import argparse
+import warnings
+
+from telegram.warnings import PTBUserWarning
+
+from bench import SCRATCH
+from bench.fake_supabase import FakeClient, FakeDatabase
+from bench.fake_telegram import FakeTelegramRequest
+from bench.sql_backend import SqlBenchDatabase
+from bench.load import (
+    COMMANDS,
+    DEFAULT_MIX,
+    bot_app,
+    compare,
+    format_report,
+    load_baseline,
+    run_load,
+    save_baseline,
+    seed,
+)
+from utils.sql_client import create_sql_client
+
+
+def _parse_mix(text: str):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in COMMANDS:
+            raise argparse.ArgumentTypeError(f"unknown command '{name}' (use {', '.join(COMMANDS)})")
+        mix[name] = float(weight)
+    return mix
+
+
+def _args():
+    p = argparse.ArgumentParser(prog="python -m bench", description="Offline load test of the bot's handlers.")
+    p.add_argument("--households", type=int, default=1000)
+    p.add_argument("--expenses", type=int, default=40, help="expenses per household this month")
+    p.add_argument("--updates", type=int, default=5000)
+    p.add_argument("--concurrency", type=int, default=64, help="users sending at the same time")
+    p.add_argument("--latency-ms", type=float, default=20.0, help="per PostgREST request")
+    p.add_argument("--jitter-ms", type=float, default=10.0)
+    p.add_argument("--telegram-latency-ms", type=float, default=0.0, help="per Bot API call")
+    p.add_argument("--backend", choices=("fake", "sqlite", "postgres"), default="fake",
+                   help="in-memory Supabase stand-in, or the SQL backend")
+    p.add_argument("--no-ledger", action="store_true", help="database without migration 010")
+    p.add_argument("--replica", action="store_true", help="serve reads from the SQLite read replica")
+    p.add_argument("--mix", type=_parse_mix, default=DEFAULT_MIX,
+                   help="weights, e.g. gasto=40,balance=25,resumen=25,espacio=10")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--save", metavar="NAME", help="save the report as baseline NAME")
+    p.add_argument("--compare", metavar="NAME", help="compare against baseline NAME")
+    p.add_argument("--tolerance", type=float, default=0.2, help="allowed latency/throughput change")
+    return p.parse_args()
+
+
+async def _database(args):
+    """(database for seed()/run_load(), client for init_client) of --backend."""
+    if args.backend == "fake":
+        db = FakeDatabase(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                          ledger=not args.no_ledger, rng=random.Random(args.seed))
+        return db, FakeClient(db)
+    if args.backend == "sqlite":
+        os.environ["SQLITE_PATH"] = os.path.join(SCRATCH, "bench.sqlite3")
+    db = SqlBenchDatabase(await create_sql_client(args.backend))
+    return db, db.client
+
+
+async def _run(args) -> dict:
+    db, client = await _database(args)
+    users = seed(db, args.households, args.expenses, random.Random(args.seed))
+    if isinstance(db, SqlBenchDatabase):
+        await db.load()
+    if args.replica:
+        os.environ["REPLICA_PATH"] = os.path.join(SCRATCH, "replica.sqlite3")
+    telegram = FakeTelegramRequest(latency_ms=args.telegram_latency_ms)
+    try:
+        async with bot_app(client, telegram) as (app, errors):
+            report = await run_load(app, db, users, args.updates, args.concurrency, args.mix, args.seed)
+    finally:
+        if isinstance(db, SqlBenchDatabase):
+            await db.sql.close()
+
+    report["config"] = {k: v for k, v in vars(args).items() if k not in ("save", "compare", "tolerance")}
+    report["background_round_trips"] = db.round_trips["background"]
+    report["telegram_calls"] = dict(sorted(telegram.calls.items()))
+    report["errors"] = len(errors)
+    for error in sorted(set(errors))[:5]:
+        print(f"handler error: {error}", file=sys.stderr)
+    return report
+
+
+def run() -> int:
+    args = _args()
+    logging.basicConfig(level=logging.WARNING)  # before main.py's INFO setup, which then does nothing
+    warnings.filterwarnings("ignore", category=PTBUserWarning)
+    report = asyncio.run(_run(args))
+    print(format_report(report))
+
+    status = 0
+    if args.compare:
+        baseline = load_baseline(args.compare)
+        if baseline is None:
+            print(f"\nNo baseline named '{args.compare}'", file=sys.stderr)
+            return 2
+        if baseline.get("config") != report["config"]:
+            print("\nWarning: baseline was recorded with different options", file=sys.stderr)
+        table, regressed = compare(report, baseline, args.tolerance)
+        print(f"\nAgainst baseline '{args.compare}':\n{table}")
+        status = 1 if regressed else 0
+    if args.save:
+        print(f"\nSaved {save_baseline(report, args.save)}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(run())
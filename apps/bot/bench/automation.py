@@ -0,0 +1,123 @@
+"""
+Automation rules: cost of matching an expense, and of loading the rules.
+
+  cd apps/bot
+  python -m bench.automation                         # 1 to 5000 rules; 2000 households
+  python -m bench.automation --households 5000 --expenses 50000 --latency-ms 20
+
+Matching: one household with --rules rules, each on its own category.
+Expenses draw a category at random, half of them without a rule. Reported:
+time of one lookup in the compiled table (CompiledRules.match) and of a
+scan over the rule rows comparing lowercased categories, which is what
+evaluating the rules one by one would cost.
+
+Loading: --households households with 1 to 10 rules each (thousands in
+all) in the fake Supabase with --latency-ms per request. --expenses /gasto
+lookups (get_household_rules + match) pick households with a skew (a few
+households register most expenses). Reported: rules in total, queries sent,
+cache hit rate, and p50/p99/max of one lookup.
+"""
+
+import sys
+import time
+import random
+import asyncio
+import argparse
+from typing import Dict, List
+
+from bench.fake_supabase import FakeClient, FakeDatabase
+from bench.load import percentile
+from utils import automation
+from utils import supabase_client as db
+from utils.automation import CompiledRules, get_household_rules
+from utils.supabase_client import VALID_CATEGORIES
+
+
+def _rules(household_id: int, n: int, first_id: int) -> List[Dict]:
+    categories = list(VALID_CATEGORIES) + [f"Categoría {i}" for i in range(max(0, n - len(VALID_CATEGORIES)))]
+    return [{"id": first_id + i, "household_id": household_id, "name": f"Regla {i}", "trigger_type": "category",
+             "trigger_category": categories[i], "auto_shared_with": [1, 2], "auto_action": {}, "is_active": True}
+            for i in range(n)]
+
+
+def _scan(rules: List[Dict], category: str):
+    key = category.lower()
+    for rule in reversed(rules):  # newest wins
+        if rule["trigger_category"].lower() == key and rule["auto_shared_with"]:
+            return rule
+    return None
+
+
+def _matching(n: int, lookups: int, rng: random.Random) -> Dict[str, float]:
+    rules = _rules(1, n, 1)
+    start = time.perf_counter()
+    compiled = CompiledRules(1, rules)
+    compile_ms = (time.perf_counter() - start) * 1000
+    names = [r["trigger_category"] for r in rules]
+    queries = [rng.choice(names).upper() if rng.random() < 0.5 else f"Sin regla {rng.randrange(n)}"
+               for _ in range(lookups)]
+    results = {"compile_ms": compile_ms}
+    for name, match in (("table", compiled.match), ("scan", lambda c: _scan(rules, c))):
+        count = lookups if name == "table" else max(100, lookups // max(1, n // 10))
+        start = time.perf_counter()
+        for c in queries[:count]:
+            match(c)
+        results[f"{name}_ns"] = (time.perf_counter() - start) / count * 1e9
+    return results
+
+
+async def _loading(args, rng: random.Random) -> Dict[str, float]:
+    fake = FakeDatabase(latency_ms=args.latency_ms)
+    total = 0
+    for h in range(1, args.households + 1):
+        for rule in _rules(h, rng.randint(1, 10), total + 1):
+            fake.add("automation_rules", rule)
+            total += 1
+    await db.init_client(FakeClient(fake))
+    automation._rules_cache.clear()
+    weights = [1 / h for h in range(1, args.households + 1)]
+    households = rng.choices(range(1, args.households + 1), weights, k=args.expenses)
+    fake.reset_counters()
+    times: List[float] = []
+    matched = 0
+    for h in households:
+        start = time.perf_counter()
+        action = (await get_household_rules(h)).match(rng.choice(VALID_CATEGORIES))
+        times.append(time.perf_counter() - start)
+        matched += action is not None
+    await db.close_client()
+    times.sort()
+    stats = automation.get_automation_cache_stats()
+    return {"rules": total, "queries": sum(fake.round_trips.values()), "hit_rate": stats.get("hit_rate", 0.0),
+            "matched": matched, "p50_us": percentile(times, 0.50) * 1e6,
+            "p99_us": percentile(times, 0.99) * 1e6, "max_ms": times[-1] * 1000}
+
+
+def run() -> int:
+    p = argparse.ArgumentParser(prog="python -m bench.automation",
+                                description="Automation rules: match cost and rule loading.")
+    p.add_argument("--rules", type=int, nargs="+", default=[1, 10, 100, 1000, 5000])
+    p.add_argument("--lookups", type=int, default=100000, help="matches timed per size")
+    p.add_argument("--households", type=int, default=2000)
+    p.add_argument("--expenses", type=int, default=20000)
+    p.add_argument("--latency-ms", type=float, default=10.0, help="per PostgREST request")
+    p.add_argument("--seed", type=int, default=1)
+    args = p.parse_args()
+    rng = random.Random(args.seed)
+
+    print("one household, half the expenses without a rule\n")
+    print(f"{'rules':>6}{'compile ms':>12}{'table ns':>10}{'scan ns':>10}")
+    for n in args.rules:
+        r = _matching(n, args.lookups, rng)
+        print(f"{n:>6}{r['compile_ms']:>12.2f}{r['table_ns']:>10.0f}{r['scan_ns']:>10.0f}")
+
+    r = asyncio.run(_loading(args, rng))
+    print(f"\n{args.expenses} /gasto lookups over {args.households} households ({r['rules']} rules), "
+          f"{args.latency_ms:.0f} ms per request, AUTOMATION_RULES_TTL={automation._rules_cache.ttl:.0f}\n")
+    print(f"queries {r['queries']}, hit rate {r['hit_rate']:.1%}, matched {r['matched']}; "
+          f"lookup p50 {r['p50_us']:.1f} us, p99 {r['p99_us']:.1f} us, max {r['max_ms']:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,142 @@
+"""
+CSV import: 10k rows end to end, and the memory a document costs.
+
+  cd apps/bot
+  python -m bench.bulk_import                       # 10k rows; 1, 5 and 20 MB files
+  python -m bench.bulk_import --rows 20000 --latency-ms 50 --sizes-mb 20
+
+Import: a --rows CSV (1% invalid lines) is streamed to a temporary file by
+download_document() and imported by import_expenses() into the fake
+Supabase with --latency-ms per request, as importar_handler does. Reported:
+rows inserted, line errors, insert requests, seconds in total and seconds
+without database latency (parsing and validation).
+
+Memory: for each file size, peak Python allocations (tracemalloc) while the
+document is downloaded, decoded, parsed and validated, without inserting:
+"buffered" holds the whole body as download_as_bytearray() did, "streamed"
+is download_document() into a temporary file. The Bot API is an
+httpx.MockTransport serving the file in 64 KiB pieces.
+"""
+
+import io
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import tracemalloc
+from typing import Dict
+
+import httpx
+
+from bench import SCRATCH
+from bench.fake_supabase import FakeClient, FakeDatabase
+from utils import supabase_client as db
+from utils.bulk_import import LineError, download_document, import_expenses, parse_csv_lines, validate
+
+URL = "https://api.telegram.org/file/bot1:bench/documents/file_0.csv"
+_CATEGORIES = ["Supermercado", "delivery", "Servicios", "transporte", "Salud", "otros"]
+
+
+def _write_csv(path: str, rows: int = 0, size: int = 0) -> None:
+    """rows lines (or enough lines for size bytes) of monto,categoría,descripción,fecha."""
+    rng = random.Random(rows or size)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("monto,categoría,descripción,fecha\n")
+        n = 0
+        while (rows and n < rows) or (size and f.tell() < size):
+            n += 1
+            amount = "abc" if rng.random() < 0.01 else f"{rng.uniform(1, 500):.2f}"
+            f.write(f"{amount},{rng.choice(_CATEGORIES)},Compra número {n} del mes,"
+                    f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}\n")
+
+
+def _transport(path: str) -> httpx.MockTransport:
+    async def body():
+        with open(path, "rb") as f:
+            while chunk := f.read(64 * 1024):
+                yield chunk
+
+    return httpx.MockTransport(lambda request: httpx.Response(200, content=body()))
+
+
+async def _import(path: str, latency_ms: float) -> Dict[str, float]:
+    fake = FakeDatabase(latency_ms=latency_ms)
+    fake.add("users", {"id": 1, "telegram_id": 1001, "name": "Ana"})
+    fake.add("households", {"id": 1, "name": "Casa", "created_by": 1})
+    await db.init_client(FakeClient(fake))
+    start = time.perf_counter()
+    async with httpx.AsyncClient(transport=_transport(path)) as http:
+        with tempfile.TemporaryFile() as tmp:
+            await download_document(URL, tmp, http)
+            tmp.seek(0)
+            stream = io.TextIOWrapper(tmp, encoding="utf-8-sig", errors="replace", newline="")
+            fake.reset_counters()
+            result = await import_expenses(parse_csv_lines(stream), household_id=1, paid_by=1,
+                                           shared_with=[1], key_prefix="bulk:1:1001:1")
+    elapsed = time.perf_counter() - start
+    await db.close_client()
+    return {"inserted": result.inserted, "errors": len(result.errors),
+            "requests": sum(fake.round_trips.values()), "seconds": elapsed}
+
+
+async def _peak(path: str, streamed: bool) -> float:
+    """Peak MiB allocated while downloading, decoding, parsing and validating path."""
+    async with httpx.AsyncClient(transport=_transport(path)) as http:
+        tracemalloc.start()
+        if streamed:
+            out = tempfile.TemporaryFile()
+            await download_document(URL, out, http)
+            out.seek(0)
+        else:
+            data = bytearray()
+            async with http.stream("GET", URL) as resp:
+                async for chunk in resp.aiter_bytes():
+                    data += chunk
+            out = io.BytesIO(data)
+        with io.TextIOWrapper(out, encoding="utf-8-sig", errors="replace", newline="") as stream:
+            for _, fields in parse_csv_lines(stream):
+                try:
+                    validate(fields)
+                except LineError:
+                    pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+async def _main(args) -> None:
+    path = os.path.join(SCRATCH, "import.csv")
+    _write_csv(path, rows=args.rows)
+    print(f"{args.rows} CSV rows ({os.path.getsize(path) / 2 ** 20:.1f} MiB)\n")
+    print(f"{'latency':>8}{'inserted':>10}{'errors':>8}{'requests':>10}{'seconds':>9}")
+    for latency in (args.latency_ms, 0):
+        r = await _import(path, latency)
+        print(f"{latency:>6.0f}ms{r['inserted']:>10}{r['errors']:>8}{r['requests']:>10}{r['seconds']:>9.2f}")
+
+    print("\npeak memory while reading a document (MiB)\n")
+    print(f"{'file':>8}{'buffered':>10}{'streamed':>10}")
+    for mb in args.sizes_mb:
+        _write_csv(path, size=int(mb * 2 ** 20))
+        buffered = await _peak(path, streamed=False)
+        streamed = await _peak(path, streamed=True)
+        print(f"{mb:>5.0f} MB{buffered:>10.1f}{streamed:>10.1f}")
+
+
+def run() -> int:
+    p = argparse.ArgumentParser(prog="python -m bench.bulk_import",
+                                description="CSV import: 10k rows end to end, and memory per document.")
+    p.add_argument("--rows", type=int, default=10000)
+    p.add_argument("--latency-ms", type=float, default=50.0, help="per PostgREST request")
+    p.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 5, 20])
+    args = p.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(_main(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,122 @@
+"""
+Multi-month reports: ExpenseBatch kernels vs the per-row loops, 1k to 1M rows.
+
+  cd apps/bot
+  python -m bench.columnar                         # 1k, 100k, 1M rows
+  python -m bench.columnar --rows 1000 10000 --members 4 --months 12
+
+Rows are one household's expenses spread over --months months, paid and
+shared among --members people (shares of any size, repeated ids included).
+For each size two reports are computed from the same rows, as
+supabase_client does when the ledger can't serve them:
+
+  category × month  /tendencia's { (month, category): cents }
+                    loop   the dict loop get_category_totals_by_month ran
+                    batch  ExpenseBatch.from_rows(splits=False) + pivot
+  paid/owed × month /balance <año>'s { (month, user): (paid, owed) }
+                    loop   one MonthlySnapshot per month, folded row by row
+                    batch  ExpenseBatch.from_rows() + member_month_pivot
+
+Both sides get the same list of row dicts and produce the same dict (checked
+on every run); "batch" includes building the batch. "kernels" is both
+pivots over an already built batch: what each further report over the same
+rows costs. Times are the best of --repeat runs.
+"""
+
+import sys
+import time
+import random
+import argparse
+from typing import Callable, Dict, List, Tuple
+
+from utils.columnar import ExpenseBatch
+from utils.snapshot import MonthlySnapshot, to_cents
+
+CATEGORIES = ["Supermercado", "Delivery", "Servicios", "Transporte", "Salud", "Salidas",
+              "Mascotas", "Educación", "Ropa", "Hogar", "Regalos", "Otros"]
+
+
+def _rows(n: int, members: int, months: int, rng: random.Random) -> List[Dict]:
+    users = list(range(1, members + 1))
+    dates = [f"{2024 + m // 12}-{m % 12 + 1:02d}-{d:02d}" for m in range(months) for d in range(1, 29)]
+    return [{"amount": rng.randint(1, 99999) / 100, "paid_by": rng.choice(users), "category": rng.choice(CATEGORIES),
+             "shared_with": rng.choices(users, k=rng.randint(0, members)), "expense_date": rng.choice(dates)}
+            for _ in range(n)]
+
+
+def _category_loop(rows: List[Dict]) -> Dict[Tuple[str, str], int]:
+    totals: Dict[Tuple[str, str], int] = {}
+    for exp in rows:
+        key = (str(exp["expense_date"])[:7] + "-01", exp["category"])
+        totals[key] = totals.get(key, 0) + to_cents(exp["amount"])
+    return totals
+
+
+def _member_loop(rows: List[Dict]) -> Dict[Tuple[str, int], Tuple[int, int]]:
+    snapshots: Dict[str, MonthlySnapshot] = {}
+    for exp in rows:
+        start = str(exp["expense_date"])[:7] + "-01"
+        snap = snapshots.get(start)
+        if snap is None:
+            snap = snapshots[start] = MonthlySnapshot(0, int(start[:4]), int(start[5:7]))
+        snap.add(exp)
+    totals = {}
+    for start, snap in snapshots.items():
+        for uid in set(snap.paid_cents) | set(snap.owed_cents):
+            paid, owed = snap.paid_cents.get(uid, 0), snap.owed_cents.get(uid, 0)
+            if paid or owed:
+                totals[(start, uid)] = (paid, owed)
+    return totals
+
+
+def _kernels(batch: ExpenseBatch) -> None:
+    first, last = batch.month_range()
+    batch.category_month_pivot(first, last)
+    batch.member_month_pivot(first, last)
+
+
+def _best(fn: Callable, repeat: int):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run() -> int:
+    p = argparse.ArgumentParser(prog="python -m bench.columnar",
+                                description="ExpenseBatch kernels vs per-row loops for multi-month reports.")
+    p.add_argument("--rows", type=int, nargs="+", default=[1000, 100_000, 1_000_000])
+    p.add_argument("--members", type=int, default=6)
+    p.add_argument("--months", type=int, default=24)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--seed", type=int, default=1)
+    args = p.parse_args()
+
+    print(f"{args.members} members, {args.months} months, best of {args.repeat}\n")
+    print(f"{'rows':>9}  {'report':<18}{'loop ms':>10}{'batch ms':>10}{'speedup':>9}")
+    for n in args.rows:
+        rows = _rows(n, args.members, args.months, random.Random(args.seed + n))
+        cases = [
+            ("category × month", _category_loop,
+             lambda: ExpenseBatch.from_rows(rows, splits=False).category_totals_by_month()),
+            ("paid/owed × month", _member_loop,
+             lambda: ExpenseBatch.from_rows(rows).member_totals_by_month()),
+        ]
+        for name, loop, batched in cases:
+            loop_s, expected = _best(lambda: loop(rows), args.repeat)
+            batch_s, actual = _best(batched, args.repeat)
+            if actual != expected:
+                print(f"{name}: batch and loop differ at {n} rows", file=sys.stderr)
+                return 1
+            print(f"{n:>9}  {name:<18}{loop_s * 1000:>10.1f}{batch_s * 1000:>10.1f}{loop_s / batch_s:>8.1f}x")
+        batch = ExpenseBatch.from_rows(rows)
+        batch.user_ids  # build the CSR outside the timing
+        kernels_s, _ = _best(lambda: _kernels(batch), args.repeat)
+        print(f"{n:>9}  {'kernels':<18}{'':>10}{kernels_s * 1000:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
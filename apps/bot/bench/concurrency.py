@@ -0,0 +1,86 @@
+"""
+N simultaneous /balance commands, with a blocking and with an async client:
+
+  cd apps/bot
+  python -m bench.concurrency                      # N = 1, 10, 50, 100
+  python -m bench.concurrency --users 25 200 --latency-ms 40
+
+Each run seeds N households and sends /balance from one member of each at
+the same moment, through the real Application. "blocking" is the fake
+Supabase with blocking=True: every round trip holds the event loop, as the
+synchronous supabase-py client did before the helpers became coroutines.
+"async" is the same database with awaitable round trips, so the commands
+overlap their I/O. Reported per run: wall time, commands per second and
+p50/p99 latency of one command.
+"""
+
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+import warnings
+from typing import Dict, List
+
+from telegram.warnings import PTBUserWarning
+
+from bench.fake_supabase import FakeClient, FakeDatabase
+from bench.fake_telegram import FakeTelegramRequest
+from bench.load import UpdateFactory, bot_app, percentile, seed
+
+
+async def _balance_burst(users: int, latency_ms: float, blocking: bool) -> Dict[str, float]:
+    db = FakeDatabase(latency_ms=latency_ms, blocking=blocking)
+    everyone = seed(db, users, 40, random.Random(1))
+    # One sender per household, so no two commands share a chat
+    senders = list({u["active_household_id"]: u for u in everyone}.values())[:users]
+    async with bot_app(FakeClient(db), FakeTelegramRequest()) as (app, errors):
+        factory = UpdateFactory(app.bot)
+        latencies: List[float] = []
+
+        async def one(user: Dict) -> None:
+            update = factory.command(user, "/balance")
+            start = time.perf_counter()
+            await app.update_processor.process_update(update, app.process_update(update))
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(u) for u in senders))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "seconds": elapsed,
+        "per_second": len(senders) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "errors": len(errors),
+    }
+
+
+async def _main(args) -> None:
+    print(f"/balance bursts, {args.latency_ms:.0f} ms per PostgREST request\n")
+    print(f"{'N':>5}  {'client':<9}{'seconds':>9}{'cmd/s':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    for n in args.users:
+        results = {}
+        for client, blocking in (("blocking", True), ("async", False)):
+            r = results[client] = await _balance_burst(n, args.latency_ms, blocking)
+            print(f"{n:>5}  {client:<9}{r['seconds']:>9.2f}{r['per_second']:>9.1f}"
+                  f"{r['p50_ms']:>9.1f}{r['p99_ms']:>9.1f}" + (f"  errors: {r['errors']}" if r["errors"] else ""))
+        print(f"{'':>5}  speedup {results['async']['per_second'] / results['blocking']['per_second']:.1f}x")
+
+
+def run() -> int:
+    p = argparse.ArgumentParser(prog="python -m bench.concurrency",
+                                description="N simultaneous /balance, blocking vs async client.")
+    p.add_argument("--users", type=int, nargs="+", default=[1, 10, 50, 100])
+    p.add_argument("--latency-ms", type=float, default=20.0, help="per PostgREST request")
+    args = p.parse_args()
+    logging.basicConfig(level=logging.WARNING)  # before main.py's INFO setup, which then does nothing
+    warnings.filterwarnings("ignore", category=PTBUserWarning)
+    asyncio.run(_main(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
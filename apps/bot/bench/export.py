@@ -0,0 +1,118 @@
+"""
+/exportar: peak RSS, throughput and event loop stalls from 1k to 1M rows.
+
+  cd apps/bot
+  python -m bench.export                             # 1k, 10k, 100k, 1M rows, CSV
+  python -m bench.export --rows 1000 1000000 --fmt jsonl --page-ms 20
+
+Each size runs export_expenses() in a fresh process, into a temporary file
+as /exportar does, so the peak RSS of one run doesn't hide the next.
+iter_expenses() is replaced by a pager that yields EXPENSE_PAGE_SIZE fresh
+rows per page after --page-ms, so the rows never exist all at once and RSS
+measures the export alone.
+
+Reported: rows, gzip size, seconds, rows per second, peak RSS, its growth
+over the process before the export, and the longest gap between 1 ms ticks
+of a task running alongside (the time the event loop was blocked). Objects
+allocated by imports are frozen first (gc.freeze), so a full collection of
+the bot's modules isn't counted against the export.
+"""
+
+import gc
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+from datetime import date, timedelta
+from typing import Dict, List
+
+from utils import export
+from utils.supabase_client import EXPENSE_PAGE_SIZE
+
+_CATEGORIES = ["Supermercado", "Delivery", "Servicios", "Transporte", "Salud", "Otros"]
+NAMES = {1: "Ana", 2: "Luis", 3: "Carla"}
+
+
+def _pager(total: int, page_ms: float):
+    rng = random.Random(total)
+    day = date(2000, 1, 1)
+    # One page of rows, copied with new ids for each page: cheap, so the
+    # event loop measures the export rather than the pager
+    template = [{"expense_date": (day + timedelta(days=i // 50)).isoformat(),
+                 "amount": round(rng.uniform(1, 500), 2), "category": rng.choice(_CATEGORIES),
+                 "type": "variable", "description": f"Compra número {i}", "store": None,
+                 "paid_by": rng.randint(1, 3), "shared_with": [1, 2, 3],
+                 "created_at": "2024-01-01T12:00:00+00:00"} for i in range(EXPENSE_PAGE_SIZE)]
+
+    async def iter_expenses(household_id, start, end, columns="*", page_size=None):
+        for first in range(0, total, EXPENSE_PAGE_SIZE):
+            await asyncio.sleep(page_ms / 1000)
+            for i, row in enumerate(template[:total - first], start=first + 1):
+                yield {**row, "id": i, "shared_with": list(row["shared_with"])}
+
+    return iter_expenses
+
+
+def _max_rss_mib() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+async def _child(rows: int, fmt: str, page_ms: float) -> Dict[str, float]:
+    export.iter_expenses = _pager(rows, page_ms)
+    gaps: List[float] = []
+    done = asyncio.Event()
+
+    async def ticker() -> None:
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    gc.freeze()  # a full collection of the bot's modules would otherwise count as a stall
+    before = _max_rss_mib()
+    tick = asyncio.create_task(ticker())
+    with tempfile.TemporaryFile() as tmp:
+        start = time.perf_counter()
+        count = await export.export_expenses(1, "2000-01-01", "2100-01-01", tmp, fmt=fmt, names=NAMES)
+        elapsed = time.perf_counter() - start
+        size = tmp.tell()
+    done.set()
+    await tick
+    peak = _max_rss_mib()
+    return {"rows": count, "mib": size / 2 ** 20, "seconds": elapsed, "per_second": count / elapsed,
+            "rss_mib": peak, "growth_mib": peak - before, "stall_ms": max(gaps) * 1000}
+
+
+def run() -> int:
+    p = argparse.ArgumentParser(prog="python -m bench.export",
+                                description="Export: peak RSS, throughput, event loop stalls.")
+    p.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    p.add_argument("--fmt", choices=export.FORMATS, default="csv")
+    p.add_argument("--page-ms", type=float, default=0.0, help="latency of one page")
+    p.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(asyncio.run(_child(args.child, args.fmt, args.page_ms))))
+        return 0
+
+    print(f"{args.fmt}, EXPENSE_PAGE_SIZE={EXPENSE_PAGE_SIZE}, {args.page_ms:.0f} ms per page\n")
+    print(f"{'rows':>9}{'gz MiB':>8}{'seconds':>9}{'rows/s':>9}{'RSS MiB':>9}{'growth':>8}{'stall ms':>10}")
+    for rows in args.rows:
+        out = subprocess.run([sys.executable, "-m", "bench.export", "--child", str(rows), "--fmt", args.fmt,
+                              "--page-ms", str(args.page_ms)], capture_output=True, text=True, check=True)
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{r['rows']:>9}{r['mib']:>8.1f}{r['seconds']:>9.2f}{r['per_second']:>9.0f}"
+              f"{r['rss_mib']:>9.1f}{r['growth_mib']:>8.1f}{r['stall_ms']:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
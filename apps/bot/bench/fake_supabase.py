@@ -0,0 +1,486 @@
+"""
+In-memory stand-in for the supabase-py AsyncClient.
+
+Implements the part of the query builder that utils/supabase_client.py uses
+(select with embeds, eq/neq/gt/gte/lt/lte/in_/is_/or_ filters, order,
+limit, insert/upsert/update/delete and the RPCs the bot calls) over plain
+dicts, so every helper runs unchanged without a database.
+
+Each execute() sleeps latency_ms (plus up to jitter_ms), which stands in for
+the PostgREST round trip, and is counted per command (see current_command)
+and per (table, op). With blocking=True the sleep holds the event loop, as
+the synchronous supabase-py client did before the helpers became async.
+
+The ledger tables (migration 010) are maintained on insert like the
+triggers do; with ledger=False they answer "table not found" and the
+helpers fall back to scanning expenses, as on a database without 010.
+Migration 017's triggers are played too: updating an expense sets its
+updated_at, and deleting one (or moving it to another household) records
+it in expense_deletions.
+"""
+
+import time
+import random
+import asyncio
+import functools
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from postgrest.exceptions import APIError
+
+# Label of the update being processed, set by the load generator; queries
+# made outside an update (write queue, notifier) are counted as "background".
+current_command: ContextVar[str] = ContextVar("current_command", default="background")
+
+# (from table, embedded table) → foreign key column on the from table
+_FOREIGN_KEYS = {
+    ("users", "households"): "active_household_id",
+    ("household_members", "users"): "user_id",
+    ("household_members", "households"): "household_id",
+    ("recurring_expenses", "users"): "paid_by",
+}
+_INDEXED = ("id", "telegram_id", "household_id", "user_id")
+_UNIQUE = {"expenses": "idempotency_key", "users": "telegram_id"}
+_LEDGER_TABLES = ("expense_ledger", "expense_ledger_categories")
+
+
+def _api_error(code: str, message: str) -> APIError:
+    return APIError({"code": code, "message": message, "hint": None, "details": None})
+
+
+def _now() -> str:
+    """NOW() as PostgREST returns it; fixed precision so that timestamps sort as text."""
+    return datetime.now(timezone.utc).isoformat(timespec="microseconds")
+
+
+def _coerce(value: Any, raw: Any) -> Any:
+    """Filter value as the type of the stored value (or_ filters arrive as text)."""
+    if isinstance(raw, str) and value is not None and not isinstance(value, str):
+        if isinstance(value, bool):
+            return raw == "true"
+        return type(value)(raw)
+    return raw
+
+
+_OPS: Dict[str, Callable[[Any, Any], bool]] = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "gt": lambda a, b: a is not None and a > b,
+    "gte": lambda a, b: a is not None and a >= b,
+    "lt": lambda a, b: a is not None and a < b,
+    "lte": lambda a, b: a is not None and a <= b,
+    "is": lambda a, b: a is b,
+    "in": lambda a, b: a in b,
+}
+
+
+def _split_top(text: str) -> List[str]:
+    """Split on commas outside parentheses."""
+    parts, depth, start = [], 0, 0
+    for i, ch in enumerate(text):
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _parse_logic(expr: str) -> Callable[[Dict], bool]:
+    """PostgREST logic tree: "a.eq.1,and(b.lt.2,c.gt.3)" (top level is OR).
+
+    Values may be double-quoted; commas inside quotes are not supported.
+    """
+    def node(term: str) -> Callable[[Dict], bool]:
+        for combinator, fn in (("and(", all), ("or(", any)):
+            if term.startswith(combinator):
+                children = [node(t) for t in _split_top(term[len(combinator):-1])]
+                return lambda row, c=children, f=fn: f(ch(row) for ch in c)
+        column, op, raw = term.split(".", 2)
+        if raw.startswith('"') and raw.endswith('"'):  # quoted value (timestamps)
+            raw = raw[1:-1]
+        test = _OPS[op]
+        return lambda row: test(row.get(column), _coerce(row.get(column), raw))
+
+    terms = [node(t) for t in _split_top(expr)]
+    return lambda row: any(t(row) for t in terms)
+
+
+class FakeDatabase:
+    """The tables, their indexes and the counters shared by every query."""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 ledger: bool = True, rng: Optional[random.Random] = None, blocking: bool = False):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.blocking = blocking
+        self.ledger = ledger
+        self.rng = rng or random.Random(0)
+        self.tables: Dict[str, List[Dict]] = defaultdict(list)
+        self._index: Dict[Tuple[str, str], Dict[Any, List[Dict]]] = defaultdict(lambda: defaultdict(list))
+        self._unique: Dict[str, Dict[Any, Dict]] = defaultdict(dict)
+        self._next_id: Dict[str, int] = defaultdict(lambda: 1)
+        self._ledger: Dict[Tuple, Dict] = {}  # (table, household, month, user/category) → row
+        self.round_trips: Counter = Counter()   # command → requests
+        self.requests: Counter = Counter()      # (table, op) → requests
+
+    # ------------------------------------------------------------------
+    # Rows
+    # ------------------------------------------------------------------
+    def add(self, table: str, row: Dict) -> Dict:
+        """Store a row (id and created_at filled in), bypassing the latency."""
+        if table in _LEDGER_TABLES:
+            raise ValueError("ledger rows are derived from expenses")
+        row = dict(row)
+        row.setdefault("id", self._next_id[table])
+        self._next_id[table] = max(self._next_id[table], row["id"] + 1)
+        row.setdefault("created_at", _now())
+        if table == "expenses":
+            row.setdefault("updated_at", row["created_at"])
+            row.setdefault("expense_date", date.today().isoformat())
+            row.setdefault("store", None)
+            row.setdefault("idempotency_key", None)
+        self.tables[table].append(row)
+        for column in _INDEXED:
+            if column in row:
+                self._index[(table, column)][row[column]].append(row)
+        unique = _UNIQUE.get(table)
+        if unique and row.get(unique) is not None:
+            self._unique[table][row[unique]] = row
+        if table == "expenses":
+            self._apply_ledger(row)
+        return row
+
+    def duplicate(self, table: str, row: Dict) -> bool:
+        unique = _UNIQUE.get(table)
+        return bool(unique and row.get(unique) is not None and row[unique] in self._unique[table])
+
+    def candidates(self, table: str, filters: List[Tuple[str, str, Any]]) -> Iterable[Dict]:
+        """Rows that can match: index buckets for an indexed eq/in filter, else all."""
+        for op, column, value in filters:
+            if op == "eq" and column in _INDEXED:
+                return self._index[(table, column)].get(value, ())
+            if op == "in" and column in _INDEXED:
+                index = self._index[(table, column)]
+                return [row for v in value for row in index.get(v, ())]
+        return self.tables[table]
+
+    def remove(self, table: str, row: Dict) -> None:
+        self.tables[table].remove(row)
+        for column in _INDEXED:
+            if column in row:
+                self._index[(table, column)][row[column]].remove(row)
+
+    def record_deletion(self, expense: Dict) -> None:
+        """expense_deletions row for an expense deleted or moved out of its household (migration 017)."""
+        table = "expense_deletions"
+        for old in [r for r in self.tables[table] if r["expense_id"] == expense["id"]]:
+            self.remove(table, old)
+        row = {"expense_id": expense["id"], "household_id": expense["household_id"], "deleted_at": _now()}
+        self.tables[table].append(row)
+        self._index[(table, "household_id")][row["household_id"]].append(row)
+
+    def reindex(self, table: str, row: Dict, before: Dict) -> None:
+        for column in _INDEXED:
+            if before.get(column) != row.get(column):
+                self._index[(table, column)][before.get(column)].remove(row)
+                self._index[(table, column)][row.get(column)].append(row)
+
+    def _apply_ledger(self, e: Dict) -> None:
+        """Same split as migration 010: leftover cents to the payer, then lowest ids."""
+        month = e["expense_date"][:7] + "-01"
+        hid = e["household_id"]
+        cents = int(round(float(e["amount"]) * 100))
+        shared = sorted(set(e.get("shared_with") or ()), key=lambda uid: (uid != e["paid_by"], uid))
+
+        user_row = functools.partial(self._ledger_row, "expense_ledger", hid, month, "user_id",
+                                     paid_cents=0, owed_cents=0)
+        user_row(e["paid_by"])["paid_cents"] += cents
+        for rn, uid in enumerate(shared, start=1):
+            user_row(uid)["owed_cents"] += cents // len(shared) + (1 if rn <= cents % len(shared) else 0)
+        cat = self._ledger_row("expense_ledger_categories", hid, month, "category", e["category"],
+                               total_cents=0, expense_count=0)
+        cat["total_cents"] += cents
+        cat["expense_count"] += 1
+
+    def _ledger_row(self, table: str, hid: int, month: str, column: str, value: Any, **zero) -> Dict:
+        key = (table, hid, month, value)
+        row = self._ledger.get(key)
+        if row is None:
+            row = self._ledger[key] = {"household_id": hid, "month": month, column: value, **zero}
+            self.tables[table].append(row)
+            self._index[(table, "household_id")][hid].append(row)
+        return row
+
+    # ------------------------------------------------------------------
+    # Embeds
+    # ------------------------------------------------------------------
+    def embed(self, table: str, row: Dict, target: str, columns: List[str]) -> Optional[Dict]:
+        fk = _FOREIGN_KEYS.get((table, target))
+        if fk is None:
+            raise _api_error("PGRST200", f"no relationship between {table} and {target}")
+        found = self._index[(target, "id")].get(row.get(fk))
+        if not found:
+            return None
+        return _project(found[0], columns)
+
+    # ------------------------------------------------------------------
+    # Round trips
+    # ------------------------------------------------------------------
+    async def round_trip(self, table: str, op: str) -> None:
+        self.round_trips[current_command.get()] += 1
+        self.requests[(table, op)] += 1
+        delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if self.blocking:
+            time.sleep(delay)
+        else:
+            await asyncio.sleep(delay)
+
+    def reset_counters(self) -> None:
+        self.round_trips.clear()
+        self.requests.clear()
+
+
+def _project(row: Dict, columns: List[str]) -> Dict:
+    if "*" in columns:
+        return dict(row)
+    return {c: row.get(c) for c in columns}
+
+
+def _parse_select(columns: str) -> Tuple[List[str], List[Tuple[str, str, List[str]]]]:
+    """Plain columns and (alias, table, columns) embeds of a select string."""
+    plain, embeds = [], []
+    for part in _split_top(columns):
+        if "(" in part:
+            head, inner = part[:-1].split("(", 1)
+            alias, _, target = head.rpartition(":")
+            target = target.split("!")[0]
+            embeds.append((alias or target, target, _split_top(inner) or ["*"]))
+        else:
+            plain.append(part)
+    return plain, embeds
+
+
+class FakeResponse:
+    def __init__(self, data: Any, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class FakeQuery:
+    """One request being built: chain filters, then await execute()."""
+
+    def __init__(self, db: FakeDatabase, table: str):
+        self._db = db
+        self._table = table
+        self._op = "select"
+        self._columns = "*"
+        self._filters: List[Tuple[str, str, Any]] = []
+        self._logic: List[Callable[[Dict], bool]] = []
+        self._order: List[Tuple[str, bool]] = []
+        self._limit: Optional[int] = None
+        self._payload: Any = None
+        self._on_conflict: Optional[str] = None
+        self._ignore_duplicates = False
+
+    # Same attributes utils/supabase_client._query_labels reads
+    @property
+    def request(self) -> SimpleNamespace:
+        method = {"select": "GET", "insert": "POST", "upsert": "POST",
+                  "update": "PATCH", "delete": "DELETE"}[self._op]
+        prefer = "resolution=ignore-duplicates" if self._op == "upsert" else ""
+        return SimpleNamespace(path=f"/rest/v1/{self._table}", http_method=method,
+                               headers={"prefer": prefer})
+
+    # --- operations ---
+    def select(self, columns: str = "*", count: Optional[str] = None) -> "FakeQuery":
+        self._columns = columns
+        return self
+
+    def insert(self, rows: Any, **_) -> "FakeQuery":
+        self._op, self._payload = "insert", rows
+        return self
+
+    def upsert(self, rows: Any, on_conflict: str = "", ignore_duplicates: bool = False, **_) -> "FakeQuery":
+        self._op, self._payload = "upsert", rows
+        self._on_conflict, self._ignore_duplicates = on_conflict, ignore_duplicates
+        return self
+
+    def update(self, values: Dict, **_) -> "FakeQuery":
+        self._op, self._payload = "update", values
+        return self
+
+    def delete(self, **_) -> "FakeQuery":
+        self._op = "delete"
+        return self
+
+    # --- filters ---
+    def _filter(self, op: str, column: str, value: Any) -> "FakeQuery":
+        self._filters.append((op, column, value))
+        return self
+
+    def eq(self, column, value): return self._filter("eq", column, value)
+    def neq(self, column, value): return self._filter("neq", column, value)
+    def gt(self, column, value): return self._filter("gt", column, value)
+    def gte(self, column, value): return self._filter("gte", column, value)
+    def lt(self, column, value): return self._filter("lt", column, value)
+    def lte(self, column, value): return self._filter("lte", column, value)
+    def is_(self, column, value): return self._filter("is", column, value)
+    def in_(self, column, values): return self._filter("in", column, set(values))
+
+    def or_(self, expr: str) -> "FakeQuery":
+        self._logic.append(_parse_logic(expr))
+        return self
+
+    def order(self, column: str, desc: bool = False, **_) -> "FakeQuery":
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, size: int, **_) -> "FakeQuery":
+        self._limit = size
+        return self
+
+    # --- execution ---
+    def _matches(self, row: Dict) -> bool:
+        for op, column, value in self._filters:
+            if not _OPS[op](row.get(column), value):
+                return False
+        return all(test(row) for test in self._logic)
+
+    async def execute(self) -> FakeResponse:
+        db = self._db
+        await db.round_trip(self._table, self._op)
+        if self._table in _LEDGER_TABLES and not db.ledger:
+            raise _api_error("PGRST205", f"Could not find the table 'public.{self._table}'")
+        if self._op in ("insert", "upsert"):
+            return FakeResponse(self._write())
+        rows = [row for row in db.candidates(self._table, self._filters) if self._matches(row)]
+        if self._op == "update":
+            for row in rows:
+                before = dict(row)
+                row.update(self._payload)
+                if self._table == "expenses":
+                    row["updated_at"] = _now()
+                    if row["household_id"] != before["household_id"]:
+                        db.record_deletion(before)
+                db.reindex(self._table, row, before)
+            return FakeResponse([dict(r) for r in rows])
+        if self._op == "delete":
+            for row in rows:
+                db.remove(self._table, row)
+                if self._table == "expenses":
+                    db.record_deletion(row)
+            return FakeResponse([dict(r) for r in rows])
+
+        for column, desc in reversed(self._order):
+            rows.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        plain, embeds = _parse_select(self._columns)
+        data = []
+        for row in rows:
+            out = _project(row, plain) if plain else {}
+            for alias, target, columns in embeds:
+                out[alias] = db.embed(self._table, row, target, columns)
+            data.append(out)
+        return FakeResponse(data)
+
+    def _write(self) -> List[Dict]:
+        db = self._db
+        rows = self._payload if isinstance(self._payload, list) else [self._payload]
+        written = []
+        for row in rows:
+            if db.duplicate(self._table, row):
+                if self._op == "upsert" and self._ignore_duplicates:
+                    continue
+                raise _api_error("23505", f"duplicate key value violates unique constraint on {self._table}")
+            if self._table == "auth_tokens":
+                row = {**row, "token": f"tok-{db._next_id[self._table]}"}
+            written.append(dict(db.add(self._table, row)))
+        return written
+
+
+class FakeRPC:
+    def __init__(self, db: FakeDatabase, fn: str, params: Dict):
+        self._db = db
+        self._fn = fn
+        self._params = params
+
+    @property
+    def request(self) -> SimpleNamespace:
+        return SimpleNamespace(path=f"/rest/v1/rpc/{self._fn}", http_method="POST", headers={})
+
+    async def execute(self) -> FakeResponse:
+        await self._db.round_trip(self._fn, "rpc")
+        handler = getattr(self, f"_rpc_{self._fn}", None)
+        if handler is None:
+            raise _api_error("PGRST202", f"Could not find the function public.{self._fn}")
+        return FakeResponse(handler(**self._params))
+
+    def _rpc_bot_session(self, p_telegram_id: int) -> Optional[Dict]:
+        db = self._db
+        users = db._index[("users", "telegram_id")].get(p_telegram_id)
+        if not users:
+            return None
+        user = users[0]
+        households = db._index[("households", "id")].get(user.get("active_household_id")) or [None]
+        household = households[0]
+        members = []
+        if household is not None:
+            ids = sorted(m["user_id"] for m in db._index[("household_members", "household_id")][household["id"]]
+                         if m.get("is_active"))
+            members = [dict(db._index[("users", "id")][uid][0]) for uid in ids]
+        return {"user": dict(user), "household": dict(household) if household else None, "members": members}
+
+    def _month_rows(self, p_household_id: int, p_start: str, p_end: str) -> List[Dict]:
+        return [e for e in self._db._index[("expenses", "household_id")].get(p_household_id, ())
+                if p_start <= e["expense_date"] < p_end]
+
+    def _rpc_household_category_totals(self, **params) -> List[Dict]:
+        totals: Dict[str, float] = defaultdict(float)
+        for e in self._month_rows(**params):
+            totals[e["category"]] += float(e["amount"])
+        return [{"category": c, "total": round(t, 2)} for c, t in totals.items()]
+
+    def _rpc_household_balance(self, **params) -> List[Dict]:
+        """Same split as migration 015 (and the ledger): distinct ids, integer cents."""
+        paid: Dict[int, int] = defaultdict(int)
+        owed: Dict[int, int] = defaultdict(int)
+        for e in self._month_rows(**params):
+            cents = int(round(float(e["amount"]) * 100))
+            shared = sorted(set(e["shared_with"] or ()), key=lambda uid: (uid != e["paid_by"], uid))
+            paid[e["paid_by"]] += cents
+            for rn, uid in enumerate(shared, start=1):
+                owed[uid] += cents // len(shared) + (1 if rn <= cents % len(shared) else 0)
+        return [{"user_id": uid, "credit": paid[uid] / 100, "owed": owed[uid] / 100,
+                 "net": (paid[uid] - owed[uid]) / 100} for uid in dict.fromkeys([*paid, *owed])]
+
+    def _rpc_recurring_advance(self, p_items: List[Dict]) -> int:
+        moved = 0
+        for item in p_items:
+            for row in self._db._index[("recurring_expenses", "id")].get(item["id"], ()):
+                if row["next_due_date"] < item["next_due_date"]:
+                    row["next_due_date"] = item["next_due_date"]
+                    if row.get("anchor_day") is None:
+                        row["anchor_day"] = item.get("anchor_day")
+                    moved += 1
+        return moved
+
+
+class FakeClient:
+    """Drop-in for the AsyncClient methods the helpers call: table() and rpc()."""
+
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self.db, name)
+
+    def rpc(self, fn: str, params: Optional[Dict] = None) -> FakeRPC:
+        return FakeRPC(self.db, fn, params or {})
@@ -0,0 +1,115 @@
+"""
+In-memory Bot API transport.
+
+FakeTelegramRequest replaces the HTTP transport of the Application's Bot
+(main.build_app(request=...)), so replies, edits and callback answers are
+answered locally instead of reaching api.telegram.org. Every call is
+counted per method and can be given a latency.
+
+It also plays Telegram's side of the two ways updates arrive (see
+bench/modes.py): push_update() queues an update for getUpdates, which
+long-polls like the real method, and wait_reply() resolves when the bot
+sends or edits a message in a chat. keyboards holds the last inline
+keyboard sent to each chat, which Telegram puts on a button tap's message.
+"""
+
+import json
+import time
+import asyncio
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "NuestrosGastos", "username": "NuestrosGastosBot"}
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Answers Bot API methods with minimal valid results."""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.calls: Counter = Counter()
+        self._message_id = 0
+        self._updates: List[Dict] = []
+        self._updates_ready = asyncio.Event()
+        self._replies: Dict[int, asyncio.Future] = {}
+        self.keyboards: Dict[int, Dict] = {}   # chat_id → last reply_markup sent
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] += 1
+        params = request_data.parameters if request_data else {}
+        if api_method == "getUpdates":
+            return 200, json.dumps({"ok": True, "result": await self._get_updates(params)}).encode()
+        if "reply_markup" in params:
+            markup = params["reply_markup"]
+            self.keyboards[params.get("chat_id")] = json.loads(markup) if isinstance(markup, str) else markup
+        if api_method in ("sendMessage", "editMessageText"):
+            waiter = self._replies.pop(params.get("chat_id"), None)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(time.perf_counter())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return 200, json.dumps({"ok": True, "result": self._result(api_method, params)}).encode()
+
+    # --- Telegram's side of the updates ---
+
+    def push_update(self, update: Dict) -> None:
+        """Queue an update (as JSON) for the next getUpdates."""
+        self._updates.append(update)
+        self._updates_ready.set()
+
+    def wait_reply(self, chat_id: int) -> "asyncio.Future[float]":
+        """Resolves with perf_counter() when the bot next messages chat_id."""
+        waiter = self._replies[chat_id] = asyncio.get_running_loop().create_future()
+        return waiter
+
+    def _result(self, api_method: str, params: dict):
+        if api_method == "getMe":
+            return {**BOT_USER, "can_join_groups": True, "can_read_all_group_messages": False,
+                    "supports_inline_queries": False}
+        if api_method in ("sendMessage", "sendDocument", "editMessageText", "editMessageReplyMarkup"):
+            if "message_id" in params:
+                message_id = params["message_id"]
+            else:
+                self._message_id += 1
+                message_id = self._message_id
+            return {"message_id": message_id, "date": int(time.time()), "from": BOT_USER,
+                    "chat": {"id": params.get("chat_id", 0), "type": "private"},
+                    "text": params.get("text", "")}
+        return True
+
+    async def _get_updates(self, params: dict) -> List[Dict]:
+        """Confirm updates below offset, then long-poll up to timeout seconds for new ones.
+
+        With a latency, the request takes half of it to reach Telegram and
+        the response the other half; updates that arrive while the response
+        travels wait for the next call.
+        """
+        if self.latency:
+            await asyncio.sleep(self.latency / 2)
+        offset = params.get("offset") or 0
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            self._updates_ready.clear()
+            try:
+                await asyncio.wait_for(self._updates_ready.wait(), params.get("timeout") or 0)
+            except asyncio.TimeoutError:
+                pass
+        batch = self._updates[:params.get("limit") or 100]
+        if self.latency:
+            await asyncio.sleep(self.latency / 2)
+        return batch
@@ -0,0 +1,167 @@
+"""
+Expense notifications: digests delivered, 429s and queue latency.
+
+  cd apps/bot
+  python -m bench.fanout                             # 100 households for 20 s
+  python -m bench.fanout --households 1000 --interval-s 30 --coalesce-s 5
+
+A Notifier runs against a fake Bot API that enforces Telegram's limits:
+at most --telegram-global messages per second overall and one per second
+per chat. Any message over a limit gets a 429 with retry_after, as
+Telegram answers. Households of 2 to 4 members register expenses for
+--seconds, each shared with the whole household: most of them one expense
+every --interval-s on average, a tenth of them bursts of 20 three times as
+far apart. Expenses enter through Notifier.on_expenses(), the listener
+every insert path calls.
+
+Each scenario reports:
+  - expenses queued and digests delivered;
+  - 429s answered and messages dropped;
+  - the mean time from an expense to the digest that carries it;
+  - the largest number of per-chat rate buckets held at once, next to the
+    number of chats notified.
+
+The default scenario keeps the notifier's rates under Telegram's. The
+"tight" one runs Telegram at a lower global limit than NOTIFY_GLOBAL_RATE,
+so sends hit 429s and are retried.
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from typing import Dict, List
+
+from telegram import Bot
+
+from bench.fake_supabase import FakeClient, FakeDatabase
+from bench.fake_telegram import FakeTelegramRequest
+from utils import notifier
+from utils import supabase_client as db
+from utils.notifier import Notifier
+
+
+class LimitedTelegram(FakeTelegramRequest):
+    """A fake Bot API that answers 429 over a global and a per-chat rate."""
+
+    def __init__(self, global_rate: float, latency_ms: float):
+        super().__init__(latency_ms=latency_ms)
+        self._global_rate = global_rate
+        self._sent: List[float] = []           # accepted sendMessage times, last second
+        self._last: Dict[int, float] = {}      # chat_id → last accepted sendMessage
+        self.too_many = 0
+        self.delivered = 0
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        if url.endswith("/sendMessage"):
+            now = time.monotonic()
+            chat_id = int(request_data.parameters["chat_id"])
+            self._sent = [t for t in self._sent if now - t < 1.0]
+            wait = max(self._last.get(chat_id, -1.0) + 1.0 - now,
+                       self._sent[0] + 1.0 - now if len(self._sent) >= self._global_rate else 0.0)
+            if wait > 0:
+                self.too_many += 1
+                return 429, json.dumps({"ok": False, "error_code": 429,
+                                        "description": "Too Many Requests: retry after 1",
+                                        "parameters": {"retry_after": 1}}).encode()
+            self._sent.append(now)
+            self._last[chat_id] = now
+            self.delivered += 1
+        return await super().do_request(url, method, request_data, **kwargs)
+
+
+def _households(n: int, rng: random.Random) -> List[List[int]]:
+    households, uid = [], 0
+    for _ in range(n):
+        size = rng.randint(2, 4)
+        households.append(list(range(uid + 1, uid + size + 1)))
+        uid += size
+    return households
+
+
+async def _scenario(telegram_global: float, args) -> Dict[str, float]:
+    rng = random.Random(args.seed)
+    households = _households(args.households, rng)
+    fake = FakeDatabase(latency_ms=args.db_ms)
+    for members in households:
+        for uid in members:
+            fake.add("users", {"id": uid, "telegram_id": 100000 + uid, "name": f"U{uid}"})
+    await db.init_client(FakeClient(fake))
+    telegram = LimitedTelegram(telegram_global, args.telegram_ms)
+    bot = Bot("1:bench", request=telegram, get_updates_request=FakeTelegramRequest())
+    await bot.initialize()
+
+    notifier.COALESCE_S = args.coalesce_s
+    notifier.GLOBAL_RATE = args.global_rate
+    sender = Notifier()
+    sender.start(bot)
+    peak_buckets = 0
+    chats = set()
+
+    async def household(members: List[int], bursty: bool) -> None:
+        end = time.monotonic() + args.seconds
+        while True:
+            wait = rng.expovariate(1 / (args.interval_s * 3 if bursty else args.interval_s))
+            if time.monotonic() + wait >= end:
+                break
+            await asyncio.sleep(wait)
+            payer = rng.choice(members)
+            rows = [{"paid_by": payer, "amount": rng.randint(100, 9000) / 100, "category": "Supermercado",
+                     "description": None, "shared_with": members} for _ in range(20 if bursty else 1)]
+            sender.on_expenses(rows)
+            chats.update(100000 + uid for uid in members if uid != payer)
+
+    async def sample() -> None:
+        nonlocal peak_buckets
+        while True:
+            peak_buckets = max(peak_buckets, len(sender._chats))
+            await asyncio.sleep(0.1)
+
+    sampler = asyncio.create_task(sample())
+    start = time.monotonic()
+    await asyncio.gather(*(household(m, n % 10 == 0) for n, m in enumerate(households)))
+    await sender.close()
+    elapsed = time.monotonic() - start
+    sampler.cancel()
+    await bot.shutdown()
+    await db.close_client()
+    stats = sender.stats()
+    return {"expenses": stats["expenses"], "delivered": telegram.delivered, "too_many": telegram.too_many,
+            "dropped": stats["dropped"], "latency_s": stats["avg_latency_s"], "seconds": elapsed,
+            "peak_buckets": peak_buckets, "chats": len(chats), "buckets_left": stats["chat_buckets"]}
+
+
+async def _main(args) -> None:
+    print(f"{args.households} households for {args.seconds:.0f} s; NOTIFY_COALESCE_S={args.coalesce_s:g}, "
+          f"NOTIFY_GLOBAL_RATE={args.global_rate:g}, NOTIFY_CHAT_RATE={notifier.CHAT_RATE:g}\n")
+    print(f"{'telegram':<10}{'expenses':>9}{'digests':>9}{'429s':>6}{'dropped':>9}{'latency s':>11}"
+          f"{'seconds':>9}{'buckets':>9}{'chats':>7}")
+    for name, limit in (("30/s", 30.0), ("tight", args.tight)):
+        r = await _scenario(limit, args)
+        print(f"{name:<10}{r['expenses']:>9}{r['delivered']:>9}{r['too_many']:>6}{r['dropped']:>9}"
+              f"{r['latency_s']:>11.2f}{r['seconds']:>9.1f}{r['peak_buckets']:>9}{r['chats']:>7}")
+
+
+def run() -> int:
+    p = argparse.ArgumentParser(prog="python -m bench.fanout",
+                                description="Expense notifications against a rate-limited fake Bot API.")
+    p.add_argument("--households", type=int, default=100)
+    p.add_argument("--interval-s", type=float, default=10.0, help="mean time between a household's expenses")
+    p.add_argument("--seconds", type=float, default=20.0, help="how long expenses keep arriving")
+    p.add_argument("--coalesce-s", type=float, default=2.0, help="NOTIFY_COALESCE_S for the run")
+    p.add_argument("--global-rate", type=float, default=25.0, help="NOTIFY_GLOBAL_RATE for the run")
+    p.add_argument("--tight", type=float, default=15.0, help="Telegram's global limit in the tight scenario")
+    p.add_argument("--telegram-ms", type=float, default=40.0, help="Bot API round trip")
+    p.add_argument("--db-ms", type=float, default=10.0, help="per PostgREST request")
+    p.add_argument("--seed", type=int, default=1)
+    args = p.parse_args()
+    logging.basicConfig(level=logging.ERROR)  # every 429 is logged as a warning
+    asyncio.run(_main(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,295 @@
+"""
+Synthetic load: seeded households, generated updates, and the report.
+
+seed() fills a FakeDatabase (or bench/sql_backend.SqlBenchDatabase) with
+households of 2–5 members and a month of expenses each; about one user in
+ten belongs to a second household.
+run_load() then replays a weighted mix of commands through the real
+Application (handlers, ConversationHandler, ChatOrderedUpdateProcessor):
+
+  gasto    /gasto <monto> <categoría> <descripción>, then "Confirmar"
+  balance  /balance
+  resumen  /resumen
+  espacio  /espacio
+  tendencia  /tendencia (not in the default mix)
+
+Users are split among `concurrency` workers, so each user's updates stay
+sequential (as in a real chat) while different users run concurrently.
+Each worker draws from its own seeded random stream, so a given seed sends
+the same updates every run. The /gasto confirmation is timed separately as "gasto:confirm".
+"""
+
+import json
+import time
+import random
+import asyncio
+import statistics
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import date
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from telegram import Update
+
+from bench.fake_supabase import FakeDatabase, current_command
+from utils.supabase_client import VALID_CATEGORIES
+
+BASELINE_DIR = Path(__file__).parent / "baselines"
+
+COMMANDS = ("gasto", "balance", "resumen", "espacio", "tendencia")
+DEFAULT_MIX = {"gasto": 40, "balance": 25, "resumen": 25, "espacio": 10}
+
+_CATEGORY_TOKENS = ["super", "Supermercado", "delivery", "servicios", "transporte",
+                    "salud", "entretenimiento", "otros", "suscrip", "mantenimiento"]
+_DESCRIPTIONS = ["", "Compras semanales", "Pizza", "Luz", "Taxi", "Farmacia", "Cine", "Gasolina"]
+
+
+# ---------------------------------------------------------------------------
+# Data
+# ---------------------------------------------------------------------------
+def seed(db: FakeDatabase, households: int, expenses_per_household: int,
+         rng: random.Random) -> List[Dict]:
+    """Create households, members and this month's expenses. Returns the users."""
+    today = date.today()
+    users: List[Dict] = []
+    for hid in range(1, households + 1):
+        size = rng.randint(2, 5)
+        members = []
+        for _ in range(size):
+            uid = len(users) + 1
+            user = db.add("users", {"id": uid, "telegram_id": 100_000 + uid, "name": f"Usuario{uid}",
+                                    "active_household_id": hid})
+            users.append(user)
+            members.append(uid)
+        db.add("households", {"id": hid, "name": f"Hogar {hid}", "created_by": members[0],
+                              "monthly_budget": 3000, "settings": {"split_method": "equal", "currency": "PEN"}})
+        for uid in members:
+            db.add("household_members", {"household_id": hid, "user_id": uid, "is_active": True,
+                                         "role": "admin" if uid == members[0] else "member"})
+        for _ in range(expenses_per_household):
+            paid_by = rng.choice(members)
+            category = rng.choice(VALID_CATEGORIES)
+            shared = sorted({paid_by, *rng.sample(members, rng.randint(1, len(members)))})
+            db.add("expenses", {
+                "household_id": hid, "paid_by": paid_by,
+                "amount": round(rng.uniform(5, 400), 2), "category": category,
+                "type": "variable", "description": rng.choice(_DESCRIPTIONS),
+                "shared_with": shared,
+                "expense_date": today.replace(day=rng.randint(1, today.day)).isoformat(),
+            })
+    # Some people share a second household (more rows for /espacio)
+    for user in rng.sample(users, len(users) // 10):
+        other = rng.randint(1, households)
+        if other != user["active_household_id"]:
+            db.add("household_members", {"household_id": other, "user_id": user["id"],
+                                         "is_active": True, "role": "member"})
+    return users
+
+
+class UpdateFactory:
+    """Builds Update objects as Telegram would send them."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._update_id = 0
+        self._message_id = 0
+
+    def _ids(self) -> Tuple[int, int]:
+        self._update_id += 1
+        self._message_id += 1
+        return self._update_id, self._message_id
+
+    def command(self, user: Dict, text: str) -> Update:
+        update_id, message_id = self._ids()
+        command = text.split()[0]
+        return Update.de_json({
+            "update_id": update_id,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": user["telegram_id"], "type": "private"},
+                "from": {"id": user["telegram_id"], "is_bot": False, "first_name": user["name"]},
+                "text": text,
+                "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+            },
+        }, self.bot)
+
+    def callback(self, user: Dict, data: str, reply_markup: Optional[Dict] = None) -> Update:
+        """A tap on a button of the message carrying reply_markup."""
+        update_id, message_id = self._ids()
+        sender = {"id": user["telegram_id"], "is_bot": False, "first_name": user["name"]}
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": user["telegram_id"], "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "NuestrosGastos"},
+            "text": "¿Quién más comparte este gasto?",
+        }
+        if reply_markup is not None:
+            message["reply_markup"] = reply_markup
+        return Update.de_json({
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": sender,
+                "chat_instance": str(user["telegram_id"]),
+                "data": data,
+                "message": message,
+            },
+        }, self.bot)
+
+
+# ---------------------------------------------------------------------------
+# Load
+# ---------------------------------------------------------------------------
+@asynccontextmanager
+async def bot_app(client: Any, request: Any, **build) -> AsyncIterator[Tuple[Any, List[str]]]:
+    """The bot's Application on client and request, started as in production.
+
+    Yields (app, handler errors). post_init/post_stop/post_shutdown run as
+    they do in main.py; extra keyword arguments go to main.build_app().
+    """
+    import main
+    from utils.supabase_client import init_client
+
+    app = main.build_app(request=request, **build)
+    errors: List[str] = []
+
+    async def on_error(update, context):
+        errors.append(repr(context.error))
+
+    app.add_error_handler(on_error)
+    await init_client(client)
+    await app.initialize()
+    await app.post_init(app)
+    try:
+        yield app, errors
+    finally:
+        await app.post_stop(app)
+        await app.post_shutdown(app)
+        await app.shutdown()
+
+
+async def run_load(app, db: FakeDatabase, users: List[Dict], updates: int, concurrency: int,
+                   mix: Dict[str, float], seed: int = 1) -> Dict:
+    """Send about `updates` updates through app and return the report."""
+    factory = UpdateFactory(app.bot)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    commands, weights = list(mix), list(mix.values())
+
+    async def process(update: Update, label: str) -> None:
+        token = current_command.set(label)
+        start = time.perf_counter()
+        try:
+            await app.update_processor.process_update(update, app.process_update(update))
+        finally:
+            latencies[label].append(time.perf_counter() - start)
+            current_command.reset(token)
+
+    async def worker(n: int) -> None:
+        # Own users, own random stream and own share of the updates: the
+        # sequence each worker sends doesn't depend on scheduling
+        own, rng, quota = users[n::concurrency], random.Random(f"{seed}:{n}"), updates // concurrency
+        while quota > 0 and own:
+            user = rng.choice(own)
+            command = rng.choices(commands, weights)[0]
+            if command == "gasto":
+                quota -= 2
+                amount = f"{rng.uniform(3, 300):.2f}".replace(".", rng.choice([".", ","]))
+                text = f"/gasto {amount} {rng.choice(_CATEGORY_TOKENS)} {rng.choice(_DESCRIPTIONS)}"
+                await process(factory.command(user, text.strip()), "gasto")
+                keyboard = getattr(app.bot.request, "keyboards", {}).get(user["telegram_id"])
+                await process(factory.callback(user, "confirm", keyboard), "gasto:confirm")
+            else:
+                quota -= 1
+                await process(factory.command(user, f"/{command}"), command)
+
+    db.reset_counters()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    report = {
+        "updates": sum(len(v) for v in latencies.values()),
+        "seconds": round(elapsed, 3),
+        "throughput": round(sum(len(v) for v in latencies.values()) / elapsed, 1),
+        "commands": {},
+    }
+    for label, values in sorted(latencies.items()):
+        values.sort()
+        report["commands"][label] = {
+            "n": len(values),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+            "mean_ms": round(statistics.fmean(values) * 1000, 2),
+            "round_trips": round(db.round_trips[label] / len(values), 2),
+        }
+    return report
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+# ---------------------------------------------------------------------------
+# Reports and baselines
+# ---------------------------------------------------------------------------
+def format_report(report: Dict) -> str:
+    lines = [
+        f"{report['updates']} updates in {report['seconds']}s — {report['throughput']} updates/s",
+        "",
+        f"{'command':<16}{'n':>7}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'round trips':>13}",
+    ]
+    for label, c in report["commands"].items():
+        lines.append(f"{label:<16}{c['n']:>7}{c['p50_ms']:>10.2f}{c['p99_ms']:>10.2f}"
+                     f"{c['mean_ms']:>10.2f}{c['round_trips']:>13.2f}")
+    for key in ("background_round_trips", "telegram_calls", "errors"):
+        if key in report:
+            lines.append(f"{key.replace('_', ' ')}: {report[key]}")
+    return "\n".join(lines)
+
+
+def save_baseline(report: Dict, name: str) -> Path:
+    BASELINE_DIR.mkdir(exist_ok=True)
+    path = BASELINE_DIR / f"{name}.json"
+    path.write_text(json.dumps(report, indent=2, sort_keys=True) + "\n")
+    return path
+
+
+def load_baseline(name: str) -> Optional[Dict]:
+    path = BASELINE_DIR / f"{name}.json"
+    return json.loads(path.read_text()) if path.exists() else None
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float = 0.2,
+            round_trip_tolerance: float = 0.05) -> Tuple[str, bool]:
+    """Table of changes against a baseline and whether anything regressed.
+
+    Latency and throughput regress when they are worse by more than
+    `tolerance` (a fraction). Round trips depend only on cache hits, so they
+    get a much smaller allowance.
+    """
+    regressed = False
+    lines = [f"{'':<16}{'p50 ms':>18}{'p99 ms':>18}{'round trips':>16}"]
+
+    def cell(now: float, before: float, limit: float) -> str:
+        nonlocal regressed
+        bad = now > before * (1 + limit) + 0.005
+        regressed |= bad
+        change = f"{(now - before) / before:+.0%}" if before else f"{now - before:+.2f}"
+        return f"{now:.2f} ({change}){'!' if bad else ''}"
+
+    for label, now in report["commands"].items():
+        before = baseline["commands"].get(label)
+        if before is None:
+            lines.append(f"{label:<16}  (not in baseline)")
+            continue
+        lines.append(f"{label:<16}{cell(now['p50_ms'], before['p50_ms'], tolerance):>18}"
+                     f"{cell(now['p99_ms'], before['p99_ms'], tolerance):>18}"
+                     f"{cell(now['round_trips'], before['round_trips'], round_trip_tolerance):>16}")
+    slower = report["throughput"] < baseline["throughput"] * (1 - tolerance)
+    regressed |= slower
+    lines.append(f"throughput: {report['throughput']} updates/s "
+                 f"(baseline {baseline['throughput']}){' !' if slower else ''}")
+    return "\n".join(lines), regressed
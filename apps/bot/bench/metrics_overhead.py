@@ -0,0 +1,143 @@
+"""
+Instrumentation overhead: what utils/metrics.py adds to every update.
+
+  cd apps/bot
+  python -m bench.metrics_overhead                   # 200k calls per case
+  python -m bench.metrics_overhead --calls 1000000 --round-trips 6
+
+Each case is timed over --calls calls, best of --repeat, and reported in
+nanoseconds per call:
+
+  observe      Histogram.observe on an existing label set
+  inc          Counter.inc
+  labels       _query_labels() of a postgrest select builder and of an rpc
+  execute      _execute() around a query whose execute() returns at once,
+               minus awaiting execute() directly
+  handler      track_round_trips() around a handler that returns at once,
+               minus awaiting the handler directly
+
+"per update" adds one handler and --round-trips executes: the cost the
+instrumentation puts on one update that queries the database that many
+times. Last, render() (GET /metrics) is timed with 13 handlers and 40
+table/operation pairs recorded, about what a running bot holds.
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+from typing import Callable, Dict
+
+from postgrest import AsyncPostgrestClient
+
+from utils import metrics
+from utils.metrics import Counter, Histogram
+from utils.supabase_client import _execute, _query_labels, track_round_trips
+
+_rest = AsyncPostgrestClient("http://127.0.0.1:1/rest/v1")
+
+
+class _Instant:
+    """A query builder whose request is real and whose execute() returns at once."""
+
+    def __init__(self, builder):
+        self.request = builder.request
+
+    async def execute(self):
+        return None
+
+
+async def _noop_handler(update, context):
+    return None
+
+
+def _best_ns(fn: Callable[[], None], calls: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best / calls * 1e9
+
+
+def _best_async_ns(make: Callable, calls: int, repeat: int) -> float:
+    async def loop():
+        best = float("inf")
+        for _ in range(repeat):
+            run = make()
+            start = time.perf_counter()
+            for _ in range(calls):
+                await run()
+            best = min(best, time.perf_counter() - start)
+        return best / calls * 1e9
+
+    return asyncio.run(loop())
+
+
+def _cases(calls: int, repeat: int) -> Dict[str, float]:
+    hist = Histogram("bench_seconds", "bench", ("table", "op"))
+    counter = Counter("bench_total", "bench", ("table", "op"))
+    hist.observe(0.01, "expenses", "select")
+    select = _rest.table("expenses").select("*").eq("household_id", 1).order("expense_date")
+    rpc = _rest.rpc("household_balance", {"p_household_id": 1})
+    query = _Instant(select)
+    wrapped = track_round_trips(_noop_handler)
+    r = {
+        "observe": _best_ns(lambda: [hist.observe(0.012, "expenses", "select") for _ in range(calls)],
+                            calls, repeat),
+        "inc": _best_ns(lambda: [counter.inc("expenses", "select") for _ in range(calls)], calls, repeat),
+        "labels select": _best_ns(lambda: [_query_labels(select) for _ in range(calls)], calls, repeat),
+        "labels rpc": _best_ns(lambda: [_query_labels(rpc) for _ in range(calls)], calls, repeat),
+    }
+    direct = _best_async_ns(lambda: query.execute, calls, repeat)
+    r["execute"] = _best_async_ns(lambda: lambda: _execute(query), calls, repeat) - direct
+    direct = _best_async_ns(lambda: lambda: _noop_handler(None, None), calls, repeat)
+    r["handler"] = _best_async_ns(lambda: lambda: wrapped(None, None), calls, repeat) - direct
+    return r
+
+
+def _render_ms(repeat: int) -> Dict[str, float]:
+    handlers = ["start_handler", "login_handler", "link_handler", "balance_handler", "espacio_handler",
+                "resumen_handler", "exportar_handler", "tendencia_handler", "gasto_handler",
+                "gasto_shared_step", "cancel_handler", "gasto_bulk_handler", "importar_handler"]
+    tables = ["users", "households", "household_members", "expenses", "recurring_expenses",
+              "automation_rules", "custom_subcategories", "expense_ledger", "bot_sessions", "invites"]
+    for h in handlers:
+        metrics.HANDLER_LATENCY.observe(0.02, h)
+        metrics.HANDLER_ROUND_TRIPS.observe(3, h)
+        metrics.HANDLER_ERRORS.inc(h)
+    for t in tables:
+        for op in ("select", "insert", "update", "upsert"):
+            metrics.QUERY_LATENCY.observe(0.01, t, op)
+            metrics.QUERY_ERRORS.inc(t, op)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = metrics.render()
+        best = min(best, time.perf_counter() - start)
+    return {"ms": best * 1000, "kib": len(text.encode()) / 1024, "lines": text.count("\n")}
+
+
+def run() -> int:
+    p = argparse.ArgumentParser(prog="python -m bench.metrics_overhead",
+                                description="Cost of the metrics instrumentation per call and per update.")
+    p.add_argument("--calls", type=int, default=200000)
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--round-trips", type=int, default=4, help="queries of the update in 'per update'")
+    args = p.parse_args()
+
+    r = _cases(args.calls, args.repeat)
+    print(f"best of {args.repeat} x {args.calls} calls\n")
+    print(f"{'case':<16}{'ns/call':>9}")
+    for name, ns in r.items():
+        print(f"{name:<16}{ns:>9.0f}")
+    per_update = r["handler"] + args.round_trips * r["execute"]
+    print(f"\nper update ({args.round_trips} round trips): {per_update / 1000:.1f} us")
+
+    rendered = _render_ms(args.repeat)
+    print(f"render(): {rendered['ms']:.2f} ms for {rendered['lines']} lines ({rendered['kib']:.1f} KiB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
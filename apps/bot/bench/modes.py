@@ -0,0 +1,181 @@
+"""
+Polling vs webhook: latency from Telegram receiving a message to the reply.
+
+  cd apps/bot
+  python -m bench.modes                              # 50 chats, 10 commands each
+  python -m bench.modes --chats 200 --telegram-ms 60 --db-ms 20
+
+Both modes run the bot as main.run() does, on the real Application and
+ChatOrderedUpdateProcessor, with bench/fake_supabase.py for the database
+and bench/fake_telegram.py for Telegram:
+
+  polling  the Updater long-polls getUpdates on the fake; an update queued
+           while a poll is waiting is returned to it at once.
+  webhook  PTB's webhook server listens on 127.0.0.1 and each update is
+           POSTed to it with the secret token, as Telegram does, over at
+           most 40 keep-alive connections (setWebhook's max_connections).
+
+--telegram-ms is the round trip to Telegram of any Bot API call; half of
+it is added on the way in (a getUpdates response, or a webhook POST).
+Every chat sends /balance, /resumen or /espacio and waits for the bot's
+reply before the next. Latency runs from the moment the update exists on
+Telegram's side to the moment Telegram receives the reply.
+"""
+
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import logging
+import argparse
+import warnings
+from typing import Dict, List
+
+from telegram.warnings import PTBUserWarning
+
+from bench.fake_supabase import FakeClient, FakeDatabase
+from bench.fake_telegram import FakeTelegramRequest
+from bench.load import UpdateFactory, bot_app, percentile, seed
+
+COMMANDS = ("/balance", "/resumen", "/espacio")
+SECRET = "bench-secret"
+WEBHOOK_CONNECTIONS = 40
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class WebhookSender:
+    """Telegram's side of a webhook: POSTs over a pool of keep-alive connections.
+
+    A bare HTTP/1.1 client on asyncio streams, so the sender costs the
+    process (which is also the bot) as little CPU as possible.
+    """
+
+    def __init__(self, port: int, path: str, connections: int):
+        self._port = port
+        self._head = (f"POST /{path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n"
+                      f"Content-Type: application/json\r\nX-Telegram-Bot-Api-Secret-Token: {SECRET}\r\n")
+        self._idle: asyncio.Queue = asyncio.Queue()
+        for _ in range(connections):
+            self._idle.put_nowait(None)  # opened on first use
+
+    async def post(self, update: Dict) -> None:
+        body = json.dumps(update).encode()
+        conn = await self._idle.get()
+        try:
+            if conn is None:
+                conn = await asyncio.open_connection("127.0.0.1", self._port)
+            reader, writer = conn
+            writer.write(f"{self._head}Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            status = (await reader.readline()).split()[1]
+            length = 0
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                name, _, value = line.decode().partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            if status != b"200":
+                raise RuntimeError(f"webhook answered {status.decode()}")
+        except BaseException:
+            if conn is not None:
+                conn[1].close()
+            conn = None
+            raise
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def close(self) -> None:
+        while not self._idle.empty():
+            conn = self._idle.get_nowait()
+            if conn is not None:
+                conn[1].close()
+
+
+async def _run_mode(mode: str, args) -> Dict[str, float]:
+    db = FakeDatabase(latency_ms=args.db_ms)
+    everyone = seed(db, args.chats, 40, random.Random(1))
+    senders = list({u["active_household_id"]: u for u in everyone}.values())[:args.chats]
+    telegram = FakeTelegramRequest(latency_ms=args.telegram_ms)
+
+    async with bot_app(FakeClient(db), telegram) as (app, errors):
+        if mode == "polling":
+            await app.updater.start_polling(poll_interval=0.0, timeout=10)
+        else:
+            port = _free_port()
+            await app.updater.start_webhook(listen="127.0.0.1", port=port, url_path="telegram",
+                                            webhook_url=f"http://127.0.0.1:{port}/telegram",
+                                            secret_token=SECRET)
+            sender = WebhookSender(port, "telegram", WEBHOOK_CONNECTIONS)
+        await app.start()
+
+        factory = UpdateFactory(app.bot)
+        latencies: List[float] = []
+
+        async def deliver(update: Dict) -> None:
+            if mode == "polling":
+                telegram.push_update(update)
+                return
+            await asyncio.sleep(args.telegram_ms / 2000)
+            await sender.post(update)
+
+        async def chat(user: Dict, rng: random.Random) -> None:
+            for _ in range(args.commands):
+                update = factory.command(user, rng.choice(COMMANDS)).to_dict()
+                reply = telegram.wait_reply(user["telegram_id"])
+                start = time.perf_counter()
+                await deliver(update)
+                latencies.append(await asyncio.wait_for(reply, 30) - start)
+
+        try:
+            start = time.perf_counter()
+            await asyncio.gather(*(chat(u, random.Random(n)) for n, u in enumerate(senders)))
+            elapsed = time.perf_counter() - start
+        finally:
+            if mode == "webhook":
+                await sender.close()
+            await app.updater.stop()
+            await app.stop()
+
+    latencies.sort()
+    return {
+        "updates": len(latencies),
+        "per_second": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "errors": len(errors),
+    }
+
+
+async def _main(args) -> None:
+    print(f"{args.chats} chats x {args.commands} commands; Telegram round trip {args.telegram_ms:.0f} ms, "
+          f"PostgREST {args.db_ms:.0f} ms\n")
+    print(f"{'mode':<9}{'updates':>8}{'upd/s':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    for mode in args.modes:
+        r = await _run_mode(mode, args)
+        print(f"{mode:<9}{r['updates']:>8}{r['per_second']:>9.1f}{r['p50_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+              + (f"  errors: {r['errors']}" if r["errors"] else ""))
+
+
+def run() -> int:
+    p = argparse.ArgumentParser(prog="python -m bench.modes",
+                                description="Update-to-reply latency, polling vs webhook.")
+    p.add_argument("--modes", nargs="+", choices=("polling", "webhook"), default=["polling", "webhook"])
+    p.add_argument("--chats", type=int, default=50)
+    p.add_argument("--commands", type=int, default=10, help="per chat, one after another")
+    p.add_argument("--telegram-ms", type=float, default=40.0, help="Bot API round trip")
+    p.add_argument("--db-ms", type=float, default=10.0, help="per PostgREST request")
+    args = p.parse_args()
+    logging.basicConfig(level=logging.WARNING)  # before main.py's INFO setup, which then does nothing
+    warnings.filterwarnings("ignore", category=PTBUserWarning)
+    asyncio.run(_main(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,131 @@
+"""
+/balance settlement: transfers and time of the exact search vs greedy.
+
+  cd apps/bot
+  python -m bench.settlement                     # n = 4, 8, 12, 14, 16, 24, 40
+  python -m bench.settlement --people 10 16 --groups 200
+
+For each group size n it draws `--groups` sets of balances in cents, built
+the way a shared trip produces them: a few sub-groups split their own
+expenses, so some subsets add up to zero. Each set is settled by
+
+  greedy     the pre-settlement.py /balance: first creditor with first debtor
+  heuristic  settlement._settle_heuristic (exact pairs, then largest ↔ largest)
+  settle     settlement.settle (exact DP up to EXACT_MAX_PEOPLE, else heuristic)
+
+and the mean number of transfers and the p50/max time of one call are
+reported. Last, the event loop is timed while /balance settles a group of
+EXACT_MAX_PEOPLE: longest gap between 1 ms ticks with settle() inline and
+with settle_async().
+"""
+
+import sys
+import time
+import random
+import asyncio
+import argparse
+from typing import Callable, Dict, List
+
+from bench.load import percentile
+from utils import settlement
+from utils.settlement import settle, settle_async
+
+
+def _balances(n: int, rng: random.Random) -> Dict[int, int]:
+    """Nets of n people after each of a few sub-groups split some expenses."""
+    net = {uid: 0 for uid in range(1, n + 1)}
+    people = list(net)
+    rng.shuffle(people)
+    while people:
+        k = rng.randint(2, 4)
+        group, people = people[:k], people[k:]
+        if len(group) < 2:  # one left over joins someone else's expenses
+            group.append(rng.choice([uid for uid in net if uid != group[0]]))
+        for _ in range(rng.randint(1, 5)):
+            cents = rng.randint(500, 40000)
+            payer = rng.choice(group)
+            net[payer] += cents
+            share, rem = divmod(cents, len(group))
+            for i, uid in enumerate(sorted(group, key=lambda u: (u != payer, u))):
+                net[uid] -= share + (1 if i < rem else 0)
+    return net
+
+
+def _greedy(balances: Dict[int, int]) -> List:
+    return settlement._settle_greedy([(uid, c) for uid, c in balances.items() if c])
+
+
+def _heuristic(balances: Dict[int, int]) -> List:
+    return settlement._settle_heuristic([(uid, c) for uid, c in sorted(balances.items()) if c])
+
+
+SOLVERS: Dict[str, Callable] = {"greedy": _greedy, "heuristic": _heuristic, "settle": settle}
+
+
+def _measure(n: int, groups: int, seed: int) -> Dict[str, Dict[str, float]]:
+    rng = random.Random(seed + n)
+    cases = [_balances(n, rng) for _ in range(groups)]
+    results = {}
+    for name, solve in SOLVERS.items():
+        counts, times = [], []
+        for balances in cases:
+            start = time.perf_counter()
+            transfers = solve(balances)
+            times.append(time.perf_counter() - start)
+            counts.append(len(transfers))
+        times.sort()
+        results[name] = {"transfers": sum(counts) / len(counts),
+                         "p50_ms": percentile(times, 0.50) * 1000, "max_ms": times[-1] * 1000}
+    return results
+
+
+async def _loop_stall(balances: Dict[int, int], offload: bool) -> float:
+    """Longest gap between 1 ms ticks while one settlement runs."""
+    gaps: List[float] = []
+    done = asyncio.Event()
+
+    async def ticker() -> None:
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    if offload:
+        await settle_async(balances)
+    else:
+        settle(balances)
+    await asyncio.sleep(0.01)
+    done.set()
+    await tick
+    return max(gaps) * 1000
+
+
+def run() -> int:
+    p = argparse.ArgumentParser(prog="python -m bench.settlement",
+                                description="Transfers and time: exact settlement vs greedy.")
+    p.add_argument("--people", type=int, nargs="+", default=[4, 8, 12, 14, 16, 24, 40])
+    p.add_argument("--groups", type=int, default=100, help="balance sets per size")
+    p.add_argument("--seed", type=int, default=1)
+    args = p.parse_args()
+
+    print(f"{args.groups} balance sets per size; EXACT_MAX_PEOPLE={settlement.EXACT_MAX_PEOPLE}, "
+          f"TIME_BUDGET_MS={settlement.TIME_BUDGET_MS:.0f}\n")
+    print(f"{'n':>4}  {'solver':<10}{'transfers':>10}{'p50 ms':>9}{'max ms':>9}")
+    for n in args.people:
+        for name, r in _measure(n, args.groups, args.seed).items():
+            print(f"{n:>4}  {name:<10}{r['transfers']:>10.2f}{r['p50_ms']:>9.2f}{r['max_ms']:>9.2f}")
+
+    n = settlement.EXACT_MAX_PEOPLE
+    balances = _balances(n, random.Random(args.seed))
+    inline = asyncio.run(_loop_stall(balances, offload=False))
+    offloaded = asyncio.run(_loop_stall(balances, offload=True))
+    print(f"\nevent loop, n={n}: longest tick gap {inline:.1f} ms inline, {offloaded:.1f} ms with settle_async")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,77 @@
+"""
+The benchmark's database on the SQL backend (STORAGE_BACKEND=sqlite/postgres).
+
+SqlBenchDatabase stands where bench/fake_supabase.FakeDatabase does for
+seed() and run_load(): add() buffers seeded rows, which load() writes with
+SqlClient.bulk_insert in one transaction, and its client counts requests per
+command (see current_command) exactly as the fake does, so reports from
+both backends compare round trip for round trip.
+
+There is no simulated latency: every request runs against the database.
+"""
+
+from collections import Counter, defaultdict
+from typing import Any, Dict, List
+
+from bench.fake_supabase import current_command
+from utils.sql_client import SqlClient
+
+
+class _Counted:
+    """A query builder whose execute() is counted; chained calls keep the wrapper."""
+
+    def __init__(self, inner: Any, round_trips: Counter):
+        self._inner = inner
+        self._round_trips = round_trips
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._inner, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return self if result is self._inner else result
+
+        return call
+
+    async def execute(self) -> Any:
+        self._round_trips[current_command.get()] += 1
+        return await self._inner.execute()
+
+
+class CountingClient:
+    """SqlClient's table() and rpc(), counted per command."""
+
+    def __init__(self, sql: SqlClient, round_trips: Counter):
+        self.sql = sql
+        self._round_trips = round_trips
+
+    def table(self, name: str) -> _Counted:
+        return _Counted(self.sql.table(name), self._round_trips)
+
+    def rpc(self, fn: str, params: Dict = None) -> _Counted:
+        return _Counted(self.sql.rpc(fn, params), self._round_trips)
+
+
+class SqlBenchDatabase:
+    """Seed buffer and per-command counters over a SqlClient."""
+
+    def __init__(self, sql: SqlClient):
+        self.sql = sql
+        self.round_trips: Counter = Counter()
+        self.client = CountingClient(sql, self.round_trips)
+        self._rows: Dict[str, List[Dict]] = defaultdict(list)
+
+    def add(self, table: str, row: Dict) -> Dict:
+        """Buffer a row for load(); ids are whatever seed() passes."""
+        row = dict(row)
+        self._rows[table].append(row)
+        return row
+
+    async def load(self) -> None:
+        await self.sql.bulk_insert(dict(self._rows))
+        self._rows.clear()
+
+    def reset_counters(self) -> None:
+        self.round_trips.clear()
@@ -0,0 +1,143 @@
+"""
+The expense write queue: confirm latency, round trips and partial failures.
+
+  cd apps/bot
+  python -m bench.write_queue                        # 500 confirms from 50 users
+  python -m bench.write_queue --confirms 2000 --users 200 --latency-ms 40
+
+Throughput (fake Supabase with --latency-ms per request): every user
+confirms expenses one after another, all users at once. "direct" awaits
+insert_expenses() for each confirm, as /gasto did before the queue;
+"queued" enqueues the row and answers, and the queue writes in batches.
+Reported: p50/p99 of one confirm, seconds until every row is stored, and
+inserts sent to the database.
+
+Failures (SQLite backend, so constraints are real): one flush of
+WRITE_BATCH_SIZE rows of which some name a user that doesn't exist (a
+foreign-key violation, as a stale id would). Reported: rows stored, rows
+dropped and reported to their chat, and inserts sent.
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+from typing import Dict, List
+
+from bench import SCRATCH
+from bench.fake_supabase import FakeClient, FakeDatabase
+from bench.load import percentile
+from bench.sql_backend import SqlBenchDatabase
+from utils import supabase_client as db
+from utils import write_queue
+from utils.sql_client import create_sql_client
+from utils.write_queue import ExpenseWriteQueue
+
+
+class _Bot:
+    """Counts the failure reports the queue sends."""
+
+    def __init__(self):
+        self.reported = 0
+
+    async def send_message(self, chat_id: int, text: str) -> None:
+        self.reported += 1
+
+
+def _payload(n: int, user: int, household: int) -> Dict:
+    return db.expense_payload(household, user, 10 + n % 90, "Supermercado", f"gasto {n}", [user],
+                              idempotency_key=f"bench:{n}")
+
+
+async def _throughput(mode: str, args) -> Dict[str, float]:
+    fake = FakeDatabase(latency_ms=args.latency_ms)
+    for uid in range(1, args.users + 1):
+        fake.add("users", {"id": uid, "telegram_id": 1000 + uid, "name": f"U{uid}"})
+        fake.add("households", {"id": uid, "name": f"H{uid}", "created_by": uid})
+    await db.init_client(FakeClient(fake))
+    queue = ExpenseWriteQueue()
+    queue.start()
+    latencies: List[float] = []
+
+    async def user(uid: int) -> None:
+        for n in range(uid, args.confirms + 1, args.users):
+            start = time.perf_counter()
+            if mode == "direct":
+                await db.insert_expenses([_payload(n, uid, uid)])
+            else:
+                queue.enqueue(_payload(n, uid, uid), chat_id=1000 + uid)
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0)
+
+    fake.reset_counters()
+    start = time.perf_counter()
+    await asyncio.gather(*(user(uid) for uid in range(1, args.users + 1)))
+    await queue.close()
+    elapsed = time.perf_counter() - start
+    await db.close_client()
+    latencies.sort()
+    return {
+        "stored": len(fake.tables["expenses"]),
+        "seconds": elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "inserts": sum(fake.round_trips.values()),
+    }
+
+
+async def _partial_failure(bad: int) -> Dict[str, int]:
+    os.environ["SQLITE_PATH"] = os.path.join(SCRATCH, f"write-queue-{bad}.sqlite3")
+    store = SqlBenchDatabase(await create_sql_client("sqlite"))
+    store.add("users", {"id": 1, "telegram_id": 1001, "name": "Ana"})
+    store.add("households", {"id": 1, "name": "Casa", "created_by": 1})
+    await store.load()
+    await db.init_client(store.client)
+    bot = _Bot()
+    queue = ExpenseWriteQueue()
+    queue.start(bot)
+    rows = write_queue.BATCH_SIZE
+    stale = set(random.Random(bad).sample(range(rows), bad))
+    store.reset_counters()
+    for n in range(rows):
+        queue.enqueue(_payload(n, 999 if n in stale else 1, 1), chat_id=1001)
+    await queue.close()
+    stored = await store.sql.table("expenses").select("id").execute()  # not counted
+    await db.close_client()
+    await store.sql.close()
+    return {"rows": rows, "stored": len(stored.data), "dropped": queue.failed, "reported": bot.reported,
+            "inserts": sum(store.round_trips.values())}
+
+
+async def _main(args) -> None:
+    print(f"{args.confirms} confirms from {args.users} users, {args.latency_ms:.0f} ms per PostgREST request, "
+          f"WRITE_BATCH_SIZE={write_queue.BATCH_SIZE}, WRITE_FLUSH_MS={write_queue.FLUSH_MS:.0f}\n")
+    print(f"{'mode':<8}{'stored':>8}{'seconds':>9}{'p50 ms':>9}{'p99 ms':>9}{'inserts':>9}")
+    for mode in ("direct", "queued"):
+        r = await _throughput(mode, args)
+        print(f"{mode:<8}{r['stored']:>8}{r['seconds']:>9.2f}{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['inserts']:>9}")
+
+    print("\none flush on SQLite with rows naming a missing user\n")
+    print(f"{'bad':>4}{'rows':>6}{'stored':>8}{'dropped':>9}{'reported':>10}{'inserts':>9}")
+    for bad in args.bad:
+        r = await _partial_failure(bad)
+        print(f"{bad:>4}{r['rows']:>6}{r['stored']:>8}{r['dropped']:>9}{r['reported']:>10}{r['inserts']:>9}")
+
+
+def run() -> int:
+    p = argparse.ArgumentParser(prog="python -m bench.write_queue",
+                                description="Write queue: confirm latency, round trips, partial failures.")
+    p.add_argument("--confirms", type=int, default=500)
+    p.add_argument("--users", type=int, default=50)
+    p.add_argument("--latency-ms", type=float, default=20.0, help="per PostgREST request")
+    p.add_argument("--bad", type=int, nargs="+", default=[0, 1, 5], help="bad rows in the failing flush")
+    args = p.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)  # the queue logs every dropped row
+    asyncio.run(_main(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
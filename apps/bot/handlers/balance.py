@@ -2,10 +2,17 @@
 /balance handler — shows who owes whom this month.
 
 Algorithm:
-  1. Fetch all expenses for the active household in the current month.
-  2. Compute net balance per user (credit from paying minus share owed).
-  3. Use greedy settlement to produce the minimal set of "X debe a Y" lines.
-     (Optimal in transaction count; trivially one line for 2-person households.)
+  1. Build the MonthlySnapshot for the active household and current month
+     (one fetch, shared with /resumen).
+  2. Take its net balance per user (credit from paying minus share owed).
+  3. Turn the nets into the fewest "X debe a Y" lines (utils/settlement.py:
+     exact for small groups, fast heuristic for big temporary households;
+     large groups are settled off the event loop).
+
+/balance 2025 does the same for a whole year from one range read
+(supabase_client.get_member_totals_by_month: the ledger, else the year's
+expenses through utils/columnar.py's paid/owed kernels), then lists each
+month's nets.
 """
 
 import logging
@@ -13,32 +20,45 @@ from datetime import datetime
 from telegram import Update
 from telegram.ext import ContextTypes
 from utils.supabase_client import (
-    get_user_by_telegram_id,
-    get_active_household,
-    get_household_members,
-    get_monthly_balance,
+    resolve_session,
+    get_member_totals_by_month,
+    get_monthly_snapshot,
 )
+from utils.settlement import settle_async
 
 logger = logging.getLogger(__name__)
 
 
 async def balance_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Query monthly balance and send formatted message."""
-    db_user = get_user_by_telegram_id(update.effective_user.id)
+    """Query monthly balance (a year's with /balance <año>) and send formatted message."""
+    now = datetime.now()
+    year = None
+    if context.args:
+        try:
+            year = int(context.args[0])
+            if not 2000 <= year <= now.year:
+                raise ValueError
+        except ValueError:
+            await update.effective_message.reply_text(f"Uso: /balance [año]  (p. ej. /balance {now.year})")
+            return
+
+    db_user, household, members = await resolve_session(update.effective_user.id)
     if not db_user:
         await update.effective_message.reply_text("No encontré tu cuenta. Usa /start primero.")
         return
 
-    household = get_active_household(db_user["id"])
     if not household:
         await update.effective_message.reply_text("No tienes un hogar activo. Usa /espacio.")
         return
 
-    now = datetime.now()
-    balances = get_monthly_balance(household["id"], now.year, now.month)
-
-    members = get_household_members(household["id"])
     name_map = {m["id"]: m["name"] for m in members}
+    if year is not None:
+        await update.effective_message.reply_text(await _year_balance(household["id"], year, name_map))
+        return
+
+    snapshot = await get_monthly_snapshot(household["id"], now.year, now.month)
+    balances = snapshot.balances()
+    net_cents = snapshot.net_cents()
 
     # --- Header ---
     month_name = now.strftime("%B").capitalize()
@@ -49,10 +69,8 @@ async def balance_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         sign = "+" if net >= 0 else ""
         lines.append(f"  {name_map.get(uid, '?')}: S/ {sign}{net:.2f}")
 
-    # --- Debt lines via greedy settlement ---
-    creditors = {uid: net for uid, net in balances.items() if net > 0}
-    debtors = {uid: -net for uid, net in balances.items() if net < 0}
-    debt_lines = _settle(creditors, debtors, name_map)
+    # --- Debt lines via minimum-transfer settlement ---
+    debt_lines = await _settle(net_cents, name_map)
 
     if debt_lines:
         lines.append("")
@@ -63,29 +81,46 @@ async def balance_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await update.effective_message.reply_text("\n".join(lines))
 
 
-def _settle(creditors: dict, debtors: dict, name_map: dict) -> list:
-    """Greedy settlement: produce human-readable debt lines.
+async def _year_balance(household_id: int, year: int, name_map: dict) -> str:
+    """The year's net per person and debt lines, then each month's nets."""
+    totals = await get_member_totals_by_month(household_id, f"{year}-01-01", f"{year + 1}-01-01")
+    if not totals:
+        return f"Sin gastos en {year}."
+
+    net_cents: dict = {}
+    by_month: dict = {}
+    for (month, uid), (paid, owed) in totals.items():
+        net_cents[uid] = net_cents.get(uid, 0) + paid - owed
+        by_month.setdefault(month, {})[uid] = paid - owed
+
+    lines = [f"Balance de {year}:", ""]
+    for uid, cents in sorted(net_cents.items(), key=lambda x: -x[1]):
+        sign = "+" if cents >= 0 else ""
+        lines.append(f"  {name_map.get(uid, '?')}: S/ {sign}{cents / 100:.2f}")
+
+    debt_lines = await _settle(net_cents, name_map)
+    if debt_lines:
+        lines.append("")
+        lines.extend(debt_lines)
+    else:
+        lines.append("\nTodos están al par.")
+
+    lines.append("")
+    lines.append("Por mes:")
+    for month, nets in sorted(by_month.items()):
+        parts = [f"{name_map.get(uid, '?')} {cents / 100:+.2f}"
+                 for uid, cents in sorted(nets.items(), key=lambda x: -x[1]) if cents]
+        lines.append(f"  {month[:7]}  {', '.join(parts) or 'al par'}")
+    return "\n".join(lines)
+
 
-    Iterates creditors and debtors, matching the smallest available amounts
-    until all debts are settled. Produces the minimum number of transfers.
+async def _settle(net_cents: dict, name_map: dict) -> list:
+    """Produce human-readable debt lines from per-user nets in cents.
 
     Returns:
         List of strings like "  Pamela debe S/ 175.00 a Andrea"
     """
-    lines = []
-    c = dict(creditors)  # copy — we mutate
-    d = dict(debtors)
-    while c and d:
-        c_id = next(iter(c))
-        d_id = next(iter(d))
-        amount = min(c[c_id], d[d_id])
-        lines.append(
-            f"  {name_map.get(d_id, '?')} debe S/ {amount:.2f} a {name_map.get(c_id, '?')}"
-        )
-        c[c_id] = round(c[c_id] - amount, 2)
-        d[d_id] = round(d[d_id] - amount, 2)
-        if c[c_id] == 0:
-            del c[c_id]
-        if d[d_id] == 0:
-            del d[d_id]
-    return lines
+    return [
+        f"  {name_map.get(d_id, '?')} debe S/ {cents / 100:.2f} a {name_map.get(c_id, '?')}"
+        for d_id, c_id, cents in await settle_async(net_cents)
+    ]
@@ -9,9 +9,11 @@ import logging
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
 from utils.supabase_client import (
-    get_user_by_telegram_id,
+    resolve_user_household,
     get_user_households,
+    get_household,
     set_active_household,
+    invalidate_user_cache,
 )
 
 logger = logging.getLogger(__name__)
@@ -19,12 +21,12 @@ logger = logging.getLogger(__name__)
 
 async def espacio_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """List user's households as an InlineKeyboard."""
-    db_user = get_user_by_telegram_id(update.effective_user.id)
+    db_user, _ = await resolve_user_household(update.effective_user.id)
     if not db_user:
         await update.effective_message.reply_text("No encontré tu cuenta. Usa /start primero.")
         return
 
-    households = get_user_households(db_user["id"])
+    households = await get_user_households(db_user["id"])
     if not households:
         await update.effective_message.reply_text(
             "No perteneces a ningún hogar. Alguien debe agregarte."
@@ -49,13 +51,13 @@ async def espacio_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     await query.answer()
 
     household_id = int(query.data.split(":")[1])
-    db_user = get_user_by_telegram_id(update.effective_user.id)
-    set_active_household(db_user["id"], household_id)
+    db_user, _ = await resolve_user_household(update.effective_user.id)
+    await set_active_household(db_user["id"], household_id)
+    invalidate_user_cache(telegram_id=update.effective_user.id)
 
     # Fetch the household name for a nicer confirmation
-    from utils.supabase_client import get_client
-    resp = get_client().table("households").select("name").eq("id", household_id).execute()
-    name = resp.data[0]["name"] if resp.data else str(household_id)
+    household = await get_household(household_id)
+    name = household["name"] if household else str(household_id)
 
     await query.edit_message_text(f"Hogar activo cambiado a: {name}")
     logger.info(f"User {db_user['id']} switched to household {household_id}")
@@ -0,0 +1,93 @@
+"""
+/exportar handler — download the active household's expenses as a file.
+
+Usage:
+  /exportar                         all expenses, gzip CSV
+  /exportar jsonl                   all expenses, gzip JSONL
+  /exportar csv 2024-01 2024-06     January through June 2024
+  /exportar csv 2024-01-15          from 15 January 2024 on
+
+The file is written to a temporary file on disk by utils/export.py, which
+streams the rows page by page, and then sent as a document.
+"""
+
+import logging
+import tempfile
+from datetime import date, timedelta
+from typing import Tuple
+from telegram import Update
+from telegram.ext import ContextTypes
+from utils.supabase_client import resolve_session
+from utils.export import FORMATS, export_expenses
+
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024  # Bot API upload limit
+
+USAGE = (
+    "Uso: /exportar [csv|jsonl] [desde] [hasta]\n"
+    "Fechas como AAAA-MM o AAAA-MM-DD (hasta incluido).\n"
+    "Ejemplo: /exportar csv 2024-01 2024-06"
+)
+
+
+async def exportar_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Stream the household's expenses into a gzip file and send it."""
+    args = list(context.args or [])
+    fmt = args.pop(0).lower() if args and args[0].lower() in FORMATS else "csv"
+    try:
+        start, end = _parse_range(args)
+    except ValueError:
+        await update.effective_message.reply_text(USAGE)
+        return
+
+    db_user, household, members = await resolve_session(update.effective_user.id)
+    if not db_user:
+        await update.effective_message.reply_text("No encontré tu cuenta. Usa /start primero.")
+        return
+
+    if not household:
+        await update.effective_message.reply_text("No tienes un hogar activo. Usa /espacio.")
+        return
+
+    names = {m["id"]: m["name"] for m in members}
+    with tempfile.TemporaryFile() as tmp:
+        count = await export_expenses(household["id"], start, end, tmp, fmt=fmt, names=names)
+        if not count:
+            await update.effective_message.reply_text("No hay gastos en ese período.")
+            return
+        if tmp.tell() > MAX_UPLOAD_BYTES:
+            await update.effective_message.reply_text(
+                "El archivo supera los 50 MB que permite Telegram. Elige un período más corto."
+            )
+            return
+        tmp.seek(0)
+        await update.effective_message.reply_document(
+            document=tmp,
+            filename=f"gastos_{household['id']}_{start}_{end}.{fmt}.gz",
+            caption=f"{count} gastos de {household['name']}",
+        )
+    logger.info(f"User {db_user['id']} exported {count} expenses as {fmt}")
+
+
+def _parse_range(args) -> Tuple[str, str]:
+    """[desde] [hasta] → half-open (start, end) ISO dates. Raises ValueError."""
+    if len(args) > 2:
+        raise ValueError("too many arguments")
+    start = _parse_bound(args[0], end=False) if args else date(1970, 1, 1)
+    end = _parse_bound(args[1], end=True) if len(args) > 1 else date.today() + timedelta(days=1)
+    if end <= start:
+        raise ValueError("empty range")
+    return start.isoformat(), end.isoformat()
+
+
+def _parse_bound(raw: str, end: bool) -> date:
+    """AAAA-MM or AAAA-MM-DD; an end bound is inclusive, so return the day after it."""
+    parts = raw.split("-")
+    if len(parts) == 2:
+        day = date(int(parts[0]), int(parts[1]), 1)
+        if not end:
+            return day
+        return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    day = date.fromisoformat(raw)
+    return day + timedelta(days=1) if end else day
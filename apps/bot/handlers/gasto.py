@@ -3,32 +3,53 @@
 
 Flow:
   1. User sends: /gasto 350 Supermercado Compras semanales
-     Bot validates amount (numeric, positive) and category (case-insensitive).
-     If valid, stores the pending expense in context.user_data and shows
-     the member picker (Step 2).
+     Bot validates amount (numeric, positive) and resolves the category
+     (utils/categories.py: accents and case ignored, "super" works, and the
+     household's custom subcategories are accepted).
+     If valid, stores the pending expense in the pending store
+     (utils/pending_store.py) and shows the member picker (Step 2).
 
   2. Bot replies with an InlineKeyboard: one toggle button per OTHER household
      member (paid_by is always included automatically). A "Confirmar" button
      finishes the selection.
 
   3. User taps "Confirmar".
-     Bot reads the final shared_with list, inserts the expense (type auto-filled
-     from the category map), sends a confirmation, and ends the conversation.
+     Bot reads the final shared_with list, queues the expense for insertion
+     (utils/write_queue.py), sends a confirmation, and ends the conversation.
+     The expense carries an idempotency key derived from the /gasto message,
+     so a double tap or a redelivered update never inserts it twice.
 
   /cancelar at any point aborts the flow.
+
+If the household has an automation rule for the category (utils/automation.py),
+its members are pre-selected in Step 2, or Steps 2–3 are skipped and the
+expense is registered right away.
+
+A /gasto message with several lines is a bulk entry instead (one expense per
+line, no member picker) and is handled by handlers/importar.py.
+
+The pending expense lives in the pending store rather than context.user_data,
+so abandoned flows expire and in-flight ones survive a restart. main.py also
+registers gasto_shared_step and cancel_handler outside the ConversationHandler
+so taps on a keyboard sent before a restart still work.
 """
 
 import logging
-from typing import List, Dict
+from typing import Dict, Tuple
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes, ConversationHandler
 from utils.supabase_client import (
-    get_user_by_telegram_id,
-    get_active_household,
-    get_household_members,
-    insert_expense,
+    resolve_session,
+    resolve_user_household,
+    get_users_by_ids,
+    expense_payload,
     VALID_CATEGORIES,
 )
+from utils.pending_store import PendingExpense, get_pending_store
+from utils.write_queue import get_write_queue
+from utils.automation import get_household_rules
+from utils.categories import get_category_index
+from handlers.importar import gasto_bulk_handler
 
 logger = logging.getLogger(__name__)
 
@@ -42,6 +63,10 @@ DONE = ConversationHandler.END
 # ---------------------------------------------------------------------------
 async def gasto_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Parse /gasto arguments, validate, store pending expense, show picker."""
+    if "\n" in (update.effective_message.text or "").strip():
+        await gasto_bulk_handler(update, context)
+        return ConversationHandler.END
+
     args = context.args or []
 
     if len(args) < 2:
@@ -61,53 +86,59 @@ async def gasto_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         await update.effective_message.reply_text("El monto debe ser un número positivo (ej: 350 o 42,50).")
         return ConversationHandler.END
 
-    # --- Validate category (case-insensitive, store canonical form) ---
-    raw_category = args[1]
-    category: str | None = None
-    for valid in VALID_CATEGORIES:
-        if valid.lower() == raw_category.lower():
-            category = valid
-            break
-    if category is None:
-        await update.effective_message.reply_text(
-            f"Categoría no válida: '{raw_category}'.\n"
-            f"Categorías disponibles: {', '.join(VALID_CATEGORIES)}"
-        )
-        return ConversationHandler.END
-
-    description = " ".join(args[2:]) if len(args) > 2 else ""
-
     # --- Resolve current user and household ---
-    db_user = get_user_by_telegram_id(update.effective_user.id)
+    db_user, household, members = await resolve_session(update.effective_user.id)
     if not db_user:
         await update.effective_message.reply_text("No encontré tu cuenta. Usa /start primero.")
         return ConversationHandler.END
 
-    household = get_active_household(db_user["id"])
     if not household:
         await update.effective_message.reply_text(
             "No tienes un hogar activo. Usa /espacio para configurar uno."
         )
         return ConversationHandler.END
 
-    # --- Store pending expense in user_data (persists across steps) ---
-    context.user_data["pending_expense"] = {
-        "amount": amount,
-        "category": category,
-        "description": description,
-        "household_id": household["id"],
-        "paid_by": db_user["id"],
-    }
-    # selected is the set of OTHER members chosen to share; paid_by added at confirm
-    context.user_data["pending_shared"] = set()
+    # --- Resolve category (household index: accents, prefixes, custom ones) ---
+    index = await get_category_index(household["id"])
+    category, used = index.resolve_tokens(args[1:])
+    if category is None:
+        suggestions = index.suggest(args[1])
+        hint = f"¿Quisiste decir: {', '.join(suggestions)}?" if suggestions else (
+            f"Categorías disponibles: {', '.join(index.names)}"
+        )
+        await update.effective_message.reply_text(f"Categoría no válida: '{args[1]}'.\n{hint}")
+        return ConversationHandler.END
 
-    # --- Build member picker (exclude paid_by) ---
-    members = get_household_members(household["id"])
-    others = [m for m in members if m["id"] != db_user["id"]]
-    context.user_data["members"] = members  # full list cached for confirm message
-    context.user_data["others"] = others    # toggle targets
+    description = " ".join(args[1 + used:])
+
+    # --- Store pending expense (persists across steps and restarts) ---
+    # shared starts empty: OTHER members chosen to share; paid_by added at confirm
+    pending = PendingExpense(
+        household_id=household["id"],
+        paid_by=db_user["id"],
+        amount_cents=int(round(amount * 100)),
+        category=category,
+        description=description,
+        members=tuple(m["id"] for m in members),
+        idempotency_key=f"tg:{update.effective_chat.id}:{update.effective_message.message_id}",
+    )
+
+    names = {m["id"]: m["name"] for m in members}
+
+    # --- Automation rule for this category: pre-fill or skip the picker ---
+    action = (await get_household_rules(household["id"])).match(category)
+    if action is not None:
+        pending.shared = tuple(uid for uid in action.shared_with
+                               if uid in names and uid != pending.paid_by)
+        if not action.confirm:
+            msg = _register(update, pending, index.type_of(category), names)
+            await update.effective_message.reply_text(f"{msg}\n  Regla:       {action.name}")
+            return ConversationHandler.END
 
-    keyboard = _build_member_keyboard(others, set())
+    get_pending_store().put(_key(update), pending)
+
+    # --- Build member picker (exclude paid_by) ---
+    keyboard = _build_member_keyboard(pending.others(), pending.shared, names)
     await update.effective_message.reply_text(
         f"Gasto de S/ {amount:.2f} en {category}.\n"
         "¿Quién más comparte este gasto? (puedes elegir varios)",
@@ -122,57 +153,31 @@ async def gasto_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 async def gasto_shared_step(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle tap on a member toggle button or the Confirm button."""
     query = update.callback_query
-    await query.answer()
-
     data = query.data
-    pending = context.user_data["pending_expense"]
-    others = context.user_data["others"]
-    shared: set = context.user_data["pending_shared"]
+    store = get_pending_store()
+    key = _key(update)
+    pending = store.get(key)
+    if pending is None:
+        # Expired, cancelled, or already confirmed (e.g. a double tap on
+        # "Confirmar"): leave the message as it is.
+        await query.answer("Este gasto ya no está pendiente.")
+        return DONE
+    await query.answer()
 
     if data == "confirm":
-        # paid_by is always part of shared_with
-        shared.add(pending["paid_by"])
-
-        expense = insert_expense(
-            household_id=pending["household_id"],
-            paid_by=pending["paid_by"],
-            amount=pending["amount"],
-            category=pending["category"],
-            description=pending["description"],
-            shared_with=list(shared),
-        )
-
-        # Build confirmation
-        members = context.user_data["members"]
-        name_map = {m["id"]: m["name"] for m in members}
-        shared_names = ", ".join(name_map.get(uid, "?") for uid in shared)
-
-        msg = (
-            f"Gasto registrado:\n"
-            f"  Monto:       S/ {pending['amount']:.2f}\n"
-            f"  Categoría:   {pending['category']}\n"
-            f"  Descripción: {pending['description'] or '—'}\n"
-            f"  Compartido:  {shared_names}"
-        )
+        index = await get_category_index(pending.household_id)
+        names = await _member_names(update, pending, with_payer=True)
+        msg = _register(update, pending, index.type_of(pending.category), names)
+        store.pop(key)
         await query.edit_message_text(msg)
-
-        # Cleanup
-        context.user_data.pop("pending_expense", None)
-        context.user_data.pop("pending_shared", None)
-        context.user_data.pop("members", None)
-        context.user_data.pop("others", None)
-
         return DONE
 
     elif data.startswith("toggle:"):
-        uid = int(data.split(":")[1])
-        if uid in shared:
-            shared.discard(uid)
-        else:
-            shared.add(uid)
-        context.user_data["pending_shared"] = shared
-
-        keyboard = _build_member_keyboard(others, shared)
+        pending.toggle(int(data.split(":")[1]))
+        store.put(key, pending)
+
+        names = await _member_names(update, pending, with_payer=False)
+        keyboard = _build_member_keyboard(pending.others(), pending.shared, names)
         await query.edit_message_reply_markup(reply_markup=keyboard)
         return AWAIT_SHARED
 
@@ -185,27 +190,87 @@ async def gasto_shared_step(update: Update, context: ContextTypes.DEFAULT_TYPE)
 # ---------------------------------------------------------------------------
 async def cancel_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Abort the /gasto conversation."""
-    context.user_data.pop("pending_expense", None)
-    context.user_data.pop("pending_shared", None)
-    context.user_data.pop("members", None)
-    context.user_data.pop("others", None)
+    get_pending_store().pop(_key(update))
     await update.effective_message.reply_text("Gasto cancelado.")
     return ConversationHandler.END
 
 
 # ---------------------------------------------------------------------------
-# Helper — build InlineKeyboard
+# Helpers
 # ---------------------------------------------------------------------------
-def _build_member_keyboard(others: List[Dict], selected: set) -> InlineKeyboardMarkup:
+def _register(update: Update, pending: PendingExpense, expense_type: str, names: Dict[int, str]) -> str:
+    """Queue the expense for insertion and return the confirmation text."""
+    # paid_by is always part of shared_with
+    shared = {pending.paid_by, *pending.shared}
+
+    # Write-behind: the row is written in the background, in a batch
+    get_write_queue().enqueue(
+        expense_payload(
+            household_id=pending.household_id,
+            paid_by=pending.paid_by,
+            amount=pending.amount,
+            category=pending.category,
+            description=pending.description,
+            shared_with=list(shared),
+            idempotency_key=pending.idempotency_key or None,
+            expense_type=expense_type,
+        ),
+        chat_id=update.effective_chat.id,
+    )
+
+    shared_names = ", ".join(names.get(uid, "?") for uid in shared)
+    return (
+        f"Gasto registrado:\n"
+        f"  Monto:       S/ {pending.amount:.2f}\n"
+        f"  Categoría:   {pending.category}\n"
+        f"  Descripción: {pending.description or '—'}\n"
+        f"  Compartido:  {shared_names}"
+    )
+
+
+async def _member_names(update: Update, pending: PendingExpense, with_payer: bool) -> Dict[int, str]:
+    """user_id → name for rendering a pending expense, which keeps ids only.
+
+    The other members' names are on the picker being answered, and the
+    payer (the user tapping) is in the session cache; only names found in
+    neither are queried.
+    """
+    names: Dict[int, str] = {}
+    message = update.callback_query.message if update.callback_query else None
+    markup = getattr(message, "reply_markup", None)
+    if markup is not None:
+        for row in markup.inline_keyboard:
+            for button in row:
+                if (button.callback_data or "").startswith("toggle:"):
+                    names[int(button.callback_data.split(":")[1])] = button.text.removeprefix("[x] ")
+    wanted = set(pending.others()) | ({pending.paid_by} if with_payer else set())
+    if pending.paid_by in wanted:
+        user, _ = await resolve_user_household(update.effective_user.id)
+        if user is not None and user["id"] == pending.paid_by:
+            names[user["id"]] = user["name"]
+    missing = wanted - set(names)
+    if missing:
+        names.update((u["id"], u["name"]) for u in await get_users_by_ids(sorted(missing)))
+    return names
+
+
+def _key(update: Update) -> Tuple[int, int]:
+    """Pending-store key: same (chat, user) scoping as the ConversationHandler."""
+    return update.effective_chat.id, update.effective_user.id
+
+
+def _build_member_keyboard(others: Tuple[int, ...], selected: Tuple[int, ...],
+                           names: Dict[int, str]) -> InlineKeyboardMarkup:
     """One toggle button per other member, plus a Confirm row.
 
     If no others exist (single-user household), the keyboard shows only Confirm
     and the expense will be shared with paid_by alone.
     """
     buttons = []
-    for m in others:
-        label = f"[x] {m['name']}" if m["id"] in selected else m["name"]
-        buttons.append([InlineKeyboardButton(label, callback_data=f"toggle:{m['id']}")])
+    for uid in others:
+        name = names.get(uid, "?")
+        label = f"[x] {name}" if uid in selected else name
+        buttons.append([InlineKeyboardButton(label, callback_data=f"toggle:{uid}")])
 
     confirm_label = "Confirmar" if others else "Solo yo — Confirmar"
     buttons.append([InlineKeyboardButton(confirm_label, callback_data="confirm")])
@@ -0,0 +1,115 @@
+"""
+Bulk expense entry — multi-line /gasto and CSV/TSV documents.
+
+Flow:
+  1. User sends either
+       /gasto
+       350 Supermercado Compras semanales
+       2024-05-03 42,50 Delivery Pizza
+     or a .csv / .tsv document (columns: monto, categoría, descripción,
+     fecha, tienda — see utils/bulk_import.py).
+  2. Every valid line becomes an expense paid by the sender and shared with
+     the household's default members (no member picker); rows are inserted
+     in chunks.
+  3. Bot replies with how many were saved and the lines that had errors.
+
+Rows are keyed by chat and message, so a redelivered update is skipped; a
+file or text sent again is a new import. If saving stops partway, the reply
+says from which line to send again.
+"""
+
+import io
+import logging
+import tempfile
+from telegram import Update
+from telegram.ext import ContextTypes
+from utils.supabase_client import resolve_session
+from utils.categories import get_category_index
+from utils.bulk_import import (
+    ImportResult,
+    default_shared_with,
+    download_document,
+    import_expenses,
+    parse_csv_lines,
+    parse_text_lines,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_ERRORS_SHOWN = 15
+MAX_FILE_BYTES = 20 * 1024 * 1024  # Bot API download limit
+
+
+async def gasto_bulk_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Import every line after the /gasto command (and any arguments on its line)."""
+    text = update.effective_message.text or ""
+    first, _, rest = text.partition("\n")
+    # Line numbers match the message: line 1 is whatever follows "/gasto"
+    lines = [" ".join(first.split()[1:])] + rest.split("\n")
+    await _run_import(update, parse_text_lines(lines))
+
+
+async def importar_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Import a CSV/TSV document sent to the bot."""
+    document = update.effective_message.document
+    if document.file_size and document.file_size > MAX_FILE_BYTES:
+        await update.effective_message.reply_text("El archivo es demasiado grande (máximo 20 MB).")
+        return
+
+    tg_file = await document.get_file()
+    with tempfile.TemporaryFile() as tmp:
+        await download_document(tg_file.file_path, tmp)
+        tmp.seek(0)
+        # Decoded and parsed lazily, line by line, while chunks are inserted
+        stream = io.TextIOWrapper(tmp, encoding="utf-8-sig", errors="replace", newline="")
+        await _run_import(update, parse_csv_lines(stream))
+
+
+async def _run_import(update: Update, parsed) -> None:
+    db_user, household, members = await resolve_session(update.effective_user.id)
+    if not db_user:
+        await update.effective_message.reply_text("No encontré tu cuenta. Usa /start primero.")
+        return
+    if not household:
+        await update.effective_message.reply_text("No tienes un hogar activo. Usa /espacio.")
+        return
+
+    message = update.effective_message
+    try:
+        result = await import_expenses(
+            parsed,
+            household_id=household["id"],
+            paid_by=db_user["id"],
+            shared_with=default_shared_with(household, members, db_user["id"]),
+            # message_id is unique within the chat
+            key_prefix=f"bulk:{household['id']}:{message.chat_id}:{message.message_id}",
+            categories=await get_category_index(household["id"]),
+        )
+    except Exception as e:
+        logger.error(f"Bulk import failed for user {db_user['id']}: {e!r}")
+        await message.reply_text(
+            "Hubo un error leyendo los gastos. Revisa con /resumen cuáles se guardaron "
+            "antes de volver a enviarlos."
+        )
+        return
+
+    await message.reply_text(_format_result(result))
+
+
+def _format_result(result: ImportResult) -> str:
+    lines = [f"Gastos registrados: {result.inserted} (S/ {result.total_cents / 100:.2f})"]
+    if result.duplicates:
+        lines.append(f"Ya registrados antes (omitidos): {result.duplicates}")
+    if result.truncated:
+        lines.append("Se alcanzó el máximo de filas por importación; envía el resto por separado.")
+    if result.stopped_at is not None:
+        lines.append(f"Hubo un error guardando; no se guardó nada desde la línea {result.stopped_at}. "
+                     "Envía de nuevo esas líneas.")
+    if result.errors:
+        lines.append("")
+        lines.append(f"Líneas con errores: {len(result.errors)}")
+        for line_no, message in result.errors[:MAX_ERRORS_SHOWN]:
+            lines.append(f"  Línea {line_no}: {message}")
+        if len(result.errors) > MAX_ERRORS_SHOWN:
+            lines.append(f"  … y {len(result.errors) - MAX_ERRORS_SHOWN} más")
+    return "\n".join(lines)
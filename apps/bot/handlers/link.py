@@ -25,8 +25,8 @@ async def link_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     telegram_id = tg_user.id
     name = tg_user.first_name or "Usuario"
 
-    ensure_user_exists(telegram_id, name)
-    code = create_link_code(telegram_id, name)
+    await ensure_user_exists(telegram_id, name)
+    code = await create_link_code(telegram_id, name)
 
     await update.effective_message.reply_text(
         LINK_TEXT.format(code=code), parse_mode="HTML"
@@ -35,9 +35,9 @@ async def login_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     name = tg_user.first_name or "Usuario"
 
     # Ensure the user exists in our DB before issuing a token
-    ensure_user_exists(telegram_id, name)
+    await ensure_user_exists(telegram_id, name)
 
-    token = create_auth_token(telegram_id, name)
+    token = await create_auth_token(telegram_id, name)
     url = f"{WEB_BASE_URL}/auth?token={token}"
 
     await update.effective_message.reply_text(LOGIN_TEXT.format(url=url))
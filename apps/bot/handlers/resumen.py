@@ -12,11 +12,8 @@ from datetime import datetime
 from telegram import Update
 from telegram.ext import ContextTypes
 from utils.supabase_client import (
-    get_user_by_telegram_id,
-    get_active_household,
-    get_household_members,
-    get_monthly_summary,
-    get_monthly_expenses,
+    resolve_session,
+    get_monthly_snapshot,
 )
 
 logger = logging.getLogger(__name__)
@@ -24,23 +21,21 @@ logger = logging.getLogger(__name__)
 
 async def resumen_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Produce and send the monthly summary message."""
-    db_user = get_user_by_telegram_id(update.effective_user.id)
+    db_user, household, members = await resolve_session(update.effective_user.id)
     if not db_user:
         await update.effective_message.reply_text("No encontré tu cuenta. Usa /start primero.")
         return
 
-    household = get_active_household(db_user["id"])
     if not household:
         await update.effective_message.reply_text("No tienes un hogar activo. Usa /espacio.")
         return
 
     now = datetime.now()
-    summary = get_monthly_summary(household["id"], now.year, now.month)   # { category: total }
-    expenses = get_monthly_expenses(household["id"], now.year, now.month) # raw rows
-    members = get_household_members(household["id"])
+    snapshot = await get_monthly_snapshot(household["id"], now.year, now.month)
+    summary = snapshot.by_category()   # { category: total }
     name_map = {m["id"]: m["name"] for m in members}
 
-    total = sum(summary.values())
+    total = snapshot.total
     month_name = now.strftime("%B").capitalize()
 
     # --- Header ---
@@ -59,12 +54,7 @@ async def resumen_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # --- Who paid (raw totals) ---
     lines.append("")
     lines.append("Pagó:")
-    paid_totals: dict = {}
-    for exp in expenses:
-        pid = exp["paid_by"]
-        paid_totals[pid] = paid_totals.get(pid, 0.0) + float(exp["amount"])
-
-    for uid, amt in sorted(paid_totals.items(), key=lambda x: -x[1]):
+    for uid, amt in sorted(snapshot.paid_by().items(), key=lambda x: -x[1]):
         lines.append(f"  {name_map.get(uid, '?')}: S/ {amt:.2f}")
 
     await update.effective_message.reply_text("\n".join(lines))
@@ -19,10 +19,13 @@ WELCOME_TEXT = """Hola {name}, bienvenido/a a NuestrosGastos!
 
 Comandos disponibles:
   /login    — Entrar al dashboard web
-  /gasto    — Registrar un nuevo gasto
-  /balance  — Ver quién debe a quién este mes
+  /gasto    — Registrar un nuevo gasto (varios: uno por línea,
+              o envía un archivo CSV)
+  /balance  — Ver quién debe a quién este mes (/balance 2025: el año)
   /resumen  — Resumen mensual por categoría
+  /tendencia — Gastos de los últimos meses frente al presupuesto
   /espacio  — Ver y cambiar tu hogar activo
+  /exportar — Descargar los gastos (CSV o JSONL)
   /ayuda    — Mostrar este mensaje
 """
 
@@ -33,13 +36,13 @@ async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     telegram_id = user.id
     name = user.first_name or "Usuario"
 
-    db_user = ensure_user_exists(telegram_id, name)
+    db_user = await ensure_user_exists(telegram_id, name)
 
     # Auto-select household if the user has exactly one and none is active
     if not db_user.get("active_household_id"):
-        households = get_user_households(db_user["id"])
+        households = await get_user_households(db_user["id"])
         if len(households) == 1:
-            set_active_household(db_user["id"], households[0]["id"])
+            await set_active_household(db_user["id"], households[0]["id"])
             logger.info(f"Auto-selected household {households[0]['id']} for user {telegram_id}")
 
     await update.effective_message.reply_text(WELCOME_TEXT.format(name=name))
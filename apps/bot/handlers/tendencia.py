@@ -0,0 +1,48 @@
+"""
+/tendencia handler — spending month by month against the budget.
+
+Usage:
+  /tendencia        the last 6 months (including this one)
+  /tendencia 12     the last 12 months (1 to 24)
+
+All months come from one range read (supabase_client.get_category_totals_by_month)
+and are bucketed by utils/trend.py, so 24 months cost about the same as 3.
+"""
+
+import logging
+from datetime import date
+from telegram import Update
+from telegram.ext import ContextTypes
+from utils.supabase_client import resolve_user_household, get_category_totals_by_month
+from utils.trend import DEFAULT_MONTHS, MAX_MONTHS, build_trend, format_trend, last_months, range_bounds
+
+logger = logging.getLogger(__name__)
+
+
+async def tendencia_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Send totals, changes and budget use for the last N months."""
+    args = context.args or []
+    try:
+        months = int(args[0]) if args else DEFAULT_MONTHS
+        if not 1 <= months <= MAX_MONTHS:
+            raise ValueError
+    except ValueError:
+        await update.effective_message.reply_text(
+            f"Uso: /tendencia [meses]  (entre 1 y {MAX_MONTHS}; por defecto {DEFAULT_MONTHS})"
+        )
+        return
+
+    db_user, household = await resolve_user_household(update.effective_user.id)
+    if not db_user:
+        await update.effective_message.reply_text("No encontré tu cuenta. Usa /start primero.")
+        return
+
+    if not household:
+        await update.effective_message.reply_text("No tienes un hogar activo. Usa /espacio.")
+        return
+
+    period = last_months(date.today(), months)
+    start, end = range_bounds(period)
+    totals = await get_category_totals_by_month(household["id"], start, end)
+    trend = build_trend(totals, period)
+    await update.effective_message.reply_text(format_trend(trend, household.get("monthly_budget")))
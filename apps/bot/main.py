@@ -1,9 +1,13 @@
 """
 NuestrosGastos Telegram Bot — entry point.
 
-Loads environment variables, initializes the Supabase client, registers all
+Loads environment variables, initializes the async Supabase client, registers all
 command handlers (and the ConversationHandler for /gasto), and starts the bot
-in polling mode.
+in polling mode (default) or webhook mode (BOT_MODE=webhook).
+
+Updates from different chats are processed concurrently, up to
+MAX_CONCURRENT_UPDATES at a time; updates from the same chat keep their order
+(see utils/update_processor.py).
 
 To run locally:
   cd apps/bot
@@ -21,6 +25,8 @@ from telegram.ext import (
     CommandHandler,
     ConversationHandler,
     CallbackQueryHandler,
+    MessageHandler,
+    filters,
 )
 
 # ---------------------------------------------------------------------------
@@ -36,7 +42,27 @@ logger = logging.getLogger(__name__)
 # ---------------------------------------------------------------------------
 # Imports (after logging setup so any import-time logs are captured)
 # ---------------------------------------------------------------------------
-from utils.supabase_client import init_client  # noqa: E402
+from utils.update_processor import ChatOrderedUpdateProcessor  # noqa: E402
+from utils.pending_store import get_pending_store  # noqa: E402
+from utils.write_queue import get_write_queue  # noqa: E402
+from utils.recurring import get_recurring_scheduler, schedule_recurring  # noqa: E402
+from utils.automation import get_automation_cache_stats  # noqa: E402
+from utils.categories import get_category_cache_stats  # noqa: E402
+from utils.notifier import get_notifier  # noqa: E402
+from utils.budget import get_budget_tracker, schedule_budget  # noqa: E402
+from utils.replica import get_read_replica  # noqa: E402
+from utils import metrics  # noqa: E402
+from utils.supabase_client import (  # noqa: E402
+    init_client,
+    close_client,
+    add_expense_listener,
+    set_read_replica,
+    get_user_cache_stats,
+    get_snapshot_cache_stats,
+    get_round_trip_stats,
+    get_sql_stats,
+    track_round_trips as rt,
+)
 
 from handlers.start   import start_handler                           # noqa: E402
 from handlers.gasto   import gasto_handler, gasto_shared_step, cancel_handler, AWAIT_SHARED  # noqa: E402
@@ -45,47 +71,148 @@ from handlers.espacio import espacio_handler, espacio_callback       # noqa: E40
 from handlers.resumen import resumen_handler                         # noqa: E402
 from handlers.login   import login_handler                           # noqa: E402
 from handlers.link    import link_handler                            # noqa: E402
+from handlers.importar import importar_handler                       # noqa: E402
+from handlers.exportar import exportar_handler                       # noqa: E402
+from handlers.tendencia import tendencia_handler                     # noqa: E402
 
 
 # ---------------------------------------------------------------------------
 # Build the Application
 # ---------------------------------------------------------------------------
-def build_app():
-    """Wire up env, Supabase, and all Telegram handlers. Return the Application."""
+async def _post_init(app) -> None:
+    """Create the async Supabase client inside the running event loop."""
+    await init_client()  # database client singleton — must happen before any handler runs
+    get_pending_store()  # restores /gasto flows that were in flight at shutdown
+    get_write_queue().start(app.bot)  # background writer for confirmed expenses
+    get_notifier().start(app.bot)     # tells members about expenses shared with them
+    add_expense_listener(get_notifier().on_expenses)
+    get_budget_tracker().start()      # month-to-date totals, 50/80/100% alerts
+    add_expense_listener(get_budget_tracker().on_expenses)
+    replica = get_read_replica()      # None unless REPLICA_PATH is set
+    if replica is not None:
+        replica.start()
+        set_read_replica(replica)
+        add_expense_listener(replica.on_expenses)
+        metrics.add_collector("replica", replica.stats)
+    if get_sql_stats() is not None:
+        metrics.add_collector("sql", get_sql_stats)
+    metrics.add_collector("write_queue", get_write_queue().stats)
+    metrics.add_collector("notifications", get_notifier().stats)
+    metrics.add_collector("user_cache", get_user_cache_stats)
+    metrics.add_collector("snapshot_cache", get_snapshot_cache_stats)
+    metrics.add_collector("pending_store", get_pending_store().stats)
+    metrics.add_collector("recurring", get_recurring_scheduler().stats)
+    metrics.add_collector("budget", get_budget_tracker().stats)
+    metrics.add_collector("automation_cache", get_automation_cache_stats)
+    metrics.add_collector("category_cache", get_category_cache_stats)
+    await metrics.start_server()  # GET /metrics when METRICS_PORT is set
+    if app.job_queue is not None:
+        schedule_recurring(app.job_queue)
+        schedule_budget(app.job_queue)
+    else:
+        logger.warning("JobQueue unavailable (python-telegram-bot[job-queue]); recurring expenses "
+                       "and budget reconciliation disabled")
+
+
+async def _post_stop(app) -> None:
+    """Flush queued expenses and open digests while the bot can still send."""
+    await get_write_queue().close()  # may message users whose expense failed
+    await get_budget_tracker().close()  # alerts go out through the notifier
+    await get_notifier().close()
+
+
+async def _post_shutdown(app) -> None:
+    """Release pooled HTTP connections and report stats."""
+    logger.info(f"Expense write queue: {get_write_queue().stats()}")
+    logger.info(f"Notifications: {get_notifier().stats()}")
+    logger.info(f"User cache stats: {get_user_cache_stats()}")
+    logger.info(f"Snapshot cache stats: {get_snapshot_cache_stats()}")
+    logger.info(f"Round trips per handler: {get_round_trip_stats()}")
+    if get_sql_stats() is not None:
+        logger.info(f"SQL backend: {get_sql_stats()}")
+    logger.info(f"Pending /gasto store: {get_pending_store().stats()}")
+    logger.info(f"Recurring expenses: {get_recurring_scheduler().stats()}")
+    logger.info(f"Budget tracking: {get_budget_tracker().stats()}")
+    if get_read_replica() is not None:
+        logger.info(f"Read replica: {get_read_replica().stats()}")
+    logger.info(f"Automation rules cache: {get_automation_cache_stats()}")
+    logger.info(f"Category index cache: {get_category_cache_stats()}")
+    get_pending_store().close()
+    if get_read_replica() is not None:
+        set_read_replica(None)
+        await get_read_replica().close()
+    await metrics.close_server()
+    await close_client()
+
+
+def build_app(request=None):
+    """Wire up env, Supabase, and all Telegram handlers. Return the Application.
+
+    request replaces the Bot API HTTP transport, getUpdates included (bench/
+    passes an in-memory one).
+    """
     load_dotenv()  # reads apps/bot/.env if present; no-op in production
-    init_client()  # Supabase singleton — must happen before any handler runs
 
     token = os.getenv("TELEGRAM_BOT_TOKEN", "")
     if not token:
         raise ValueError("TELEGRAM_BOT_TOKEN must be set")
 
-    app = ApplicationBuilder().token(token).build()
+    max_concurrent = int(os.getenv("MAX_CONCURRENT_UPDATES", "32"))
+
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .concurrent_updates(ChatOrderedUpdateProcessor(max_concurrent))
+        .post_init(_post_init)
+        .post_stop(_post_stop)
+        .post_shutdown(_post_shutdown)
+    )
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    app = builder.build()
+
+    # Every handler is wrapped with rt() so its latency, errors and number of
+    # database round trips are recorded (see utils/metrics.py).
 
     # --- Simple command handlers ---
-    app.add_handler(CommandHandler("start",   start_handler))
-    app.add_handler(CommandHandler("login",   login_handler))
-    app.add_handler(CommandHandler("link",    link_handler))
-    app.add_handler(CommandHandler("balance", balance_handler))
-    app.add_handler(CommandHandler("espacio", espacio_handler))
-    app.add_handler(CommandHandler("resumen", resumen_handler))
+    app.add_handler(CommandHandler("start",   rt(start_handler)))
+    app.add_handler(CommandHandler("login",   rt(login_handler)))
+    app.add_handler(CommandHandler("link",    rt(link_handler)))
+    app.add_handler(CommandHandler("balance", rt(balance_handler)))
+    app.add_handler(CommandHandler("espacio", rt(espacio_handler)))
+    app.add_handler(CommandHandler("resumen", rt(resumen_handler)))
+    app.add_handler(CommandHandler("exportar", rt(exportar_handler)))
+    app.add_handler(CommandHandler("tendencia", rt(tendencia_handler)))
     # /ayuda is an alias for /start (same welcome text)
-    app.add_handler(CommandHandler("ayuda", start_handler))
+    app.add_handler(CommandHandler("ayuda", rt(start_handler)))
 
     # --- ConversationHandler for /gasto (multi-step) ---
     gasto_conversation = ConversationHandler(
-        entry_points=[CommandHandler("gasto", gasto_handler)],
+        entry_points=[CommandHandler("gasto", rt(gasto_handler))],
         states={
-            AWAIT_SHARED: [CallbackQueryHandler(gasto_shared_step)],
+            AWAIT_SHARED: [CallbackQueryHandler(rt(gasto_shared_step))],
         },
-        fallbacks=[CommandHandler("cancelar", cancel_handler)],
+        fallbacks=[CommandHandler("cancelar", rt(cancel_handler))],
     )
     app.add_handler(gasto_conversation)
 
+    # Same /gasto steps outside the conversation: after a restart the
+    # ConversationHandler has forgotten its state, but the pending store
+    # hasn't, so taps on an old keyboard (and /cancelar) still work.
+    app.add_handler(CallbackQueryHandler(rt(gasto_shared_step), pattern=r"^(toggle:\d+|confirm)$"))
+    app.add_handler(CommandHandler("cancelar", rt(cancel_handler)))
+
     # --- Standalone callback for /espacio inline keyboard ---
     # Pattern "^espacio:" ensures it only fires for espacio buttons,
     # not for the /gasto toggle:/confirm buttons (those are scoped inside
     # the ConversationHandler above).
-    app.add_handler(CallbackQueryHandler(espacio_callback, pattern=r"^espacio:"))
+    app.add_handler(CallbackQueryHandler(rt(espacio_callback), pattern=r"^espacio:"))
+
+    # --- Bulk import: CSV/TSV documents (multi-line /gasto goes through gasto_handler) ---
+    app.add_handler(MessageHandler(
+        filters.Document.FileExtension("csv") | filters.Document.FileExtension("tsv"),
+        rt(importar_handler),
+    ))
 
     return app
 
@@ -93,7 +220,36 @@ def build_app():
 # ---------------------------------------------------------------------------
 # Entry point
 # ---------------------------------------------------------------------------
+def run(app) -> None:
+    """Start the bot in the mode selected by BOT_MODE ("polling" or "webhook").
+
+    Webhook mode serves Telegram's POSTs from an embedded HTTP server on
+    0.0.0.0:$PORT at /$WEBHOOK_PATH and registers $WEBHOOK_URL/$WEBHOOK_PATH
+    with Telegram. WEBHOOK_SECRET, if set, is checked on every request.
+    """
+    mode = os.getenv("BOT_MODE", "polling").lower()
+    if mode == "polling":
+        logger.info("Starting NuestrosGastos bot (polling mode)...")
+        app.run_polling()
+        return
+    if mode != "webhook":
+        raise ValueError(f"BOT_MODE must be 'polling' or 'webhook', got '{mode}'")
+
+    base_url = os.getenv("WEBHOOK_URL", "").rstrip("/")
+    if not base_url:
+        raise ValueError("WEBHOOK_URL must be set when BOT_MODE=webhook")
+    path = os.getenv("WEBHOOK_PATH", "telegram").strip("/")
+    port = int(os.getenv("PORT", "8080"))
+
+    logger.info(f"Starting NuestrosGastos bot (webhook mode on port {port})...")
+    app.run_webhook(
+        listen="0.0.0.0",
+        port=port,
+        url_path=path,
+        webhook_url=f"{base_url}/{path}",
+        secret_token=os.getenv("WEBHOOK_SECRET") or None,
+    )
+
+
 if __name__ == "__main__":
-    application = build_app()
-    logger.info("Starting NuestrosGastos bot (polling mode)...")
-    application.run_polling()
+    run(build_app())
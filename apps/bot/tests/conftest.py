@@ -0,0 +1,16 @@
+"""
+Tests for the bot's helpers:
+
+  cd apps/bot
+  python -m pytest tests
+
+They run offline against bench/fake_supabase.py and the SQLite backend;
+tests that need PostgreSQL are skipped unless its URL is set (see each test).
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench  # noqa: E402,F401 — points the bot's local files at a scratch directory
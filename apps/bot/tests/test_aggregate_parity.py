@@ -0,0 +1,173 @@
+"""
+household_balance / household_category_totals against the bot's row fallback.
+
+/balance and /resumen read the ledger, else the RPCs, else every expense
+folded by balance_from_rows / summary_from_rows. The same month must give
+the same answer, to the cent, whichever path serves it. The fixture has
+shares that don't divide evenly, repeated ids in shared_with and expenses
+nobody shares.
+
+The RPCs run on the fake (bench/fake_supabase.py) and on the SQLite backend.
+The SQL functions of the migrations run when PARITY_DATABASE_URL points at
+a PostgreSQL database with supabase/migrations applied; the fixture is
+written inside a transaction that is rolled back.
+"""
+
+import os
+import random
+import asyncio
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List
+
+import pytest
+
+from bench.fake_supabase import FakeClient, FakeDatabase
+from bench.sql_backend import SqlBenchDatabase
+from utils.snapshot import MonthlySnapshot
+from utils.sql_client import create_sql_client
+from utils.supabase_client import balance_from_rows, summary_from_rows
+
+HOUSEHOLD = 10
+USERS = [1, 2, 3, 4]
+MONTH = {"p_household_id": HOUSEHOLD, "p_start": "2025-03-01", "p_end": "2025-04-01"}
+
+
+def _expenses() -> List[Dict]:
+    rng = random.Random(7)
+    rows = [
+        # 10.00 / 3 and 0.01 / 2: leftover cents
+        {"paid_by": 1, "amount": 10.00, "shared_with": [1, 2, 3]},
+        {"paid_by": 2, "amount": 0.01, "shared_with": [1, 3]},
+        # repeated id, payer outside the split, nobody sharing
+        {"paid_by": 3, "amount": 100.00, "shared_with": [1, 1, 2]},
+        {"paid_by": 4, "amount": 7.77, "shared_with": [2, 3]},
+        {"paid_by": 2, "amount": 25.50, "shared_with": []},
+    ]
+    for _ in range(200):
+        rows.append({"paid_by": rng.choice(USERS), "amount": rng.randint(1, 99999) / 100,
+                     "shared_with": rng.sample(USERS, rng.randint(1, len(USERS)))})
+    categories = ["Supermercado", "Delivery", "Servicios", "Salidas"]
+    return [{"id": i, "household_id": HOUSEHOLD, "category": categories[i % len(categories)], "type": "variable",
+             "expense_date": f"2025-03-{1 + i % 28:02d}", **row}
+            for i, row in enumerate(rows, start=1)]
+
+
+EXPENSES = _expenses()
+# Outside the month or the household: must not count
+OTHER = [
+    {"id": 900, "household_id": HOUSEHOLD, "paid_by": 1, "amount": 50.0, "shared_with": [1, 2],
+     "category": "Salidas", "type": "variable", "expense_date": "2025-04-01"},
+    {"id": 901, "household_id": 20, "paid_by": 1, "amount": 50.0, "shared_with": [1, 2],
+     "category": "Salidas", "type": "variable", "expense_date": "2025-03-10"},
+]
+FIXTURE = {
+    "users": [{"id": uid, "telegram_id": 1000 + uid, "name": f"U{uid}"} for uid in USERS],
+    "households": [{"id": HOUSEHOLD, "name": "Casa", "created_by": 1}, {"id": 20, "name": "Viaje", "created_by": 1}],
+    "expenses": EXPENSES + OTHER,
+}
+
+
+def _balance(rows: List[Dict]) -> Dict[int, float]:
+    return {r["user_id"]: round(float(r["net"]), 2) for r in rows}
+
+
+def _totals(rows: List[Dict]) -> Dict[str, float]:
+    return {r["category"]: round(float(r["total"]), 2) for r in rows}
+
+
+def _assert_parity(balance_rows: List[Dict], total_rows: List[Dict]) -> None:
+    assert _balance(balance_rows) == balance_from_rows(EXPENSES)
+    assert _totals(total_rows) == summary_from_rows(EXPENSES)
+    for r in balance_rows:  # credit - owed = net, each to the cent
+        assert round(float(r["credit"]) - float(r["owed"]), 2) == round(float(r["net"]), 2)
+
+
+def test_fold_matches_snapshot():
+    snap = MonthlySnapshot.from_rows(HOUSEHOLD, 2025, 3, EXPENSES)
+    balance = balance_from_rows(EXPENSES)
+    assert balance == snap.balances()
+    # Nets add up to zero except for the expense nobody shares (payer keeps the credit)
+    assert sum(snap.net_cents().values()) == 2550
+    assert summary_from_rows(EXPENSES) == snap.by_category()
+    assert balance[2] != 0 and 4 in balance
+
+
+def test_fake_rpcs_and_ledger():
+    fake = FakeDatabase()
+    for table, rows in FIXTURE.items():
+        for r in rows:
+            fake.add(table, r)
+    client = FakeClient(fake)
+
+    async def read():
+        balance = await client.rpc("household_balance", MONTH).execute()
+        totals = await client.rpc("household_category_totals", MONTH).execute()
+        users = await client.table("expense_ledger").select("*").eq("household_id", HOUSEHOLD) \
+            .eq("month", "2025-03-01").execute()
+        categories = await client.table("expense_ledger_categories").select("*").eq("household_id", HOUSEHOLD) \
+            .eq("month", "2025-03-01").execute()
+        return balance.data, totals.data, users.data, categories.data
+
+    balance, totals, users, categories = asyncio.run(read())
+    _assert_parity(balance, totals)
+    ledger = MonthlySnapshot.from_ledger(HOUSEHOLD, 2025, 3, users, categories)
+    assert ledger.balances() == balance_from_rows(EXPENSES)
+    assert ledger.by_category() == summary_from_rows(EXPENSES)
+
+
+def test_sqlite_rpcs(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "parity.sqlite3"))
+
+    async def read():
+        store = SqlBenchDatabase(await create_sql_client("sqlite"))
+        try:
+            for table, rows in FIXTURE.items():
+                for r in rows:
+                    store.add(table, r)
+            await store.load()
+            balance = await store.sql.rpc("household_balance", MONTH).execute()
+            totals = await store.sql.rpc("household_category_totals", MONTH).execute()
+        finally:
+            await store.sql.close()
+        return balance.data, totals.data
+
+    _assert_parity(*asyncio.run(read()))
+
+
+@pytest.mark.skipif(not os.getenv("PARITY_DATABASE_URL"), reason="PARITY_DATABASE_URL not set")
+def test_postgres_functions():
+    asyncpg = pytest.importorskip("asyncpg")
+
+    async def read():
+        conn = await asyncpg.connect(os.environ["PARITY_DATABASE_URL"])
+        tx = conn.transaction()
+        await tx.start()
+        try:
+            # Identity columns: map the fixture's ids to the ones the database assigns
+            ids = {}
+            for uid in USERS:
+                ids[uid] = await conn.fetchval(
+                    "INSERT INTO users (telegram_id, name) VALUES ($1, $2) RETURNING id",
+                    -1000000 - uid, f"parity {uid}")
+            household = await conn.fetchval(
+                "INSERT INTO households (name, created_by) VALUES ('parity', $1) RETURNING id", ids[1])
+            for e in EXPENSES:
+                await conn.execute(
+                    "INSERT INTO expenses (household_id, paid_by, amount, category, type, shared_with, expense_date)"
+                    " VALUES ($1, $2, $3, $4, $5, $6, $7)",
+                    household, ids[e["paid_by"]], Decimal(str(e["amount"])), e["category"], e["type"],
+                    [ids[uid] for uid in e["shared_with"]], date.fromisoformat(e["expense_date"]))
+            args = (household, date(2025, 3, 1), date(2025, 4, 1))
+            balance = await conn.fetch("SELECT * FROM household_balance($1, $2, $3)", *args)
+            totals = await conn.fetch("SELECT * FROM household_category_totals($1, $2, $3)", *args)
+            drift = await conn.fetch("SELECT * FROM ledger_check($1)", household)
+        finally:
+            await tx.rollback()
+            await conn.close()
+        back = {db_id: uid for uid, db_id in ids.items()}
+        return [{**dict(r), "user_id": back[r["user_id"]]} for r in balance], [dict(r) for r in totals], drift
+
+    balance, totals, drift = asyncio.run(read())
+    _assert_parity(balance, totals)
+    assert drift == []
@@ -0,0 +1,83 @@
+"""
+VersionedCache keeps versions only for scopes it still has something of.
+
+Every expense write bumps its household's version, so without pruning the
+map of versions grows with every household that ever wrote. It must stay
+bounded by the cached entries and running computations, without letting a
+computation that started before a bump store its outdated result.
+"""
+
+import asyncio
+
+from utils.cache import VersionedCache
+
+
+def test_versions_bounded_by_entries():
+    cache = VersionedCache(maxsize=4, ttl=0)
+
+    async def run():
+        for household in range(100):
+            await cache.get_or_compute((household, 2025, 3), household, lambda: asyncio.sleep(0, result=household))
+            cache.bump(household)
+        for household in range(1000, 2000):  # writes to households never read
+            cache.bump(household)
+
+    asyncio.run(run())
+    assert len(cache) == 4
+    assert len(cache._versions) <= 4 and len(cache._refs) == 4
+    cache.clear()
+    assert cache._versions == {} and cache._refs == {}
+
+
+def test_bump_during_computation_is_not_lost():
+    cache = VersionedCache(maxsize=1, ttl=0)
+
+    async def run():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def slow():
+            started.set()
+            await release.wait()
+            return "old"
+
+        pending = asyncio.create_task(cache.get_or_compute("a", 1, slow))
+        await started.wait()
+        cache.bump(1)  # a write while "a" is being computed
+        await cache.get_or_compute("b", 2, lambda: asyncio.sleep(0, result="b"))  # evicts nothing of scope 1
+        release.set()
+        assert await pending == "old"
+        # The outdated result was not stored: the next read computes again
+        return await cache.get_or_compute("a", 1, lambda: asyncio.sleep(0, result="new"))
+
+    assert asyncio.run(run()) == "new"
+    assert cache._refs == {1: 1} and 2 not in cache._versions
+
+
+def test_bump_during_recompute_of_stale_entry():
+    cache = VersionedCache(maxsize=4, ttl=0)
+    db = {"rows": "A"}
+
+    async def run():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def read():
+            return db["rows"]
+
+        async def slow():
+            value = db["rows"]
+            started.set()
+            await release.wait()
+            return value
+
+        assert await cache.get_or_compute("m", 1, read) == "A"
+        db["rows"] = "B"
+        cache.bump(1)  # the cached A is stale; dropping it releases the scope's version
+        pending = asyncio.create_task(cache.get_or_compute("m", 1, slow))
+        await started.wait()
+        db["rows"] = "C"
+        cache.bump(1)  # a write while B is being computed
+        release.set()
+        assert await pending == "B"
+        return await cache.get_or_compute("m", 1, read)
+
+    assert asyncio.run(run()) == "C"
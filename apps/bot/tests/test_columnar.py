@@ -0,0 +1,95 @@
+"""
+ExpenseBatch kernels against the MonthlySnapshot loops.
+
+/tendencia and /balance <año> read ExpenseBatch pivots when the ledger
+can't serve them; each month of a pivot must equal, to the cent, the
+MonthlySnapshot that /resumen and /balance fold from the same rows. The
+rows have shares that don't divide evenly, repeated ids in shared_with,
+payers outside the split, nobody sharing, zero amounts and amounts as
+strings (NUMERIC from PostgREST).
+"""
+
+import random
+from typing import Dict, List
+
+import pytest
+
+from utils.columnar import ExpenseBatch, month_key, month_start
+from utils.snapshot import MonthlySnapshot
+
+USERS = [1, 2, 3, 4, 17]
+CATEGORIES = ["Supermercado", "Delivery", "Servicios", "Salidas", "Mascotas"]
+
+
+def _expenses(n: int, seed: int) -> List[Dict]:
+    rng = random.Random(seed)
+    rows = [
+        {"paid_by": 1, "amount": 10.00, "shared_with": [1, 2, 3]},
+        {"paid_by": 2, "amount": "0.01", "shared_with": [1, 3]},
+        {"paid_by": 3, "amount": 100.00, "shared_with": [1, 1, 2]},
+        {"paid_by": 4, "amount": 7.77, "shared_with": None},
+        {"paid_by": 17, "amount": 0, "shared_with": [17, 2]},
+    ]
+    for _ in range(n):
+        rows.append({"paid_by": rng.choice(USERS), "amount": rng.randint(1, 99999) / 100,
+                     "shared_with": rng.choices(USERS, k=rng.randint(0, 4))})
+    return [{**row, "category": CATEGORIES[i % len(CATEGORIES)],
+             "expense_date": f"{rng.choice([2024, 2025])}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"}
+            for i, row in enumerate(rows)]
+
+
+def _snapshots(rows: List[Dict]) -> Dict[str, MonthlySnapshot]:
+    by_month: Dict[str, MonthlySnapshot] = {}
+    for exp in rows:
+        start = exp["expense_date"][:7] + "-01"
+        if start not in by_month:
+            by_month[start] = MonthlySnapshot(10, int(start[:4]), int(start[5:7]))
+        by_month[start].add(exp)
+    return by_month
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_pivots_match_monthly_snapshots(seed):
+    rows = _expenses(2000, seed)
+    snapshots = _snapshots(rows)
+    batch = ExpenseBatch.from_rows(rows)
+
+    categories = {(start, category): cents for start, snap in snapshots.items()
+                  for category, cents in snap.category_cents.items()}
+    assert batch.category_totals_by_month() == categories
+    assert ExpenseBatch.from_rows(iter(rows), splits=False).category_totals_by_month() == categories
+
+    members = {}
+    for start, snap in snapshots.items():
+        for uid in set(snap.paid_cents) | set(snap.owed_cents):
+            paid, owed = snap.paid_cents.get(uid, 0), snap.owed_cents.get(uid, 0)
+            if paid or owed:
+                members[(start, uid)] = (paid, owed)
+    assert batch.member_totals_by_month() == members
+
+
+def test_pivot_window():
+    rows = _expenses(300, 4)
+    batch, snapshots = ExpenseBatch.from_rows(rows), _snapshots(rows)
+    first, last = month_key(2025, 3), month_key(2025, 5)
+    paid, owed = batch.member_month_pivot(first, last)
+    assert paid.shape == owed.shape == (len(batch.user_ids), 3)
+    for col, key in enumerate(range(first, last + 1)):
+        snap = snapshots[month_start(key)]
+        assert {int(u): int(c) for u, c in zip(batch.user_ids, paid[:, col]) if c} == \
+            {u: c for u, c in snap.paid_cents.items() if c}
+        assert owed[:, col].sum() == sum(snap.owed_cents.values())
+    cents, counts = batch.category_month_pivot(first, last)
+    assert cents.sum() == sum(snapshots[month_start(k)].total_cents for k in range(first, last + 1))
+    assert counts.sum() == sum(snapshots[month_start(k)].count for k in range(first, last + 1))
+
+
+def test_empty_batch():
+    batch = ExpenseBatch.from_rows([])
+    assert len(batch) == 0 and batch.month_range() is None
+    assert batch.category_totals_by_month() == {} and batch.member_totals_by_month() == {}
+
+
+def test_splits_false_has_no_members():
+    with pytest.raises(ValueError):
+        ExpenseBatch.from_rows(_expenses(10, 5), splits=False).member_totals_by_month()
@@ -0,0 +1,293 @@
+"""
+Every storage backend answers the database helpers the bot uses the same way.
+
+  cd apps/bot
+  python -m pytest tests/test_conformance.py
+  CONFORMANCE_DATABASE_URL=postgresql://… python -m pytest tests/test_conformance.py
+
+The same fixture (two households, their members, a few months of expenses,
+recurring expenses, automation rules and subcategories) is loaded into each
+backend: the in-memory Supabase stand-in (bench/fake_supabase.py), and
+utils/sql_client.py on SQLite and on PostgreSQL. Each helper of
+utils/supabase_client.py is then called and its result compared with the
+value the fixture implies — not with another backend, so a failure names
+the backend that is wrong. PostgreSQL runs only when
+CONFORMANCE_DATABASE_URL points at an empty database: the fixture is
+loaded with fixed ids.
+"""
+
+import os
+import asyncio
+from typing import Any, Dict, List
+
+import pytest
+from postgrest.exceptions import APIError
+
+from bench.fake_supabase import FakeClient, FakeDatabase
+from bench.sql_backend import SqlBenchDatabase
+from utils import supabase_client as db
+from utils.snapshot import MonthlySnapshot
+from utils.sql_client import create_sql_client
+
+USERS = [
+    {"id": 1, "telegram_id": 1001, "name": "Ana", "active_household_id": 10},
+    {"id": 2, "telegram_id": 1002, "name": "Beto", "active_household_id": 10},
+    {"id": 3, "telegram_id": 1003, "name": "Carla", "active_household_id": 10},
+    {"id": 4, "telegram_id": 1004, "name": "Dani", "active_household_id": None},
+]
+HOUSEHOLDS = [
+    {"id": 10, "name": "Casa", "created_by": 1, "monthly_budget": 1500,
+     "settings": {"split_method": "equal", "currency": "PEN"}},
+    {"id": 20, "name": "Viaje", "created_by": 3, "monthly_budget": None,
+     "settings": {"split_method": "equal", "currency": "USD"}},
+]
+MEMBERS = [
+    {"id": 1, "household_id": 10, "user_id": 1, "role": "admin", "is_active": True},
+    {"id": 2, "household_id": 10, "user_id": 2, "role": "member", "is_active": True},
+    {"id": 3, "household_id": 10, "user_id": 3, "role": "member", "is_active": True},
+    {"id": 4, "household_id": 10, "user_id": 4, "role": "member", "is_active": False},
+    {"id": 5, "household_id": 20, "user_id": 3, "role": "admin", "is_active": True},
+]
+EXPENSES = [
+    {"id": 1, "household_id": 10, "paid_by": 1, "amount": 120.50, "category": "Supermercado",
+     "type": "variable", "description": "Compras", "shared_with": [1, 2, 3], "expense_date": "2025-03-02"},
+    {"id": 2, "household_id": 10, "paid_by": 2, "amount": 45.00, "category": "Delivery",
+     "type": "variable", "description": "Pizza", "shared_with": [1, 2], "expense_date": "2025-03-02"},
+    {"id": 3, "household_id": 10, "paid_by": 3, "amount": 210.00, "category": "Servicios",
+     "type": "fixed", "description": "Luz", "shared_with": [1, 2, 3], "expense_date": "2025-03-15"},
+    {"id": 4, "household_id": 10, "paid_by": 1, "amount": 10.01, "category": "Delivery",
+     "type": "variable", "description": "", "shared_with": [1, 2, 3], "expense_date": "2025-03-31"},
+    {"id": 5, "household_id": 10, "paid_by": 2, "amount": 33.30, "category": "Transporte",
+     "type": "variable", "description": "Taxi", "shared_with": [2], "expense_date": "2025-04-01"},
+    {"id": 6, "household_id": 20, "paid_by": 3, "amount": 99.99, "category": "Otros",
+     "type": "variable", "description": "", "shared_with": [3], "expense_date": "2025-03-10"},
+]
+RECURRING = [
+    {"id": 1, "household_id": 10, "paid_by": 3, "name": "Internet", "amount": 89.90, "category": "Servicios",
+     "type": "fixed", "shared_with": [1, 2, 3], "frequency": "monthly", "next_due_date": "2025-03-20",
+     "is_active": True},
+    {"id": 2, "household_id": 10, "paid_by": 1, "name": "Netflix", "amount": 44.90, "category": "Suscripciones",
+     "type": "fixed", "shared_with": [1, 2], "frequency": "monthly", "next_due_date": "2025-03-05",
+     "is_active": True},
+    {"id": 3, "household_id": 20, "paid_by": 3, "name": "Gimnasio", "amount": 120.00, "category": "Salud",
+     "type": "fixed", "shared_with": [3], "frequency": "monthly", "next_due_date": "2025-03-01",
+     "is_active": False},
+]
+RULES = [
+    {"id": 1, "household_id": 10, "name": "Super compartido", "trigger_type": "category",
+     "trigger_category": "Supermercado", "auto_shared_with": [1, 2, 3], "auto_action": None, "is_active": True},
+    {"id": 2, "household_id": 10, "name": "Apagada", "trigger_type": "category",
+     "trigger_category": "Delivery", "auto_shared_with": [1], "auto_action": None, "is_active": False},
+]
+SUBCATEGORIES = [
+    {"id": 1, "household_id": 10, "macro_category": "alimentos", "name": "Panadería", "created_by": 1},
+    {"id": 2, "household_id": 10, "macro_category": "servicios", "name": "Gas", "created_by": 2},
+]
+FIXTURE = {
+    "users": USERS, "households": HOUSEHOLDS, "household_members": MEMBERS, "expenses": EXPENSES,
+    "recurring_expenses": RECURRING, "automation_rules": RULES, "custom_subcategories": SUBCATEGORIES,
+}
+
+
+def _month(household_id: int, prefix: str, extra: List[Dict] = ()) -> List[Dict]:
+    return [e for e in [*EXPENSES, *extra] if e["household_id"] == household_id and e["expense_date"].startswith(prefix)]
+
+
+def _close(actual: Dict, expected: Dict) -> bool:
+    return set(actual) == set(expected) and all(abs(actual[k] - expected[k]) <= 0.011 for k in expected)
+
+
+class Checks:
+    """Records every mismatch, so one run reports all the helpers that differ."""
+
+    def __init__(self):
+        self.failed: List[str] = []
+        self.passed = 0
+
+    def __call__(self, name: str, actual: Any, expected: Any, equal=None) -> None:
+        ok = equal(actual, expected) if equal else actual == expected
+        if ok:
+            self.passed += 1
+            return
+        self.failed.append(f"{name}\n  expected {expected!r}\n  got      {actual!r}")
+
+
+async def run_checks(check: Checks) -> None:
+    # --- users ---
+    check("get_user_by_telegram_id", (await db.get_user_by_telegram_id(1002))["name"], "Beto")
+    check("get_user_by_telegram_id missing", await db.get_user_by_telegram_id(9999), None)
+    check("ensure_user_exists existing", (await db.ensure_user_exists(1001, "Otro"))["id"], 1)
+    created = await db.ensure_user_exists(2001, "Nuevo")
+    check("ensure_user_exists new", (created["telegram_id"], created["name"]), (2001, "Nuevo"))
+    check("ensure_user_exists again", (await db.ensure_user_exists(2001, "Nuevo"))["id"], created["id"])
+    check("get_users_by_ids", sorted((u["id"], u["telegram_id"], u["name"]) for u in await db.get_users_by_ids([1, 2])),
+          [(1, 1001, "Ana"), (2, 1002, "Beto")])
+
+    # --- households and sessions ---
+    user, household = await db.resolve_user_household(1001)
+    check("resolve_user_household", (user["id"], household["id"], household["name"]), (1, 10, "Casa"))
+    check("resolve_user_household unknown", await db.resolve_user_household(9999), (None, None))
+    user, household, members = await db.resolve_session(1002)
+    check("resolve_session", (user["id"], household["id"], [m["id"] for m in members]), (2, 10, [1, 2, 3]))
+    user, household, members = await db.resolve_session(1004)
+    check("resolve_session without household", (user["id"], household, members), (4, None, []))
+    check("resolve_session unknown", await db.resolve_session(9999), (None, None, []))
+    h = await db.get_household(10)
+    check("get_household", (h["name"], float(h["monthly_budget"]), h["settings"]),
+          ("Casa", 1500.0, {"split_method": "equal", "currency": "PEN"}))
+    check("get_household missing", await db.get_household(999), None)
+    check("get_user_households", sorted(h["id"] for h in await db.get_user_households(3)), [10, 20])
+    check("get_user_households inactive", await db.get_user_households(4), [])
+    await db.set_active_household(3, 20)
+    check("set_active_household", (await db.get_active_household(3))["id"], 20)
+    check("set_active_household session", (await db.resolve_user_household(1003))[1]["id"], 20)
+    check("get_household_members", sorted(m["name"] for m in await db.get_household_members(10)),
+          ["Ana", "Beto", "Carla"])
+    check("get_households_by_ids", sorted(h["id"] for h in await db.get_households_by_ids([10, 20, 30])), [10, 20])
+    rows = await db.get_members_of_households([10, 20])
+    check("get_members_of_households", sorted((r["household_id"], r["user_id"], r["users"]["name"]) for r in rows),
+          [(10, 1, "Ana"), (10, 2, "Beto"), (10, 3, "Carla"), (20, 3, "Carla")])
+
+    # --- tokens ---
+    check("create_auth_token", bool(await db.create_auth_token(1001, "Ana")), True)
+    check("create_link_code", len(await db.create_link_code(1001, "Ana")), 6)
+
+    # --- reads over the fixture ---
+    march = _month(10, "2025-03")
+    check("get_monthly_expenses", [e["id"] for e in await db.get_monthly_expenses(10, 2025, 3)],
+          [e["id"] for e in sorted(march, key=lambda e: (e["expense_date"], e["id"]), reverse=True)])
+    streamed = [e async for e in db.iter_expenses(10, "2025-03-01", "2025-05-01", ("amount",), page_size=2)]
+    check("iter_expenses pages", [(e["expense_date"], e["id"], float(e["amount"])) for e in streamed],
+          sorted((e["expense_date"], e["id"], e["amount"]) for e in _month(10, "2025-0") if e["expense_date"] < "2025-05"))
+    check("get_monthly_balance", await db.get_monthly_balance(10, 2025, 3), db.balance_from_rows(march), _close)
+    check("get_monthly_summary", await db.get_monthly_summary(10, 2025, 3), db.summary_from_rows(march), _close)
+    snapshot = await db.get_monthly_snapshot(10, 2025, 3)
+    check("get_monthly_snapshot", snapshot.by_category(), db.summary_from_rows(march), _close)
+    check("get_monthly_snapshot balances", snapshot.balances(), db.balance_from_rows(march), _close)
+    check("get_monthly_balance empty", await db.get_monthly_balance(10, 2024, 1), {})
+
+    # --- writes ---
+    row = await db.insert_expense(10, 1, 12.5, "Salud", "Farmacia", [1, 2])
+    check("insert_expense", (row["household_id"], float(row["amount"]), row["type"], row["shared_with"]),
+          (10, 12.5, "variable", [1, 2]))
+    april = [db.expense_payload(10, 2, 20.0, "Transporte", "Bus", [1, 2], idempotency_key="k1", expense_date="2025-04-10"),
+             db.expense_payload(10, 3, 15.5, "Mantenimiento", "Foco", [3], idempotency_key="k2", expense_date="2025-04-11")]
+    written = await db.insert_expenses(april)
+    check("insert_expenses", sorted((r["idempotency_key"], r["type"]) for r in written), [("k1", "variable"), ("k2", "fixed")])
+    k3 = db.expense_payload(10, 1, 7.0, "Otros", "", [1], idempotency_key="k3", expense_date="2025-04-12")
+    again = await db.insert_expenses([april[1], k3])
+    check("insert_expenses skips duplicates", [r["idempotency_key"] for r in again], ["k3"])
+    try:
+        await db.get_client().table("expenses").insert({**april[0], "idempotency_key": "k1"}).execute()
+        check("duplicate insert raises 23505", None, "23505")
+    except APIError as e:
+        check("duplicate insert raises 23505", e.code, "23505")
+
+    inserted = [*april, k3]
+    check("get_monthly_summary after writes", await db.get_monthly_summary(10, 2025, 4),
+          db.summary_from_rows(_month(10, "2025-04", inserted)), _close)
+    expected_totals: Dict = {}
+    for e in [*_month(10, "2025-03"), *_month(10, "2025-04", inserted)]:
+        key = (e["expense_date"][:7] + "-01", e["category"])
+        expected_totals[key] = expected_totals.get(key, 0) + round(e["amount"] * 100)
+    check("get_category_totals_by_month", await db.get_category_totals_by_month(10, "2025-03-01", "2025-05-01"),
+          expected_totals)
+    expected_members: Dict = {}
+    for prefix, extra in (("2025-03", ()), ("2025-04", inserted)):
+        snap = MonthlySnapshot.from_rows(10, 2025, int(prefix[5:]), _month(10, prefix, extra))
+        for uid in set(snap.paid_cents) | set(snap.owed_cents):
+            expected_members[(prefix + "-01", uid)] = (snap.paid_cents.get(uid, 0), snap.owed_cents.get(uid, 0))
+    check("get_member_totals_by_month", await db.get_member_totals_by_month(10, "2025-03-01", "2025-05-01"),
+          expected_members)
+
+    # --- replica sync queries ---
+    newest = max(r["id"] for r in again)
+    cursor = await db.get_latest_expense_cursor()
+    check("get_latest_expense_cursor", cursor[1], newest)
+    seen, after = [], None
+    while True:
+        page = await db.get_expenses_created_after([10], after, 2)
+        seen += [r["id"] for r in page]
+        if len(page) < 2:
+            break
+        after = (page[-1]["created_at"], page[-1]["id"])
+    household_10 = [e["id"] for e in EXPENSES if e["household_id"] == 10] + [row["id"]] + [r["id"] for r in [*written, *again]]
+    check("get_expenses_created_after pages", sorted(seen), sorted(household_10))
+    check("get_expenses_created_after once", len(seen), len(set(seen)))
+    check("get_expenses_created_after min date",
+          sorted(r["id"] for r in await db.get_expenses_created_after([10], None, 100, "2025-04-01"))[:1], [5])
+
+    # Edits, moves and deletions made outside the bot, as the web app makes them
+    changed_from, deleted_from = await db.get_latest_expense_cursor(), await db.get_latest_deletion_cursor()
+    await asyncio.sleep(0.01)  # SQLite timestamps have millisecond precision
+    await db.get_client().table("expenses").update({"amount": 50.0}).eq("id", 2).execute()
+    await db.get_client().table("expenses").update({"household_id": 20}).eq("id", 3).execute()
+    await db.get_client().table("expenses").delete().eq("id", 4).execute()
+    changed = await db.get_expenses_changed_after([10, 20], changed_from, 100)
+    check("get_expenses_changed_after", [(r["id"], r["household_id"], float(r["amount"])) for r in changed],
+          [(2, 10, 50.0), (3, 20, 210.0)])
+    check("get_expenses_changed_after pages", [r["id"] for r in await db.get_expenses_changed_after(
+        [10, 20], (changed[0]["updated_at"], changed[0]["id"]), 100)], [3])
+    check("get_latest_expense_cursor after update", (await db.get_latest_expense_cursor())[1], 3)
+    deleted = await db.get_expense_deletions_after([10, 20], deleted_from, 100)
+    check("get_expense_deletions_after", [(r["expense_id"], r["household_id"]) for r in deleted], [(3, 10), (4, 10)])
+    check("get_expense_deletions_after household", await db.get_expense_deletions_after([20], deleted_from, 100), [])
+    check("get_latest_deletion_cursor", (await db.get_latest_deletion_cursor())[1], 4)
+
+    # --- recurring expenses, rules, subcategories ---
+    due = await db.get_due_recurring_expenses("2025-03-31")
+    check("get_due_recurring_expenses", [(r["id"], r["payer"]["name"]) for r in due], [(2, "Ana"), (1, "Carla")])
+    check("advance_recurring_expenses", await db.advance_recurring_expenses({1: "2025-04-20", 2: "2025-03-05"}), 1)
+    check("advance_recurring_expenses again", await db.advance_recurring_expenses({1: "2025-04-20"}), 0)
+    check("get_due_recurring_expenses after", [r["id"] for r in await db.get_due_recurring_expenses("2025-03-31")], [2])
+    rules = await db.get_automation_rules(10)
+    check("get_automation_rules", [(r["name"], r["auto_shared_with"]) for r in rules], [("Super compartido", [1, 2, 3])])
+    check("get_custom_subcategories", [(s["macro_category"], s["name"]) for s in await db.get_custom_subcategories(10)],
+          [("alimentos", "Panadería"), ("servicios", "Gas")])
+
+
+
+async def _conformance(backend: str) -> Checks:
+    # Caches are process-wide: a backend must not be served what the previous one answered
+    db._session_cache.clear()
+    db._snapshot_cache.clear()
+    if backend == "fake":
+        fake = FakeDatabase()
+        for table, rows in FIXTURE.items():
+            for r in rows:
+                fake.add(table, r)
+        client, close = FakeClient(fake), None
+    else:
+        store = SqlBenchDatabase(await create_sql_client(backend))
+        for table, rows in FIXTURE.items():
+            for r in rows:
+                store.add(table, r)
+        await store.load()
+        client, close = store.client, store.sql.close
+    await db.init_client(client)
+    check = Checks()
+    try:
+        await run_checks(check)
+    finally:
+        await db.close_client()
+        if close is not None:
+            await close()
+    return check
+
+
+@pytest.mark.parametrize("backend", [
+    "fake",
+    "sqlite",
+    pytest.param("postgres", marks=pytest.mark.skipif(not os.getenv("CONFORMANCE_DATABASE_URL"),
+                                                      reason="CONFORMANCE_DATABASE_URL not set")),
+])
+def test_backend_conforms(backend, tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "_ledger_enabled", db._ledger_enabled)  # a backend without the ledger turns it off
+    if backend == "sqlite":
+        monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "conformance.sqlite3"))
+    elif backend == "postgres":
+        pytest.importorskip("asyncpg")
+        monkeypatch.setenv("DATABASE_URL", os.environ["CONFORMANCE_DATABASE_URL"])
+    check = asyncio.run(_conformance(backend))
+    assert not check.failed, f"{len(check.failed)} of {check.passed + len(check.failed)} checks failed:\n" + \
+        "\n".join(check.failed)
@@ -0,0 +1,43 @@
+"""
+PendingExpenseStore: what stats() reports and what survives a restart.
+
+"live" is the number of /gasto flows that can still be confirmed, so
+entries past their TTL that no sweep has dropped yet must not count.
+Entries keep member ids only; rows written with [id, name] pairs before
+that still load.
+"""
+
+import json
+
+from utils.pending_store import PendingExpense, PendingExpenseStore
+
+
+def _pending(**kw) -> PendingExpense:
+    return PendingExpense(household_id=10, paid_by=1, amount_cents=35050, category="Supermercado",
+                          description="", members=(1, 2, 3), **kw)
+
+
+def test_live_excludes_expired(tmp_path):
+    store = PendingExpenseStore(str(tmp_path / "pending.sqlite3"), ttl=900, sweep_every=1000)
+    store.put((100, 1), _pending())
+    store.put((200, 2), _pending())
+    store._entries[(200, 2)].expires_at = 0.0  # past its TTL, not swept yet
+    stats = store.stats()
+    assert stats["live"] == 1 and len(store._entries) == 2
+    assert store.get((200, 2)) is None and store.stats()["live"] == 1
+    store.close()
+
+
+def test_restart_keeps_ids(tmp_path):
+    path = str(tmp_path / "pending.sqlite3")
+    store = PendingExpenseStore(path, ttl=900)
+    store.put((100, 1), _pending(shared=(3,)))
+    old = json.dumps([10, 2, 500, "Delivery", "", [[1, "Ana"], [2, "Beto"]], [1], 4e9])
+    store._db.execute("INSERT INTO pending_expenses VALUES (?, ?, ?, ?)", (200, 2, 4e9, old))
+    store.close()
+
+    store = PendingExpenseStore(path, ttl=900)
+    assert store.get((100, 1)).members == (1, 2, 3) and store.get((100, 1)).shared == (3,)
+    restored = store.get((200, 2))
+    assert restored.members == (1, 2) and restored.others() == (1,) and restored.idempotency_key == ""
+    store.close()
@@ -0,0 +1,69 @@
+"""
+Recurring schedules keep their day of the month across short months.
+
+An item due on the 31st is clamped to the month's last day (28/02) and
+must come back to the 31st in March; a yearly item on 29 February must
+return to the 29th in the next leap year. The scheduler test runs the
+ticks on the fake Supabase, with a row inserted without anchor_day.
+"""
+
+import asyncio
+from datetime import date
+
+from bench.fake_supabase import FakeClient, FakeDatabase
+from utils import supabase_client as db
+from utils.recurring import RecurringScheduler, missed_occurrences, next_due_date
+
+
+def test_monthly_31st_through_february():
+    due = date(2025, 1, 31)
+    dates = []
+    for _ in range(4):
+        due = next_due_date(due, "monthly", anchor_day=31)
+        dates.append(due)
+    assert dates == [date(2025, 2, 28), date(2025, 3, 31), date(2025, 4, 30), date(2025, 5, 31)]
+    # Without the anchor the day is taken from due itself
+    assert next_due_date(date(2025, 2, 28), "monthly") == date(2025, 3, 28)
+
+
+def test_yearly_29th_february():
+    due = date(2024, 2, 29)
+    dates = []
+    for _ in range(4):
+        due = next_due_date(due, "yearly", anchor_day=29)
+        dates.append(due)
+    assert dates == [date(2025, 2, 28), date(2026, 2, 28), date(2027, 2, 28), date(2028, 2, 29)]
+
+
+def test_missed_occurrences_keep_the_anchor():
+    dates, following = missed_occurrences(date(2025, 1, 31), "monthly", date(2025, 4, 15), 24, anchor_day=31)
+    assert dates == [date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 31)]
+    assert following == date(2025, 4, 30)
+
+
+def test_scheduler_anchors_and_advances():
+    fake = FakeDatabase()
+    fake.add("users", {"id": 1, "telegram_id": 1001, "name": "Ana"})
+    fake.add("households", {"id": 1, "name": "Casa", "created_by": 1})
+    fake.add("recurring_expenses", {
+        "id": 7, "household_id": 1, "paid_by": 1, "name": "Alquiler", "amount": 1200, "category": "Vivienda",
+        "type": "fixed", "shared_with": [1], "frequency": "monthly", "next_due_date": "2025-01-31",
+        "reminder_days_before": [], "auto_register": True, "is_active": True,
+    })
+
+    async def run():
+        await db.init_client(FakeClient(fake))
+        scheduler = RecurringScheduler()
+        seen = []
+        try:
+            for today in (date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 31)):
+                await scheduler.tick(today=today)
+                seen.append(fake.tables["recurring_expenses"][0]["next_due_date"])
+        finally:
+            await db.close_client()
+        return seen
+
+    assert asyncio.run(run()) == ["2025-02-28", "2025-03-31", "2025-04-30"]
+    row = fake.tables["recurring_expenses"][0]
+    assert row["anchor_day"] == 31
+    assert sorted(e["expense_date"] for e in fake.tables["expenses"]) == ["2025-01-31", "2025-02-28", "2025-03-31"]
@@ -0,0 +1,84 @@
+"""
+ReadReplica: edits, moves and deletions made outside the bot reach the
+replica through the incremental round, without a full reload.
+
+The replica follows migration 017's feeds (expenses by updated_at and
+expense_deletions) on the in-memory Supabase stand-in, which keeps them the
+way the migration's triggers do.
+"""
+
+import asyncio
+from datetime import date
+
+from bench.fake_supabase import FakeClient, FakeDatabase
+from utils import supabase_client as db
+from utils.replica import ReadReplica
+
+TODAY = date.today().isoformat()
+MONTH = TODAY[:7] + "-01"
+
+
+def _fake() -> FakeDatabase:
+    fake = FakeDatabase()
+    fake.add("users", {"id": 1, "telegram_id": 1001, "name": "Ana", "active_household_id": 10})
+    fake.add("users", {"id": 2, "telegram_id": 1002, "name": "Beto", "active_household_id": 10})
+    for household_id in (10, 20):
+        fake.add("households", {"id": household_id, "name": f"Casa {household_id}", "created_by": 1})
+    fake.add("household_members", {"id": 1, "household_id": 10, "user_id": 1, "is_active": True})
+    fake.add("household_members", {"id": 2, "household_id": 10, "user_id": 2, "is_active": True})
+    for i in range(1, 5):
+        fake.add("expenses", {"id": i, "household_id": 10, "paid_by": 1, "amount": 10.0 * i, "category": "Otros",
+                              "type": "variable", "description": "", "shared_with": [1, 2], "expense_date": TODAY})
+    return fake
+
+
+async def _edits_reach_replica(path: str) -> None:
+    await db.init_client(FakeClient(_fake()))
+    replica = ReadReplica(path)
+    try:
+        assert not replica.fresh(10)  # asks for the household
+        await replica.sync()
+        assert replica.full_syncs == 1 and replica.fresh(10)
+        assert [e["id"] for e in replica.expenses(10, MONTH, "9999-12-31")] == [1, 2, 3, 4]
+
+        # As the web app would: edit one, move one, delete one, push one out of the window
+        await db.get_client().table("expenses").update({"amount": 99.5}).eq("id", 1).execute()
+        await db.get_client().table("expenses").update({"household_id": 20}).eq("id", 2).execute()
+        await db.get_client().table("expenses").delete().eq("id", 3).execute()
+        await db.get_client().table("expenses").update({"expense_date": "2000-01-01"}).eq("id", 4).execute()
+        await replica.sync()
+
+        assert replica.full_syncs == 1 and replica.fresh(10)
+        rows = replica._db.execute("SELECT id, household_id FROM expenses").fetchall()
+        assert rows == [(1, 10)]
+        assert replica.expenses(10, MONTH, "9999-12-31")[0]["amount"] == 99.5
+    finally:
+        await replica.close()
+        await db.close_client()
+
+
+async def _old_file_reloads(path: str) -> None:
+    await db.init_client(FakeClient(_fake()))
+    replica = ReadReplica(path)
+    replica.fresh(10)
+    await replica.sync()
+    # A file synced before the change feeds kept one creation-order watermark
+    replica._db.execute("DELETE FROM meta")
+    replica._db.execute("INSERT INTO meta VALUES ('watermark', '[\"2025-01-01T00:00:00+00:00\", 4]')")
+    await replica.close()
+
+    replica = ReadReplica(path)
+    try:
+        await replica.sync()
+        assert replica.full_syncs == 1 and replica.fresh(10)
+    finally:
+        await replica.close()
+        await db.close_client()
+
+
+def test_edits_and_deletions_sync_incrementally(tmp_path):
+    asyncio.run(_edits_reach_replica(str(tmp_path / "replica.sqlite3")))
+
+
+def test_file_without_feed_watermarks_reloads(tmp_path):
+    asyncio.run(_old_file_reloads(str(tmp_path / "replica.sqlite3")))
@@ -0,0 +1,83 @@
+"""
+Automation rules — per-household "category → who shares it" defaults.
+
+automation_rules rows with trigger_type = 'category' say that expenses of
+trigger_category are shared with auto_shared_with. A household's active
+rules are loaded once (one query on idx_automation_rules_household_category),
+compiled into a dict keyed by lowercased category, and cached, so applying
+them to an expense is a single dict lookup however many rules exist.
+
+Actions:
+  - default: /gasto registers the expense right away with the rule's
+    members, skipping the member picker;
+  - auto_action {"confirm": true}: the picker is still shown, pre-filled.
+Rules with an empty auto_shared_with do nothing. If several rules name the
+same category, the newest one wins.
+
+Rules are only written by the web app, which can't reach this process's
+cache, so the cache is TTL-only: a new, edited or deleted rule takes effect
+in /gasto at most AUTOMATION_RULES_TTL seconds later.
+"""
+
+import os
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+
+from utils.cache import TTLCache
+from utils.supabase_client import get_automation_rules
+
+logger = logging.getLogger(__name__)
+
+_rules_cache = TTLCache(
+    maxsize=int(os.getenv("AUTOMATION_RULES_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("AUTOMATION_RULES_TTL", "300")),
+)
+
+
+class RuleAction:
+    """What a matching rule does to a new expense."""
+
+    __slots__ = ("rule_id", "name", "shared_with", "confirm")
+
+    def __init__(self, rule_id: int, name: str, shared_with: Tuple[int, ...], confirm: bool):
+        self.rule_id = rule_id
+        self.name = name
+        self.shared_with = shared_with
+        self.confirm = confirm
+
+
+class CompiledRules:
+    """A household's rules as a category → RuleAction lookup table."""
+
+    __slots__ = ("household_id", "_by_category")
+
+    def __init__(self, household_id: int, rules: Iterable[Dict]):
+        self.household_id = household_id
+        self._by_category: Dict[str, RuleAction] = {}
+        for rule in rules:  # oldest first, so newer rules overwrite older ones
+            category = (rule.get("trigger_category") or "").strip().lower()
+            shared = tuple(sorted(set(rule.get("auto_shared_with") or ())))
+            if not category or not shared:
+                continue
+            confirm = bool((rule.get("auto_action") or {}).get("confirm", False))
+            self._by_category[category] = RuleAction(rule["id"], rule["name"], shared, confirm)
+
+    def match(self, category: str) -> Optional[RuleAction]:
+        """The action for an expense of category, or None."""
+        return self._by_category.get(category.lower())
+
+    def __len__(self) -> int:
+        return len(self._by_category)
+
+
+async def get_household_rules(household_id: int) -> CompiledRules:
+    """Return the household's compiled rules (cached; one query on a miss)."""
+    rules = _rules_cache.get(household_id)
+    if rules is None:
+        rules = CompiledRules(household_id, await get_automation_rules(household_id))
+        _rules_cache.set(household_id, rules)
+    return rules
+
+
+def get_automation_cache_stats() -> Dict[str, float]:
+    return _rules_cache.stats()
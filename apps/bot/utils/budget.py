@@ -0,0 +1,257 @@
+"""
+Month-to-date budget tracking: alerts at 50/80/100% of monthly_budget.
+
+BudgetTracker keeps a running total per household for the current month
+(BUDGET_TZ), so checking the budget never re-sums the month:
+
+  seed       The first expense a household inserts this month loads its
+             total (one range read: get_category_totals_by_month, from the
+             ledger when migration 010 is there) and monthly_budget. If more
+             of its expenses arrive while that read is in flight, the read is
+             repeated, so they are counted exactly once.
+  on insert  on_expenses() (an expense listener) adds each row dated this
+             month to its household's total and checks the thresholds.
+  reconcile  Every BUDGET_RECONCILE_S seconds the tracked households are
+             re-read and their totals and budgets replaced, which picks up
+             expenses edited or added through the web app.
+
+Each threshold is sent at most once per household and month: it is
+recorded in a local SQLite file (BUDGET_STORE_PATH) before the message goes
+out, and a restarted bot reads those records back. When one expense crosses
+several thresholds, all of them are recorded and only the highest is sent.
+Alerts reach every active member through the notifier's rate limits.
+"""
+
+import os
+import time
+import asyncio
+import sqlite3
+import logging
+from datetime import datetime
+from typing import Dict, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+
+from utils.notifier import get_notifier
+from utils.snapshot import to_cents
+from utils.supabase_client import (
+    get_category_totals_by_month,
+    get_household,
+    get_household_members,
+)
+
+logger = logging.getLogger(__name__)
+
+THRESHOLDS = (50, 80, 100)  # percent of monthly_budget
+RECONCILE_S = float(os.getenv("BUDGET_RECONCILE_S", "900"))
+RECONCILE_CONCURRENCY = 8
+SEED_ATTEMPTS = 3
+TZ = ZoneInfo(os.getenv("BUDGET_TZ", os.getenv("RECURRING_TZ", "America/Lima")))
+
+
+def _month_key(now: datetime) -> str:
+    return f"{now.year}-{now.month:02d}"
+
+
+def _month_range(month: str) -> Tuple[str, str]:
+    year, m = int(month[:4]), int(month[5:7])
+    end = f"{year + 1}-01-01" if m == 12 else f"{year}-{m + 1:02d}-01"
+    return f"{month}-01", end
+
+
+class BudgetTracker:
+    """Running month-to-date totals per household, with threshold alerts."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path, isolation_level=None)  # autocommit
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS budget_alerts ("
+            " household_id INTEGER NOT NULL, month TEXT NOT NULL,"
+            " threshold INTEGER NOT NULL, sent_at REAL NOT NULL,"
+            " PRIMARY KEY (household_id, month, threshold))"
+        )
+        self._month = _month_key(datetime.now(TZ))
+        self._totals: Dict[int, int] = {}         # household_id → cents this month
+        self._budgets: Dict[int, int] = {}        # household_id → budget cents (0 = none)
+        self._alerted: Dict[int, Set[int]] = {}   # household_id → thresholds recorded
+        self._writes: Dict[int, int] = {}         # household_id → inserts seen (seed races)
+        self._seeding: Dict[int, asyncio.Task] = {}
+        self._sending: Set[asyncio.Task] = set()
+        self._started = False
+        self.seeds = 0
+        self.updates = 0
+        self.reconciled = 0
+        self.corrections = 0
+        self.alerts = 0
+
+    def start(self) -> None:
+        self._started = True
+
+    def on_expenses(self, rows) -> None:
+        """Expense listener: add this month's rows to their households' totals."""
+        if not self._started:
+            return
+        self._roll_month()
+        added: Dict[int, int] = {}
+        for row in rows:
+            if str(row.get("expense_date", ""))[:7] == self._month:
+                added[row["household_id"]] = added.get(row["household_id"], 0) + to_cents(row["amount"])
+        for household_id, cents in added.items():
+            self._writes[household_id] = self._writes.get(household_id, 0) + 1
+            if household_id in self._totals:
+                self._totals[household_id] += cents
+                self.updates += 1
+                self._check(household_id)
+            elif household_id not in self._seeding:
+                self._seeding[household_id] = asyncio.create_task(
+                    self._seed(household_id), name=f"budget-seed-{household_id}")
+
+    async def reconcile(self, context=None) -> None:
+        """JobQueue callback: replace every tracked total with the database's."""
+        self._roll_month()
+        month = self._month
+        semaphore = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+
+        async def one(household_id: int) -> None:
+            async with semaphore:
+                writes = self._writes.get(household_id, 0)
+                try:
+                    total, budget = await self._load(household_id, month)
+                except Exception as e:
+                    logger.warning(f"Could not reconcile budget of household {household_id}: {e!r}")
+                    return
+            # An insert during the read may or may not be in it; the next run settles it
+            if self._month != month or self._writes.get(household_id, 0) != writes:
+                return
+            if household_id not in self._totals:
+                return
+            if total != self._totals[household_id]:
+                logger.info(f"Budget total of household {household_id} drifted by "
+                            f"{(total - self._totals[household_id]) / 100:+.2f}; corrected")
+                self.corrections += 1
+            self._totals[household_id] = total
+            self._budgets[household_id] = budget
+            self._check(household_id)
+
+        await asyncio.gather(*(one(hid) for hid in list(self._totals)))
+        self.reconciled += 1
+
+    async def close(self) -> None:
+        """Wait for alerts being sent (before the notifier stops), then close the file."""
+        self._started = False
+        for task in self._seeding.values():
+            task.cancel()
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+        self._db.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "households": len(self._totals),
+            "seeds": self.seeds,
+            "updates": self.updates,
+            "reconciled": self.reconciled,
+            "corrections": self.corrections,
+            "alerts": self.alerts,
+        }
+
+    # ------------------------------------------------------------------
+    def _roll_month(self) -> None:
+        month = _month_key(datetime.now(TZ))
+        if month == self._month:
+            return
+        self._month = month
+        for task in self._seeding.values():
+            task.cancel()
+        self._seeding.clear()
+        self._totals.clear()
+        self._budgets.clear()
+        self._alerted.clear()
+        self._writes.clear()
+
+    async def _load(self, household_id: int, month: str) -> Tuple[int, int]:
+        """(cents spent in month, monthly_budget in cents) from the database."""
+        start, end = _month_range(month)
+        totals, household = await asyncio.gather(
+            get_category_totals_by_month(household_id, start, end),
+            get_household(household_id),
+        )
+        budget = (household or {}).get("monthly_budget")
+        return sum(totals.values()), to_cents(budget) if budget else 0
+
+    async def _seed(self, household_id: int) -> None:
+        month = self._month
+        try:
+            for _ in range(SEED_ATTEMPTS):
+                writes = self._writes.get(household_id, 0)
+                total, budget = await self._load(household_id, month)
+                if self._writes.get(household_id, 0) == writes:
+                    break
+            # Still racing after SEED_ATTEMPTS reads: reconcile() corrects any miscount
+            if self._month != month:
+                return
+            self._totals[household_id] = total
+            self._budgets[household_id] = budget
+            self._alerted[household_id] = {t for (t,) in self._db.execute(
+                "SELECT threshold FROM budget_alerts WHERE household_id = ? AND month = ?",
+                (household_id, month),
+            )}
+            self.seeds += 1
+            self._check(household_id)
+        except Exception as e:
+            logger.warning(f"Could not load the budget of household {household_id}: {e!r}")
+        finally:
+            self._seeding.pop(household_id, None)
+
+    def _check(self, household_id: int) -> None:
+        budget = self._budgets.get(household_id)
+        if not budget:
+            return
+        total = self._totals[household_id]
+        alerted = self._alerted.setdefault(household_id, set())
+        crossed = [t for t in THRESHOLDS if total * 100 >= t * budget and t not in alerted]
+        if not crossed:
+            return
+        # Recorded before sending: a crash mid-send loses the alert rather than repeating it
+        now = time.time()
+        self._db.executemany(
+            "INSERT OR IGNORE INTO budget_alerts VALUES (?, ?, ?, ?)",
+            [(household_id, self._month, t, now) for t in crossed],
+        )
+        alerted.update(crossed)
+        task = asyncio.create_task(self._alert(household_id, max(crossed), total, budget))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _alert(self, household_id: int, threshold: int, total: int, budget: int) -> None:
+        try:
+            members = await get_household_members(household_id)
+        except Exception as e:
+            logger.error(f"Could not look up members for the budget alert of household {household_id}: {e!r}")
+            return
+        if threshold >= 100:
+            text = (f"Se superó el presupuesto mensual: S/ {total / 100:.2f} "
+                    f"de S/ {budget / 100:.2f} ({total / budget * 100:.0f}%).")
+        else:
+            text = (f"Ya se usó el {threshold}% del presupuesto mensual: S/ {total / 100:.2f} "
+                    f"de S/ {budget / 100:.2f}. Quedan S/ {(budget - total) / 100:.2f}.")
+        sent = await asyncio.gather(*(get_notifier().send(m["telegram_id"], text)
+                                      for m in members if m.get("telegram_id")))
+        self.alerts += sum(sent)
+
+
+_tracker: Optional[BudgetTracker] = None
+
+
+def get_budget_tracker() -> BudgetTracker:
+    """Return the process-wide tracker, opening its alert file on first use."""
+    global _tracker
+    if _tracker is None:
+        _tracker = BudgetTracker(path=os.getenv("BUDGET_STORE_PATH", "budget_alerts.sqlite3"))
+    return _tracker
+
+
+def schedule_budget(job_queue) -> None:
+    """Register the reconciliation job on the Application's JobQueue."""
+    job_queue.run_repeating(get_budget_tracker().reconcile, interval=RECONCILE_S,
+                            first=RECONCILE_S, name="budget-reconcile")
@@ -0,0 +1,293 @@
+"""
+Bulk expense entry — many expenses from one message or one CSV/TSV file.
+
+Input lines are parsed lazily, one at a time, validated (categories through
+the household's CategoryIndex, see utils/categories.py), and turned into
+expenses rows that are inserted in chunks of BULK_CHUNK_SIZE (one request
+per chunk). Invalid lines are collected with their line number
+and never stop the import.
+
+Line formats:
+  text (multi-line /gasto):  [fecha] <monto> <categoría> [descripción]
+  CSV/TSV:                   monto, categoría[, descripción[, fecha[, tienda]]]
+
+A CSV header row is optional; if present, its column names (Spanish or
+English, see _HEADER_ALIASES) decide the column order. The delimiter (tab,
+";" or ",") is detected from the first line. Dates are YYYY-MM-DD or
+DD/MM/YYYY; lines without a date get today's date from the database.
+
+Every row gets an idempotency key (migration 012) built from a caller-given
+prefix that identifies the message (see handlers/importar.py) and its line
+number, so a redelivered update doesn't insert its rows twice. If a chunk
+can't be inserted the import stops there and the result says from which
+line on nothing was saved.
+
+Documents are streamed from the Bot API to a file (download_document), so a
+20 MB upload never sits in memory.
+"""
+
+import os
+import csv
+import re
+import logging
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import httpx
+
+from utils.supabase_client import expense_payload, insert_expenses
+from utils.categories import DEFAULT_INDEX, CategoryIndex
+
+logger = logging.getLogger(__name__)
+
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", "20000"))
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+DOWNLOAD_TIMEOUT_S = 60.0
+
+_HEADER_ALIASES: Dict[str, str] = {
+    "monto": "amount", "amount": "amount", "importe": "amount",
+    "categoria": "category", "categoría": "category", "category": "category",
+    "descripcion": "description", "descripción": "description", "description": "description",
+    "fecha": "expense_date", "date": "expense_date", "expense_date": "expense_date",
+    "tienda": "store", "store": "store",
+}
+_POSITIONAL = ("amount", "category", "description", "expense_date", "store")
+
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_DMY_DATE = re.compile(r"^\d{1,2}/\d{1,2}/\d{4}$")
+
+
+class LineError(ValueError):
+    """A line that cannot become an expense. The message is shown to the user."""
+
+
+@dataclass
+class ImportResult:
+    """Outcome of one bulk import."""
+
+    inserted: int = 0
+    duplicates: int = 0
+    total_cents: int = 0
+    errors: List[Tuple[int, str]] = field(default_factory=list)  # (line number, message)
+    truncated: bool = False  # stopped at BULK_MAX_ROWS
+    stopped_at: Optional[int] = None  # first line not saved because its chunk failed
+
+
+# ---------------------------------------------------------------------------
+# Download
+# ---------------------------------------------------------------------------
+async def download_document(url: str, out: BinaryIO, http: Optional[httpx.AsyncClient] = None) -> int:
+    """Stream url (a Telegram File.file_path) into out. Returns the bytes written.
+
+    Only DOWNLOAD_CHUNK_BYTES are held at a time. http defaults to a client
+    opened for this download.
+    """
+    if http is None:
+        async with httpx.AsyncClient(timeout=DOWNLOAD_TIMEOUT_S) as client:
+            return await download_document(url, out, client)
+    size = 0
+    async with http.stream("GET", url) as resp:
+        resp.raise_for_status()
+        async for chunk in resp.aiter_bytes(DOWNLOAD_CHUNK_BYTES):
+            out.write(chunk)
+            size += len(chunk)
+    return size
+
+
+# ---------------------------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------------------------
+def parse_amount(raw: str) -> float:
+    """Positive amount, accepting both 350,50 and 350.50."""
+    try:
+        amount = float(raw.strip().replace(",", "."))
+    except ValueError:
+        raise LineError(f"Monto no válido: '{raw}'")
+    if amount <= 0:
+        raise LineError(f"El monto debe ser positivo: '{raw}'")
+    return amount
+
+
+def parse_category(raw: str, index: CategoryIndex = DEFAULT_INDEX) -> str:
+    """Category name as resolved by the household's CategoryIndex."""
+    category = index.resolve(raw)
+    if category is None:
+        suggestions = index.suggest(raw)
+        hint = f" (¿{' / '.join(suggestions)}?)" if suggestions else ""
+        raise LineError(f"Categoría no válida: '{raw}'{hint}")
+    return category
+
+
+def parse_date(raw: str) -> Optional[str]:
+    """ISO date from YYYY-MM-DD or DD/MM/YYYY; None for an empty field."""
+    raw = raw.strip()
+    if not raw:
+        return None
+    try:
+        if _ISO_DATE.match(raw):
+            return date.fromisoformat(raw).isoformat()
+        if _DMY_DATE.match(raw):
+            return datetime.strptime(raw, "%d/%m/%Y").date().isoformat()
+    except ValueError:
+        pass
+    raise LineError(f"Fecha no válida: '{raw}' (usa AAAA-MM-DD o DD/MM/AAAA)")
+
+
+def _is_date(token: str) -> bool:
+    return bool(_ISO_DATE.match(token) or _DMY_DATE.match(token))
+
+
+def parse_text_lines(lines: Iterable[str], first_line: int = 1) -> Iterator[Tuple[int, Dict]]:
+    """Yield (line number, fields) for "[fecha] <monto> <categoría> [descripción]" lines.
+
+    Blank lines are skipped. Lines that can't be parsed yield fields with an
+    "error" entry instead of raising, so the caller can keep going.
+    """
+    for line_no, line in enumerate(lines, start=first_line):
+        tokens = line.split()
+        if not tokens:
+            continue
+        fields: Dict = {}
+        if _is_date(tokens[0]):
+            fields["expense_date"] = tokens.pop(0)
+        if len(tokens) < 2:
+            yield line_no, {"error": "Se esperaba: <monto> <categoría> [descripción]"}
+            continue
+        fields["amount"], fields["category"] = tokens[0], tokens[1]
+        fields["description"] = " ".join(tokens[2:])
+        yield line_no, fields
+
+
+def parse_csv_lines(lines: Iterable[str]) -> Iterator[Tuple[int, Dict]]:
+    """Yield (line number, fields) for CSV/TSV lines, header optional."""
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    delimiter = "\t" if "\t" in first else ";" if ";" in first else ","
+
+    def chain():
+        yield first
+        yield from lines
+
+    columns: Sequence[str] = _POSITIONAL
+    reader = csv.reader(chain(), delimiter=delimiter)
+    for row in reader:
+        line_no = reader.line_num
+        if not any(cell.strip() for cell in row):
+            continue
+        if line_no == 1:
+            header = [_HEADER_ALIASES.get(cell.strip().lower()) for cell in row]
+            if "amount" in header and "category" in header:
+                columns = [h or "" for h in header]
+                continue
+        fields = {name: value for name, value in zip(columns, row) if name}
+        if "amount" not in fields or "category" not in fields:
+            yield line_no, {"error": "Faltan columnas: monto y categoría son obligatorias"}
+            continue
+        yield line_no, fields
+
+
+def validate(fields: Dict, index: CategoryIndex = DEFAULT_INDEX) -> Dict:
+    """Turn raw fields into typed ones, raising LineError on the first problem."""
+    if "error" in fields:
+        raise LineError(fields["error"])
+    return {
+        "amount": parse_amount(fields["amount"]),
+        "category": parse_category(fields["category"], index),
+        "description": (fields.get("description") or "").strip(),
+        "expense_date": parse_date(fields.get("expense_date") or ""),
+        "store": (fields.get("store") or "").strip() or None,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Shared-with default
+# ---------------------------------------------------------------------------
+def default_shared_with(household: Dict, members: List[Dict], paid_by: int) -> List[int]:
+    """Who shares a bulk-imported expense.
+
+    households.settings.default_shared_with (user ids) if configured,
+    otherwise every active member; the payer is always included.
+    """
+    member_ids = {m["id"] for m in members}
+    configured = (household.get("settings") or {}).get("default_shared_with")
+    shared = member_ids.intersection(configured) if configured else set(member_ids)
+    shared.add(paid_by)
+    return sorted(shared)
+
+
+# ---------------------------------------------------------------------------
+# Import
+# ---------------------------------------------------------------------------
+async def import_expenses(
+    parsed: Iterable[Tuple[int, Dict]],
+    household_id: int,
+    paid_by: int,
+    shared_with: List[int],
+    key_prefix: str,
+    chunk_size: Optional[int] = None,
+    categories: CategoryIndex = DEFAULT_INDEX,
+) -> ImportResult:
+    """Validate parsed lines and insert the valid ones in chunks.
+
+    parsed comes from parse_text_lines() / parse_csv_lines(); only one chunk
+    of rows is held at a time. key_prefix must identify the message so that
+    idempotency keys are stable across redeliveries. A chunk that fails to
+    insert stops the import (see ImportResult.stopped_at).
+    """
+    chunk_size = chunk_size or BULK_CHUNK_SIZE
+    result = ImportResult()
+    chunk: List[Dict] = []
+    chunk_start = 0
+    rows = 0
+
+    async def flush() -> bool:
+        try:
+            inserted = await insert_expenses(chunk)
+        except Exception as e:
+            logger.error(f"Bulk import into household {household_id} stopped at line {chunk_start}: {e!r}")
+            result.stopped_at = chunk_start
+            return False
+        result.inserted += len(inserted)
+        result.duplicates += len(chunk) - len(inserted)
+        result.total_cents += sum(int(round(float(row["amount"]) * 100)) for row in inserted)
+        chunk.clear()
+        return True
+
+    for line_no, fields in parsed:
+        if rows >= BULK_MAX_ROWS:
+            result.truncated = True
+            break
+        rows += 1
+        try:
+            exp = validate(fields, categories)
+        except LineError as e:
+            result.errors.append((line_no, str(e)))
+            continue
+        if not chunk:
+            chunk_start = line_no
+        chunk.append(expense_payload(
+            household_id=household_id,
+            paid_by=paid_by,
+            amount=exp["amount"],
+            category=exp["category"],
+            description=exp["description"],
+            shared_with=shared_with,
+            store=exp["store"],
+            idempotency_key=f"{key_prefix}:{line_no}",
+            expense_date=exp["expense_date"],
+            expense_type=categories.type_of(exp["category"]),
+        ))
+        if len(chunk) >= chunk_size and not await flush():
+            return result
+    if chunk and not await flush():
+        return result
+
+    logger.info(
+        f"Bulk import into household {household_id}: {result.inserted} inserted, "
+        f"{result.duplicates} duplicates, {len(result.errors)} errors"
+    )
+    return result
@@ -0,0 +1,202 @@
+"""
+Small in-process caches used by the database helpers.
+
+TTLCache is a bounded LRU map whose entries also expire after a fixed number
+of seconds. VersionedCache is a bounded LRU map of computed results tagged
+with the version of the scope (e.g. household) they were computed from;
+bumping the scope's version makes them stale, and concurrent misses for the
+same key can share one computation. Neither is thread-safe, which is fine:
+the bot runs every handler on a single asyncio event loop.
+"""
+
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """Bounded LRU cache with per-entry time-to-live and hit/miss counters."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key → (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired."""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store value under key, evicting the least recently used entry if full."""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        """Drop a single entry (no-op if absent)."""
+        self._data.pop(key, None)
+
+    def pop_where(self, predicate: Callable[[Any], bool]) -> int:
+        """Drop every entry whose value matches predicate. Returns how many were dropped."""
+        stale = [k for k, (_, v) in self._data.items() if predicate(v)]
+        for k in stale:
+            del self._data[k]
+        return len(stale)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, float]:
+        """Counters for sizing: hits, misses, evictions, current size and hit rate."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class VersionedCache:
+    """Bounded LRU of computed values, invalidated by per-scope version counters.
+
+    Each entry remembers the version of its scope at the time its computation
+    started. bump(scope) advances the version, so every entry of that scope
+    is stale from then on, including ones still being computed. ttl (seconds,
+    0 = none) bounds how long an entry may miss changes the cache is not told
+    about. With single_flight, concurrent misses for one key await a single
+    computation instead of each running their own.
+
+    A scope's version is only kept while the scope has cached entries or
+    running computations; without either there is nothing to outdate, so
+    bump() is a no-op and _versions holds no more scopes than that.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 0.0, single_flight: bool = True):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.single_flight = single_flight
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key → (scope, version, expires_at, value)
+        self._versions: Dict[Hashable, int] = {}
+        self._refs: Dict[Hashable, int] = {}  # scope → cached entries + running computations
+        self._inflight: Dict[Hashable, "asyncio.Future"] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0       # misses because the scope changed
+        self.coalesced = 0   # misses served by a computation already running
+        self.evictions = 0
+
+    def version(self, scope: Hashable) -> int:
+        return self._versions.get(scope, 0)
+
+    def bump(self, scope: Hashable) -> None:
+        """Mark every cached value of scope as out of date."""
+        if scope in self._refs:
+            self._versions[scope] = self._versions.get(scope, 0) + 1
+
+    def _ref(self, scope: Hashable) -> None:
+        self._refs[scope] = self._refs.get(scope, 0) + 1
+
+    def _unref(self, scope: Hashable) -> None:
+        if self._refs[scope] > 1:
+            self._refs[scope] -= 1
+        else:  # nothing left that the version could outdate
+            del self._refs[scope]
+            self._versions.pop(scope, None)
+
+    def _drop(self, key: Hashable) -> None:
+        self._unref(self._data.pop(key)[0])
+
+    async def get_or_compute(self, key: Hashable, scope: Hashable,
+                             compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value of key, or compute, store and return it."""
+        version = self.version(scope)
+        entry = self._data.get(key)
+        if entry is not None:
+            cached_scope, cached_version, expires_at, value = entry
+            if cached_version == version and (not self.ttl or expires_at > time.monotonic()):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            self._drop(key)
+            self.stale += cached_version != version
+            # The drop may have released the scope's version: compare later writes with what is kept now
+            version = self.version(scope)
+        self.misses += 1
+
+        flight_key = (key, version)
+        if self.single_flight:
+            running = self._inflight.get(flight_key)
+            if running is not None:
+                self.coalesced += 1
+                return await asyncio.shield(running)
+            future = self._inflight[flight_key] = asyncio.get_running_loop().create_future()
+        self._ref(scope)
+        try:
+            value = await compute()
+        except BaseException as e:
+            self._unref(scope)
+            if self.single_flight:
+                self._inflight.pop(flight_key, None)
+                if isinstance(e, Exception):
+                    future.set_exception(e)
+                    future.exception()  # retrieved here: there may be no waiters
+                else:
+                    future.cancel()
+            raise
+        if self.single_flight:
+            self._inflight.pop(flight_key, None)
+            future.set_result(value)
+        if self.version(scope) == version:  # not already outdated by a write
+            if key in self._data:  # stored meanwhile by another computation
+                self._drop(key)
+            self._data[key] = (scope, version, time.monotonic() + self.ttl, value)
+            self._ref(scope)
+            while len(self._data) > self.maxsize:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+        self._unref(scope)
+        return value
+
+    def clear(self) -> None:
+        while self._data:
+            self._drop(next(iter(self._data)))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "scopes": len(self._versions),
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,123 @@
+"""
+Category resolution — from what the user typed to a stored category name.
+
+A CategoryIndex is built once per household and answers with dict lookups:
+
+  - canonical names (CATEGORIES) and the household's custom_subcategories
+    (migration 006), matched lowercase and without accents
+    ("teléfono" = "telefono" = "TELEFONO");
+  - unambiguous prefixes of at least MIN_PREFIX characters, so "super"
+    resolves to Supermercado, while "s" or an ambiguous "se" do not;
+  - names of several words ("Seguro auto") when the message has them.
+
+type_of() gives the expenses.type to store: from CATEGORIES for canonical
+names, from the macro category (MACRO_CATEGORY_TYPES) for custom ones.
+
+On a miss, suggest() ranks the closest names (prefix matches first, then
+by similarity). Only misses pay for a scan of the names.
+
+Indexes are cached per household for CATEGORY_INDEX_TTL seconds. Custom
+subcategories are only written by the web app, which can't reach this
+process's cache, so the cache is TTL-only: a new or renamed subcategory
+resolves in /gasto and bulk imports at most CATEGORY_INDEX_TTL seconds
+later.
+"""
+
+import os
+import difflib
+import logging
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from utils.cache import TTLCache
+from utils.supabase_client import CATEGORIES, MACRO_CATEGORY_TYPES, VALID_CATEGORIES, get_custom_subcategories
+
+logger = logging.getLogger(__name__)
+
+MIN_PREFIX = 3
+
+_index_cache = TTLCache(
+    maxsize=int(os.getenv("CATEGORY_INDEX_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("CATEGORY_INDEX_TTL", "300")),
+)
+
+
+def fold(text: str) -> str:
+    """Lowercase, strip accents and collapse whitespace."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return " ".join("".join(c for c in decomposed if not unicodedata.combining(c)).split())
+
+
+class CategoryIndex:
+    """Precomputed lookups from folded names and prefixes to category names."""
+
+    def __init__(self, custom: Iterable[Tuple[str, str]] = ()):
+        """custom: (name, macro_category) of the household's custom subcategories."""
+        self.names: List[str] = []
+        self._exact: Dict[str, str] = {}
+        self._types: Dict[str, str] = {name: c["type"] for name, c in CATEGORIES.items()}
+        # Canonical names first: a custom subcategory can't shadow them
+        for name, macro in (*((n, None) for n in VALID_CATEGORIES), *custom):
+            key = fold(name)
+            if key and key not in self._exact:
+                self._exact[key] = name
+                self.names.append(name)
+                if macro is not None:
+                    self._types[name] = MACRO_CATEGORY_TYPES.get(macro, "variable")
+
+        # prefix → name, or None when several names share the prefix
+        self._prefix: Dict[str, Optional[str]] = {}
+        for key, name in self._exact.items():
+            for end in range(MIN_PREFIX, len(key)):
+                prefix = key[:end]
+                self._prefix[prefix] = name if prefix not in self._prefix else None
+        self.max_words = max((len(k.split()) for k in self._exact), default=1)
+
+    def resolve(self, raw: str) -> Optional[str]:
+        """The category name for raw, or None if unknown or ambiguous."""
+        key = fold(raw)
+        return self._exact.get(key) or self._prefix.get(key)
+
+    def resolve_tokens(self, tokens: Sequence[str]) -> Tuple[Optional[str], int]:
+        """Longest category at the start of tokens: (name, tokens used) or (None, 0)."""
+        for n in range(min(self.max_words, len(tokens)), 0, -1):
+            name = self.resolve(" ".join(tokens[:n]))
+            if name is not None:
+                return name, n
+        return None, 0
+
+    def type_of(self, name: str) -> str:
+        """expenses.type for a name returned by resolve()."""
+        return self._types.get(name, "variable")
+
+    def suggest(self, raw: str, limit: int = 3) -> List[str]:
+        """Closest names to an unresolved input, best first."""
+        key = fold(raw)
+        if not key:
+            return []
+        starts = [name for k, name in self._exact.items() if k.startswith(key)]
+        close = difflib.get_close_matches(key, list(self._exact), n=limit, cutoff=0.5)
+        ranked = dict.fromkeys([*starts, *(self._exact[k] for k in close)])
+        return list(ranked)[:limit]
+
+    def __len__(self) -> int:
+        return len(self._exact)
+
+
+DEFAULT_INDEX = CategoryIndex()
+
+
+async def get_category_index(household_id: Optional[int]) -> CategoryIndex:
+    """Return the household's index (cached; one query on a miss)."""
+    if household_id is None:
+        return DEFAULT_INDEX
+    index = _index_cache.get(household_id)
+    if index is None:
+        custom = await get_custom_subcategories(household_id)
+        index = CategoryIndex((row["name"], row["macro_category"]) for row in custom) if custom else DEFAULT_INDEX
+        _index_cache.set(household_id, index)
+    return index
+
+
+def get_category_cache_stats() -> Dict[str, float]:
+    return _index_cache.stats()
@@ -0,0 +1,198 @@
+"""
+ExpenseBatch — columnar (NumPy) representation of many expense rows.
+
+Per-row dict loops are fine for one month, but reports over a year or more
+touch every expense of the range. ExpenseBatch converts the rows once into
+flat arrays and answers the aggregates with bincount kernels:
+
+  category_month_pivot  cents[category, month]        (/tendencia)
+  member_month_pivot    paid and owed cents[user, month]: credit and each
+                        member's share (/balance <año>)
+
+Columns (one entry per expense):
+  amount_cents  int64   amount in cents
+  category      int32   index into categories
+  month         int32   months since 1970-01 (see month_key)
+  paid_by       int64   payer's user id
+
+shared_with is stored CSR-style: the people sharing expense i are
+user_ids[shared_indices[shared_indptr[i]:shared_indptr[i + 1]]], deduplicated
+and ordered payer first, then by id. Leftover cents of a split go to the
+first entries in that order, matching utils/snapshot.py and the ledger.
+The CSR arrays (and payer, the payer's index into user_ids) are built on
+first use, with whole-array operations, so a category-only report never
+pays for the splits.
+
+python -m bench.columnar times the kernels against the MonthlySnapshot
+loops at 1k, 100k and 1M rows.
+"""
+
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def month_key(year: int, month: int) -> int:
+    """Months since 1970-01, the unit of the month column."""
+    return (year - 1970) * 12 + month - 1
+
+
+def month_start(key: int) -> str:
+    """First day of month `key`, as the ledger and the range helpers write it."""
+    return f"{1970 + key // 12}-{key % 12 + 1:02d}-01"
+
+
+class ExpenseBatch:
+    """Immutable columnar batch of expenses with vectorized aggregate kernels."""
+
+    def __init__(
+        self,
+        categories: List[str],
+        amount_cents: np.ndarray,
+        category: np.ndarray,
+        month: np.ndarray,
+        paid_by: Optional[np.ndarray] = None,
+        shared_with: Optional[Sequence[Sequence[int]]] = None,
+    ):
+        self.categories = categories
+        self.amount_cents = amount_cents
+        self.category = category
+        self.month = month
+        self.paid_by = paid_by
+        self._shared_with = shared_with  # raw lists until the CSR is needed
+        self._csr: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return len(self.amount_cents)
+
+    # ------------------------------------------------------------------
+    # Construction
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict], splits: bool = True) -> "ExpenseBatch":
+        """Build a batch from expense rows (amount, category, expense_date, paid_by, shared_with).
+
+        With splits=False, paid_by and shared_with aren't read and only the
+        category kernels can be used. Each column is pulled out in one
+        comprehension; unit conversions (cents, months) run on whole arrays.
+        """
+        rows = rows if isinstance(rows, list) else list(rows)
+        category_index: Dict[str, int] = {}
+        intern = category_index.setdefault
+        codes = [intern(e["category"], len(category_index)) for e in rows]
+        # float() first: NUMERIC arrives as str or Decimal from some backends
+        amount = np.array([float(e["amount"]) for e in rows], dtype=np.float64)
+        return cls(
+            categories=list(category_index),
+            amount_cents=np.rint(amount * 100).astype(np.int64),
+            category=np.array(codes, dtype=np.int32),
+            month=np.array([str(e["expense_date"])[:7] for e in rows], dtype="datetime64[M]").astype(np.int32),
+            paid_by=np.array([e["paid_by"] for e in rows], dtype=np.int64) if splits else None,
+            shared_with=[e["shared_with"] or () for e in rows] if splits else None,
+        )
+
+    @property
+    def user_ids(self) -> np.ndarray:
+        """Every payer and sharer, ascending; the user axis of member_month_pivot."""
+        return self._shares_csr()[0]
+
+    @property
+    def payer(self) -> np.ndarray:
+        """Index of each expense's payer into user_ids."""
+        return self._shares_csr()[1]
+
+    @property
+    def shared_indptr(self) -> np.ndarray:
+        return self._shares_csr()[2]
+
+    @property
+    def shared_indices(self) -> np.ndarray:
+        return self._shares_csr()[3]
+
+    def _shares_csr(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        if self._csr is None:
+            if self.paid_by is None:
+                raise ValueError("batch built with splits=False has no payers or shares")
+            n = len(self)
+            lengths = np.fromiter(map(len, self._shared_with), dtype=np.int64, count=n)
+            ids = np.fromiter(chain.from_iterable(self._shared_with), dtype=np.int64, count=int(lengths.sum()))
+            rows = np.repeat(np.arange(n, dtype=np.int64), lengths)
+            # Within each expense: payer first, then ascending ids; a repeated id counts once
+            order = np.lexsort((ids, ids != self.paid_by[rows], rows))
+            rows, ids = rows[order], ids[order]
+            first = np.ones(len(ids), dtype=bool)
+            first[1:] = (rows[1:] != rows[:-1]) | (ids[1:] != ids[:-1])
+            rows, ids = rows[first], ids[first]
+            user_ids, index = np.unique(np.concatenate([self.paid_by, ids]), return_inverse=True)
+            indptr = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+            self._csr = (user_ids, index[:n].astype(np.int32), indptr, index[n:].astype(np.int32))
+        return self._csr
+
+    # ------------------------------------------------------------------
+    # Kernels
+    # ------------------------------------------------------------------
+    def month_range(self) -> Optional[Tuple[int, int]]:
+        """(first, last) month key present in the batch, or None when empty."""
+        if not len(self):
+            return None
+        return int(self.month.min()), int(self.month.max())
+
+    def _shares(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Per-share arrays: (expense row of each share, cents of each share)."""
+        counts = np.diff(self.shared_indptr)
+        rows = np.repeat(np.arange(len(self), dtype=np.int64), counts)
+        n = counts[rows]
+        amount = self.amount_cents[rows]
+        rank = np.arange(len(rows), dtype=np.int64) - self.shared_indptr[:-1][rows]
+        return rows, amount // n + (rank < amount % n)
+
+    @staticmethod
+    def _pivot(index: np.ndarray, months: np.ndarray, weights: np.ndarray, size: int,
+               first_month: int, last_month: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(sum of weights, number of entries)[index, month - first_month], months first..last."""
+        width = last_month - first_month + 1
+        keep = (months >= first_month) & (months <= last_month)
+        cell = index[keep].astype(np.int64) * width + (months[keep] - first_month)
+        # float64 weights are exact for sums below 2**53 cents
+        sums = np.bincount(cell, weights=weights[keep], minlength=size * width).round().astype(np.int64)
+        counts = np.bincount(cell, minlength=size * width)
+        return sums.reshape(size, width), counts.reshape(size, width)
+
+    def category_month_pivot(self, first_month: int, last_month: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(cents, expense count)[category, month - first_month] for months first..last."""
+        return self._pivot(self.category, self.month, self.amount_cents, len(self.categories),
+                           first_month, last_month)
+
+    def member_month_pivot(self, first_month: int, last_month: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(paid, owed) cents[user, month - first_month] for months first..last."""
+        paid, _ = self._pivot(self.payer, self.month, self.amount_cents, len(self.user_ids),
+                              first_month, last_month)
+        rows, cents = self._shares()
+        owed, _ = self._pivot(self.shared_indices, self.month[rows], cents, len(self.user_ids),
+                              first_month, last_month)
+        return paid, owed
+
+    # ------------------------------------------------------------------
+    # Report shapes (same keys as the ledger reads of supabase_client)
+    # ------------------------------------------------------------------
+    def category_totals_by_month(self) -> Dict[Tuple[str, str], int]:
+        """{ (first day of month, category): cents } for every pair with expenses."""
+        span = self.month_range()
+        if span is None:
+            return {}
+        cents, counts = self.category_month_pivot(*span)
+        cats, cols = np.nonzero(counts)
+        return {(month_start(span[0] + int(m)), self.categories[c]): int(cents[c, m])
+                for c, m in zip(cats.tolist(), cols.tolist())}
+
+    def member_totals_by_month(self) -> Dict[Tuple[str, int], Tuple[int, int]]:
+        """{ (first day of month, user_id): (paid cents, owed cents) }, all-zero pairs left out."""
+        span = self.month_range()
+        if span is None:
+            return {}
+        paid, owed = self.member_month_pivot(*span)
+        users, cols = np.nonzero(paid | owed)
+        return {(month_start(span[0] + int(m)), int(self.user_ids[u])): (int(paid[u, m]), int(owed[u, m]))
+                for u, m in zip(users.tolist(), cols.tolist())}
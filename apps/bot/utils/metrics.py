@@ -0,0 +1,196 @@
+"""
+In-process metrics with a Prometheus text endpoint.
+
+Recorded on the hot path (see supabase_client.track_round_trips and
+_execute):
+
+  bot_handler_duration_seconds{handler}    latency of every handler in main.py
+  bot_handler_errors_total{handler}        handlers that raised
+  bot_handler_round_trips{handler}         database round trips per update
+  bot_db_query_duration_seconds{table,op}  latency of every PostgREST request
+  bot_db_query_errors_total{table,op}      requests that raised
+
+Recording is a dict lookup, a bisect over the bucket bounds and a few
+integer adds — no locks, since everything runs on one event loop. Other
+components publish their stats() dicts as gauges through add_collector().
+
+With METRICS_PORT set, start_server() serves GET /metrics on METRICS_HOST
+(127.0.0.1 by default, so it is only reachable from the host).
+"""
+
+import os
+import asyncio
+import logging
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 = no endpoint
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21)
+
+
+def _label_str(names: Sequence[str], values: Tuple) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class Counter:
+    """Monotonic count per label set."""
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        for values, count in sorted(self._values.items()):
+            lines.append(f"{self.name}{_label_str(self.labels, values)} {count}")
+        return lines
+
+
+class Histogram:
+    """Bucketed distribution per label set (sum and count included)."""
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values → [count per bucket..., +Inf count, sum]
+        self._series: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def quantile(self, q: float, *labels) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None if no data)."""
+        series = self._series.get(labels)
+        if not series:
+            return None
+        target = q * sum(series[:-1])
+        seen = 0
+        for bound, n in zip((*self.buckets, float("inf")), series[:-1]):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        for values, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), series[:-1]):
+                cumulative += n
+                le = _label_str((*self.labels, "le"), (*values, bound))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _label_str(self.labels, values)
+            lines.append(f"{self.name}_sum{labels} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_duration_seconds", "Handler latency.", ("handler",))
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Handlers that raised.", ("handler",))
+HANDLER_ROUND_TRIPS = Histogram(
+    "bot_handler_round_trips", "Database round trips per update.", ("handler",), COUNT_BUCKETS)
+QUERY_LATENCY = Histogram(
+    "bot_db_query_duration_seconds", "PostgREST request latency.", ("table", "op"))
+QUERY_ERRORS = Counter(
+    "bot_db_query_errors_total", "PostgREST requests that raised.", ("table", "op"))
+
+_metrics = [HANDLER_LATENCY, HANDLER_ERRORS, HANDLER_ROUND_TRIPS, QUERY_LATENCY, QUERY_ERRORS]
+_collectors: Dict[str, Callable[[], Dict]] = {}
+
+
+def add_collector(name: str, stats: Callable[[], Dict]) -> None:
+    """Publish every numeric value of stats() as a gauge bot_<name>_<key>."""
+    _collectors[name] = stats
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for name, stats in _collectors.items():
+        try:
+            values = stats()
+        except Exception as e:
+            logger.warning(f"Metrics collector {name} failed: {e!r}")
+            continue
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"# TYPE bot_{name}_{key} gauge")
+                lines.append(f"bot_{name}_{key} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------------------------------------------------------
+# Exposition endpoint
+# ---------------------------------------------------------------------------
+async def _serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass  # headers are not needed
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+_server: Optional[asyncio.AbstractServer] = None
+
+
+async def start_server(port: int = METRICS_PORT, host: str = METRICS_HOST) -> None:
+    """Serve GET /metrics on host:port (no-op when port is 0)."""
+    global _server
+    if not port or _server is not None:
+        return
+    _server = await asyncio.start_server(_serve, host, port)
+    logger.info(f"Metrics endpoint on http://{host}:{port}/metrics")
+
+
+async def close_server() -> None:
+    global _server
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
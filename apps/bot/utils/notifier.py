@@ -0,0 +1,254 @@
+"""
+Fan-out notifications: tell household members about expenses shared with them.
+
+Every successful expense insert (single, queued, bulk or recurring) reaches
+Notifier.on_expenses() through supabase_client's expense listeners. For each
+member in shared_with other than the payer, the expense is added to that
+member's pending digest:
+
+  - Coalescing: the first expense for a member opens a window of
+    NOTIFY_COALESCE_S seconds; everything that arrives meanwhile goes into
+    the same message, so 20 expenses in a minute become one digest.
+  - Rate limits: sends go through a global token bucket (NOTIFY_GLOBAL_RATE
+    messages/second, Telegram allows about 30) and a per-chat one
+    (NOTIFY_CHAT_RATE; Telegram allows about 1/second per chat).
+  - 429s: RetryAfter is retried after the delay Telegram asks for, up to
+    NOTIFY_MAX_ATTEMPTS; members who blocked the bot are skipped.
+
+Per-chat buckets that are full again with nobody waiting on them are
+dropped after every flush (a new bucket starts full, so nothing changes for
+that chat); only chats messaged in the last 1/NOTIFY_CHAT_RATE seconds keep
+one.
+
+Recipients' telegram_ids (and payers' names) are looked up once per flush
+for every user id not seen before, in one query.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set
+
+from telegram.error import Forbidden, RetryAfter
+
+from utils.cache import TTLCache
+from utils.supabase_client import get_users_by_ids
+
+logger = logging.getLogger(__name__)
+
+COALESCE_S = float(os.getenv("NOTIFY_COALESCE_S", "60"))
+GLOBAL_RATE = float(os.getenv("NOTIFY_GLOBAL_RATE", "25"))
+CHAT_RATE = float(os.getenv("NOTIFY_CHAT_RATE", "1"))
+MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+MAX_LINES = 10  # expenses listed per digest; the rest are summarized
+
+
+class TokenBucket:
+    """rate tokens per second, bursts up to capacity. acquire() waits for a token."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.waiters = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def idle(self) -> bool:
+        """Full and nobody waiting: the same as a new bucket."""
+        return not self.waiters and self.delay() == 0 and self.tokens >= self.capacity
+
+    async def acquire(self) -> None:
+        self.waiters += 1
+        try:
+            while (wait := self.delay()) > 0:
+                await asyncio.sleep(wait)
+        finally:
+            self.waiters -= 1
+        self.tokens -= 1
+
+
+class Notifier:
+    """Coalesces expense notifications per member and sends them rate-limited."""
+
+    def __init__(self):
+        self._bot = None
+        self._digests: Dict[int, List[Dict]] = {}   # user_id → expenses not yet sent
+        self._ready: Deque[int] = deque()           # user_ids whose window closed
+        self._wakeup = asyncio.Event()
+        self._timers: Dict[int, asyncio.TimerHandle] = {}  # user_id → window end
+        self._task: Optional[asyncio.Task] = None
+        self._global = TokenBucket(GLOBAL_RATE, capacity=1)  # smooth: no bursts over the limit
+        self._chats: Dict[int, TokenBucket] = {}
+        self._users = TTLCache(maxsize=4096, ttl=3600)  # user_id → users row
+        self.expenses = 0
+        self.sent = 0
+        self.retries = 0
+        self.dropped = 0
+        self.latency_total = 0.0
+
+    def start(self, bot) -> None:
+        self._bot = bot
+        self._task = asyncio.create_task(self._run(), name="expense-notifier")
+
+    def on_expenses(self, rows: List[Dict]) -> None:
+        """Expense listener: add each row to the digest of every other sharer."""
+        if self._task is None:
+            return
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        for row in rows:
+            recipients = set(row.get("shared_with") or ()) - {row["paid_by"]}
+            if not recipients:
+                continue
+            item = {k: row.get(k) for k in ("paid_by", "amount", "category", "description")}
+            item["_queued_at"] = now
+            for uid in recipients:
+                digest = self._digests.setdefault(uid, [])
+                if not digest:
+                    self._timers[uid] = loop.call_later(COALESCE_S, self._window_closed, uid)
+                digest.append(item)
+                self.expenses += 1
+
+    async def send(self, chat_id: int, text: str) -> bool:
+        """Send one message within the same rate limits (e.g. budget alerts)."""
+        if self._bot is None:
+            return False
+        return await self._send(chat_id, text)
+
+    async def close(self) -> None:
+        """Send every open digest now, then stop."""
+        if self._task is None:
+            return
+        for uid, timer in self._timers.items():
+            timer.cancel()
+            self._ready.append(uid)
+        self._timers.clear()
+        self._ready.append(None)  # stop marker
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "expenses": self.expenses,
+            "sent": self.sent,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "pending": len(self._digests),
+            "chat_buckets": len(self._chats),
+            "avg_latency_s": round(self.latency_total / self.sent, 3) if self.sent else 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    def _window_closed(self, uid: int) -> None:
+        self._timers.pop(uid, None)
+        self._ready.append(uid)
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            batch = []
+            while self._ready:
+                uid = self._ready.popleft()
+                if uid is None:
+                    await self._flush(batch)
+                    return
+                batch.append(uid)
+            await self._flush(batch)
+
+    async def _flush(self, user_ids: List[int]) -> None:
+        digests = {uid: self._digests.pop(uid) for uid in user_ids if uid in self._digests}
+        if not digests:
+            return
+        try:
+            await self._load_users({*digests, *(e["paid_by"] for d in digests.values() for e in d)})
+        except Exception as e:
+            logger.error(f"Could not look up notification recipients: {e!r}")
+            self.dropped += len(digests)
+            return
+        # Concurrent sends; the token buckets keep them within Telegram's limits
+        await asyncio.gather(*(self._deliver(uid, expenses) for uid, expenses in digests.items()))
+        for chat_id in [c for c, bucket in self._chats.items() if bucket.idle()]:
+            del self._chats[chat_id]
+
+    async def _deliver(self, uid: int, expenses: List[Dict]) -> None:
+        user = self._users.get(uid)
+        if not user or not user.get("telegram_id"):
+            self.dropped += 1
+            return
+        if await self._send(user["telegram_id"], self._format(expenses)):
+            now = time.monotonic()
+            self.latency_total += sum(now - e["_queued_at"] for e in expenses) / len(expenses)
+
+    async def _load_users(self, user_ids: Set[int]) -> None:
+        missing = [uid for uid in user_ids if self._users.get(uid) is None]
+        for user in await get_users_by_ids(missing):
+            self._users.set(user["id"], user)
+
+    def _format(self, expenses: List[Dict]) -> str:
+        def payer(e):
+            return (self._users.get(e["paid_by"]) or {}).get("name", "?")
+
+        total = sum(float(e["amount"]) for e in expenses)
+        if len(expenses) == 1:
+            e = expenses[0]
+            lines = [f"{payer(e)} registró un gasto compartido contigo:",
+                     f"  S/ {float(e['amount']):.2f} en {e['category']}"
+                     + (f" — {e['description']}" if e.get("description") else "")]
+        else:
+            lines = [f"{len(expenses)} gastos nuevos compartidos contigo (S/ {total:.2f}):"]
+            for e in expenses[:MAX_LINES]:
+                lines.append(f"  {payer(e)}: S/ {float(e['amount']):.2f} en {e['category']}")
+            if len(expenses) > MAX_LINES:
+                lines.append(f"  … y {len(expenses) - MAX_LINES} más. Usa /resumen para verlos.")
+        return "\n".join(lines)
+
+    async def _send(self, chat_id: int, text: str) -> bool:
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            # Looked up on every attempt: an idle bucket may have been dropped meanwhile
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                bucket = self._chats[chat_id] = TokenBucket(CHAT_RATE, capacity=1)
+            await bucket.acquire()
+            await self._global.acquire()
+            try:
+                await self._bot.send_message(chat_id, text)
+                self.sent += 1
+                return True
+            except RetryAfter as e:
+                self.retries += 1
+                delay = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+                logger.warning(f"Telegram 429 for chat {chat_id}; retrying in {delay}s")
+                await asyncio.sleep(delay)
+            except Forbidden:  # the member blocked the bot or never started it
+                break
+            except Exception as e:
+                logger.warning(f"Could not notify chat {chat_id} (attempt {attempt}): {e!r}")
+                await asyncio.sleep(attempt)
+        self.dropped += 1
+        return False
+
+
+_notifier: Optional[Notifier] = None
+
+
+def get_notifier() -> Notifier:
+    """Return the process-wide notifier (started in main._post_init)."""
+    global _notifier
+    if _notifier is None:
+        _notifier = Notifier()
+    return _notifier
@@ -0,0 +1,179 @@
+"""
+Pending /gasto expenses — compact, TTL-evicted, persisted to SQLite.
+
+Between "/gasto 350 Supermercado" and the "Confirmar" tap the bot has to
+remember the expense being built. Keeping it in context.user_data meant full
+member rows per open flow, no expiry for abandoned flows, and everything lost
+on restart. This store keeps one small PendingExpense per (chat_id, user_id),
+drops it PENDING_TTL seconds after the last change, and writes it through to a
+local SQLite file so a restarted bot can finish in-flight expenses.
+
+Expiry is checked on the entry being read; abandoned flows nobody reads again
+are dropped by a full sweep every PENDING_SWEEP_EVERY reads and writes.
+
+SQLite calls are synchronous; each one is a single-row write to a local file,
+which is cheap enough to run on the event loop.
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[int, int]  # (chat_id, user_id)
+
+
+class PendingExpense:
+    """One expense awaiting confirmation. Amount in cents, people as ids."""
+
+    __slots__ = ("household_id", "paid_by", "amount_cents", "category", "description",
+                 "members", "shared", "expires_at", "idempotency_key")
+
+    def __init__(self, household_id: int, paid_by: int, amount_cents: int, category: str,
+                 description: str, members: Tuple[int, ...],
+                 shared: Tuple[int, ...] = (), expires_at: float = 0.0,
+                 idempotency_key: str = ""):
+        self.household_id = household_id
+        self.paid_by = paid_by
+        self.amount_cents = amount_cents
+        self.category = category
+        self.description = description
+        self.members = members      # user ids; names are resolved when rendering
+        self.shared = shared        # sorted ids of OTHER members toggled on
+        self.expires_at = expires_at
+        self.idempotency_key = idempotency_key  # identifies the /gasto message
+
+    @property
+    def amount(self) -> float:
+        return self.amount_cents / 100
+
+    def others(self) -> Tuple[int, ...]:
+        """Members other than the payer (the toggle targets)."""
+        return tuple(uid for uid in self.members if uid != self.paid_by)
+
+    def toggle(self, user_id: int) -> None:
+        shared = set(self.shared)
+        shared.symmetric_difference_update({user_id})
+        self.shared = tuple(sorted(shared))
+
+    def to_json(self) -> str:
+        return json.dumps([self.household_id, self.paid_by, self.amount_cents, self.category,
+                           self.description, self.members, self.shared, self.expires_at,
+                           self.idempotency_key])
+
+    @classmethod
+    def from_json(cls, raw: str) -> "PendingExpense":
+        h, p, a, c, d, members, shared, exp, *key = json.loads(raw)  # key absent in old rows
+        # Old rows kept [user_id, name] pairs
+        members = tuple(m[0] if isinstance(m, list) else m for m in members)
+        return cls(h, p, a, c, d, members, tuple(shared), exp, key[0] if key else "")
+
+    def size_bytes(self) -> int:
+        """Approximate memory held by this entry."""
+        size = sys.getsizeof(self) + sys.getsizeof(self.members) + sys.getsizeof(self.shared)
+        size += sys.getsizeof(self.category) + sys.getsizeof(self.description)
+        size += sys.getsizeof(self.idempotency_key)
+        return size
+
+
+class PendingExpenseStore:
+    """In-memory map of pending expenses, written through to SQLite."""
+
+    def __init__(self, path: str, ttl: float, sweep_every: int = 256):
+        self.path = path
+        self.ttl = ttl
+        self.sweep_every = sweep_every
+        self._ops = 0
+        self._entries: Dict[Key, PendingExpense] = {}
+        self._db = sqlite3.connect(path, isolation_level=None)  # autocommit
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pending_expenses ("
+            " chat_id INTEGER NOT NULL, user_id INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL, payload TEXT NOT NULL,"
+            " PRIMARY KEY (chat_id, user_id))"
+        )
+        self._load()
+
+    def _load(self) -> None:
+        now = time.time()
+        self._db.execute("DELETE FROM pending_expenses WHERE expires_at <= ?", (now,))
+        for chat_id, user_id, payload in self._db.execute(
+            "SELECT chat_id, user_id, payload FROM pending_expenses"
+        ):
+            self._entries[(chat_id, user_id)] = PendingExpense.from_json(payload)
+        if self._entries:
+            logger.info(f"Restored {len(self._entries)} pending expenses from {self.path}")
+
+    def get(self, key: Key) -> Optional[PendingExpense]:
+        """Return the live entry for key, or None if absent or expired."""
+        self._tick()
+        pending = self._entries.get(key)
+        if pending is not None and pending.expires_at <= time.time():
+            self.pop(key)
+            return None
+        return pending
+
+    def put(self, key: Key, pending: PendingExpense) -> None:
+        """Insert or update an entry and restart its TTL."""
+        self._tick()
+        pending.expires_at = time.time() + self.ttl
+        self._entries[key] = pending
+        self._db.execute(
+            "INSERT OR REPLACE INTO pending_expenses VALUES (?, ?, ?, ?)",
+            (key[0], key[1], pending.expires_at, pending.to_json()),
+        )
+
+    def pop(self, key: Key) -> Optional[PendingExpense]:
+        pending = self._entries.pop(key, None)
+        self._db.execute("DELETE FROM pending_expenses WHERE chat_id = ? AND user_id = ?", key)
+        return pending
+
+    def _tick(self) -> None:
+        self._ops += 1
+        if self._ops >= self.sweep_every:
+            self._ops = 0
+            self.evict_expired()
+
+    def evict_expired(self) -> int:
+        """Drop abandoned flows. Returns how many were evicted."""
+        now = time.time()
+        expired = [k for k, p in self._entries.items() if p.expires_at <= now]
+        for k in expired:
+            del self._entries[k]
+        if expired:
+            self._db.execute("DELETE FROM pending_expenses WHERE expires_at <= ?", (now,))
+            logger.info(f"Evicted {len(expired)} abandoned /gasto flows")
+        return len(expired)
+
+    def stats(self) -> Dict[str, int]:
+        """Entries within their TTL, approximate bytes in memory and bytes on disk."""
+        now = time.time()
+        return {
+            "live": sum(1 for p in self._entries.values() if p.expires_at > now),
+            "memory_bytes": sum(p.size_bytes() for p in self._entries.values()),
+            "disk_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+        }
+
+    def close(self) -> None:
+        self._db.close()
+
+
+_store: Optional[PendingExpenseStore] = None
+
+
+def get_pending_store() -> PendingExpenseStore:
+    """Return the process-wide store, opening it on first use."""
+    global _store
+    if _store is None:
+        _store = PendingExpenseStore(
+            path=os.getenv("PENDING_STORE_PATH", "pending_expenses.sqlite3"),
+            ttl=float(os.getenv("PENDING_TTL", "900")),
+            sweep_every=int(os.getenv("PENDING_SWEEP_EVERY", "256")),
+        )
+    return _store
@@ -0,0 +1,216 @@
+"""
+Recurring-expense scheduler — registers and reminds recurring_expenses.
+
+Runs on python-telegram-bot's JobQueue:
+
+  tick    (every RECURRING_TICK_S seconds, and right after startup)
+          One query (migration 013's partial index) fetches every active
+          recurring expense due within the next RECURRING_WINDOW_DAYS days,
+          across all households, into a min-heap by due date. Items due today
+          or earlier are popped: auto_register ones become expenses (one bulk
+          insert for the whole tick), the others get a "vence hoy" message,
+          and all of them have next_due_date moved past today in one batched
+          update (recurring_advance).
+
+  remind  (daily at RECURRING_REMINDER_HOUR, RECURRING_TZ)
+          Sends "vence en N días" to the payer of every item still in the
+          heap whose distance to its due date is in reminder_days_before.
+          Reminders further ahead than the window are not sent.
+
+Monthly and yearly items keep their day (anchor_day, migration 016): one due
+on the 31st is registered on 28/02 and again on 31/03.
+
+Catch-up: after downtime an item may be several periods overdue. Every
+missed occurrence (up to RECURRING_MAX_CATCHUP per item and tick; the rest
+on later ticks) is registered with its own expense_date in the same bulk
+insert, so no per-row queries are needed. Each occurrence's idempotency key
+(migration 012) is "recurring:<id>:<date>", so if the insert succeeds but
+the advance fails, the next tick does not register it twice.
+"""
+
+import os
+import heapq
+import asyncio
+import calendar
+import logging
+from datetime import date, datetime, time as dtime, timedelta
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from utils.categories import get_category_index
+from utils.supabase_client import (
+    advance_recurring_expenses,
+    expense_payload,
+    get_due_recurring_expenses,
+    insert_expenses,
+)
+
+logger = logging.getLogger(__name__)
+
+TICK_S = float(os.getenv("RECURRING_TICK_S", "300"))
+WINDOW_DAYS = int(os.getenv("RECURRING_WINDOW_DAYS", "7"))
+REMINDER_HOUR = int(os.getenv("RECURRING_REMINDER_HOUR", "9"))
+MAX_CATCHUP = int(os.getenv("RECURRING_MAX_CATCHUP", "24"))
+TZ = ZoneInfo(os.getenv("RECURRING_TZ", "America/Lima"))
+
+# (next_due_date, recurring_expenses.id, row)
+_Entry = Tuple[date, int, Dict]
+
+
+def next_due_date(due: date, frequency: str, anchor_day: Optional[int] = None) -> date:
+    """The occurrence after due.
+
+    Monthly/yearly dates fall on anchor_day (the schedule's own day, default
+    due.day), clamped to the month's last day: an item anchored on the 31st
+    goes 31/01, 28/02, 31/03.
+    """
+    if frequency == "weekly":
+        return due + timedelta(days=7)
+    if frequency == "monthly":
+        year, month = (due.year + 1, 1) if due.month == 12 else (due.year, due.month + 1)
+    elif frequency == "yearly":
+        year, month = due.year + 1, due.month
+    else:
+        raise ValueError(f"Unknown frequency '{frequency}'")
+    return date(year, month, min(anchor_day or due.day, calendar.monthrange(year, month)[1]))
+
+
+def missed_occurrences(
+    due: date, frequency: str, today: date, limit: int, anchor_day: Optional[int] = None
+) -> Tuple[List[date], date]:
+    """(occurrences from due up to today, at most limit of them; the next due date)."""
+    dates = []
+    while due <= today and len(dates) < limit:
+        dates.append(due)
+        due = next_due_date(due, frequency, anchor_day)
+    return dates, due
+
+
+class RecurringScheduler:
+    """Holds the heap of upcoming recurring expenses between JobQueue runs."""
+
+    def __init__(self):
+        self._heap: List[_Entry] = []
+        self._lock = asyncio.Lock()
+        self.registered = 0
+        self.messages = 0
+
+    @staticmethod
+    def today() -> date:
+        return datetime.now(TZ).date()
+
+    async def tick(self, context=None, today: Optional[date] = None) -> None:
+        """JobQueue callback: register/notify everything due, refresh the heap."""
+        async with self._lock:
+            await self._tick(context.bot if context else None, today or self.today())
+
+    async def remind(self, context=None, today: Optional[date] = None) -> None:
+        """JobQueue callback: send "vence en N días" reminders."""
+        today = today or self.today()
+        bot = context.bot if context else None
+        async with self._lock:
+            await self._tick(bot, today)
+            for due, _, row in sorted(self._heap):
+                days = (due - today).days
+                if days in (row.get("reminder_days_before") or ()):
+                    plural = "día" if days == 1 else "días"
+                    await self._send(
+                        bot, row,
+                        f"Recordatorio: {row['name']} (S/ {float(row['amount']):.2f}) "
+                        f"vence en {days} {plural}, el {due:%d/%m}.",
+                    )
+
+    def stats(self) -> Dict[str, int]:
+        return {"upcoming": len(self._heap), "registered": self.registered, "messages": self.messages}
+
+    # ------------------------------------------------------------------
+    async def _tick(self, bot, today: date) -> None:
+        until = today + timedelta(days=WINDOW_DAYS)
+        heap: List[_Entry] = [
+            (date.fromisoformat(row["next_due_date"]), row["id"], row)
+            for row in await get_due_recurring_expenses(until.isoformat())
+        ]
+        heapq.heapify(heap)
+
+        payloads: List[Dict] = []
+        advance: Dict[int, str] = {}
+        anchors: Dict[int, int] = {}
+        notices: List[Tuple[Dict, List[date]]] = []
+        while heap and heap[0][0] <= today:
+            due, rid, row = heapq.heappop(heap)
+            # Rows inserted without anchor_day (migration 016) are anchored on their first due date
+            anchors[rid] = row.get("anchor_day") or due.day
+            dates, following = missed_occurrences(due, row["frequency"], today, MAX_CATCHUP, anchors[rid])
+            advance[rid] = following.isoformat()
+            notices.append((row, dates))
+            if row.get("auto_register"):
+                expense_type = (await get_category_index(row["household_id"])).type_of(row["category"])
+                payloads.extend(
+                    expense_payload(
+                        household_id=row["household_id"],
+                        paid_by=row["paid_by"],
+                        amount=float(row["amount"]),
+                        category=row["category"],
+                        description=row["name"],
+                        shared_with=row["shared_with"] or [row["paid_by"]],
+                        idempotency_key=f"recurring:{rid}:{d.isoformat()}",
+                        expense_date=d.isoformat(),
+                        expense_type=expense_type,
+                    )
+                    for d in dates
+                )
+            if today < following <= until:  # upcoming within the window: keep for reminders
+                heapq.heappush(heap, (following, rid, row))
+        self._heap = heap
+
+        if not advance:
+            return
+        inserted = {e["idempotency_key"] for e in await insert_expenses(payloads)} if payloads else set()
+        self.registered += len(inserted)
+        await advance_recurring_expenses(advance, anchors)
+        logger.info(f"Recurring tick: {len(advance)} due, {len(inserted)} occurrences registered")
+
+        for row, dates in notices:
+            if row.get("auto_register"):
+                # Occurrences registered by an earlier, half-finished tick were announced then
+                dates = [d for d in dates if f"recurring:{row['id']}:{d.isoformat()}" in inserted]
+                if not dates:
+                    continue
+            amount = f"S/ {float(row['amount']):.2f}"
+            when = ", ".join(f"{d:%d/%m}" for d in dates)
+            if row.get("auto_register"):
+                text = f"Registré automáticamente {row['name']}: {amount} en {row['category']} ({when})."
+            else:
+                text = (
+                    f"Vence {row['name']}: {amount} en {row['category']} ({when}).\n"
+                    f"Regístralo con /gasto {float(row['amount']):g} {row['category']}"
+                )
+            await self._send(bot, row, text)
+
+    async def _send(self, bot, row: Dict, text: str) -> None:
+        chat_id = (row.get("payer") or {}).get("telegram_id")
+        if bot is None or chat_id is None:
+            return
+        try:
+            await bot.send_message(chat_id, text)
+            self.messages += 1
+        except Exception as e:  # e.g. the payer never opened a chat with the bot
+            logger.warning(f"Could not notify {chat_id} about recurring {row['id']}: {e!r}")
+
+
+_scheduler: Optional[RecurringScheduler] = None
+
+
+def get_recurring_scheduler() -> RecurringScheduler:
+    """Return the process-wide scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RecurringScheduler()
+    return _scheduler
+
+
+def schedule_recurring(job_queue) -> None:
+    """Register the tick and reminder jobs on the Application's JobQueue."""
+    scheduler = get_recurring_scheduler()
+    job_queue.run_repeating(scheduler.tick, interval=TICK_S, first=5, name="recurring-tick")
+    job_queue.run_daily(scheduler.remind, time=dtime(hour=REMINDER_HOUR, tzinfo=TZ), name="recurring-remind")
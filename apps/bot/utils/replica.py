@@ -0,0 +1,398 @@
+"""
+Optional local read replica — a SQLite copy of the households in use.
+
+Enabled by REPLICA_PATH. A household is added the first time one of its
+reads misses (the read itself still goes to Supabase) and dropped after
+REPLICA_IDLE_S without reads. For each one the file holds its households
+row, its active members' users rows and its expenses dated from the first
+day of REPLICA_MONTHS months ago.
+
+A background task keeps it current:
+
+  incremental  every REPLICA_SYNC_S seconds, paged queries for all tracked
+               households follow two feeds of migration 017 from their
+               watermarks: expenses inserted or edited, in (updated_at, id)
+               order, and expense_deletions, in (deleted_at, expense_id)
+               order. Each restarts COMMIT_SKEW_S seconds behind its
+               watermark, since a row can commit after a newer one was
+               read. Edits made from the web app arrive here as well as new
+               rows; an edit that moves an expense out of the window drops
+               it. The same round refreshes members, users and households
+               rows.
+  full         on a household's first sync, and every REPLICA_FULL_SYNC_S
+               seconds after that, its rows are replaced: a consistency
+               check, which also drops months that left the window.
+  own writes   on_expenses() (an expense listener) stores the bot's inserts
+               as soon as they succeed.
+
+supabase_client serves get_household, get_household_members and expense
+ranges (iter_expenses, monthly snapshots, category totals) from the file
+while the household's last sync started at most REPLICA_MAX_STALENESS_S
+ago. That bounds what a replica read can miss: new rows, edits and
+deletions alike. A household is stale after a failed sync, before the first
+sync after a restart, and, since expense_deletions keeps 30 days, until it
+is reloaded when its last full sync is older than that. Its reads then go
+to Supabase. The watermarks and the tracked households survive restarts,
+so syncing resumes where it stopped. Without migration 017 every round
+fails and all reads go to Supabase.
+
+SQLite calls are synchronous and hit a local file; as with the pending
+/gasto store they run on the event loop.
+"""
+
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from utils.supabase_client import (
+    get_expense_deletions_after,
+    get_expenses_changed_after,
+    get_expenses_created_after,
+    get_households_by_ids,
+    get_latest_deletion_cursor,
+    get_latest_expense_cursor,
+    get_members_of_households,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_STALENESS_S = float(os.getenv("REPLICA_MAX_STALENESS_S", "30"))
+SYNC_S = float(os.getenv("REPLICA_SYNC_S", "5"))
+FULL_SYNC_S = float(os.getenv("REPLICA_FULL_SYNC_S", "3600"))
+IDLE_S = float(os.getenv("REPLICA_IDLE_S", "3600"))
+MONTHS = int(os.getenv("REPLICA_MONTHS", "3"))
+COMMIT_SKEW_S = 5
+DELETIONS_KEPT_S = 30 * 86400  # expense_deletions retention (migration 017)
+FULL_SYNC_CONCURRENCY = 8
+PAGE_SIZE = 1000
+CHUNK = 100  # household ids per in_() filter
+
+Cursor = Tuple[str, int]  # (timestamp, id) of a feed row
+_EPOCH: Cursor = ("1970-01-01T00:00:00+00:00", 0)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS households (
+  id INTEGER PRIMARY KEY, row TEXT NOT NULL, full_synced_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS members (
+  household_id INTEGER NOT NULL, user_id INTEGER NOT NULL,
+  PRIMARY KEY (household_id, user_id));
+CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, row TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS expenses (
+  id INTEGER PRIMARY KEY, household_id INTEGER NOT NULL,
+  expense_date TEXT NOT NULL, row TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS expenses_household_date ON expenses (household_id, expense_date, id);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def _window_start(today: date, months: int) -> str:
+    """First day of the month `months` months before today's."""
+    index = today.year * 12 + today.month - 1 - months
+    return f"{index // 12}-{index % 12 + 1:02d}-01"
+
+
+def _cursor_key(cursor: Cursor) -> Tuple[datetime, int]:
+    return datetime.fromisoformat(cursor[0]), cursor[1]
+
+
+class ReadReplica:
+    """SQLite mirror of the tracked households, synced in the background."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path, isolation_level=None)  # autocommit
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")  # a lost commit is re-synced, no fsync per write
+        self._db.executescript(_SCHEMA)
+        now = time.monotonic()
+        self._full_at: Dict[int, float] = {}     # household_id → wall time the last full sync started
+        self._synced_at: Dict[int, float] = {}   # household_id → monotonic start of the last sync
+        self._read_at: Dict[int, float] = {}     # household_id → last read (for eviction)
+        self._wanted: Set[int] = set()           # missed, not yet loaded
+        self._loading: Dict[int, List[Dict]] = {}  # household_id → own writes during its full sync
+        for household_id, full_at in self._db.execute("SELECT id, full_synced_at FROM households"):
+            self._full_at[household_id] = full_at
+            self._read_at[household_id] = now
+        meta = dict(self._db.execute("SELECT key, value FROM meta WHERE key IN ('changed', 'deleted')"))
+        self._changed: Optional[Cursor] = tuple(json.loads(meta["changed"])) if "changed" in meta else None
+        self._deleted: Optional[Cursor] = tuple(json.loads(meta["deleted"])) if "deleted" in meta else None
+        if self._changed is None:  # a file synced by creation order only: reload everything
+            self._full_at = dict.fromkeys(self._full_at, 0.0)
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.syncs = 0
+        self.full_syncs = 0
+        self.rows_synced = 0
+        self.failures = 0
+        self.evictions = 0
+        if self._full_at:
+            logger.info(f"Read replica {path}: {len(self._full_at)} households, resuming sync")
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="read-replica")
+        self._wake.set()  # households kept from the last run become fresh right away
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._db.close()
+
+    # ------------------------------------------------------------------
+    # Reads (called by supabase_client)
+    # ------------------------------------------------------------------
+    def fresh(self, household_id: int) -> bool:
+        """Whether household_id was synced within MAX_STALENESS_S; a miss asks for a sync."""
+        now = time.monotonic()
+        self._read_at[household_id] = now
+        synced = self._synced_at.get(household_id)
+        if synced is not None and now - synced <= MAX_STALENESS_S:
+            self.hits += 1
+            return True
+        self.misses += 1
+        if household_id not in self._full_at and household_id not in self._wanted:
+            self._wanted.add(household_id)
+            self._wake.set()
+        return False
+
+    def covers(self, household_id: int, start: str) -> bool:
+        """Whether expenses from start on can be read here right now."""
+        return start >= _window_start(date.today(), MONTHS) and self.fresh(household_id)
+
+    def expenses(self, household_id: int, start: str, end: str, descending: bool = False) -> List[Dict]:
+        order = "DESC" if descending else "ASC"
+        return [json.loads(row) for (row,) in self._db.execute(
+            "SELECT row FROM expenses WHERE household_id = ? AND expense_date >= ? AND expense_date < ?"
+            f" ORDER BY expense_date {order}, id {order}",
+            (household_id, start, end),
+        )]
+
+    def members(self, household_id: int) -> List[Dict]:
+        return [json.loads(row) for (row,) in self._db.execute(
+            "SELECT u.row FROM members m JOIN users u ON u.id = m.user_id WHERE m.household_id = ?",
+            (household_id,),
+        )]
+
+    def household(self, household_id: int) -> Optional[Dict]:
+        row = self._db.execute("SELECT row FROM households WHERE id = ?", (household_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def on_expenses(self, rows: List[Dict]) -> None:
+        """Expense listener: store the bot's own inserts for tracked households."""
+        mine = [r for r in rows if r["household_id"] in self._full_at or r["household_id"] in self._loading]
+        for row in mine:
+            if row["household_id"] in self._loading:  # re-applied after the reload
+                self._loading[row["household_id"]].append(row)
+        self._store_expenses(mine)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "households": len(self._full_at),
+            "fresh": sum(1 for t in self._synced_at.values() if time.monotonic() - t <= MAX_STALENESS_S),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "syncs": self.syncs,
+            "full_syncs": self.full_syncs,
+            "rows_synced": self.rows_synced,
+            "failures": self.failures,
+            "evictions": self.evictions,
+            "disk_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Sync
+    # ------------------------------------------------------------------
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), SYNC_S)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.sync()
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"Read replica sync failed: {e!r}")
+
+    async def sync(self) -> None:
+        """One round: incremental sync of the tracked households, then full syncs due."""
+        started = time.monotonic()
+        self._evict_idle(started)
+        if self._changed is None and (self._wanted or self._full_at):
+            # Read before any household is loaded: changes after these are
+            # followed incrementally, earlier ones come with the full syncs
+            changed, deleted = await asyncio.gather(get_latest_expense_cursor(), get_latest_deletion_cursor())
+            self._changed, self._deleted = changed or _EPOCH, deleted or _EPOCH
+            self._save_watermarks()
+
+        now = time.time()
+        tracked = list(self._full_at)
+        if tracked:
+            await self._sync_changes(tracked)
+            await self._sync_members(tracked)
+            for household_id in tracked:
+                # Deletions older than DELETIONS_KEPT_S are gone from the feed: wait for the reload
+                if now - self._full_at[household_id] <= DELETIONS_KEPT_S:
+                    self._synced_at[household_id] = started
+            self.syncs += 1
+
+        due = [*self._wanted, *(h for h, t in self._full_at.items() if now - t > FULL_SYNC_S)]
+        semaphore = asyncio.Semaphore(FULL_SYNC_CONCURRENCY)
+
+        async def one(household_id: int) -> None:
+            async with semaphore:
+                await self._full_sync(household_id)
+
+        await asyncio.gather(*(one(h) for h in dict.fromkeys(due)))
+
+    async def _sync_changes(self, household_ids: List[int]) -> None:
+        window = _window_start(date.today(), MONTHS)
+
+        def changed(rows: List[Dict]) -> None:
+            self._store_expenses([r for r in rows if str(r["expense_date"])[:10] >= window])
+            self._db.executemany("DELETE FROM expenses WHERE id = ?",
+                                 [(r["id"],) for r in rows if str(r["expense_date"])[:10] < window])
+
+        def deleted(rows: List[Dict]) -> None:
+            self._db.executemany("DELETE FROM expenses WHERE id = ? AND household_id = ?",
+                                 [(r["expense_id"], r["household_id"]) for r in rows])
+
+        changed_to = await self._follow(get_expenses_changed_after, household_ids, self._changed,
+                                        ("updated_at", "id"), changed)
+        deleted_to = await self._follow(get_expense_deletions_after, household_ids, self._deleted,
+                                        ("deleted_at", "expense_id"), deleted)
+        if (changed_to, deleted_to) != (self._changed, self._deleted):
+            self._changed, self._deleted = changed_to, deleted_to
+            self._save_watermarks()
+
+    async def _follow(self, fetch, household_ids: List[int], watermark: Cursor,
+                      columns: Tuple[str, str], apply) -> Cursor:
+        """Page a feed from COMMIT_SKEW_S before watermark, apply each page, return the new watermark."""
+        t, _ = watermark
+        start: Cursor = ((datetime.fromisoformat(t) - timedelta(seconds=COMMIT_SKEW_S)).isoformat(), 0)
+        newest = watermark
+        for i in range(0, len(household_ids), CHUNK):
+            after = start
+            while True:
+                rows = await fetch(household_ids[i:i + CHUNK], after, PAGE_SIZE)
+                apply(rows)
+                self.rows_synced += len(rows)
+                if rows:
+                    after = (rows[-1][columns[0]], rows[-1][columns[1]])
+                    newest = max(newest, after, key=_cursor_key)
+                if len(rows) < PAGE_SIZE:
+                    break
+        return newest
+
+    async def _sync_members(self, household_ids: List[int]) -> None:
+        for i in range(0, len(household_ids), CHUNK):
+            chunk = household_ids[i:i + CHUNK]
+            members, households = await asyncio.gather(
+                get_members_of_households(chunk), get_households_by_ids(chunk))
+            self._store_members(chunk, members, households)
+
+    async def _full_sync(self, household_id: int) -> None:
+        started, started_wall = time.monotonic(), time.time()
+        self._loading[household_id] = []
+        try:
+            rows: List[Dict] = []
+            after: Optional[Cursor] = None
+            window = _window_start(date.today(), MONTHS)
+            while True:
+                page = await get_expenses_created_after([household_id], after, PAGE_SIZE, window)
+                rows.extend(page)
+                if len(page) < PAGE_SIZE:
+                    break
+                after = (page[-1]["created_at"], page[-1]["id"])
+            members, households = await asyncio.gather(
+                get_members_of_households([household_id]), get_households_by_ids([household_id]))
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Read replica could not load household {household_id}: {e!r}")
+            return
+        finally:
+            written = self._loading.pop(household_id)
+        if not households:  # deleted
+            self._wanted.discard(household_id)
+            self._drop([household_id])
+            return
+
+        self._db.execute("BEGIN")
+        self._db.execute("DELETE FROM expenses WHERE household_id = ?", (household_id,))
+        self._store_expenses(rows + written)
+        self._store_members([household_id], members, households)
+        self._db.execute("UPDATE households SET full_synced_at = ? WHERE id = ?", (started_wall, household_id))
+        self._db.execute("COMMIT")
+        self._full_at[household_id] = started_wall
+        self._synced_at[household_id] = started
+        self._wanted.discard(household_id)
+        self.full_syncs += 1
+        self.rows_synced += len(rows)
+
+    # ------------------------------------------------------------------
+    # Storage
+    # ------------------------------------------------------------------
+    def _store_expenses(self, rows: Sequence[Dict]) -> None:
+        if rows:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO expenses VALUES (?, ?, ?, ?)",
+                [(r["id"], r["household_id"], str(r["expense_date"])[:10], json.dumps(r)) for r in rows],
+            )
+
+    def _store_members(self, household_ids: List[int], members: List[Dict], households: List[Dict]) -> None:
+        marks = ",".join("?" * len(household_ids))
+        self._db.execute(f"DELETE FROM members WHERE household_id IN ({marks})", household_ids)
+        self._db.executemany("INSERT OR IGNORE INTO members VALUES (?, ?)",
+                             [(m["household_id"], m["user_id"]) for m in members if m.get("users")])
+        self._db.executemany("INSERT OR REPLACE INTO users VALUES (?, ?)",
+                             [(m["users"]["id"], json.dumps(m["users"])) for m in members if m.get("users")])
+        self._db.executemany(
+            "INSERT INTO households VALUES (?, ?, 0) ON CONFLICT (id) DO UPDATE SET row = excluded.row",
+            [(h["id"], json.dumps(h)) for h in households],
+        )
+
+    def _save_watermarks(self) -> None:
+        self._db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                             [("changed", json.dumps(self._changed)), ("deleted", json.dumps(self._deleted))])
+
+    def _evict_idle(self, now: float) -> None:
+        idle = [h for h in self._full_at if now - self._read_at.get(h, now) > IDLE_S]
+        if idle:
+            self._drop(idle)
+            self.evictions += len(idle)
+
+    def _drop(self, household_ids: List[int]) -> None:
+        marks = ",".join("?" * len(household_ids))
+        for table, column in (("expenses", "household_id"), ("members", "household_id"), ("households", "id")):
+            self._db.execute(f"DELETE FROM {table} WHERE {column} IN ({marks})", household_ids)
+        self._db.execute("DELETE FROM users WHERE id NOT IN (SELECT user_id FROM members)")
+        for household_id in household_ids:
+            self._full_at.pop(household_id, None)
+            self._synced_at.pop(household_id, None)
+            self._read_at.pop(household_id, None)
+
+
+_replica: Optional[ReadReplica] = None
+
+
+def get_read_replica() -> Optional[ReadReplica]:
+    """Return the process-wide replica, or None when REPLICA_PATH is unset."""
+    global _replica
+    path = os.getenv("REPLICA_PATH", "")
+    if _replica is None and path:
+        _replica = ReadReplica(path)
+    return _replica
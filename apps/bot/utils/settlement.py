@@ -0,0 +1,175 @@
+"""
+Settlement engine — turn per-user net balances into "X pays Y" transfers.
+
+All amounts are integer cents (positive net → is owed money, negative → owes).
+
+Minimum number of transfers:
+  A group of k people whose balances add up to zero can always be settled
+  with k - 1 transfers, so the fewest transfers for n people is
+  n - (maximum number of disjoint zero-sum groups). That maximum is found
+  with a DP over subsets (bitmasks), O(2^n · n), which is exact but only
+  affordable for small n.
+
+Above EXACT_MAX_PEOPLE (or when the DP exceeds TIME_BUDGET_MS) a heuristic
+is used instead: first pair people whose balances cancel exactly, then
+repeatedly match the largest creditor with the largest debtor. That is
+never worse than n - 1 transfers and is usually close to optimal.
+
+The DP takes up to TIME_BUDGET_MS of CPU, so handlers call settle_async(),
+which runs it on a worker thread once more than INLINE_MAX_PEOPLE people
+have a non-zero balance (below that it takes under a millisecond).
+"""
+
+import os
+import heapq
+import time
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+# (debtor_id, creditor_id, amount_cents)
+Transfer = Tuple[int, int, int]
+
+EXACT_MAX_PEOPLE = int(os.getenv("SETTLEMENT_EXACT_MAX_PEOPLE", "16"))
+TIME_BUDGET_MS = float(os.getenv("SETTLEMENT_TIME_BUDGET_MS", "250"))
+INLINE_MAX_PEOPLE = int(os.getenv("SETTLEMENT_INLINE_MAX_PEOPLE", "8"))
+
+
+def settle(balances: Dict[int, int], exact_max: Optional[int] = None,
+           time_budget_ms: Optional[float] = None) -> List[Transfer]:
+    """Return transfers that settle balances, largest first.
+
+    Uses the exact minimum-transfer DP when there are at most exact_max
+    people with a non-zero balance and it finishes within time_budget_ms;
+    otherwise the greedy heuristic.
+    """
+    exact_max = EXACT_MAX_PEOPLE if exact_max is None else exact_max
+    time_budget_ms = TIME_BUDGET_MS if time_budget_ms is None else time_budget_ms
+
+    people = [(uid, cents) for uid, cents in sorted(balances.items()) if cents]
+    transfers = None
+    if len(people) <= exact_max:
+        deadline = time.monotonic() + time_budget_ms / 1000
+        groups = _zero_sum_groups(people, deadline)
+        if groups is not None:
+            transfers = [t for group in groups for t in _settle_greedy(group)]
+    if transfers is None:
+        transfers = _settle_heuristic(people)
+    return sorted(transfers, key=lambda t: (-t[2], t[0], t[1]))
+
+
+async def settle_async(balances: Dict[int, int]) -> List[Transfer]:
+    """settle() without holding the event loop for the DP of a large group."""
+    if sum(1 for cents in balances.values() if cents) <= INLINE_MAX_PEOPLE:
+        return settle(balances)
+    return await asyncio.to_thread(settle, balances)
+
+
+# ---------------------------------------------------------------------------
+# Exact: maximum partition into zero-sum groups
+# ---------------------------------------------------------------------------
+def _zero_sum_groups(people: List[Tuple[int, int]], deadline: float) -> Optional[List[List[Tuple[int, int]]]]:
+    """Partition people into the maximum number of zero-sum groups.
+
+    dp[mask] = most zero-sum groups that fit in mask
+             = max over i in mask of dp[mask without i], +1 if sum(mask) == 0
+    Walking the DP back yields an order of people whose running sum touches
+    zero exactly dp[full] times; each stretch between zeros is one group.
+    Returns None if the deadline passes first.
+    """
+    n = len(people)
+    if n == 0:
+        return []
+    amounts = [cents for _, cents in people]
+    size = 1 << n
+    total = [0] * size
+    dp = [0] * size
+    for mask in range(1, size):
+        if not mask & 1023 and time.monotonic() > deadline:
+            return None
+        low = mask & -mask
+        total[mask] = total[mask ^ low] + amounts[low.bit_length() - 1]
+        best = 0
+        m = mask
+        while m:
+            bit = m & -m
+            if dp[mask ^ bit] > best:
+                best = dp[mask ^ bit]
+            m ^= bit
+        dp[mask] = best + (1 if total[mask] == 0 else 0)
+
+    # Reconstruct: remove, one by one, a person that keeps dp consistent.
+    order = []
+    mask = size - 1
+    while mask:
+        target = dp[mask] - (1 if total[mask] == 0 else 0)
+        m = mask
+        while m:
+            bit = m & -m
+            if dp[mask ^ bit] == target:
+                break
+            m ^= bit
+        order.append(bit.bit_length() - 1)
+        mask ^= bit
+    order.reverse()
+
+    groups, current, running = [], [], 0
+    for i in order:
+        current.append(people[i])
+        running += amounts[i]
+        if running == 0:
+            groups.append(current)
+            current = []
+    if current:  # balances that don't add up to zero overall
+        groups.append(current)
+    return groups
+
+
+def _settle_greedy(group: List[Tuple[int, int]]) -> List[Transfer]:
+    """Settle one group; at most len(group) - 1 transfers when it sums to zero."""
+    creditors = [[uid, cents] for uid, cents in group if cents > 0]
+    debtors = [[uid, -cents] for uid, cents in group if cents < 0]
+    transfers = []
+    ci = di = 0
+    while ci < len(creditors) and di < len(debtors):
+        c, d = creditors[ci], debtors[di]
+        amount = min(c[1], d[1])
+        transfers.append((d[0], c[0], amount))
+        c[1] -= amount
+        d[1] -= amount
+        if c[1] == 0:
+            ci += 1
+        if d[1] == 0:
+            di += 1
+    return transfers
+
+
+# ---------------------------------------------------------------------------
+# Heuristic: exact-match pairing, then largest creditor ↔ largest debtor
+# ---------------------------------------------------------------------------
+def _settle_heuristic(people: List[Tuple[int, int]]) -> List[Transfer]:
+    transfers = []
+    debtors_by_amount: Dict[int, List[int]] = {}
+    for uid, cents in people:
+        if cents < 0:
+            debtors_by_amount.setdefault(-cents, []).append(uid)
+
+    creditors = []
+    for uid, cents in people:
+        if cents > 0 and debtors_by_amount.get(cents):
+            transfers.append((debtors_by_amount[cents].pop(), uid, cents))
+        elif cents > 0:
+            creditors.append((-cents, uid))
+    debtors = [(-cents, uid) for cents, uids in debtors_by_amount.items() for uid in uids]
+
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+    while creditors and debtors:
+        c_amt, c_id = heapq.heappop(creditors)
+        d_amt, d_id = heapq.heappop(debtors)
+        amount = min(-c_amt, -d_amt)
+        transfers.append((d_id, c_id, amount))
+        if -c_amt > amount:
+            heapq.heappush(creditors, (c_amt + amount, c_id))
+        if -d_amt > amount:
+            heapq.heappush(debtors, (d_amt + amount, d_id))
+    return transfers
@@ -0,0 +1,107 @@
+"""
+MonthlySnapshot — every aggregate /resumen and /balance need, from one pass.
+
+Amounts are accumulated as integer cents so totals never drift. When an
+expense is split, the cents that don't divide evenly are absorbed by the
+payer first and then by the lowest user ids, so the shares always add up to
+the amount and the per-user nets add up to zero.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List
+
+
+def to_cents(amount) -> int:
+    """Convert a NUMERIC(12,2) value (float, str or Decimal) to integer cents."""
+    return int(round(float(amount) * 100))
+
+
+def split_cents(amount_cents: int, user_ids: List[int], payer: int) -> Dict[int, int]:
+    """Split amount_cents among user_ids; leftover cents go to payer, then lowest ids."""
+    order = sorted(set(user_ids), key=lambda uid: (uid != payer, uid))
+    base, rem = divmod(amount_cents, len(order))
+    return {uid: base + (1 if i < rem else 0) for i, uid in enumerate(order)}
+
+
+@dataclass
+class MonthlySnapshot:
+    """Aggregates of one household's expenses for one calendar month."""
+
+    household_id: int
+    year: int
+    month: int
+    count: int = 0
+    total_cents: int = 0
+    category_cents: Dict[str, int] = field(default_factory=dict)
+    paid_cents: Dict[int, int] = field(default_factory=dict)
+    owed_cents: Dict[int, int] = field(default_factory=dict)
+
+    @classmethod
+    def from_rows(cls, household_id: int, year: int, month: int, rows: Iterable[Dict]) -> "MonthlySnapshot":
+        """Build a snapshot in a single pass over expense rows.
+
+        Each row needs amount, paid_by, shared_with and category.
+        """
+        snap = cls(household_id, year, month)
+        for exp in rows:
+            snap.add(exp)
+        return snap
+
+    def add(self, exp: Dict) -> None:
+        """Fold one expense row into the totals."""
+        cents = to_cents(exp["amount"])
+        payer = exp["paid_by"]
+        shared = exp["shared_with"]
+
+        self.count += 1
+        self.total_cents += cents
+        self.category_cents[exp["category"]] = self.category_cents.get(exp["category"], 0) + cents
+        self.paid_cents[payer] = self.paid_cents.get(payer, 0) + cents
+        if shared:
+            owed = self.owed_cents
+            for uid, share in split_cents(cents, shared, payer).items():
+                owed[uid] = owed.get(uid, 0) + share
+
+    @classmethod
+    def from_ledger(
+        cls, household_id: int, year: int, month: int, user_rows: List[Dict], category_rows: List[Dict]
+    ) -> "MonthlySnapshot":
+        """Build a snapshot from expense_ledger / expense_ledger_categories rows.
+
+        Rows left at zero by deleted expenses are skipped.
+        """
+        snap = cls(household_id, year, month)
+        for r in user_rows:
+            if r["paid_cents"]:
+                snap.paid_cents[r["user_id"]] = r["paid_cents"]
+            if r["owed_cents"]:
+                snap.owed_cents[r["user_id"]] = r["owed_cents"]
+        for r in category_rows:
+            if r["expense_count"]:
+                snap.category_cents[r["category"]] = r["total_cents"]
+                snap.count += r["expense_count"]
+                snap.total_cents += r["total_cents"]
+        return snap
+
+    # --- Views in soles (what the handlers render) ---
+
+    @property
+    def total(self) -> float:
+        return self.total_cents / 100
+
+    def by_category(self) -> Dict[str, float]:
+        """{ category: total_amount }"""
+        return {cat: cents / 100 for cat, cents in self.category_cents.items()}
+
+    def paid_by(self) -> Dict[int, float]:
+        """{ user_id: raw amount paid } (not net)."""
+        return {uid: cents / 100 for uid, cents in self.paid_cents.items()}
+
+    def net_cents(self) -> Dict[int, int]:
+        """{ user_id: paid - owed } in cents. Positive → others owe this person."""
+        users = set(self.paid_cents) | set(self.owed_cents)
+        return {uid: self.paid_cents.get(uid, 0) - self.owed_cents.get(uid, 0) for uid in users}
+
+    def balances(self) -> Dict[int, float]:
+        """{ user_id: net_amount }, same shape as get_monthly_balance()."""
+        return {uid: cents / 100 for uid, cents in self.net_cents().items()}
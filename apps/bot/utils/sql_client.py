@@ -0,0 +1,783 @@
+"""
+Direct SQL backend: the query-builder surface of supabase-py over SQLite or PostgreSQL.
+
+Every helper in utils/supabase_client.py is written against the same small
+part of the PostgREST client — table() with select/filters/order/limit and
+insert/upsert/update/delete, rpc() for the functions of migrations 008, 009,
+013, 015 and 016 — so that part is the repository interface (QueryClient there).
+SqlClient implements it with SQL, so the helpers, caches and handlers run
+unchanged when STORAGE_BACKEND is "sqlite" or "postgres":
+
+  select   Columns and many-to-one embeds ("users(*)", "alias:table!fk(…)")
+           as PostgREST resolves them from the foreign keys of the schema;
+           each embed is one batched IN query on the same connection.
+  filters  eq/neq/gt/gte/lt/lte/is_/in_ and or_() logic trees, with values
+           converted to the column's type (or_ filters arrive as text).
+  writes   INSERT … RETURNING *; upsert is ON CONFLICT DO NOTHING/UPDATE.
+           Updates and deletes of expenses do what migration 017's
+           triggers do: set updated_at, and record deleted (or moved)
+           expenses in expense_deletions. Old deletions aren't pruned.
+  rpc      bot_session, household_balance, household_category_totals and
+           recurring_advance, as in the migrations. Anything else answers
+           PGRST202, like a missing function, so the helpers fall back.
+
+The schema comes from the migrations (utils/sql_schema.py) and is created
+if missing. Tables it leaves out (the ledger) answer PGRST205, so the
+helpers use their fallbacks. Database errors become postgrest APIErrors
+with the Postgres SQLSTATE, which is what the helpers check.
+
+PostgreSQL is reached through an asyncpg connection pool (SQL_POOL_SIZE,
+asyncpg imported only for this backend); SQLite through one connection used
+on the event loop, like the bot's other SQLite files. Statements are
+prepared once per connection (asyncpg's and sqlite3's statement caches): IN
+lists are a single parameter (= ANY($n) / json_each(?)), so a query's text
+doesn't change with the list length.
+"""
+
+import os
+import json
+import uuid
+import logging
+import sqlite3
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from postgrest.exceptions import APIError
+
+from utils.snapshot import split_cents, to_cents
+from utils.sql_schema import Schema, load_schema
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv("SQL_POOL_SIZE", "4"))  # PostgreSQL connections
+BUSY_TIMEOUT_MS = 5000
+
+
+def _api_error(code: str, message: str) -> APIError:
+    return APIError({"code": code, "message": message, "hint": None, "details": None})
+
+
+# ---------------------------------------------------------------------------
+# Engines: connections, placeholders and value conversion per dialect
+# ---------------------------------------------------------------------------
+class SqliteEngine:
+    """One connection, used from the event loop like the bot's other SQLite files.
+
+    Statements take tens of microseconds, less than handing them to a
+    thread would. A session never yields to the event loop between its
+    statements, so a transaction can't interleave with other queries.
+    """
+
+    dialect = "sqlite"
+    now = "strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')"  # as the schema's NOW() defaults
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None, cached_statements=512)  # autocommit
+        self._conn.row_factory = _dict_row
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        self.statements = 0
+
+    @staticmethod
+    def placeholder(n: int) -> str:
+        return "?"
+
+    @staticmethod
+    def in_list(column: str, placeholder: str) -> str:
+        return f"{column} IN (SELECT value FROM json_each({placeholder}))"
+
+    @staticmethod
+    def encode_list(values: List[Any]) -> Any:
+        return json.dumps(values)
+
+    @staticmethod
+    def encode(kind: str, value: Any) -> Any:
+        if value is None:
+            return None
+        if kind in ("json", "array"):
+            return json.dumps(value)
+        if kind == "bool":
+            return int(bool(value))
+        if isinstance(value, (date, datetime)):
+            return value.isoformat()
+        return value
+
+    @staticmethod
+    def decode(kind: str, value: Any) -> Any:
+        if value is None:
+            return None
+        if kind in ("json", "array"):
+            return json.loads(value) if isinstance(value, str) else value
+        if kind == "bool":
+            return bool(value)
+        if kind == "numeric":
+            return float(value)
+        return value
+
+    async def apply_schema(self, schema: Schema) -> None:
+        async with self.session() as s:
+            for statement in schema.ddl("sqlite"):
+                await s.fetch(statement)
+
+    @asynccontextmanager
+    async def session(self, transaction: bool = False) -> AsyncIterator["_SqliteSession"]:
+        session = _SqliteSession(self, self._conn)
+        if not transaction:
+            yield session
+            return
+        await session.fetch("BEGIN IMMEDIATE")
+        try:
+            yield session
+            await session.fetch("COMMIT")
+        except BaseException:
+            if self._conn.in_transaction:
+                self._conn.execute("ROLLBACK")
+            raise
+
+    async def close(self) -> None:
+        self._conn.close()
+
+
+def _dict_row(cursor: sqlite3.Cursor, row: Tuple) -> Dict:
+    return {d[0]: v for d, v in zip(cursor.description, row)}
+
+
+class _SqliteSession:
+    def __init__(self, engine: SqliteEngine, conn: sqlite3.Connection):
+        self._engine = engine
+        self._conn = conn
+
+    async def fetch(self, sql: str, params: Sequence = ()) -> List[Dict]:
+        self._engine.statements += 1
+        try:
+            return self._conn.execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            raise _sqlite_error(e) from e
+
+    async def executemany(self, sql: str, rows: List[Sequence]) -> None:
+        self._engine.statements += 1
+        try:
+            self._conn.executemany(sql, rows)
+        except sqlite3.Error as e:
+            raise _sqlite_error(e) from e
+
+    async def defer_foreign_keys(self) -> None:
+        await self.fetch("PRAGMA defer_foreign_keys=ON")
+
+    async def after_bulk_insert(self, table: str) -> None:
+        pass  # AUTOINCREMENT keeps counting after the largest id inserted
+
+
+def _sqlite_error(e: sqlite3.Error) -> APIError:
+    message = str(e)
+    for prefix, code in (("UNIQUE", "23505"), ("FOREIGN KEY", "23503"), ("NOT NULL", "23502"),
+                         ("CHECK", "23514"), ("no such table", "42P01"), ("no such column", "42703")):
+        if message.startswith(prefix):
+            return _api_error(code, message)
+    return _api_error("XX000", message)
+
+
+class PostgresEngine:
+    dialect = "postgres"
+    now = "NOW()"
+
+    def __init__(self, dsn: str, pool_size: int = POOL_SIZE):
+        try:
+            import asyncpg
+        except ImportError as e:
+            raise RuntimeError("STORAGE_BACKEND=postgres needs asyncpg (pip install asyncpg)") from e
+        self._asyncpg = asyncpg
+        self.dsn = dsn
+        self.pool_size = pool_size
+        self._pool = None
+        self.statements = 0
+
+    async def start(self) -> None:
+        self._pool = await self._asyncpg.create_pool(self.dsn, min_size=1, max_size=self.pool_size)
+
+    @staticmethod
+    def placeholder(n: int) -> str:
+        return f"${n}"
+
+    @staticmethod
+    def in_list(column: str, placeholder: str) -> str:
+        return f"{column} = ANY({placeholder})"
+
+    @staticmethod
+    def encode_list(values: List[Any]) -> Any:
+        return values
+
+    @staticmethod
+    def encode(kind: str, value: Any) -> Any:
+        if value is None:
+            return None
+        if kind == "json":
+            return json.dumps(value)
+        if kind == "date" and isinstance(value, str):
+            return date.fromisoformat(value[:10])
+        if kind == "timestamp" and isinstance(value, str):
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if kind == "numeric":
+            return Decimal(str(value))
+        if kind == "uuid":
+            return str(value)
+        return value
+
+    @staticmethod
+    def decode(kind: str, value: Any) -> Any:
+        if value is None:
+            return None
+        if kind == "json" and isinstance(value, str):
+            return json.loads(value)
+        if isinstance(value, Decimal):
+            return float(value)
+        if isinstance(value, (date, datetime)):
+            return value.isoformat()
+        if isinstance(value, uuid.UUID):
+            return str(value)
+        return value
+
+    async def apply_schema(self, schema: Schema) -> None:
+        async with self.session(transaction=True) as s:
+            for statement in schema.ddl("postgres"):
+                await s.fetch(statement)
+            for name, statement in schema.foreign_key_ddl():
+                if not await s.fetch("SELECT 1 FROM pg_constraint WHERE conname = $1", [name]):
+                    await s.fetch(statement)
+
+    @asynccontextmanager
+    async def session(self, transaction: bool = False) -> AsyncIterator["_PostgresSession"]:
+        async with self._pool.acquire() as conn:
+            if transaction:
+                try:
+                    async with conn.transaction():
+                        yield _PostgresSession(self, conn)
+                except self._asyncpg.PostgresError as e:  # deferred checks fail at COMMIT
+                    raise _api_error(e.sqlstate, str(e)) from e
+            else:
+                yield _PostgresSession(self, conn)
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+
+
+class _PostgresSession:
+    def __init__(self, engine: PostgresEngine, conn):
+        self._engine = engine
+        self._conn = conn
+
+    async def fetch(self, sql: str, params: Sequence = ()) -> List[Dict]:
+        self._engine.statements += 1
+        try:
+            return [dict(r) for r in await self._conn.fetch(sql, *params)]
+        except self._engine._asyncpg.PostgresError as e:
+            raise _api_error(e.sqlstate, str(e)) from e
+
+    async def executemany(self, sql: str, rows: List[Sequence]) -> None:
+        self._engine.statements += 1
+        try:
+            await self._conn.executemany(sql, rows)
+        except self._engine._asyncpg.PostgresError as e:
+            raise _api_error(e.sqlstate, str(e)) from e
+
+    async def defer_foreign_keys(self) -> None:
+        await self.fetch("SET CONSTRAINTS ALL DEFERRED")
+
+    async def after_bulk_insert(self, table: str) -> None:
+        # Rows loaded with their ids don't advance the identity sequence
+        await self.fetch(f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), MAX(id)) "
+                         f'FROM "{table}" HAVING MAX(id) IS NOT NULL')
+
+
+# ---------------------------------------------------------------------------
+# Query builder
+# ---------------------------------------------------------------------------
+_COMPARISONS = {"eq": "=", "neq": "<>", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+_METHODS = {"select": "GET", "insert": "POST", "upsert": "POST", "update": "PATCH", "delete": "DELETE"}
+
+
+def _split_top(text: str) -> List[str]:
+    """Split on commas outside parentheses and double quotes."""
+    parts, depth, start, quoted = [], 0, 0, False
+    for i, ch in enumerate(text):
+        if ch == '"':
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _coerce(kind: str, value: Any) -> Any:
+    """A filter value (text in or_ trees) as the column's Python type."""
+    if not isinstance(value, str):
+        return value
+    if kind == "int":
+        return int(value)
+    if kind == "numeric":
+        return float(value)
+    if kind == "bool":
+        return value.lower() == "true"
+    return value
+
+
+class SqlResponse:
+    def __init__(self, data: Any, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class _Params:
+    """Collects the values of one statement and hands out their placeholders."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.values: List[Any] = []
+
+    def add(self, value: Any) -> str:
+        self.values.append(value)
+        return self.engine.placeholder(len(self.values))
+
+
+class SqlQuery:
+    """One request being built: chain filters, then await execute()."""
+
+    def __init__(self, client: "SqlClient", table: str):
+        self._client = client
+        self._table = table
+        self._op = "select"
+        self._columns = "*"
+        self._filters: List[Tuple[str, str, Any]] = []
+        self._logic: List[str] = []
+        self._order: List[Tuple[str, bool, Optional[bool]]] = []
+        self._limit: Optional[int] = None
+        self._payload: Any = None
+        self._on_conflict: Optional[str] = None
+        self._ignore_duplicates = False
+        self._default_to_null = True
+
+    # Same attributes utils/supabase_client._query_labels reads
+    @property
+    def request(self) -> SimpleNamespace:
+        prefer = ""
+        if self._op == "upsert":
+            prefer = "resolution=ignore-duplicates" if self._ignore_duplicates else "resolution=merge-duplicates"
+        return SimpleNamespace(path=f"/rest/v1/{self._table}", http_method=_METHODS[self._op],
+                               headers={"prefer": prefer})
+
+    # --- operations ---
+    def select(self, columns: str = "*", count: Optional[str] = None) -> "SqlQuery":
+        self._columns = columns
+        return self
+
+    def insert(self, rows: Any, default_to_null: bool = True, **_) -> "SqlQuery":
+        self._op, self._payload, self._default_to_null = "insert", rows, default_to_null
+        return self
+
+    def upsert(self, rows: Any, on_conflict: str = "", ignore_duplicates: bool = False,
+               default_to_null: bool = True, **_) -> "SqlQuery":
+        self._op, self._payload, self._default_to_null = "upsert", rows, default_to_null
+        self._on_conflict, self._ignore_duplicates = on_conflict, ignore_duplicates
+        return self
+
+    def update(self, values: Dict, **_) -> "SqlQuery":
+        self._op, self._payload = "update", values
+        return self
+
+    def delete(self, **_) -> "SqlQuery":
+        self._op = "delete"
+        return self
+
+    # --- filters ---
+    def _filter(self, op: str, column: str, value: Any) -> "SqlQuery":
+        self._filters.append((op, column, value))
+        return self
+
+    def eq(self, column, value): return self._filter("eq", column, value)
+    def neq(self, column, value): return self._filter("neq", column, value)
+    def gt(self, column, value): return self._filter("gt", column, value)
+    def gte(self, column, value): return self._filter("gte", column, value)
+    def lt(self, column, value): return self._filter("lt", column, value)
+    def lte(self, column, value): return self._filter("lte", column, value)
+    def is_(self, column, value): return self._filter("is", column, value)
+    def in_(self, column, values): return self._filter("in", column, list(values))
+
+    def or_(self, expr: str) -> "SqlQuery":
+        self._logic.append(expr)
+        return self
+
+    def order(self, column: str, desc: bool = False, nullsfirst: Optional[bool] = None, **_) -> "SqlQuery":
+        self._order.append((column, desc, nullsfirst))
+        return self
+
+    def limit(self, size: int, **_) -> "SqlQuery":
+        self._limit = size
+        return self
+
+    # --- SQL ---
+    def _kinds(self, table: str) -> Dict[str, str]:
+        kinds = self._client.kinds.get(table)
+        if kinds is None:
+            raise _api_error("PGRST205", f"Could not find the table 'public.{table}' in the schema cache")
+        return kinds
+
+    def _column(self, table: str, column: str) -> str:
+        if column not in self._kinds(table):
+            raise _api_error("42703", f"column {table}.{column} does not exist")
+        return f'"{column}"'
+
+    def _condition(self, p: _Params, op: str, column: str, value: Any) -> str:
+        kinds, engine = self._kinds(self._table), self._client.engine
+        name = self._column(self._table, column)
+        kind = kinds[column]
+        if op == "is":
+            if value is None or (isinstance(value, str) and value.lower() == "null"):
+                return f"{name} IS NULL"
+            return f"{name} = {p.add(engine.encode(kind, _coerce(kind, value)))}"
+        if op == "in":
+            values = [engine.encode(kind, _coerce(kind, v)) for v in value]
+            return engine.in_list(name, p.add(engine.encode_list(values)))
+        return f"{name} {_COMPARISONS[op]} {p.add(engine.encode(kind, _coerce(kind, value)))}"
+
+    def _logic_tree(self, p: _Params, expr: str) -> str:
+        """PostgREST logic tree, e.g. "a.eq.1,and(b.lt.2,c.gt.3)" (top level is OR)."""
+        def node(term: str) -> str:
+            for combinator, joiner in (("and(", " AND "), ("or(", " OR ")):
+                if term.startswith(combinator):
+                    return "(" + joiner.join(node(t) for t in _split_top(term[len(combinator):-1])) + ")"
+            column, op, raw = term.split(".", 2)
+            if raw.startswith('"') and raw.endswith('"'):  # quoted value (timestamps)
+                raw = raw[1:-1]
+            return self._condition(p, op, column, raw)
+
+        return "(" + " OR ".join(node(t) for t in _split_top(expr)) + ")"
+
+    def _where(self, p: _Params) -> str:
+        conditions = [self._condition(p, op, column, value) for op, column, value in self._filters]
+        conditions += [self._logic_tree(p, expr) for expr in self._logic]
+        return f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    def _decode(self, table: str, rows: List[Dict]) -> List[Dict]:
+        kinds, decode = self._kinds(table), self._client.engine.decode
+        return [{k: decode(kinds.get(k, "text"), v) for k, v in row.items()} for row in rows]
+
+    # --- execution ---
+    async def execute(self) -> SqlResponse:
+        self._kinds(self._table)
+        if self._op == "select":
+            return SqlResponse(await self._select())
+        if self._op in ("insert", "upsert"):
+            return SqlResponse(await self._write())
+        engine = self._client.engine
+        p = _Params(engine)
+        if self._op == "update":
+            kinds = self._kinds(self._table)
+            sets = ", ".join(f"{self._column(self._table, c)} = {p.add(engine.encode(kinds[c], v))}"
+                             for c, v in self._payload.items() if not (self._table == "expenses" and c == "updated_at"))
+            if self._table == "expenses":
+                sets += f', "updated_at" = {engine.now}'
+            sql = f'UPDATE "{self._table}" SET {sets}{self._where(p)} RETURNING *'
+        else:
+            sql = f'DELETE FROM "{self._table}"{self._where(p)} RETURNING *'
+        if self._table == "expenses":
+            return SqlResponse(await self._change_expenses(sql, p))
+        async with engine.session() as s:
+            return SqlResponse(self._decode(self._table, await s.fetch(sql, p.values)))
+
+    async def _change_expenses(self, sql: str, p: _Params) -> List[Dict]:
+        """Run an UPDATE/DELETE of expenses and record what left a household (migration 017)."""
+        engine = self._client.engine
+        async with engine.session(transaction=True) as s:
+            households: Dict[int, int] = {}
+            if self._op == "update" and "household_id" in self._payload:
+                q = _Params(engine)
+                households = {r["id"]: r["household_id"] for r in await s.fetch(
+                    f'SELECT id, household_id FROM "expenses"{self._where(q)}', q.values)}
+            rows = self._decode("expenses", await s.fetch(sql, p.values))
+            if self._op == "delete":
+                gone = [(r["id"], r["household_id"]) for r in rows]
+            else:
+                gone = [(r["id"], households[r["id"]]) for r in rows
+                        if households.get(r["id"], r["household_id"]) != r["household_id"]]
+            if gone:
+                await s.executemany(
+                    f'INSERT INTO "expense_deletions" (expense_id, household_id) '
+                    f"VALUES ({engine.placeholder(1)}, {engine.placeholder(2)}) "
+                    f"ON CONFLICT (expense_id) DO UPDATE SET household_id = excluded.household_id, "
+                    f"deleted_at = {engine.now}", gone)
+        return rows
+
+    async def _select(self) -> List[Dict]:
+        plain, embeds = [], []
+        for part in _split_top(self._columns):
+            if "(" not in part:
+                plain.append(part)
+                continue
+            head, inner = part[:-1].split("(", 1)
+            alias, _, target = head.rpartition(":")
+            target, _, hint = target.partition("!")
+            self._kinds(target)
+            fk = self._client.schema.relation(self._table, target, hint or None)
+            if fk is None:
+                raise _api_error("PGRST200", f"Could not find a relationship between '{self._table}' "
+                                             f"and '{target}' in the schema cache")
+            embeds.append((alias or target, fk, _split_top(inner) or ["*"]))
+
+        hidden = {fk.column for _, fk, _ in embeds} - set(plain) if "*" not in plain else set()
+        selected = plain + sorted(hidden)
+        columns = "*" if "*" in selected else ", ".join(self._column(self._table, c) for c in selected)
+        p = _Params(self._client.engine)
+        sql = f'SELECT {columns} FROM "{self._table}"{self._where(p)}'
+        if self._order:
+            sql += " ORDER BY " + ", ".join(
+                f"{self._column(self._table, c)} {'DESC' if desc else 'ASC'} "
+                f"NULLS {'FIRST' if (desc if nullsfirst is None else nullsfirst) else 'LAST'}"
+                for c, desc, nullsfirst in self._order)
+        if self._limit is not None:
+            sql += f" LIMIT {int(self._limit)}"
+
+        async with self._client.engine.session() as s:
+            rows = self._decode(self._table, await s.fetch(sql, p.values))
+            for alias, fk, inner in embeds:
+                found = await self._embed(s, fk, inner, {r[fk.column] for r in rows} - {None})
+                for row in rows:
+                    row[alias] = found.get(row[fk.column])
+        for row in rows:
+            for column in hidden:
+                del row[column]
+            if not plain:  # only embeds were selected
+                for column in [c for c in row if c not in {a for a, _, _ in embeds}]:
+                    del row[column]
+        return rows
+
+    async def _embed(self, s, fk, columns: List[str], keys: set) -> Dict[Any, Dict]:
+        """Target rows of a many-to-one embed, by the referenced column."""
+        if not keys:
+            return {}
+        engine = self._client.engine
+        kind = self._kinds(fk.table)[fk.target_column]
+        wanted = "*" if "*" in columns else ", ".join(
+            self._column(fk.table, c) for c in dict.fromkeys([*columns, fk.target_column]))
+        p = _Params(engine)
+        where = engine.in_list(f'"{fk.target_column}"', p.add(engine.encode_list([engine.encode(kind, k) for k in keys])))
+        found = {}
+        for row in self._decode(fk.table, await s.fetch(f'SELECT {wanted} FROM "{fk.table}" WHERE {where}', p.values)):
+            key = row[fk.target_column]
+            if "*" not in columns and fk.target_column not in columns:
+                del row[fk.target_column]
+            found[key] = row
+        return found
+
+    async def _write(self) -> List[Dict]:
+        engine, table = self._client.engine, self._table
+        rows = self._payload if isinstance(self._payload, list) else [self._payload]
+        rows = [self._client.fill_defaults(table, dict(r)) for r in rows]
+        if self._default_to_null:  # PostgREST: columns missing from a row are NULL
+            every = list(dict.fromkeys(c for r in rows for c in r))
+            rows = [{c: r.get(c) for c in every} for r in rows]
+        groups: Dict[Tuple[str, ...], List[Dict]] = {}
+        for row in rows:  # rows with the same columns go in one statement
+            groups.setdefault(tuple(row), []).append(row)
+
+        written: List[Dict] = []
+        async with engine.session(transaction=len(groups) > 1) as s:
+            for columns, group in groups.items():
+                p = _Params(engine)
+                kinds = self._kinds(table)
+                names = ", ".join(self._column(table, c) for c in columns)
+                values = ", ".join(
+                    "(" + ", ".join(p.add(engine.encode(kinds[c], r[c])) for c in columns) + ")" for r in group)
+                sql = f'INSERT INTO "{table}" ({names}) VALUES {values}'
+                if self._op == "upsert":
+                    target = ", ".join(self._column(table, c.strip()) for c in self._on_conflict.split(","))
+                    if self._ignore_duplicates:
+                        sql += f" ON CONFLICT ({target}) DO NOTHING"
+                    else:
+                        sql += f" ON CONFLICT ({target}) DO UPDATE SET " + ", ".join(
+                            f'"{c}" = excluded."{c}"' for c in columns)
+                written += self._decode(table, await s.fetch(sql + " RETURNING *", p.values))
+        return written
+
+
+# ---------------------------------------------------------------------------
+# Functions (migrations 008, 009, 013, 015 and 016)
+# ---------------------------------------------------------------------------
+class SqlRPC:
+    def __init__(self, client: "SqlClient", fn: str, params: Dict):
+        self._client = client
+        self._fn = fn
+        self._params = params
+
+    @property
+    def request(self) -> SimpleNamespace:
+        return SimpleNamespace(path=f"/rest/v1/rpc/{self._fn}", http_method="POST", headers={})
+
+    async def execute(self) -> SqlResponse:
+        handler = getattr(self, f"_rpc_{self._fn}", None)
+        if handler is None:
+            raise _api_error("PGRST202", f"Could not find the function public.{self._fn}")
+        return SqlResponse(await handler(**self._params))
+
+    def _sql(self, sql: str) -> str:
+        """Write ?-placeholders as the engine's."""
+        parts = sql.split("?")
+        return "".join(part + (self._client.engine.placeholder(n) if n < len(parts) else "")
+                       for n, part in enumerate(parts, start=1))
+
+    async def _rpc_bot_session(self, p_telegram_id: int) -> Optional[Dict]:
+        decode = SqlQuery(self._client, "users")._decode
+        async with self._client.engine.session() as s:
+            users = await s.fetch(self._sql('SELECT * FROM "users" WHERE "telegram_id" = ?'), [p_telegram_id])
+            if not users:
+                return None
+            user = decode("users", users)[0]
+            household, members = None, []
+            if user["active_household_id"] is not None:
+                found = await s.fetch(self._sql('SELECT * FROM "households" WHERE "id" = ?'),
+                                      [user["active_household_id"]])
+                if found:
+                    household = decode("households", found)[0]
+                    members = decode("users", await s.fetch(self._sql(
+                        'SELECT u.* FROM "household_members" hm JOIN "users" u ON u."id" = hm."user_id" '
+                        'WHERE hm."household_id" = ? AND hm."is_active" = ? ORDER BY u."id"'),
+                        [household["id"], self._client.engine.encode("bool", True)]))
+        return {"user": user, "household": household, "members": members}
+
+    async def _month_rows(self, columns: str, p_household_id: int, p_start: str, p_end: str,
+                          group_by: str = "") -> List[Dict]:
+        engine = self._client.engine
+        async with engine.session() as s:
+            rows = await s.fetch(self._sql(
+                f'SELECT {columns} FROM "expenses" WHERE "household_id" = ? '
+                f'AND "expense_date" >= ? AND "expense_date" < ?{group_by}'),
+                [p_household_id, engine.encode("date", p_start), engine.encode("date", p_end)])
+        return SqlQuery(self._client, "expenses")._decode("expenses", rows)
+
+    async def _rpc_household_category_totals(self, **params) -> List[Dict]:
+        rows = await self._month_rows('"category", SUM("amount") AS "total"', **params,
+                                      group_by=' GROUP BY "category"')
+        return [{"category": r["category"], "total": round(float(r["total"]), 2)} for r in rows]
+
+    async def _rpc_household_balance(self, **params) -> List[Dict]:
+        # shared_with is an array (JSON text on SQLite), so the split (migration
+        # 015's, in cents) is done here
+        paid: Dict[int, int] = {}
+        owed: Dict[int, int] = {}
+        for e in await self._month_rows('"paid_by", "amount", "shared_with"', **params):
+            cents = to_cents(e["amount"])
+            paid[e["paid_by"]] = paid.get(e["paid_by"], 0) + cents
+            if e["shared_with"]:
+                for uid, share in split_cents(cents, e["shared_with"], e["paid_by"]).items():
+                    owed[uid] = owed.get(uid, 0) + share
+        return [{"user_id": uid, "credit": paid.get(uid, 0) / 100, "owed": owed.get(uid, 0) / 100,
+                 "net": (paid.get(uid, 0) - owed.get(uid, 0)) / 100}
+                for uid in dict.fromkeys([*paid, *owed])]
+
+    async def _rpc_recurring_advance(self, p_items: List[Dict]) -> int:
+        engine = self._client.engine
+        sql = self._sql('UPDATE "recurring_expenses" SET "next_due_date" = ?, '
+                        '"anchor_day" = COALESCE("anchor_day", ?), "updated_at" = ? '
+                        'WHERE "id" = ? AND "next_due_date" < ? RETURNING "id"')
+        now = engine.encode("timestamp", datetime.now().astimezone().isoformat())
+        moved = 0
+        async with engine.session(transaction=True) as s:
+            for item in p_items:
+                due = engine.encode("date", item["next_due_date"])
+                moved += len(await s.fetch(sql, [due, item.get("anchor_day"), now, item["id"], due]))
+        return moved
+
+
+# ---------------------------------------------------------------------------
+# Client
+# ---------------------------------------------------------------------------
+class SqlClient:
+    """Drop-in for the AsyncClient methods the helpers call: table() and rpc()."""
+
+    def __init__(self, engine, schema: Schema):
+        self.engine = engine
+        self.schema = schema
+        self.kinds: Dict[str, Dict[str, str]] = {
+            name: {c.name: c.kind for c in t.columns.values()} for name, t in schema.tables.items()
+        }
+        # gen_random_uuid() defaults, which SQLite can't express
+        self._uuid_columns: Dict[str, List[str]] = {}
+        if engine.dialect == "sqlite":
+            for name, t in schema.tables.items():
+                cols = [c.name for c in t.columns.values()
+                        if (c.default or "").lower().startswith("gen_random_uuid")]
+                if cols:
+                    self._uuid_columns[name] = cols
+
+    def table(self, name: str) -> SqlQuery:
+        return SqlQuery(self, name)
+
+    def rpc(self, fn: str, params: Optional[Dict] = None) -> SqlRPC:
+        return SqlRPC(self, fn, params or {})
+
+    def fill_defaults(self, table: str, row: Dict) -> Dict:
+        for column in self._uuid_columns.get(table, ()):
+            if row.get(column) is None:
+                row[column] = str(uuid.uuid4())
+        return row
+
+    async def bulk_insert(self, tables: Dict[str, List[Dict]]) -> None:
+        """Load rows (with their ids) into several tables in one transaction.
+
+        Foreign keys are checked at commit, so rows that reference each other
+        (users ↔ households) can be loaded in any order.
+        """
+        engine = self.engine
+        async with engine.session(transaction=True) as s:
+            await s.defer_foreign_keys()
+            for table, rows in tables.items():
+                kinds = SqlQuery(self, table)._kinds(table)
+                groups: Dict[Tuple[str, ...], List[Sequence]] = {}
+                for row in rows:
+                    row = self.fill_defaults(table, dict(row))
+                    groups.setdefault(tuple(row), []).append(
+                        [engine.encode(kinds[c], v) for c, v in row.items()])
+                for columns, values in groups.items():
+                    names = ", ".join(f'"{c}"' for c in columns)
+                    marks = ", ".join(engine.placeholder(n) for n in range(1, len(columns) + 1))
+                    await s.executemany(f'INSERT INTO "{table}" ({names}) VALUES ({marks})', values)
+                if "id" in kinds:
+                    await s.after_bulk_insert(table)
+
+    async def close(self) -> None:
+        await self.engine.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.engine.dialect, "statements": self.engine.statements}
+
+
+async def create_sql_client(backend: str) -> SqlClient:
+    """Open the configured database and create the schema if it is missing."""
+    if backend == "sqlite":
+        engine = SqliteEngine(os.getenv("SQLITE_PATH", "nuestros_gastos.sqlite3"))
+    elif backend == "postgres":
+        dsn = os.getenv("DATABASE_URL", "")
+        if not dsn:
+            raise ValueError("DATABASE_URL must be set for STORAGE_BACKEND=postgres")
+        engine = PostgresEngine(dsn, POOL_SIZE)
+        await engine.start()
+    else:
+        raise ValueError(f"Unknown STORAGE_BACKEND '{backend}' (use supabase, sqlite or postgres)")
+    schema = load_schema()
+    await engine.apply_schema(schema)
+    logger.info(f"SQL backend {backend} ready ({len(schema.tables)} tables)")
+    return SqlClient(engine, schema)
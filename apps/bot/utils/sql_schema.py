@@ -0,0 +1,434 @@
+"""
+The bot's tables, read from supabase/migrations/*.sql, for the SQL backend.
+
+The migrations are written for Supabase. load_schema() replays their
+CREATE TABLE, CREATE INDEX and ALTER TABLE statements (including the ones
+inside DO blocks) into a model of tables, columns, constraints and indexes.
+Everything that only makes sense on Supabase is skipped: row level security,
+policies, functions, triggers and grants. So are the ledger tables of
+migration 010, which only triggers keep correct; without them the helpers
+use their fallbacks.
+
+Schema.ddl() renders the model for SQLite or PostgreSQL:
+
+  SQLite      identity/serial keys become INTEGER PRIMARY KEY AUTOINCREMENT;
+              dates, timestamps, UUIDs, JSONB and arrays are TEXT (JSON for
+              the last two); booleans are 0/1; NOW(), CURRENT_DATE and
+              NOW() + INTERVAL '…' become strftime()/date() defaults, in
+              UTC ISO 8601. gen_random_uuid() is filled in by the client.
+  PostgreSQL  column types and defaults as written. Identity keys become
+              GENERATED BY DEFAULT, so that exported rows can be loaded with
+              their ids.
+
+In both dialects every foreign key is DEFERRABLE, so a bulk load can insert
+users and households (which reference each other) in one transaction.
+"""
+
+import re
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+MIGRATIONS_DIR = Path(os.getenv("MIGRATIONS_DIR", Path(__file__).resolve().parents[3] / "supabase" / "migrations"))
+
+# Maintained by triggers (migration 010), which aren't translated
+SKIPPED_TABLES = {"expense_ledger", "expense_ledger_categories"}
+
+_KINDS = (
+    ("int", ("BIGINT", "INT", "INTEGER", "SMALLINT", "SERIAL", "BIGSERIAL")),
+    ("numeric", ("NUMERIC", "DECIMAL", "REAL", "DOUBLE")),
+    ("bool", ("BOOLEAN", "BOOL")),
+    ("timestamp", ("TIMESTAMPTZ", "TIMESTAMP")),
+    ("date", ("DATE",)),
+    ("json", ("JSONB", "JSON")),
+    ("uuid", ("UUID",)),
+)
+_CONSTRAINT_WORDS = {"NOT", "NULL", "PRIMARY", "UNIQUE", "DEFAULT", "REFERENCES", "CHECK",
+                     "GENERATED", "CONSTRAINT"}
+_SQLITE_NOW = "strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'{})"
+
+
+@dataclass
+class Column:
+    name: str
+    pg_type: str
+    kind: str                       # int, numeric, bool, timestamp, date, json, uuid, array, text
+    not_null: bool = False
+    primary_key: bool = False
+    unique: bool = False
+    identity: bool = False
+    default: Optional[str] = None   # as written in the migration
+    check: Optional[str] = None
+
+
+@dataclass
+class ForeignKey:
+    name: str
+    column: str
+    table: str
+    target_column: str
+    on_delete: Optional[str] = None
+
+
+@dataclass
+class Index:
+    name: str
+    table: str
+    body: str                       # "(cols) [WHERE …]"
+    unique: bool = False
+
+
+@dataclass
+class Table:
+    name: str
+    columns: Dict[str, Column] = field(default_factory=dict)
+    constraints: List[str] = field(default_factory=list)   # UNIQUE (…), PRIMARY KEY (…), CHECK (…)
+    foreign_keys: List[ForeignKey] = field(default_factory=list)
+
+    @property
+    def primary_key(self) -> List[str]:
+        cols = [c.name for c in self.columns.values() if c.primary_key]
+        for constraint in self.constraints:
+            m = re.match(r"PRIMARY KEY\s*\((.*)\)", constraint, re.I)
+            if m:
+                cols = [c.strip() for c in m.group(1).split(",")]
+        return cols
+
+
+class SchemaError(ValueError):
+    pass
+
+
+class Schema:
+    """Tables and indexes after every migration, renderable for SQLite or PostgreSQL."""
+
+    def __init__(self):
+        self.tables: Dict[str, Table] = {}
+        self.indexes: Dict[str, Index] = {}
+
+    def table(self, name: str) -> Optional[Table]:
+        return self.tables.get(name)
+
+    def relation(self, table: str, target: str, hint: Optional[str] = None) -> Optional[ForeignKey]:
+        """The foreign key of table that references target (many-to-one), like a PostgREST embed."""
+        candidates = [fk for fk in self.tables[table].foreign_keys if fk.table == target]
+        if hint:
+            candidates = [fk for fk in candidates if hint in (fk.name, fk.column)]
+        return candidates[0] if len(candidates) == 1 else None
+
+    # ------------------------------------------------------------------
+    # Rendering
+    # ------------------------------------------------------------------
+    def ddl(self, dialect: str) -> List[str]:
+        """CREATE statements for dialect ("sqlite" or "postgres"), safe to run again."""
+        statements = []
+        for table in self.tables.values():
+            parts = [_column_ddl(c, dialect) for c in table.columns.values()]
+            parts += table.constraints
+            if dialect == "sqlite":  # no ALTER TABLE … ADD CONSTRAINT in SQLite
+                parts += [_fk_ddl(fk) for fk in table.foreign_keys]
+            statements.append(f'CREATE TABLE IF NOT EXISTS "{table.name}" (\n  ' + ",\n  ".join(parts) + "\n)")
+        for index in self.indexes.values():
+            unique = "UNIQUE " if index.unique else ""
+            statements.append(f'CREATE {unique}INDEX IF NOT EXISTS "{index.name}" ON "{index.table}" {index.body}')
+        return statements
+
+    def foreign_key_ddl(self) -> List[Tuple[str, str]]:
+        """(constraint name, ALTER TABLE statement) of every foreign key, for PostgreSQL."""
+        return [(fk.name, f'ALTER TABLE "{t.name}" ADD CONSTRAINT "{fk.name}" {_fk_ddl(fk)}')
+                for t in self.tables.values() for fk in t.foreign_keys]
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+    def apply(self, statement: str) -> None:
+        """Replay one migration statement; statements the SQL backend doesn't need are ignored."""
+        s = " ".join(statement.split())
+        upper = s.upper()
+        if upper.startswith("DO "):
+            for inner in re.findall(r"ALTER TABLE .*?;", s, re.I | re.S):
+                self.apply(inner.rstrip(";"))
+            return
+        m = re.match(r"CREATE TABLE (?:IF NOT EXISTS )?(?:public\.)?(\w+) \((.*)\)$", s, re.I)
+        if m:
+            return self._create_table(m.group(1), m.group(2))
+        m = re.match(r"CREATE (UNIQUE )?INDEX (?:IF NOT EXISTS )?(\w+) ON (?:public\.)?(\w+)"
+                     r"(?: USING \w+)? ?(\(.*)$", s, re.I)
+        if m:
+            if m.group(3) in self.tables:
+                self.indexes[m.group(2)] = Index(m.group(2), m.group(3), m.group(4), bool(m.group(1)))
+            return
+        m = re.match(r"ALTER TABLE (?:IF EXISTS )?(?:ONLY )?(?:public\.)?(\w+) (.*)$", s, re.I)
+        if m and m.group(1) in self.tables:
+            self._alter(self.tables[m.group(1)], m.group(2))
+
+    def _create_table(self, name: str, body: str) -> None:
+        if name in SKIPPED_TABLES or name in self.tables:
+            return
+        table = self.tables[name] = Table(name)
+        for part in _split_top(body):
+            head = part.split()[0].upper()
+            if head in ("UNIQUE", "PRIMARY", "CHECK"):
+                table.constraints.append(part)
+            elif head in ("CONSTRAINT", "FOREIGN"):
+                self._table_constraint(table, part)
+            else:
+                self._add_column(table, part)
+
+    def _alter(self, table: Table, action: str) -> None:
+        m = re.match(r"ADD COLUMN (?:IF NOT EXISTS )?(.*)$", action, re.I)
+        if m:
+            column = m.group(1).split()[0]
+            if column not in table.columns:
+                self._add_column(table, m.group(1))
+            return
+        m = re.match(r"ALTER COLUMN (\w+) (DROP|SET) NOT NULL$", action, re.I)
+        if m and m.group(1) in table.columns:
+            table.columns[m.group(1)].not_null = m.group(2).upper() == "SET"
+            return
+        if re.match(r"ADD CONSTRAINT ", action, re.I):
+            self._table_constraint(table, action[len("ADD "):])
+
+    def _table_constraint(self, table: Table, text: str) -> None:
+        m = re.match(r"(?:CONSTRAINT (\w+) )?(.*)$", text, re.I)
+        name, body = m.group(1), m.group(2)
+        fk = re.match(r"FOREIGN KEY \((\w+)\) REFERENCES (?:public\.)?(\w+) ?\((\w+)\)(?: ON DELETE (\w+(?: \w+)?))?",
+                      body, re.I)
+        if fk:
+            if fk.group(2) not in SKIPPED_TABLES:
+                table.foreign_keys.append(ForeignKey(name or f"{table.name}_{fk.group(1)}_fkey",
+                                                     fk.group(1), fk.group(2), fk.group(3), fk.group(4)))
+        elif body not in table.constraints:
+            table.constraints.append(body)
+
+    def _add_column(self, table: Table, text: str) -> None:
+        tokens = _tokens(text)
+        name, i = tokens[0].strip('"'), 1
+        type_tokens = []
+        while i < len(tokens) and tokens[i].upper() not in _CONSTRAINT_WORDS:
+            type_tokens.append(tokens[i])
+            i += 1
+        pg_type = " ".join(type_tokens).replace(" (", "(").replace(" [", "[")
+        column = Column(name, pg_type, _kind(pg_type))
+        column.identity = pg_type.upper() in ("SERIAL", "BIGSERIAL")
+        while i < len(tokens):
+            word = tokens[i].upper()
+            if word == "NOT":
+                column.not_null, i = True, i + 2
+            elif word == "NULL":
+                i += 1
+            elif word == "PRIMARY":
+                column.primary_key, column.not_null, i = True, True, i + 2
+            elif word == "UNIQUE":
+                column.unique, i = True, i + 1
+            elif word == "GENERATED":  # GENERATED {ALWAYS|BY DEFAULT} AS IDENTITY
+                column.identity = True
+                while i < len(tokens) and tokens[i].upper() != "IDENTITY":
+                    i += 1
+                i += 1
+            elif word == "DEFAULT":
+                j = i + 2  # the first token belongs to the default even if it is NULL
+                while j < len(tokens) and tokens[j].upper() not in _CONSTRAINT_WORDS:
+                    j += 1
+                column.default, i = " ".join(tokens[i + 1:j]), j
+            elif word == "CHECK":
+                column.check, i = tokens[i + 1], i + 2
+            elif word == "REFERENCES":
+                target, rest = tokens[i + 1], tokens[i + 2:]
+                target_column = "id"
+                if "(" in target:
+                    target, target_column = target.rstrip(")").split("(")
+                elif rest and rest[0].startswith("("):
+                    target_column, rest = rest[0].strip("()"), rest[1:]
+                i = len(tokens) - len(rest)
+                on_delete = None
+                if len(rest) >= 3 and rest[0].upper() == "ON" and rest[1].upper() == "DELETE":
+                    on_delete = " ".join(rest[2:4]) if rest[2].upper() in ("SET", "NO") else rest[2]
+                    i += 4 if rest[2].upper() in ("SET", "NO") else 3
+                target = target.split(".")[-1]
+                if target not in SKIPPED_TABLES:
+                    table.foreign_keys.append(ForeignKey(f"{table.name}_{name}_fkey", name, target,
+                                                         target_column, on_delete))
+            else:
+                i += 1
+        table.columns[name] = column
+
+
+def load_schema(directory: Path = MIGRATIONS_DIR) -> Schema:
+    """Replay every migration in directory, in file name order."""
+    files = sorted(Path(directory).glob("*.sql"))
+    if not files:
+        raise SchemaError(f"No migrations found in {directory} (set MIGRATIONS_DIR)")
+    schema = Schema()
+    for path in files:
+        for statement in split_statements(path.read_text()):
+            schema.apply(statement)
+    return schema
+
+
+# ---------------------------------------------------------------------------
+# Parsing helpers
+# ---------------------------------------------------------------------------
+def split_statements(sql: str) -> List[str]:
+    """Statements of a migration file, comments removed; $$ bodies and quotes kept whole."""
+    statements, current, i = [], [], 0
+    quote: Optional[str] = None
+    while i < len(sql):
+        ch = sql[i]
+        if quote:
+            if sql.startswith(quote, i):
+                current.append(quote)
+                i += len(quote)
+                quote = None
+                continue
+            current.append(ch)
+        elif sql.startswith("--", i):
+            i = sql.find("\n", i)
+            i = len(sql) if i < 0 else i
+            continue
+        elif sql.startswith("$$", i):
+            quote = "$$"
+            current.append("$$")
+            i += 2
+            continue
+        elif ch == "'":
+            quote = "'"
+            current.append(ch)
+        elif ch == ";":
+            statements.append("".join(current).strip())
+            current = []
+        else:
+            current.append(ch)
+        i += 1
+    statements.append("".join(current).strip())
+    return [s for s in statements if s]
+
+
+def _split_top(text: str) -> List[str]:
+    """Split on commas outside parentheses and quotes."""
+    parts, depth, start, quoted = [], 0, 0, False
+    for i, ch in enumerate(text):
+        if ch == "'":
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _tokens(text: str) -> List[str]:
+    """Words, 'quoted strings' (with any ::cast) and (parenthesized groups) of a column definition."""
+    tokens, i = [], 0
+    while i < len(text):
+        ch = text[i]
+        if ch.isspace():
+            i += 1
+            continue
+        start = i
+        if ch == "'":
+            i += 1
+            while i < len(text):
+                if text.startswith("''", i):  # escaped quote
+                    i += 2
+                    continue
+                i += 1
+                if text[i - 1] == "'":
+                    break
+        elif ch == "(":
+            depth = 0
+            while i < len(text):
+                depth += {"(": 1, ")": -1}.get(text[i], 0)
+                i += 1
+                if depth == 0:
+                    break
+        else:
+            while i < len(text) and not text[i].isspace() and text[i] not in "(":
+                i += 1
+            if i < len(text) and text[i] == "(" and text[start:i].upper() not in _CONSTRAINT_WORDS:
+                depth = 0  # NUMERIC(12,2), NOW(), households(id)
+                while i < len(text):
+                    depth += {"(": 1, ")": -1}.get(text[i], 0)
+                    i += 1
+                    if depth == 0:
+                        break
+        while text.startswith("::", i) or (i < len(text) and text[i] in "[]"):
+            i += 2 if text.startswith("::", i) else 1
+            while i < len(text) and (text[i].isalnum() or text[i] in "_[]"):
+                i += 1
+        tokens.append(text[start:i])
+    return tokens
+
+
+def _kind(pg_type: str) -> str:
+    upper = pg_type.upper()
+    if upper.endswith("[]"):
+        return "array"
+    base = re.split(r"[ (]", upper)[0]
+    for kind, names in _KINDS:
+        if base in names:
+            return kind
+    return "text"
+
+
+def _fk_ddl(fk: ForeignKey) -> str:
+    on_delete = f" ON DELETE {fk.on_delete}" if fk.on_delete else ""
+    return (f'FOREIGN KEY ("{fk.column}") REFERENCES "{fk.table}" ("{fk.target_column}"){on_delete}'
+            " DEFERRABLE INITIALLY IMMEDIATE")
+
+
+def _column_ddl(c: Column, dialect: str) -> str:
+    if dialect == "sqlite":
+        if c.identity:
+            return f'"{c.name}" INTEGER PRIMARY KEY AUTOINCREMENT'
+        sql_type = {"int": "INTEGER", "numeric": "NUMERIC", "bool": "INTEGER"}.get(c.kind, "TEXT")
+        default = _sqlite_default(c)
+    else:
+        if c.identity:
+            base = "INTEGER" if c.pg_type.upper() in ("SERIAL", "INT", "INTEGER") else "BIGINT"
+            return f'"{c.name}" {base} GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY'
+        sql_type, default = c.pg_type, c.default
+    parts = [f'"{c.name}"', sql_type]
+    if c.primary_key:
+        parts.append("PRIMARY KEY")
+    if c.not_null and not c.primary_key:
+        parts.append("NOT NULL")
+    if c.unique:
+        parts.append("UNIQUE")
+    if default is not None:
+        parts.append(f"DEFAULT {default}")
+    if c.check:
+        parts.append(f"CHECK {c.check}")
+    return " ".join(parts)
+
+
+def _sqlite_default(c: Column) -> Optional[str]:
+    """The column default as an SQLite expression; None if it has none (or the client fills it)."""
+    if c.default is None:
+        return None
+    d = c.default.strip()
+    while d.startswith("(") and d.endswith(")"):
+        d = d[1:-1].strip()
+    upper = d.upper()
+    if upper in ("NOW()", "CURRENT_TIMESTAMP"):
+        return f"({_SQLITE_NOW.format('')})"
+    m = re.match(r"NOW\(\) \+ INTERVAL '(\d+) (\w+)'$", d, re.I)
+    if m:
+        return "(" + _SQLITE_NOW.format(f", '+{m.group(1)} {m.group(2)}'") + ")"
+    if upper == "CURRENT_DATE":
+        return "(date('now'))"
+    if upper in ("TRUE", "FALSE"):
+        return "1" if upper == "TRUE" else "0"
+    if upper.startswith("GEN_RANDOM_UUID"):
+        return None
+    literal = re.sub(r"::\w+(\[\])?$", "", d)
+    if c.kind == "array" and literal.startswith("'{"):
+        return "'[" + literal[2:-2] + "]'"
+    return literal
@@ -5,12 +5,38 @@ Single source of truth for:
   - The Supabase client singleton
   - The CATEGORIES map (name → type) used for validation and auto-fill
   - All database query helpers consumed by the command handlers
+
+All helpers are coroutines backed by supabase-py's AsyncClient, which shares
+one pooled keep-alive httpx client. Handlers must ``await`` them so that a slow
+PostgREST round trip never blocks the python-telegram-bot event loop.
+
+The helpers only use the query-builder surface described by QueryClient, so
+STORAGE_BACKEND can swap Supabase for a direct SQLite or PostgreSQL
+connection (utils/sql_client.py) without changing any of them.
 """
 
 import os
+import time
+import asyncio
 import logging
-from typing import Optional, List, Dict
-from supabase import create_client, Client
+import functools
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Optional, List, Dict, Protocol, Sequence, Tuple, Union
+
+import httpx
+from postgrest.exceptions import APIError
+from supabase import acreate_client, AsyncClientOptions
+
+from utils.cache import TTLCache, VersionedCache
+from utils.columnar import ExpenseBatch
+from utils.snapshot import MonthlySnapshot
+from utils.metrics import (
+    HANDLER_ERRORS,
+    HANDLER_LATENCY,
+    HANDLER_ROUND_TRIPS,
+    QUERY_ERRORS,
+    QUERY_LATENCY,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -32,99 +58,341 @@ CATEGORIES: Dict[str, Dict[str, str]] = {
 
 VALID_CATEGORIES: List[str] = list(CATEGORIES.keys())
 
+# Type of the custom subcategories (migration 006) under each macro category
+MACRO_CATEGORY_TYPES: Dict[str, str] = {
+    "vivienda":        "fixed",
+    "alimentos":       "variable",
+    "servicios":       "fixed",
+    "transporte":      "variable",
+    "entretenimiento": "variable",
+    "salud":           "variable",
+    "otros":           "variable",
+}
+
 # ---------------------------------------------------------------------------
 # Client singleton
+# STORAGE_BACKEND picks what answers the queries: "supabase" (PostgREST, the
+# default), or "sqlite" / "postgres" for a direct connection with the schema
+# of supabase/migrations (utils/sql_client.py). Every backend implements
+# QueryClient, and tests/test_conformance.py checks them against each other.
 # ---------------------------------------------------------------------------
-_client: Optional[Client] = None
+class QueryClient(Protocol):
+    """The part of supabase-py's AsyncClient the helpers use.
+
+    table(name) returns a builder with select/insert/upsert/update/delete,
+    the eq/neq/gt/gte/lt/lte/is_/in_/or_ filters, order and limit, and an
+    awaitable execute(); rpc(fn, params) one with execute(). Both expose
+    .request (path, http_method, headers) for _query_labels, and errors
+    are postgrest APIErrors carrying PostgREST or SQLSTATE codes.
+    """
+
+    def table(self, name: str) -> Any: ...
+
+    def rpc(self, fn: str, params: Optional[Dict] = None) -> Any: ...
 
 
-def init_client() -> Client:
-    """Create the Supabase client from env vars. Called once at bot startup."""
-    global _client
+_client: Optional[QueryClient] = None
+_http: Optional[httpx.AsyncClient] = None
+_sql = None  # utils.sql_client.SqlClient when STORAGE_BACKEND isn't supabase
+
+# Connection pool sizing. Every concurrent handler holds at most one
+# connection per in-flight query, so this caps parallel PostgREST requests.
+MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "10"))
+HTTP_TIMEOUT = float(os.getenv("SUPABASE_HTTP_TIMEOUT", "30"))
+
+
+async def init_client(client: Optional[QueryClient] = None) -> QueryClient:
+    """Create the client for STORAGE_BACKEND from env vars. Called once at bot startup.
+
+    A client passed in (bench/ installs an in-memory fake) or created by an
+    earlier call is kept as is.
+    """
+    global _client, _http, _sql
+    if client is not None:
+        _client = client
+    if _client is not None:
+        return _client
+    backend = os.getenv("STORAGE_BACKEND", "supabase")
+    if backend != "supabase":
+        from utils.sql_client import create_sql_client
+
+        _client = _sql = await create_sql_client(backend)
+        return _client
     url = os.getenv("SUPABASE_URL", "")
     key = os.getenv("SUPABASE_SERVICE_KEY", "")
     if not url or not key:
         raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
-    _client = create_client(url, key)
-    logger.info("Supabase client initialized")
+    _http = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE,
+        ),
+        timeout=HTTP_TIMEOUT,
+        follow_redirects=True,
+    )
+    _client = await acreate_client(url, key, options=AsyncClientOptions(httpx_client=_http))
+    logger.info(f"Supabase client initialized (pool size {MAX_CONNECTIONS})")
     return _client
 
 
-def get_client() -> Client:
+async def close_client() -> None:
+    """Close the pooled HTTP (or database) connections. Called once at bot shutdown."""
+    global _client, _http, _sql
+    if _http is not None:
+        await _http.aclose()
+    if _sql is not None:
+        await _sql.close()
+    _client = None
+    _http = None
+    _sql = None
+
+
+def get_sql_stats() -> Optional[Dict[str, Any]]:
+    """Statement counters of the SQL backend, or None on Supabase."""
+    return _sql.stats() if _sql is not None else None
+
+
+def get_client() -> QueryClient:
     """Return the already-initialized client."""
     if _client is None:
-        raise RuntimeError("Supabase client not initialized. Call init_client() first.")
+        raise RuntimeError("Database client not initialized. Call init_client() first.")
     return _client
 
 
+# ---------------------------------------------------------------------------
+# Round-trip accounting and metrics
+# Every query goes through _execute(), which bumps the counter of the
+# handler currently running (a ContextVar, so concurrent updates don't mix)
+# and records its latency by table and operation (utils/metrics.py).
+# ---------------------------------------------------------------------------
+_round_trips: ContextVar[Optional[List[int]]] = ContextVar("round_trips", default=None)
+_round_trip_stats: Dict[str, Dict[str, int]] = {}
+
+_HTTP_OPS = {"GET": "select", "POST": "insert", "PATCH": "update", "DELETE": "delete", "HEAD": "count"}
+
+
+def _query_labels(query: Any) -> Tuple[str, str]:
+    """(table, op) of a PostgREST request builder; RPCs are (function, "rpc")."""
+    request = getattr(query, "request", None)
+    if request is None:
+        return "unknown", "unknown"
+    url = request.path
+    head, _, name = (getattr(url, "path", None) or str(url)).rpartition("/")
+    if head.endswith("/rpc"):
+        return name, "rpc"
+    method = request.http_method
+    if method == "POST" and "resolution=" in (request.headers.get("prefer") or ""):
+        return name, "upsert"
+    return name, _HTTP_OPS.get(method) or method.lower()
+
+
+async def _execute(query: Any) -> Any:
+    """Run a PostgREST query builder, counting it as one round trip."""
+    counter = _round_trips.get()
+    if counter is not None:
+        counter[0] += 1
+    labels = _query_labels(query)
+    start = time.perf_counter()
+    try:
+        return await query.execute()
+    except Exception:
+        QUERY_ERRORS.inc(*labels)
+        raise
+    finally:
+        QUERY_LATENCY.observe(time.perf_counter() - start, *labels)
+
+
+def track_round_trips(handler: Callable) -> Callable:
+    """Wrap a handler coroutine so its round trips, latency and errors are recorded."""
+    name = handler.__name__
+
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        counter = [0]
+        token = _round_trips.set(counter)
+        start = time.perf_counter()
+        try:
+            return await handler(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - start, name)
+            HANDLER_ROUND_TRIPS.observe(counter[0], name)
+            _round_trips.reset(token)
+            stats = _round_trip_stats.setdefault(name, {"calls": 0, "round_trips": 0, "max": 0})
+            stats["calls"] += 1
+            stats["round_trips"] += counter[0]
+            stats["max"] = max(stats["max"], counter[0])
+            logger.debug(f"{name}: {counter[0]} round trips")
+
+    return wrapper
+
+
+def get_round_trip_stats() -> Dict[str, Dict[str, int]]:
+    """Per-handler totals: { handler_name: {calls, round_trips, max} }."""
+    return {name: dict(stats) for name, stats in _round_trip_stats.items()}
+
+
+# ---------------------------------------------------------------------------
+# Session cache: telegram_id → (users row, active households row)
+# Every command needs both before doing any real work; caching them saves
+# three round trips per command. Writes that change either row invalidate.
+# ---------------------------------------------------------------------------
+_session_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "300")),
+)
+
+
+def invalidate_user_cache(telegram_id: Optional[int] = None, user_id: Optional[int] = None) -> None:
+    """Drop cached session entries for a telegram_id and/or a users.id."""
+    if telegram_id is not None:
+        _session_cache.pop(telegram_id)
+    if user_id is not None:
+        _session_cache.pop_where(lambda entry: entry[0]["id"] == user_id)
+
+
+def get_user_cache_stats() -> Dict[str, float]:
+    """Hit/miss/eviction counters of the session cache."""
+    return _session_cache.stats()
+
+
 # ---------------------------------------------------------------------------
 # User helpers
 # ---------------------------------------------------------------------------
-def get_user_by_telegram_id(telegram_id: int) -> Optional[Dict]:
+async def get_user_by_telegram_id(telegram_id: int) -> Optional[Dict]:
     """Return the users row matching telegram_id, or None."""
-    resp = get_client().table("users").select("*").eq("telegram_id", telegram_id).execute()
+    resp = await _execute(get_client().table("users").select("*").eq("telegram_id", telegram_id))
     return resp.data[0] if resp.data else None
 
 
-def ensure_user_exists(telegram_id: int, name: str) -> Dict:
+async def ensure_user_exists(telegram_id: int, name: str) -> Dict:
     """Upsert: insert if new, return existing row otherwise."""
-    user = get_user_by_telegram_id(telegram_id)
+    invalidate_user_cache(telegram_id=telegram_id)
+    user = await get_user_by_telegram_id(telegram_id)
     if user:
         return user
-    resp = get_client().table("users").insert({
+    resp = await _execute(get_client().table("users").insert({
         "telegram_id": telegram_id,
         "name": name,
-    }).execute()
+    }))
     logger.info(f"Created user: telegram_id={telegram_id}, name={name}")
     return resp.data[0]
 
 
+async def get_users_by_ids(user_ids: Sequence[int]) -> List[Dict]:
+    """Return id, telegram_id and name of the given users in one query."""
+    if not user_ids:
+        return []
+    resp = await _execute(
+        get_client().table("users").select("id,telegram_id,name").in_("id", list(user_ids))
+    )
+    return resp.data
+
+
 # ---------------------------------------------------------------------------
 # Household helpers
 # ---------------------------------------------------------------------------
-def get_active_household(user_id: int) -> Optional[Dict]:
+# users.active_household_id → households needs an explicit FK hint because
+# households.created_by → users is a second relationship between the tables.
+_ACTIVE_HOUSEHOLD_EMBED = "active_household:households!users_active_household_id_fkey(*)"
+
+
+async def get_active_household(user_id: int) -> Optional[Dict]:
     """Return the households row that is the user's active_household_id."""
-    user = get_client().table("users").select("active_household_id").eq("id", user_id).execute()
-    if not user.data or not user.data[0].get("active_household_id"):
-        return None
-    hid = user.data[0]["active_household_id"]
-    resp = get_client().table("households").select("*").eq("id", hid).execute()
+    resp = await _execute(
+        get_client().table("users").select(_ACTIVE_HOUSEHOLD_EMBED).eq("id", user_id)
+    )
+    return resp.data[0]["active_household"] if resp.data else None
+
+
+async def resolve_user_household(telegram_id: int) -> Tuple[Optional[Dict], Optional[Dict]]:
+    """Return (users row, active households row) for telegram_id, cached.
+
+    Either element may be None: no user → (None, None); user without an
+    active household → (user, None). Unknown users are not cached so that
+    /start takes effect immediately. A cache miss costs one round trip.
+    """
+    cached = _session_cache.get(telegram_id)
+    if cached is not None:
+        return cached
+    resp = await _execute(
+        get_client()
+        .table("users")
+        .select(f"*, {_ACTIVE_HOUSEHOLD_EMBED}")
+        .eq("telegram_id", telegram_id)
+    )
+    if not resp.data:
+        return None, None
+    user = dict(resp.data[0])
+    household = user.pop("active_household", None)
+    _session_cache.set(telegram_id, (user, household))
+    return user, household
+
+
+async def resolve_session(telegram_id: int) -> Tuple[Optional[Dict], Optional[Dict], List[Dict]]:
+    """Return (users row, active households row, active members) for telegram_id.
+
+    Used by commands that also need the member list (/gasto, /balance).
+    On a session-cache miss everything comes from the bot_session() RPC
+    (migration 008) in one round trip; on a hit only the members are fetched.
+    Members are never cached, so people who just joined show up immediately.
+    """
+    cached = _session_cache.get(telegram_id)
+    if cached is not None:
+        user, household = cached
+        members = await get_household_members(household["id"]) if household else []
+        return user, household, members
+
+    resp = await _execute(get_client().rpc("bot_session", {"p_telegram_id": telegram_id}))
+    if not resp.data:
+        return None, None, []
+    user, household = resp.data["user"], resp.data["household"]
+    _session_cache.set(telegram_id, (user, household))
+    return user, household, resp.data["members"]
+
+
+async def get_household(household_id: int) -> Optional[Dict]:
+    """Return the households row with the given id, or None."""
+    if _replica is not None and _replica.fresh(household_id):
+        return _replica.household(household_id)
+    resp = await _execute(get_client().table("households").select("*").eq("id", household_id))
     return resp.data[0] if resp.data else None
 
 
-def get_user_households(user_id: int) -> List[Dict]:
+async def get_user_households(user_id: int) -> List[Dict]:
     """Return all households the user is an active member of."""
-    members = (
+    resp = await _execute(
         get_client()
         .table("household_members")
-        .select("household_id")
+        .select("households(*)")
         .eq("user_id", user_id)
         .eq("is_active", True)
-        .execute()
     )
-    if not members.data:
-        return []
-    household_ids = [m["household_id"] for m in members.data]
-    resp = get_client().table("households").select("*").in_("id", household_ids).execute()
-    return resp.data
+    return [m["households"] for m in resp.data if m.get("households")]
 
 
-def set_active_household(user_id: int, household_id: int) -> None:
+async def set_active_household(user_id: int, household_id: int) -> None:
     """Update users.active_household_id."""
-    get_client().table("users").update({"active_household_id": household_id}).eq("id", user_id).execute()
+    await _execute(
+        get_client().table("users").update({"active_household_id": household_id}).eq("id", user_id)
+    )
+    invalidate_user_cache(user_id=user_id)
     logger.info(f"User {user_id} switched active household to {household_id}")
 
 
-def create_auth_token(telegram_id: int, name: str) -> str:
+async def create_auth_token(telegram_id: int, name: str) -> str:
     """Insert a one-time magic-link token for this user. Returns the UUID string."""
-    resp = get_client().table("auth_tokens").insert({
+    resp = await _execute(get_client().table("auth_tokens").insert({
         "telegram_id": telegram_id,
         "name": name,
-    }).execute()
+    }))
     return resp.data[0]["token"]
 
 
-def create_link_code(telegram_id: int, name: str) -> str:
+async def create_link_code(telegram_id: int, name: str) -> str:
     """Generate a 6-character code for linking Telegram to a web account.
 
     The code is stored in the link_codes table and expires after 10 minutes
@@ -134,35 +402,32 @@ def create_link_code(telegram_id: int, name: str) -> str:
     import string
 
     code = "".join(random.choices(string.ascii_uppercase + string.digits, k=6))
-    get_client().table("link_codes").insert({
+    await _execute(get_client().table("link_codes").insert({
         "code": code,
         "telegram_id": telegram_id,
         "name": name,
-    }).execute()
+    }))
     return code
 
 
-def get_household_members(household_id: int) -> List[Dict]:
+async def get_household_members(household_id: int) -> List[Dict]:
     """Return all active users who are members of the given household."""
-    members = (
+    if _replica is not None and _replica.fresh(household_id):
+        return _replica.members(household_id)
+    resp = await _execute(
         get_client()
         .table("household_members")
-        .select("user_id")
+        .select("users(*)")
         .eq("household_id", household_id)
         .eq("is_active", True)
-        .execute()
     )
-    if not members.data:
-        return []
-    user_ids = [m["user_id"] for m in members.data]
-    resp = get_client().table("users").select("*").in_("id", user_ids).execute()
-    return resp.data
+    return [m["users"] for m in resp.data if m.get("users")]
 
 
 # ---------------------------------------------------------------------------
 # Expense helpers
 # ---------------------------------------------------------------------------
-def insert_expense(
+def expense_payload(
     household_id: int,
     paid_by: int,
     amount: float,
@@ -170,9 +435,16 @@ def insert_expense(
     description: str,
     shared_with: List[int],
     store: Optional[str] = None,
+    idempotency_key: Optional[str] = None,
+    expense_date: Optional[str] = None,
+    expense_type: Optional[str] = None,
 ) -> Dict:
-    """Insert a row into expenses. Type is auto-filled from CATEGORIES."""
-    exp_type = CATEGORIES.get(category, {}).get("type", "variable")
+    """Build an expenses row. Type is auto-filled from CATEGORIES.
+
+    expense_date (ISO date) defaults to today on the database side. Pass
+    expense_type (CategoryIndex.type_of) for custom subcategories.
+    """
+    exp_type = expense_type or CATEGORIES.get(category, {}).get("type", "variable")
     payload = {
         "household_id": household_id,
         "paid_by": paid_by,
@@ -184,41 +456,224 @@ def insert_expense(
     }
     if store:
         payload["store"] = store
-    resp = get_client().table("expenses").insert(payload).execute()
-    logger.info(f"Inserted expense: {payload}")
+    if idempotency_key:
+        payload["idempotency_key"] = idempotency_key
+    if expense_date:
+        payload["expense_date"] = expense_date
+    return payload
+
+
+# Called with the rows of every successful expense insert (e.g. notifications).
+_expense_listeners: List[Callable[[List[Dict]], None]] = []
+
+
+def add_expense_listener(listener: Callable[[List[Dict]], None]) -> None:
+    """Register a synchronous callback for newly inserted expense rows."""
+    _expense_listeners.append(listener)
+
+
+def _after_expense_write(rows: List[Dict]) -> None:
+    """Outdate cached aggregates of the rows' households and tell the listeners."""
+    if not rows:
+        return
+    for household_id in {row["household_id"] for row in rows}:
+        _snapshot_cache.bump(household_id)
+    for listener in _expense_listeners:
+        try:
+            listener(rows)
+        except Exception as e:
+            logger.error(f"Expense listener {listener!r} failed: {e!r}")
+
+
+async def insert_expense(
+    household_id: int,
+    paid_by: int,
+    amount: float,
+    category: str,
+    description: str,
+    shared_with: List[int],
+    store: Optional[str] = None,
+) -> Dict:
+    """Insert a row into expenses. Type is auto-filled from CATEGORIES."""
+    payload = expense_payload(household_id, paid_by, amount, category, description, shared_with, store)
+    resp = await _execute(get_client().table("expenses").insert(payload))
+    _after_expense_write(resp.data)
+    logger.debug(f"Inserted expense {resp.data[0].get('id')} into household {household_id}")
     return resp.data[0]
 
 
-def get_monthly_expenses(household_id: int, year: int, month: int) -> List[Dict]:
-    """Return all expenses for a household in a given month, newest first."""
-    # Build the month boundaries
+async def insert_expenses(payloads: List[Dict]) -> List[Dict]:
+    """Insert many expense rows (see expense_payload) in one request.
+
+    Rows whose idempotency_key already exists are skipped, so retrying a
+    batch is safe. Returns only the rows actually inserted.
+    """
+    if not payloads:
+        return []
+    resp = await _execute(
+        get_client()
+        .table("expenses")
+        .upsert(payloads, on_conflict="idempotency_key", ignore_duplicates=True, default_to_null=False)
+    )
+    _after_expense_write(resp.data)
+    logger.debug(f"Inserted {len(resp.data)} of {len(payloads)} expenses")
+    return resp.data
+
+
+def _month_bounds(year: int, month: int) -> Tuple[str, str]:
+    """Return the half-open [start, end) ISO dates of a calendar month."""
     start = f"{year}-{month:02d}-01"
     if month == 12:
         end = f"{year + 1}-01-01"
     else:
         end = f"{year}-{month + 1:02d}-01"
+    return start, end
 
-    resp = (
-        get_client()
-        .table("expenses")
-        .select("*")
-        .eq("household_id", household_id)
-        .gte("expense_date", start)
-        .lt("expense_date", end)
-        .order("expense_date", desc=True)
-        .execute()
-    )
+
+# Rows per request when streaming expenses. Must not exceed PostgREST's
+# max-rows setting (1000 on Supabase), since a short page ends the stream.
+EXPENSE_PAGE_SIZE = int(os.getenv("EXPENSE_PAGE_SIZE", "1000"))
+
+# The columns the aggregates need (see MonthlySnapshot.add).
+AGGREGATE_COLUMNS = ("amount", "paid_by", "shared_with", "category")
+
+
+async def iter_expenses(
+    household_id: int,
+    start: str,
+    end: str,
+    columns: Union[str, Sequence[str]] = "*",
+    page_size: Optional[int] = None,
+    descending: bool = False,
+) -> AsyncIterator[Dict]:
+    """Stream a household's expenses with start <= expense_date < end.
+
+    Pages through the range by the (expense_date, id) keyset, so it never
+    hits PostgREST's max-rows cap and only one page is held in memory.
+    Rows always include id and expense_date in addition to `columns`; rows
+    served by the read replica include every column.
+    """
+    rows = _replica_rows(household_id, start, end, descending)
+    if rows is not None:
+        for row in rows:
+            yield row
+        return
+    page_size = page_size or EXPENSE_PAGE_SIZE
+    if not isinstance(columns, str):
+        columns = ",".join(dict.fromkeys(("id", "expense_date", *columns)))
+    elif columns != "*":
+        columns = f"id,expense_date,{columns}"
+    op = "lt" if descending else "gt"
+
+    last: Optional[Dict] = None
+    while True:
+        query = (
+            get_client()
+            .table("expenses")
+            .select(columns)
+            .eq("household_id", household_id)
+            .gte("expense_date", start)
+            .lt("expense_date", end)
+        )
+        if last is not None:
+            d, i = last["expense_date"], last["id"]
+            query = query.or_(f"expense_date.{op}.{d},and(expense_date.eq.{d},id.{op}.{i})")
+        resp = await _execute(
+            query
+            .order("expense_date", desc=descending)
+            .order("id", desc=descending)
+            .limit(page_size)
+        )
+        for row in resp.data:
+            yield row
+        if len(resp.data) < page_size:
+            return
+        last = resp.data[-1]
+
+
+async def get_monthly_expenses(household_id: int, year: int, month: int) -> List[Dict]:
+    """Return all expenses for a household in a given month, newest first."""
+    start, end = _month_bounds(year, month)
+    return [row async for row in iter_expenses(household_id, start, end, descending=True)]
+
+
+# ---------------------------------------------------------------------------
+# Aggregates
+# Read, in order of preference, from:
+#   1. the trigger-maintained ledger tables (migration 010) — a few rows;
+#   2. the aggregate functions (migration 009) — one scan in Postgres;
+#   3. the month's raw rows, aggregated here.
+# A source that is missing (migration not applied) is skipped until restart.
+# ---------------------------------------------------------------------------
+_ledger_enabled = os.getenv("EXPENSE_LEDGER", "1") != "0"
+_server_aggregates = os.getenv("SERVER_AGGREGATES", "1") != "0"
+
+
+async def _aggregate_rpc(fn: str, household_id: int, year: int, month: int) -> Optional[List[Dict]]:
+    """Call an aggregate function; return its rows, or None to request the fallback."""
+    global _server_aggregates
+    if not _server_aggregates:
+        return None
+    start, end = _month_bounds(year, month)
+    try:
+        resp = await _execute(get_client().rpc(fn, {
+            "p_household_id": household_id,
+            "p_start": start,
+            "p_end": end,
+        }))
+    except APIError as e:
+        if e.code == "PGRST202":  # function not found — stop trying until restart
+            _server_aggregates = False
+        logger.warning(f"{fn} RPC failed ({e.code}: {e.message}); using row fallback")
+        return None
     return resp.data
 
 
-def get_monthly_balance(household_id: int, year: int, month: int) -> Dict[int, float]:
-    """Compute net balance per user_id for the month.
+def _ledger_failed(e: APIError) -> None:
+    global _ledger_enabled
+    if e.code in ("PGRST205", "42P01"):  # table not found — stop trying until restart
+        _ledger_enabled = False
+    logger.warning(f"Ledger read failed ({e.code}: {e.message}); using fallback")
 
-    Algorithm:
-        For each expense:
-            per_person_share = amount / len(shared_with)
-            Each person in shared_with owes that share.
+
+async def _ledger_snapshot(household_id: int, year: int, month: int) -> Optional[MonthlySnapshot]:
+    """Build the month's snapshot from the ledger tables, or None if unavailable."""
+    if not _ledger_enabled:
+        return None
+    month_start, _ = _month_bounds(year, month)
+    try:
+        users, categories = await asyncio.gather(
+            _execute(
+                get_client()
+                .table("expense_ledger")
+                .select("user_id,paid_cents,owed_cents")
+                .eq("household_id", household_id)
+                .eq("month", month_start)
+            ),
+            _execute(
+                get_client()
+                .table("expense_ledger_categories")
+                .select("category,total_cents,expense_count")
+                .eq("household_id", household_id)
+                .eq("month", month_start)
+            ),
+        )
+    except APIError as e:
+        _ledger_failed(e)
+        return None
+    return MonthlySnapshot.from_ledger(household_id, year, month, users.data, categories.data)
+
+
+def balance_from_rows(expenses: List[Dict]) -> Dict[int, float]:
+    """Compute net balance per user_id from raw expense rows.
+
+    Algorithm (MonthlySnapshot, the same split as the ledger and the
+    household_balance RPC):
+        For each expense, in integer cents:
             The payer (paid_by) gets full credit for the amount.
+            The amount is split among the distinct ids in shared_with; the
+            cents that don't divide evenly go to the payer first, then to
+            the lowest user ids.
         net[user] = credit[user] - owed[user]
             positive  → others owe this person
             negative  → this person owes others
@@ -226,30 +681,336 @@ def get_monthly_balance(household_id: int, year: int, month: int) -> Dict[int, f
     Returns:
         { user_id: net_amount }
     """
-    expenses = get_monthly_expenses(household_id, year, month)
-    credit: Dict[int, float] = {}
-    owed: Dict[int, float] = {}
+    return MonthlySnapshot.from_rows(0, 0, 0, expenses).balances()
 
-    for exp in expenses:
-        amount = float(exp["amount"])
-        paid_by = exp["paid_by"]
-        shared = exp["shared_with"]
-        share = amount / len(shared) if shared else amount
 
-        credit[paid_by] = credit.get(paid_by, 0.0) + amount
-        for uid in shared:
-            owed[uid] = owed.get(uid, 0.0) + share
+def summary_from_rows(expenses: List[Dict]) -> Dict[str, float]:
+    """Return { category: total_amount } from raw expense rows.
 
-    # Merge into net
-    all_users = set(credit.keys()) | set(owed.keys())
-    return {uid: round(credit.get(uid, 0.0) - owed.get(uid, 0.0), 2) for uid in all_users}
+    Totalled in integer cents by MonthlySnapshot, like the ledger and the
+    household_category_totals RPC.
+    """
+    return MonthlySnapshot.from_rows(0, 0, 0, expenses).by_category()
 
 
-def get_monthly_summary(household_id: int, year: int, month: int) -> Dict[str, float]:
+async def get_monthly_balance(household_id: int, year: int, month: int) -> Dict[int, float]:
+    """Return { user_id: net_amount } for the month (see balance_from_rows)."""
+    snap = await _ledger_snapshot(household_id, year, month)
+    if snap is not None:
+        return snap.balances()
+    rows = await _aggregate_rpc("household_balance", household_id, year, month)
+    if rows is None:
+        start, end = _month_bounds(year, month)
+        return balance_from_rows([r async for r in iter_expenses(household_id, start, end, AGGREGATE_COLUMNS)])
+    return {r["user_id"]: round(float(r["net"]), 2) for r in rows}
+
+
+async def get_monthly_summary(household_id: int, year: int, month: int) -> Dict[str, float]:
     """Return { category: total_amount } for the month."""
-    expenses = get_monthly_expenses(household_id, year, month)
-    summary: Dict[str, float] = {}
-    for exp in expenses:
-        cat = exp["category"]
-        summary[cat] = round(summary.get(cat, 0.0) + float(exp["amount"]), 2)
-    return summary
+    snap = await _ledger_snapshot(household_id, year, month)
+    if snap is not None:
+        return snap.by_category()
+    rows = await _aggregate_rpc("household_category_totals", household_id, year, month)
+    if rows is None:
+        start, end = _month_bounds(year, month)
+        return summary_from_rows([r async for r in iter_expenses(household_id, start, end, AGGREGATE_COLUMNS)])
+    return {r["category"]: round(float(r["total"]), 2) for r in rows}
+
+
+# ---------------------------------------------------------------------------
+# Monthly snapshot
+# Read from the ledger when available; otherwise one streamed pass over the
+# month's rows (only the columns the aggregates need) builds every total.
+# Cached per (household, year, month) and tagged with the household's
+# version, which every expense write through this module bumps
+# (_after_expense_write), so /balance and /resumen reuse the snapshot until
+# the household changes. SNAPSHOT_TTL bounds how long writes made elsewhere
+# (the web app) can go unseen. Concurrent misses for the same month share one
+# fetch.
+# ---------------------------------------------------------------------------
+_snapshot_cache = VersionedCache(
+    maxsize=int(os.getenv("SNAPSHOT_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("SNAPSHOT_TTL", "60")),
+    single_flight=os.getenv("SNAPSHOT_SINGLE_FLIGHT", "1") != "0",
+)
+
+
+async def get_monthly_snapshot(household_id: int, year: int, month: int) -> MonthlySnapshot:
+    """Return the MonthlySnapshot for a household and month (cached until it changes)."""
+    async def build() -> MonthlySnapshot:
+        start, end = _month_bounds(year, month)
+        rows = _replica_rows(household_id, start, end)
+        snap = await _ledger_snapshot(household_id, year, month) if rows is None else None
+        if snap is None:
+            snap = MonthlySnapshot(household_id, year, month)
+            if rows is not None:
+                for exp in rows:
+                    snap.add(exp)
+            else:
+                async for exp in iter_expenses(household_id, start, end, AGGREGATE_COLUMNS):
+                    snap.add(exp)
+        return snap
+
+    return await _snapshot_cache.get_or_compute((household_id, year, month), household_id, build)
+
+
+def get_snapshot_cache_stats() -> Dict[str, float]:
+    """Hits, misses (stale = outdated by a write, coalesced = shared fetch) and hit rate."""
+    return _snapshot_cache.stats()
+
+
+# ---------------------------------------------------------------------------
+# Totals over several months
+# One range read whatever the number of months: the ledger's (month,
+# category) or (month, user) rows when available, otherwise the range's
+# expenses in one ExpenseBatch (utils/columnar.py), pivoted by month with
+# bincount kernels instead of a per-row dict loop.
+# ---------------------------------------------------------------------------
+async def get_category_totals_by_month(household_id: int, start: str, end: str) -> Dict[Tuple[str, str], int]:
+    """{ (first day of month, category): cents } for start <= month < end.
+
+    start and end must be first days of months (see _month_bounds).
+    """
+    rows = _replica_rows(household_id, start, end)
+    if rows is not None:
+        return ExpenseBatch.from_rows(rows, splits=False).category_totals_by_month()
+
+    if _ledger_enabled:
+        try:
+            resp = await _execute(
+                get_client()
+                .table("expense_ledger_categories")
+                .select("month,category,total_cents")
+                .eq("household_id", household_id)
+                .gte("month", start)
+                .lt("month", end)
+            )
+        except APIError as e:
+            _ledger_failed(e)
+        else:
+            return {(str(r["month"])[:10], r["category"]): int(r["total_cents"])
+                    for r in resp.data if r["total_cents"]}
+
+    rows = [exp async for exp in iter_expenses(household_id, start, end, ("amount", "category"))]
+    return ExpenseBatch.from_rows(rows, splits=False).category_totals_by_month()
+
+
+async def get_member_totals_by_month(
+    household_id: int, start: str, end: str
+) -> Dict[Tuple[str, int], Tuple[int, int]]:
+    """{ (first day of month, user_id): (paid cents, owed cents) } for start <= month < end.
+
+    start and end must be first days of months (see _month_bounds). Pairs
+    left at zero are omitted.
+    """
+    rows = _replica_rows(household_id, start, end)
+    if rows is not None:
+        return ExpenseBatch.from_rows(rows).member_totals_by_month()
+
+    if _ledger_enabled:
+        try:
+            resp = await _execute(
+                get_client()
+                .table("expense_ledger")
+                .select("month,user_id,paid_cents,owed_cents")
+                .eq("household_id", household_id)
+                .gte("month", start)
+                .lt("month", end)
+            )
+        except APIError as e:
+            _ledger_failed(e)
+        else:
+            return {(str(r["month"])[:10], r["user_id"]): (int(r["paid_cents"]), int(r["owed_cents"]))
+                    for r in resp.data if r["paid_cents"] or r["owed_cents"]}
+
+    rows = [exp async for exp in iter_expenses(household_id, start, end, AGGREGATE_COLUMNS)]
+    return ExpenseBatch.from_rows(rows).member_totals_by_month()
+
+
+# ---------------------------------------------------------------------------
+# Read replica (utils/replica.py, optional)
+# When one is installed, household, member and expense reads are answered
+# from its SQLite file as long as the household was synced within the
+# replica's staleness bound; otherwise they go to Supabase as usual. The
+# queries below are the replica's own, so they never read from it.
+# ---------------------------------------------------------------------------
+_replica: Optional[Any] = None
+
+
+def set_read_replica(replica: Optional[Any]) -> None:
+    """Serve reads from replica (a utils.replica.ReadReplica) when it is fresh enough."""
+    global _replica
+    _replica = replica
+
+
+def _replica_rows(household_id: int, start: str, end: str, descending: bool = False) -> Optional[List[Dict]]:
+    """The range's expenses from the read replica, or None when it can't serve them."""
+    if _replica is None or not _replica.covers(household_id, start):
+        return None
+    return _replica.expenses(household_id, start, end, descending)
+
+
+def _after(query, column: str, id_column: str, after: Optional[Tuple[str, int]]):
+    """Keyset filter: rows after the cursor in (column, id_column) order.
+
+    Timestamps are quoted because they contain the separators of
+    PostgREST's logic trees.
+    """
+    if after is None:
+        return query
+    t, i = after
+    return query.or_(f'{column}.gt."{t}",and({column}.eq."{t}",{id_column}.gt.{i})')
+
+
+async def get_latest_expense_cursor() -> Optional[Tuple[str, int]]:
+    """(updated_at, id) of the expense inserted or edited last, in any household, or None."""
+    resp = await _execute(
+        get_client()
+        .table("expenses")
+        .select("id,updated_at")
+        .order("updated_at", desc=True)
+        .order("id", desc=True)
+        .limit(1)
+    )
+    return (resp.data[0]["updated_at"], resp.data[0]["id"]) if resp.data else None
+
+
+async def get_latest_deletion_cursor() -> Optional[Tuple[str, int]]:
+    """(deleted_at, expense_id) of the newest expense_deletions row, or None."""
+    resp = await _execute(
+        get_client()
+        .table("expense_deletions")
+        .select("expense_id,deleted_at")
+        .order("deleted_at", desc=True)
+        .order("expense_id", desc=True)
+        .limit(1)
+    )
+    return (resp.data[0]["deleted_at"], resp.data[0]["expense_id"]) if resp.data else None
+
+
+async def get_expenses_created_after(
+    household_ids: Sequence[int],
+    after: Optional[Tuple[str, int]],
+    limit: int,
+    min_expense_date: Optional[str] = None,
+) -> List[Dict]:
+    """One page of the households' expenses in (created_at, id) order, after the cursor.
+
+    Uses migration 014's index.
+    """
+    query = get_client().table("expenses").select("*").in_("household_id", list(household_ids))
+    if min_expense_date:
+        query = query.gte("expense_date", min_expense_date)
+    query = _after(query, "created_at", "id", after)
+    resp = await _execute(query.order("created_at").order("id").limit(limit))
+    return resp.data
+
+
+async def get_expenses_changed_after(
+    household_ids: Sequence[int], after: Optional[Tuple[str, int]], limit: int
+) -> List[Dict]:
+    """One page of the households' expenses inserted or edited after the cursor, in (updated_at, id) order.
+
+    updated_at is kept by migration 017's trigger and served by its index.
+    """
+    query = get_client().table("expenses").select("*").in_("household_id", list(household_ids))
+    query = _after(query, "updated_at", "id", after)
+    resp = await _execute(query.order("updated_at").order("id").limit(limit))
+    return resp.data
+
+
+async def get_expense_deletions_after(
+    household_ids: Sequence[int], after: Optional[Tuple[str, int]], limit: int
+) -> List[Dict]:
+    """One page of the households' expense_deletions rows (migration 017) after the cursor."""
+    query = get_client().table("expense_deletions").select("*").in_("household_id", list(household_ids))
+    query = _after(query, "deleted_at", "expense_id", after)
+    resp = await _execute(query.order("deleted_at").order("expense_id").limit(limit))
+    return resp.data
+
+
+async def get_members_of_households(household_ids: Sequence[int]) -> List[Dict]:
+    """Active household_members rows of the households, each embedding its users row."""
+    resp = await _execute(
+        get_client()
+        .table("household_members")
+        .select("household_id,user_id,users(*)")
+        .in_("household_id", list(household_ids))
+        .eq("is_active", True)
+    )
+    return resp.data
+
+
+async def get_households_by_ids(household_ids: Sequence[int]) -> List[Dict]:
+    """Return the households rows with the given ids in one query."""
+    resp = await _execute(get_client().table("households").select("*").in_("id", list(household_ids)))
+    return resp.data
+
+
+# ---------------------------------------------------------------------------
+# Recurring expenses (migrations 013, 016)
+# ---------------------------------------------------------------------------
+async def get_due_recurring_expenses(until: str) -> List[Dict]:
+    """Active recurring expenses of every household with next_due_date <= until.
+
+    One range scan of idx_recurring_expenses_due; each row embeds the payer's
+    telegram_id and name as "payer". Oldest due first.
+    """
+    resp = await _execute(
+        get_client()
+        .table("recurring_expenses")
+        .select("*, payer:users(telegram_id,name)")
+        .eq("is_active", True)
+        .lte("next_due_date", until)
+        .order("next_due_date")
+        .order("id")
+    )
+    return resp.data
+
+
+async def advance_recurring_expenses(next_due: Dict[int, str], anchor_days: Optional[Dict[int, int]] = None) -> int:
+    """Move next_due_date forward for many rows in one call ({id: ISO date}).
+
+    anchor_days ({id: day of month}) is stored on rows that have no
+    anchor_day yet (migration 016).
+    """
+    if not next_due:
+        return 0
+    anchor_days = anchor_days or {}
+    resp = await _execute(get_client().rpc("recurring_advance", {
+        "p_items": [{"id": rid, "next_due_date": due, "anchor_day": anchor_days.get(rid)}
+                    for rid, due in next_due.items()],
+    }))
+    return resp.data or 0
+
+
+# ---------------------------------------------------------------------------
+# Automation rules
+# ---------------------------------------------------------------------------
+async def get_automation_rules(household_id: int) -> List[Dict]:
+    """Active category-triggered automation_rules of a household, oldest first."""
+    resp = await _execute(
+        get_client()
+        .table("automation_rules")
+        .select("id,name,trigger_category,auto_shared_with,auto_action")
+        .eq("household_id", household_id)
+        .eq("is_active", True)
+        .eq("trigger_type", "category")
+        .order("id")
+    )
+    return resp.data
+
+
+# ---------------------------------------------------------------------------
+# Custom subcategories (migration 006)
+# ---------------------------------------------------------------------------
+async def get_custom_subcategories(household_id: int) -> List[Dict]:
+    """Return the household's custom_subcategories rows (macro_category, name)."""
+    resp = await _execute(
+        get_client()
+        .table("custom_subcategories")
+        .select("id,macro_category,name")
+        .eq("household_id", household_id)
+        .order("id")
+    )
+    return resp.data
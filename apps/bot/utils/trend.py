@@ -0,0 +1,102 @@
+"""
+Multi-month spending trend for /tendencia.
+
+build_trend() turns the { (month, category): cents } map that
+supabase_client.get_category_totals_by_month() returns (one range read) into
+one MonthTotals per month, empty months included, in a single pass.
+format_trend() renders each month's total, its change against the previous
+month and how much of households.monthly_budget it used, followed by the
+categories with the most spending over the range.
+"""
+
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_MONTHS = 6
+MAX_MONTHS = 24
+MAX_CATEGORIES = 8
+
+
+@dataclass
+class MonthTotals:
+    """Spending of one calendar month, in cents."""
+
+    year: int
+    month: int
+    total_cents: int = 0
+    category_cents: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def label(self) -> str:
+        return f"{self.year}-{self.month:02d}"
+
+
+def last_months(today: date, months: int) -> List[Tuple[int, int]]:
+    """(year, month) of the `months` months ending with today's, oldest first."""
+    index = today.year * 12 + today.month - 1
+    return [(i // 12, i % 12 + 1) for i in range(index - months + 1, index + 1)]
+
+
+def range_bounds(months: List[Tuple[int, int]]) -> Tuple[str, str]:
+    """Half-open [start, end) ISO dates covering the months."""
+    (first_year, first_month), (last_year, last_month) = months[0], months[-1]
+    end_year, end_month = (last_year + 1, 1) if last_month == 12 else (last_year, last_month + 1)
+    return f"{first_year}-{first_month:02d}-01", f"{end_year}-{end_month:02d}-01"
+
+
+def build_trend(totals: Dict[Tuple[str, str], int], months: List[Tuple[int, int]]) -> List[MonthTotals]:
+    """One MonthTotals per (year, month) in months, filled from totals."""
+    trend = [MonthTotals(year, month) for year, month in months]
+    by_start = {f"{m.label}-01": m for m in trend}
+    for (month_start, category), cents in totals.items():
+        bucket = by_start.get(month_start)
+        if bucket is None:
+            continue
+        bucket.total_cents += cents
+        bucket.category_cents[category] = bucket.category_cents.get(category, 0) + cents
+    return trend
+
+
+def _change(now: int, before: int) -> str:
+    if not before:
+        return "—"
+    return f"{(now - before) / before * 100:+.0f}%"
+
+
+def format_trend(trend: List[MonthTotals], monthly_budget: Optional[float] = None) -> str:
+    """Month-by-month totals, changes and budget use, then the top categories."""
+    budget_cents = int(round(float(monthly_budget) * 100)) if monthly_budget else 0
+    lines = [f"Tendencia de los últimos {len(trend)} meses"]
+    if budget_cents:
+        lines.append(f"Presupuesto mensual: S/ {budget_cents / 100:.2f}")
+    lines.append("")
+
+    previous = None
+    for m in trend:
+        line = f"  {m.label}  S/ {m.total_cents / 100:>9.2f}"
+        line += f"  {_change(m.total_cents, previous.total_cents) if previous else '—':>5}"
+        if budget_cents:
+            used = m.total_cents / budget_cents * 100
+            line += f"  {used:>4.0f}% del presupuesto" + (" (excedido)" if used > 100 else "")
+        lines.append(line)
+        previous = m
+
+    range_cents = sum(m.total_cents for m in trend)
+    lines.append("")
+    lines.append(f"Total: S/ {range_cents / 100:.2f} — promedio S/ {range_cents / len(trend) / 100:.2f} por mes")
+
+    by_category: Dict[str, int] = {}
+    for m in trend:
+        for category, cents in m.category_cents.items():
+            by_category[category] = by_category.get(category, 0) + cents
+    if by_category:
+        last, before = trend[-1], trend[-2] if len(trend) > 1 else None
+        lines.append("")
+        lines.append("Por categoría (promedio mensual; último mes y cambio):")
+        for category, cents in sorted(by_category.items(), key=lambda x: -x[1])[:MAX_CATEGORIES]:
+            now = last.category_cents.get(category, 0)
+            change = _change(now, before.category_cents.get(category, 0)) if before else "—"
+            lines.append(f"  {category}: S/ {cents / len(trend) / 100:.2f}; "
+                         f"último S/ {now / 100:.2f} ({change})")
+    return "\n".join(lines)
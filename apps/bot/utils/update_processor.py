@@ -0,0 +1,65 @@
+"""
+Concurrent update processing that keeps each chat's updates in order.
+
+python-telegram-bot processes updates one at a time by default, so one slow
+/resumen delays every other chat. With concurrency enabled, though, two
+updates from the same chat could run at the same time and break the /gasto
+ConversationHandler (e.g. a "Confirmar" tap racing its own /gasto).
+
+ChatOrderedUpdateProcessor runs updates from different chats concurrently
+(at most `max_running` handlers at once) while updates from the same chat
+run strictly one after another, in arrival order.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Per-chat FIFO, cross-chat concurrency, bounded number of running handlers."""
+
+    def __init__(self, max_running: int, max_pending: Optional[int] = None):
+        # The base class semaphore bounds updates in flight, including those
+        # waiting behind an earlier update of the same chat; max_running
+        # bounds the handlers actually executing.
+        super().__init__(max_pending or max_running * 4)
+        self.max_running = max_running
+        self._running = asyncio.BoundedSemaphore(max_running)
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._chat_waiters: Dict[int, int] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        chat_id = _chat_id(update)
+        if chat_id is None:
+            async with self._running:
+                await coroutine
+            return
+
+        # asyncio.Lock wakes waiters in FIFO order and the Application starts
+        # one task per update in arrival order, so a chat's updates run in order.
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        self._chat_waiters[chat_id] = self._chat_waiters.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                async with self._running:
+                    await coroutine
+        finally:
+            self._chat_waiters[chat_id] -= 1
+            if not self._chat_waiters[chat_id]:
+                del self._chat_waiters[chat_id]
+                del self._chat_locks[chat_id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+def _chat_id(update: object) -> Optional[int]:
+    if isinstance(update, Update) and update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
@@ -0,0 +1,188 @@
+"""
+Write-behind queue for expense inserts.
+
+Confirming an expense used to wait on its INSERT, and a double tap or a
+Telegram redelivery could insert it twice. Handlers now enqueue the row
+(an in-memory operation) and answer right away; a background task writes
+queued rows in bulk:
+
+  - Each row carries an idempotency_key derived from the conversation that
+    created it. The queue ignores a key it already holds, and the database
+    (migration 012) ignores a key it already stored, so retries are safe.
+  - Rows are flushed when WRITE_BATCH_SIZE are waiting or WRITE_FLUSH_MS after
+    the first one arrived, whichever comes first.
+  - Transient failures (network, timeouts, Postgres overload) are retried with
+    exponential backoff up to WRITE_MAX_ATTEMPTS; after that the user who
+    created the expense is told it was not saved.
+  - A batch rejected for any other reason (a constraint, a stale user id) is
+    written again one row at a time, so only the rows that fail on their own
+    are dropped and reported.
+  - close() stops accepting rows and drains everything still queued.
+"""
+
+import os
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+import httpx
+from postgrest.exceptions import APIError
+
+from utils.supabase_client import insert_expenses
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "50"))
+FLUSH_MS = float(os.getenv("WRITE_FLUSH_MS", "50"))
+MAX_ATTEMPTS = int(os.getenv("WRITE_MAX_ATTEMPTS", "5"))
+BACKOFF_BASE_S = 0.5
+
+# Postgres error classes worth retrying: connection, resources, operator
+# intervention (e.g. shutdown), serialization failures and deadlocks.
+_TRANSIENT_SQLSTATE_PREFIXES = ("08", "53", "57", "40001", "40P01")
+
+# (payload, chat_id to notify on permanent failure)
+_Item = Tuple[Dict, Optional[int]]
+
+
+def _is_transient(exc: Exception) -> bool:
+    if isinstance(exc, httpx.HTTPError):
+        return True
+    if isinstance(exc, APIError):
+        code = exc.code or ""
+        return not code or code.startswith(_TRANSIENT_SQLSTATE_PREFIXES)
+    return False
+
+
+class ExpenseWriteQueue:
+    """Deduplicating, batching, retrying queue in front of insert_expenses()."""
+
+    def __init__(self):
+        self._queue: "asyncio.Queue[_Item]" = asyncio.Queue()
+        self._keys: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._bot = None
+        self._closed = False
+        self.written = 0
+        self.duplicates = 0
+        self.failed = 0
+
+    def start(self, bot=None) -> None:
+        """Start the background writer. bot is used to report failed writes."""
+        self._bot = bot
+        self._task = asyncio.create_task(self._run(), name="expense-write-queue")
+
+    def enqueue(self, payload: Dict, chat_id: Optional[int] = None) -> bool:
+        """Queue one expenses row. Returns False if its key is already queued."""
+        if self._closed:
+            raise RuntimeError("Expense write queue is closed")
+        key = payload.get("idempotency_key")
+        if key:
+            if key in self._keys:
+                self.duplicates += 1
+                return False
+            self._keys.add(key)
+        self._queue.put_nowait((payload, chat_id))
+        return True
+
+    async def close(self) -> None:
+        """Stop accepting rows, write everything still queued, stop the task."""
+        self._closed = True
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+        }
+
+    # ------------------------------------------------------------------
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch: List[_Item] = [await self._queue.get()]
+            deadline = loop.time() + FLUSH_MS / 1000
+            while len(batch) < BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._write(batch)
+            finally:
+                for payload, _ in batch:
+                    self._keys.discard(payload.get("idempotency_key"))
+                    self._queue.task_done()
+
+    async def _write(self, batch: List[_Item]) -> None:
+        error = await self._insert(batch)
+        if error is None:
+            return
+        failed = batch
+        if len(batch) > 1 and not _is_transient(error):
+            logger.warning(f"Expense batch of {len(batch)} rejected ({error!r}); writing rows one by one")
+            failed = []
+            for item in batch:
+                row_error = await self._insert([item])
+                if row_error is not None:
+                    failed.append(item)
+                    error = row_error
+        if failed:
+            logger.error(f"Dropping {len(failed)} of {len(batch)} expenses: {error!r}")
+            self.failed += len(failed)
+            await self._report_failure(failed)
+
+    async def _insert(self, batch: List[_Item]) -> Optional[Exception]:
+        """Insert batch, retrying transient errors. Returns the error that stopped it, or None."""
+        payloads = [payload for payload, _ in batch]
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                inserted = await insert_expenses(payloads)
+                self.written += len(inserted)
+                self.duplicates += len(payloads) - len(inserted)
+                return None
+            except Exception as e:
+                if not _is_transient(e) or attempt == MAX_ATTEMPTS:
+                    return e
+                delay = BACKOFF_BASE_S * 2 ** (attempt - 1)
+                logger.warning(f"Expense batch failed ({e!r}); retry {attempt} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _report_failure(self, batch: List[_Item]) -> None:
+        if self._bot is None:
+            return
+        for payload, chat_id in batch:
+            if chat_id is None:
+                continue
+            try:
+                await self._bot.send_message(
+                    chat_id,
+                    f"No pude guardar el gasto de S/ {float(payload['amount']):.2f} "
+                    f"en {payload['category']}. Vuelve a registrarlo con /gasto.",
+                )
+            except Exception as e:
+                logger.error(f"Could not report failed expense to chat {chat_id}: {e!r}")
+
+
+_queue: Optional[ExpenseWriteQueue] = None
+
+
+def get_write_queue() -> ExpenseWriteQueue:
+    """Return the process-wide queue (started in main._post_init)."""
+    global _queue
+    if _queue is None:
+        _queue = ExpenseWriteQueue()
+    return _queue
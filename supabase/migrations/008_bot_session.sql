@@ -0,0 +1,32 @@
+-- Migration 008: Single round-trip session lookup for the Telegram bot
+--
+-- Every bot command needs the caller's users row, their active household and
+-- (for /gasto and /balance) that household's active members. Fetching these
+-- one table at a time costs up to five sequential PostgREST requests; this
+-- function returns all three in one call:
+--
+--   { "user": {...}, "household": {...} | null, "members": [{...}, ...] }
+--
+-- Returns NULL when no user has the given telegram_id.
+-- SECURITY INVOKER (default): RLS still applies to non-service callers.
+
+CREATE OR REPLACE FUNCTION bot_session(p_telegram_id BIGINT)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT jsonb_build_object(
+    'user',      to_jsonb(u),
+    'household', CASE WHEN h.id IS NULL THEN NULL ELSE to_jsonb(h) END,
+    'members',   COALESCE((
+      SELECT jsonb_agg(to_jsonb(mu) ORDER BY mu.id)
+      FROM household_members hm
+      JOIN users mu ON mu.id = hm.user_id
+      WHERE hm.household_id = h.id
+        AND hm.is_active = TRUE
+    ), '[]'::jsonb)
+  )
+  FROM users u
+  LEFT JOIN households h ON h.id = u.active_household_id
+  WHERE u.telegram_id = p_telegram_id
+$$;
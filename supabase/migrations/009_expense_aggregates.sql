@@ -0,0 +1,71 @@
+-- Migration 009: Server-side expense aggregation for the Telegram bot
+--
+-- /balance and /resumen used to download every expense row of the month and
+-- aggregate in Python. These functions do the same work next to the data and
+-- return one row per user / per category instead.
+--
+-- Date ranges are half-open: p_start <= expense_date < p_end.
+
+-- -------------------------------------------------------------------------
+-- household_balance: per-user credit, owed share and net for a date range
+--   credit = sum of amounts the user paid
+--   owed   = sum over expenses of amount / cardinality(shared_with),
+--            for every expense whose shared_with contains the user
+--   net    = credit - owed, rounded to cents
+--            (positive → others owe this person)
+-- -------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION household_balance(
+  p_household_id BIGINT,
+  p_start        DATE,
+  p_end          DATE
+)
+RETURNS TABLE (user_id BIGINT, credit NUMERIC, owed NUMERIC, net NUMERIC)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH scoped AS (
+    SELECT e.paid_by, e.amount, e.shared_with
+    FROM expenses e
+    WHERE e.household_id = p_household_id
+      AND e.expense_date >= p_start
+      AND e.expense_date <  p_end
+  ),
+  credits AS (
+    SELECT s.paid_by AS uid, SUM(s.amount) AS credit
+    FROM scoped s
+    GROUP BY s.paid_by
+  ),
+  debts AS (
+    SELECT sw.uid, SUM(s.amount / cardinality(s.shared_with)) AS owed
+    FROM scoped s
+    CROSS JOIN LATERAL unnest(s.shared_with) AS sw(uid)
+    GROUP BY sw.uid
+  )
+  SELECT
+    COALESCE(c.uid, d.uid),
+    COALESCE(c.credit, 0),
+    ROUND(COALESCE(d.owed, 0), 2),
+    ROUND(COALESCE(c.credit, 0) - COALESCE(d.owed, 0), 2)
+  FROM credits c
+  FULL OUTER JOIN debts d ON d.uid = c.uid
+$$;
+
+-- -------------------------------------------------------------------------
+-- household_category_totals: total spent per category for a date range
+-- -------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION household_category_totals(
+  p_household_id BIGINT,
+  p_start        DATE,
+  p_end          DATE
+)
+RETURNS TABLE (category TEXT, total NUMERIC)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT e.category, SUM(e.amount)
+  FROM expenses e
+  WHERE e.household_id = p_household_id
+    AND e.expense_date >= p_start
+    AND e.expense_date <  p_end
+  GROUP BY e.category
+$$;
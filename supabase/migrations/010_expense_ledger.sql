@@ -0,0 +1,231 @@
+-- Migration 010: Per-month expense ledger maintained by triggers
+--
+-- /balance and /resumen only need monthly totals, yet they used to scan every
+-- expense of the month. These tables hold those totals and are kept current
+-- by triggers on expenses, so reading a month costs a handful of rows no
+-- matter how active the household is.
+--
+--   expense_ledger             one row per (household, month, user):
+--                              cents paid and cents owed (their shares)
+--   expense_ledger_categories  one row per (household, month, category):
+--                              cents spent and number of expenses
+--
+-- Amounts are integer cents. An expense split among N people gives each
+-- amount_cents / N, and the leftover cents go one each to the payer first and
+-- then to the lowest user ids (same rule as the bot's MonthlySnapshot), so
+-- shares always add up to the amount.
+--
+-- Maintenance:
+--   SELECT ledger_rebuild();          -- recompute everything (or pass a household id)
+--   SELECT * FROM ledger_check();     -- rows where ledger ≠ full recomputation
+
+-- -------------------------------------------------------------------------
+-- TABLES
+-- -------------------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS expense_ledger (
+  household_id BIGINT NOT NULL REFERENCES households(id) ON DELETE CASCADE,
+  month        DATE   NOT NULL,                     -- first day of the month
+  user_id      BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  paid_cents   BIGINT NOT NULL DEFAULT 0,
+  owed_cents   BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (household_id, month, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS expense_ledger_categories (
+  household_id  BIGINT  NOT NULL REFERENCES households(id) ON DELETE CASCADE,
+  month         DATE    NOT NULL,
+  category      TEXT    NOT NULL,
+  total_cents   BIGINT  NOT NULL DEFAULT 0,
+  expense_count INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (household_id, month, category)
+);
+
+-- Bot-only tables (service_role bypasses RLS); keep them closed to clients.
+ALTER TABLE expense_ledger ENABLE ROW LEVEL SECURITY;
+ALTER TABLE expense_ledger_categories ENABLE ROW LEVEL SECURITY;
+
+-- -------------------------------------------------------------------------
+-- EXPECTED VALUES (full recomputation from expenses)
+-- -------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION ledger_expected(p_household_id BIGINT DEFAULT NULL)
+RETURNS TABLE (household_id BIGINT, month DATE, user_id BIGINT, paid_cents BIGINT, owed_cents BIGINT)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH scoped AS (
+    SELECT e.household_id,
+           date_trunc('month', e.expense_date)::date AS month,
+           e.paid_by,
+           ROUND(e.amount * 100)::bigint AS cents,
+           ARRAY(SELECT DISTINCT unnest(e.shared_with)) AS shared
+    FROM expenses e
+    WHERE p_household_id IS NULL OR e.household_id = p_household_id
+  ),
+  paid AS (
+    SELECT s.household_id, s.month, s.paid_by AS uid, s.cents AS paid, 0::bigint AS owed
+    FROM scoped s
+  ),
+  owed AS (
+    SELECT s.household_id, s.month, sw.uid, 0::bigint AS paid,
+           s.cents / cardinality(s.shared)
+             + CASE WHEN sw.rn <= s.cents % cardinality(s.shared) THEN 1 ELSE 0 END AS owed
+    FROM scoped s
+    CROSS JOIN LATERAL (
+      SELECT u.uid, row_number() OVER (ORDER BY u.uid <> s.paid_by, u.uid) AS rn
+      FROM unnest(s.shared) AS u(uid)
+    ) sw
+  )
+  SELECT x.household_id, x.month, x.uid, SUM(x.paid)::bigint, SUM(x.owed)::bigint
+  FROM (SELECT * FROM paid UNION ALL SELECT * FROM owed) x
+  GROUP BY x.household_id, x.month, x.uid
+$$;
+
+CREATE OR REPLACE FUNCTION ledger_expected_categories(p_household_id BIGINT DEFAULT NULL)
+RETURNS TABLE (household_id BIGINT, month DATE, category TEXT, total_cents BIGINT, expense_count INTEGER)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT e.household_id,
+         date_trunc('month', e.expense_date)::date,
+         e.category,
+         SUM(ROUND(e.amount * 100))::bigint,
+         COUNT(*)::integer
+  FROM expenses e
+  WHERE p_household_id IS NULL OR e.household_id = p_household_id
+  GROUP BY 1, 2, 3
+$$;
+
+-- -------------------------------------------------------------------------
+-- INCREMENTAL MAINTENANCE
+-- ledger_apply_expense adds (p_sign = 1) or removes (p_sign = -1) one row.
+-- -------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION ledger_apply_expense(e expenses, p_sign INTEGER)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_month  DATE     := date_trunc('month', e.expense_date)::date;
+  v_cents  BIGINT   := ROUND(e.amount * 100)::bigint;
+  v_shared BIGINT[] := ARRAY(SELECT DISTINCT unnest(e.shared_with));
+  v_n      INTEGER  := cardinality(v_shared);
+BEGIN
+  INSERT INTO expense_ledger AS l (household_id, month, user_id, paid_cents)
+  VALUES (e.household_id, v_month, e.paid_by, p_sign * v_cents)
+  ON CONFLICT (household_id, month, user_id)
+  DO UPDATE SET paid_cents = l.paid_cents + EXCLUDED.paid_cents;
+
+  IF v_n > 0 THEN
+    INSERT INTO expense_ledger AS l (household_id, month, user_id, owed_cents)
+    SELECT e.household_id, v_month, sw.uid,
+           p_sign * (v_cents / v_n + CASE WHEN sw.rn <= v_cents % v_n THEN 1 ELSE 0 END)
+    FROM (
+      SELECT u.uid, row_number() OVER (ORDER BY u.uid <> e.paid_by, u.uid) AS rn
+      FROM unnest(v_shared) AS u(uid)
+    ) sw
+    ON CONFLICT (household_id, month, user_id)
+    DO UPDATE SET owed_cents = l.owed_cents + EXCLUDED.owed_cents;
+  END IF;
+
+  INSERT INTO expense_ledger_categories AS c (household_id, month, category, total_cents, expense_count)
+  VALUES (e.household_id, v_month, e.category, p_sign * v_cents, p_sign)
+  ON CONFLICT (household_id, month, category)
+  DO UPDATE SET total_cents   = c.total_cents + EXCLUDED.total_cents,
+                expense_count = c.expense_count + EXCLUDED.expense_count;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION ledger_expenses_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM ledger_apply_expense(OLD, -1);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM ledger_apply_expense(NEW, 1);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS expenses_ledger ON expenses;
+CREATE TRIGGER expenses_ledger
+  AFTER INSERT OR UPDATE OR DELETE ON expenses
+  FOR EACH ROW EXECUTE FUNCTION ledger_expenses_trigger();
+
+-- -------------------------------------------------------------------------
+-- REBUILD / BACKFILL
+-- Locks the ledger so concurrent expense writes wait for the rebuild; their
+-- triggers then apply on top of the recomputed totals.
+-- -------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION ledger_rebuild(p_household_id BIGINT DEFAULT NULL)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  LOCK TABLE expense_ledger, expense_ledger_categories IN EXCLUSIVE MODE;
+
+  DELETE FROM expense_ledger l
+  WHERE p_household_id IS NULL OR l.household_id = p_household_id;
+  DELETE FROM expense_ledger_categories c
+  WHERE p_household_id IS NULL OR c.household_id = p_household_id;
+
+  INSERT INTO expense_ledger (household_id, month, user_id, paid_cents, owed_cents)
+  SELECT * FROM ledger_expected(p_household_id);
+  INSERT INTO expense_ledger_categories (household_id, month, category, total_cents, expense_count)
+  SELECT * FROM ledger_expected_categories(p_household_id);
+END;
+$$;
+
+-- -------------------------------------------------------------------------
+-- CONSISTENCY CHECK
+-- Returns one row per value where the ledger disagrees with a full
+-- recomputation (missing rows count as 0). Empty result = consistent.
+-- -------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION ledger_check(p_household_id BIGINT DEFAULT NULL)
+RETURNS TABLE (household_id BIGINT, month DATE, field TEXT, key TEXT, ledger BIGINT, expected BIGINT)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH l AS (
+    SELECT * FROM expense_ledger x
+    WHERE p_household_id IS NULL OR x.household_id = p_household_id
+  ),
+  users_cmp AS (
+    SELECT COALESCE(l.household_id, x.household_id) AS household_id,
+           COALESCE(l.month, x.month)               AS month,
+           COALESCE(l.user_id, x.user_id)::text     AS key,
+           COALESCE(l.paid_cents, 0) AS l_paid, COALESCE(x.paid_cents, 0) AS x_paid,
+           COALESCE(l.owed_cents, 0) AS l_owed, COALESCE(x.owed_cents, 0) AS x_owed
+    FROM l
+    FULL OUTER JOIN ledger_expected(p_household_id) x
+      ON x.household_id = l.household_id AND x.month = l.month AND x.user_id = l.user_id
+  ),
+  c AS (
+    SELECT * FROM expense_ledger_categories y
+    WHERE p_household_id IS NULL OR y.household_id = p_household_id
+  ),
+  cats_cmp AS (
+    SELECT COALESCE(c.household_id, x.household_id) AS household_id,
+           COALESCE(c.month, x.month)               AS month,
+           COALESCE(c.category, x.category)         AS key,
+           COALESCE(c.total_cents, 0) AS l_total, COALESCE(x.total_cents, 0) AS x_total,
+           COALESCE(c.expense_count, 0)::bigint AS l_count, COALESCE(x.expense_count, 0)::bigint AS x_count
+    FROM c
+    FULL OUTER JOIN ledger_expected_categories(p_household_id) x
+      ON x.household_id = c.household_id AND x.month = c.month AND x.category = c.category
+  )
+  SELECT household_id, month, 'paid_cents', key, l_paid, x_paid FROM users_cmp WHERE l_paid <> x_paid
+  UNION ALL
+  SELECT household_id, month, 'owed_cents', key, l_owed, x_owed FROM users_cmp WHERE l_owed <> x_owed
+  UNION ALL
+  SELECT household_id, month, 'total_cents', key, l_total, x_total FROM cats_cmp WHERE l_total <> x_total
+  UNION ALL
+  SELECT household_id, month, 'expense_count', key, l_count, x_count FROM cats_cmp WHERE l_count <> x_count
+$$;
+
+-- -------------------------------------------------------------------------
+-- BACKFILL existing expenses
+-- -------------------------------------------------------------------------
+SELECT ledger_rebuild();
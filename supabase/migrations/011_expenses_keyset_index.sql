@@ -0,0 +1,9 @@
+-- Migration 011: Index for keyset pagination of expenses
+--
+-- The bot streams expense ranges page by page ordered by (expense_date, id)
+-- and resumes after the last row seen. With id in the index the resume
+-- condition and the ORDER BY are served from the index alone, in either
+-- direction, for every page.
+
+CREATE INDEX IF NOT EXISTS idx_expenses_household_date_id
+  ON expenses (household_id, expense_date, id);
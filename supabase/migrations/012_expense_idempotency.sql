@@ -0,0 +1,21 @@
+-- Migration 012: Idempotency key for expense inserts
+--
+-- The bot writes expenses through a retrying, batched queue. Each expense
+-- carries a key derived from the conversation that created it (e.g. the
+-- /gasto message), so a double tap, a Telegram redelivery or a retried batch
+-- can never insert the same expense twice: inserts use
+-- ON CONFLICT (idempotency_key) DO NOTHING.
+--
+-- NULL for rows created elsewhere (web app); UNIQUE allows many NULLs.
+
+ALTER TABLE expenses ADD COLUMN IF NOT EXISTS idempotency_key TEXT;
+
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_constraint WHERE conname = 'expenses_idempotency_key_key'
+  ) THEN
+    ALTER TABLE expenses
+      ADD CONSTRAINT expenses_idempotency_key_key UNIQUE (idempotency_key);
+  END IF;
+END $$;
@@ -0,0 +1,34 @@
+-- Migration 013: Due-date lookup and batched advance for recurring expenses
+--
+-- The bot's recurring-expense scheduler asks, every few minutes, for every
+-- active recurring expense due within the next few days (across all
+-- households). The partial index serves that range scan directly.
+--
+-- After registering or reminding, the scheduler moves each processed row's
+-- next_due_date forward. Rows move by different amounts, so a plain
+-- PATCH cannot do it in one request; recurring_advance does:
+--
+--   SELECT recurring_advance('[{"id": 1, "next_due_date": "2024-06-01"}, ...]');
+--
+-- Returns the number of rows updated. A row is only moved forward, never
+-- back, so applying the same batch twice is harmless.
+
+CREATE INDEX IF NOT EXISTS idx_recurring_expenses_due
+  ON recurring_expenses (next_due_date)
+  WHERE is_active = TRUE;
+
+CREATE OR REPLACE FUNCTION recurring_advance(p_items JSONB)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+  WITH updated AS (
+    UPDATE recurring_expenses r
+    SET next_due_date = i.next_due_date,
+        updated_at    = NOW()
+    FROM jsonb_to_recordset(p_items) AS i(id BIGINT, next_due_date DATE)
+    WHERE r.id = i.id
+      AND r.next_due_date < i.next_due_date
+    RETURNING 1
+  )
+  SELECT COUNT(*)::INTEGER FROM updated
+$$;
@@ -0,0 +1,9 @@
+-- Migration 014: Index for incremental sync of expenses by creation time
+--
+-- The bot's optional read replica (apps/bot/utils/replica.py) pulls new
+-- expenses in (created_at, id) order and resumes after the last row it has
+-- seen, and on first start asks for the newest expense overall. With id in
+-- the index both are served from it instead of sorting the table.
+
+CREATE INDEX IF NOT EXISTS idx_expenses_created_id
+  ON expenses (created_at, id);
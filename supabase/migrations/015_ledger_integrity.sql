@@ -0,0 +1,110 @@
+-- Migration 015: Ledger without foreign keys; household_balance in cents
+--
+-- expense_ledger.user_id referenced users(id), so an expense whose
+-- shared_with still held the id of a deleted user made its trigger (and the
+-- expense insert) fail, and deleting a user cascaded into the ledger while
+-- the expenses they paid stayed — the totals drifted from ledger_check().
+-- The ledger is derived data: it now has no foreign keys and no cascades.
+-- When a household is deleted, the trigger run by the cascade on its
+-- expenses clears that household's ledger rows instead of updating them.
+--
+-- household_balance (migration 009) split each expense as amount / N and
+-- counted repeated ids in shared_with twice. It now uses the ledger's rule:
+-- distinct ids, integer cents, leftover cents to the payer first and then to
+-- the lowest user ids, so the RPC, the ledger and the bot's fallback agree
+-- to the cent.
+
+-- -------------------------------------------------------------------------
+-- LEDGER: drop the foreign keys
+-- -------------------------------------------------------------------------
+ALTER TABLE expense_ledger DROP CONSTRAINT IF EXISTS expense_ledger_user_id_fkey;
+ALTER TABLE expense_ledger DROP CONSTRAINT IF EXISTS expense_ledger_household_id_fkey;
+ALTER TABLE expense_ledger_categories DROP CONSTRAINT IF EXISTS expense_ledger_categories_household_id_fkey;
+
+CREATE OR REPLACE FUNCTION ledger_apply_expense(e expenses, p_sign INTEGER)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_month  DATE     := date_trunc('month', e.expense_date)::date;
+  v_cents  BIGINT   := ROUND(e.amount * 100)::bigint;
+  v_shared BIGINT[] := ARRAY(SELECT DISTINCT unnest(e.shared_with));
+  v_n      INTEGER  := cardinality(v_shared);
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM households h WHERE h.id = e.household_id) THEN
+    DELETE FROM expense_ledger l WHERE l.household_id = e.household_id;
+    DELETE FROM expense_ledger_categories c WHERE c.household_id = e.household_id;
+    RETURN;
+  END IF;
+
+  INSERT INTO expense_ledger AS l (household_id, month, user_id, paid_cents)
+  VALUES (e.household_id, v_month, e.paid_by, p_sign * v_cents)
+  ON CONFLICT (household_id, month, user_id)
+  DO UPDATE SET paid_cents = l.paid_cents + EXCLUDED.paid_cents;
+
+  IF v_n > 0 THEN
+    INSERT INTO expense_ledger AS l (household_id, month, user_id, owed_cents)
+    SELECT e.household_id, v_month, sw.uid,
+           p_sign * (v_cents / v_n + CASE WHEN sw.rn <= v_cents % v_n THEN 1 ELSE 0 END)
+    FROM (
+      SELECT u.uid, row_number() OVER (ORDER BY u.uid <> e.paid_by, u.uid) AS rn
+      FROM unnest(v_shared) AS u(uid)
+    ) sw
+    ON CONFLICT (household_id, month, user_id)
+    DO UPDATE SET owed_cents = l.owed_cents + EXCLUDED.owed_cents;
+  END IF;
+
+  INSERT INTO expense_ledger_categories AS c (household_id, month, category, total_cents, expense_count)
+  VALUES (e.household_id, v_month, e.category, p_sign * v_cents, p_sign)
+  ON CONFLICT (household_id, month, category)
+  DO UPDATE SET total_cents   = c.total_cents + EXCLUDED.total_cents,
+                expense_count = c.expense_count + EXCLUDED.expense_count;
+END;
+$$;
+
+-- Rows of households deleted while the foreign keys were in place are gone
+-- already; rows left by users deleted since are rebuilt from the expenses.
+SELECT ledger_rebuild();
+
+-- -------------------------------------------------------------------------
+-- household_balance: same split as the ledger, amounts in soles
+-- -------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION household_balance(
+  p_household_id BIGINT,
+  p_start        DATE,
+  p_end          DATE
+)
+RETURNS TABLE (user_id BIGINT, credit NUMERIC, owed NUMERIC, net NUMERIC)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH scoped AS (
+    SELECT e.paid_by,
+           ROUND(e.amount * 100)::bigint AS cents,
+           ARRAY(SELECT DISTINCT unnest(e.shared_with)) AS shared
+    FROM expenses e
+    WHERE e.household_id = p_household_id
+      AND e.expense_date >= p_start
+      AND e.expense_date <  p_end
+  ),
+  paid AS (
+    SELECT s.paid_by AS uid, s.cents AS paid, 0::bigint AS owed
+    FROM scoped s
+  ),
+  owed AS (
+    SELECT sw.uid, 0::bigint AS paid,
+           s.cents / cardinality(s.shared)
+             + CASE WHEN sw.rn <= s.cents % cardinality(s.shared) THEN 1 ELSE 0 END AS owed
+    FROM scoped s
+    CROSS JOIN LATERAL (
+      SELECT u.uid, row_number() OVER (ORDER BY u.uid <> s.paid_by, u.uid) AS rn
+      FROM unnest(s.shared) AS u(uid)
+    ) sw
+  )
+  SELECT x.uid,
+         SUM(x.paid) / 100.0,
+         SUM(x.owed) / 100.0,
+         (SUM(x.paid) - SUM(x.owed)) / 100.0
+  FROM (SELECT * FROM paid UNION ALL SELECT * FROM owed) x
+  GROUP BY x.uid
+$$;
@@ -0,0 +1,40 @@
+-- Migration 016: Anchor day for monthly and yearly recurring expenses
+--
+-- next_due_date alone cannot say which day a schedule belongs on once it
+-- has been clamped: an item due on the 31st falls on 28 February, and
+-- advancing from there gave 28 March, 28 April, ... for good. Likewise a
+-- yearly item on 29 February stayed on the 28th after its first non-leap
+-- year. anchor_day keeps the day of the month the schedule was created
+-- with; the bot's scheduler computes every next date from it, clamped to
+-- the month's last day.
+--
+-- Existing rows are anchored on their current next_due_date. Rows that had
+-- already drifted keep the drifted day; fix them by setting anchor_day.
+--
+-- recurring_advance now also accepts "anchor_day" per item and stores it on
+-- rows that don't have one yet (e.g. inserted without it), so the first
+-- advance anchors a new row on its first due date.
+
+ALTER TABLE recurring_expenses
+  ADD COLUMN IF NOT EXISTS anchor_day SMALLINT CHECK (anchor_day BETWEEN 1 AND 31);
+
+UPDATE recurring_expenses
+SET anchor_day = EXTRACT(DAY FROM next_due_date)
+WHERE anchor_day IS NULL;
+
+CREATE OR REPLACE FUNCTION recurring_advance(p_items JSONB)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+  WITH updated AS (
+    UPDATE recurring_expenses r
+    SET next_due_date = i.next_due_date,
+        anchor_day    = COALESCE(r.anchor_day, i.anchor_day),
+        updated_at    = NOW()
+    FROM jsonb_to_recordset(p_items) AS i(id BIGINT, next_due_date DATE, anchor_day SMALLINT)
+    WHERE r.id = i.id
+      AND r.next_due_date < i.next_due_date
+    RETURNING 1
+  )
+  SELECT COUNT(*)::INTEGER FROM updated
+$$;
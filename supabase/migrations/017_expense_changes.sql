@@ -0,0 +1,105 @@
+-- Migration 017: Feeds of edited and deleted expenses
+--
+-- The bot's optional read replica (apps/bot/utils/replica.py) followed new
+-- expenses in creation order (migration 014), so edits and deletions made
+-- from the web app only reached it on a full reload of the household. Two
+-- feeds let it follow every change incrementally:
+--
+--   expenses.updated_at  set to NOW() by a trigger on every update, so rows
+--                        read in (updated_at, id) order after a watermark
+--                        are the ones inserted or edited since
+--   expense_deletions    one row per deleted expense (id, household, when),
+--                        read in (deleted_at, expense_id) order. An expense
+--                        moved to another household is recorded as deleted
+--                        from the old one.
+--
+-- Deletions older than 30 days are pruned after each DELETE statement. A
+-- replica reloads each household far more often than that, so it never
+-- misses one.
+
+-- -------------------------------------------------------------------------
+-- UPDATED_AT
+-- -------------------------------------------------------------------------
+-- Existing rows take the migration time (a stored default, no rewrite, no
+-- ledger trigger); a replica follows the feed from the newest row it finds.
+ALTER TABLE expenses ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+
+CREATE OR REPLACE FUNCTION expenses_touch_updated_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW.updated_at := NOW();
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS expenses_touch_updated_at ON expenses;
+CREATE TRIGGER expenses_touch_updated_at
+  BEFORE UPDATE ON expenses
+  FOR EACH ROW EXECUTE FUNCTION expenses_touch_updated_at();
+
+CREATE INDEX IF NOT EXISTS idx_expenses_updated_id
+  ON expenses (updated_at, id);
+
+-- -------------------------------------------------------------------------
+-- DELETIONS
+-- No foreign keys: the row outlives the expense and, for a deleted
+-- household, the household.
+-- -------------------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS expense_deletions (
+  expense_id   BIGINT      PRIMARY KEY,
+  household_id BIGINT      NOT NULL,
+  deleted_at   TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_expense_deletions_deleted
+  ON expense_deletions (deleted_at, expense_id);
+
+-- Bot-only table (service_role bypasses RLS); keep it closed to clients.
+ALTER TABLE expense_deletions ENABLE ROW LEVEL SECURITY;
+
+-- SECURITY DEFINER: deletions made by web app users write the table too.
+CREATE OR REPLACE FUNCTION expenses_record_deletion()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  INSERT INTO expense_deletions AS d (expense_id, household_id)
+  VALUES (OLD.id, OLD.household_id)
+  ON CONFLICT (expense_id)
+  DO UPDATE SET household_id = EXCLUDED.household_id, deleted_at = EXCLUDED.deleted_at;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS expenses_deleted ON expenses;
+CREATE TRIGGER expenses_deleted
+  AFTER DELETE ON expenses
+  FOR EACH ROW EXECUTE FUNCTION expenses_record_deletion();
+
+DROP TRIGGER IF EXISTS expenses_moved ON expenses;
+CREATE TRIGGER expenses_moved
+  AFTER UPDATE OF household_id ON expenses
+  FOR EACH ROW
+  WHEN (OLD.household_id IS DISTINCT FROM NEW.household_id)
+  EXECUTE FUNCTION expenses_record_deletion();
+
+CREATE OR REPLACE FUNCTION expense_deletions_prune()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  DELETE FROM expense_deletions WHERE deleted_at < NOW() - INTERVAL '30 days';
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS expenses_prune_deletions ON expenses;
+CREATE TRIGGER expenses_prune_deletions
+  AFTER DELETE ON expenses
+  FOR EACH STATEMENT EXECUTE FUNCTION expense_deletions_prune();